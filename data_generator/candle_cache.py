@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+from sortedcontainers import SortedDict, SortedList
+
+from vali_objects.vali_config import ValiConfig
+
+
+class CandleSeries:
+    """
+    Cached candles of one trade pair and timespan. covered holds the disjoint time ranges that were fetched, merged
+    when they touch, and candles holds every candle fetched within them by start time.
+    """
+    def __init__(self):
+        self.covered = SortedList()  # (start_ms, end_ms), both inclusive
+        self.candles = SortedDict()  # start ms -> candle
+
+    def gaps(self, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """
+        The parts of [start_ms, end_ms] not covered yet.
+        """
+        ans = []
+        cursor = start_ms
+        # The range before the first one starting after start_ms may still overlap it
+        i = max(self.covered.bisect_right((start_ms, float('inf'))) - 1, 0)
+        while i < len(self.covered) and cursor <= end_ms:
+            lo, hi = self.covered[i]
+            if lo > end_ms:
+                break
+            if hi >= cursor:
+                if lo > cursor:
+                    ans.append((cursor, lo - 1))
+                cursor = hi + 1
+            i += 1
+        if cursor <= end_ms:
+            ans.append((cursor, end_ms))
+        return ans
+
+    def add(self, start_ms: int, end_ms: int, candles: Iterable):
+        for c in candles:
+            if start_ms <= c.timestamp <= end_ms:
+                self.candles[c.timestamp] = c
+        # Merge with every range that overlaps or touches the new one
+        i = self.covered.bisect_left((start_ms, start_ms))
+        if i > 0 and self.covered[i - 1][1] >= start_ms - 1:
+            i -= 1
+        while i < len(self.covered) and self.covered[i][0] <= end_ms + 1:
+            lo, hi = self.covered.pop(i)
+            start_ms, end_ms = min(start_ms, lo), max(end_ms, hi)
+        self.covered.add((start_ms, end_ms))
+
+    def get(self, start_ms: int, end_ms: int) -> list:
+        return list(self.candles.values()[self.candles.bisect_left(start_ms): self.candles.bisect_right(end_ms)])
+
+    def trim(self, max_candles: int):
+        """
+        Drops the oldest candles and the ranges they were part of until at most max_candles remain.
+        """
+        n_drop = len(self.candles) - max_candles
+        if n_drop <= 0:
+            return
+        cutoff_ms = self.candles.keys()[n_drop - 1]
+        for k in list(self.candles.irange(maximum=cutoff_ms)):
+            del self.candles[k]
+        while self.covered and self.covered[0][0] <= cutoff_ms:
+            _, hi = self.covered.pop(0)
+            if hi > cutoff_ms:
+                self.covered.add((cutoff_ms + 1, hi))
+                break
+
+
+class CandleCache:
+    """
+    Historical candles shared by every PolygonDataService in the process, so the perf ledger, the MDD checker and
+    the price fallbacks don't fetch the same windows from Polygon separately.
+
+    A query is answered from the cached ranges it overlaps and only the span from the first to the last missing
+    candle is fetched, so a query never costs more than one request. Identical fetches that are already in flight
+    are waited on instead of repeated. Candles that could still change (ending less than settle_ms ago) are passed
+    through without being cached, and so are empty responses, which may just be a delayed feed.
+
+    At most max_candles are kept across all series. The least recently queried series are evicted first.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, settle_ms: int = ValiConfig.CANDLE_CACHE_SETTLE_MS,
+                 max_candles: int = ValiConfig.CANDLE_CACHE_MAX_CANDLES):
+        self.settle_ms = settle_ms
+        self.max_candles = max_candles
+        self.lock = threading.Lock()
+        self.series: OrderedDict[Hashable, CandleSeries] = OrderedDict()  # Least recently queried first
+        self.n_candles = 0
+        self.in_flight: Dict[Tuple, Future] = {}
+        self.stats = defaultdict(int)
+
+    @classmethod
+    def shared(cls) -> 'CandleCache':
+        # Kept off the data services since they are pickled when processes start and locks can't be
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+            self.n_candles = 0
+            self.stats.clear()
+
+    def _get_series(self, key: Hashable) -> CandleSeries:
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = CandleSeries()
+        else:
+            self.series.move_to_end(key)
+        return series
+
+    def _evict(self):
+        """
+        Drops the least recently queried series until the cache is within max_candles. The most recent series is
+        only trimmed, oldest candles first.
+        """
+        while self.n_candles > self.max_candles and len(self.series) > 1:
+            _, series = self.series.popitem(last=False)
+            self.n_candles -= len(series.candles)
+            self.stats['n_series_evicted'] += 1
+        if self.n_candles > self.max_candles:
+            series = next(iter(self.series.values()))
+            n_before = len(series.candles)
+            series.trim(self.max_candles)
+            self.n_candles -= n_before - len(series.candles)
+
+    def hit_rate(self) -> float:
+        n_queries = self.stats['n_queries']
+        return self.stats['n_hits'] / n_queries if n_queries else 0.0
+
+    def get_candles(self, key: Hashable, start_ms: int, end_ms: int, timespan_ms: int, now_ms: int,
+                    fetch: Callable[[int, int], Iterable]) -> list:
+        """
+        Candles of series key starting within [start_ms, end_ms], sorted by start time. fetch(start_ms, end_ms)
+        requests a range from upstream.
+        """
+        settled_ms = now_ms - timespan_ms - self.settle_ms
+        with self.lock:
+            series = self._get_series(key)
+            self.stats['n_queries'] += 1
+            gaps = series.gaps(start_ms, min(end_ms, settled_ms)) if start_ms <= settled_ms else []
+            if end_ms > settled_ms:
+                gaps.append((max(start_ms, settled_ms + 1), end_ms))
+            if not gaps:
+                ans = series.get(start_ms, end_ms)
+                self.stats['n_hits'] += 1
+                self.stats['n_candles_from_cache'] += len(ans)
+                return ans
+            # Everything missing is fetched in one request. Splitting around the cached ranges in between would
+            # cost more requests than the candles it saves.
+            fetch_start_ms, fetch_end_ms = gaps[0][0], gaps[-1][1]
+            before = series.get(start_ms, fetch_start_ms - 1)
+            after = series.get(fetch_end_ms + 1, end_ms)
+            if before or after:
+                self.stats['n_partial_hits'] += 1
+            self.stats['n_candles_from_cache'] += len(before) + len(after)
+            flight_key = (key, fetch_start_ms, fetch_end_ms)
+            future = self.in_flight.get(flight_key)
+            is_owner = future is None
+            if is_owner:
+                future = self.in_flight[flight_key] = Future()
+            else:
+                self.stats['n_single_flight_waits'] += 1
+
+        if is_owner:
+            try:
+                candles = list(fetch(fetch_start_ms, fetch_end_ms))
+            except Exception as e:
+                # Fail the waiters too so no one waits forever
+                with self.lock:
+                    self.in_flight.pop(flight_key, None)
+                    self.stats['n_upstream_requests'] += 1
+                future.set_exception(e)
+                raise
+            with self.lock:
+                self.in_flight.pop(flight_key, None)
+                self.stats['n_upstream_requests'] += 1
+                self.stats['n_candles_from_upstream'] += len(candles)
+                if candles and fetch_start_ms <= settled_ms:
+                    # The series may have been evicted while fetching
+                    series = self._get_series(key)
+                    n_before = len(series.candles)
+                    series.add(fetch_start_ms, min(fetch_end_ms, settled_ms), candles)
+                    self.n_candles += len(series.candles) - n_before
+                    self._evict()
+            future.set_result(candles)
+        return before + [c for c in future.result() if fetch_start_ms <= c.timestamp <= fetch_end_ms] + after
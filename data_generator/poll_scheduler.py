@@ -0,0 +1,99 @@
+from typing import Callable, Dict, List
+
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.price_source import PriceSource
+
+
+class PollScheduler:
+    """
+    Decides when to poll each trade pair of a REST API standing in for a websocket.
+
+    Trade pairs are polled every BASE_INTERVAL_S. A trade pair with recent orders or a large price move since its
+    last poll is polled every MIN_INTERVAL_S. When the upstream price hasn't changed, the interval doubles up to
+    MAX_INTERVAL_S. Polls are aligned to multiples of their interval and trade pairs due within BATCH_WINDOW_S go out
+    together, so each trade pair category makes at most one request per poll no matter how intervals diverge.
+    """
+    MIN_INTERVAL_S = 1
+    BASE_INTERVAL_S = 5
+    MAX_INTERVAL_S = 20
+    BATCH_WINDOW_S = 1
+    ORDER_ACTIVITY_WINDOW_S = 60
+    VOLATILE_RETURN = 0.001
+    MARKET_STATUS_REFRESH_S = 10
+
+    def __init__(self, trade_pairs: List[TradePair], is_market_open: Callable[[TradePair, int], bool]):
+        self.trade_pairs = list(trade_pairs)
+        self.is_market_open = is_market_open
+        self.open_trade_pairs = []
+        self.market_status_refresh_s = None
+        self.interval_s = {tp: self.BASE_INTERVAL_S for tp in self.trade_pairs}
+        self.last_poll_s = {tp: None for tp in self.trade_pairs}
+        self.next_poll_s = {tp: 0 for tp in self.trade_pairs}
+        self.last_price = {}  # trade pair -> (start_ms, close) of the last price source seen
+
+    def refresh_market_status(self, now_s: float):
+        if self.market_status_refresh_s is not None and now_s - self.market_status_refresh_s < self.MARKET_STATUS_REFRESH_S:
+            return
+        self.market_status_refresh_s = now_s
+        now_ms = int(now_s * 1000)
+        open_trade_pairs = [tp for tp in self.trade_pairs if self.is_market_open(tp, now_ms)]
+        for tp in set(open_trade_pairs) - set(self.open_trade_pairs):
+            # Poll right away when a market opens
+            self.interval_s[tp] = self.BASE_INTERVAL_S
+            self.next_poll_s[tp] = now_s
+        self.open_trade_pairs = open_trade_pairs
+
+    def is_recently_ordered(self, tp: TradePair, now_s: float, trade_pair_id_to_last_order_ms: Dict[str, int]) -> bool:
+        last_order_ms = trade_pair_id_to_last_order_ms.get(tp.trade_pair_id)
+        return last_order_ms is not None and now_s - last_order_ms / 1000 < self.ORDER_ACTIVITY_WINDOW_S
+
+    def due_trade_pairs(self, now_s: float, trade_pair_id_to_last_order_ms: Dict[str, int]) -> List[TradePair]:
+        """
+        Returns the trade pairs to poll now, batched by category.
+        """
+        self.refresh_market_status(now_s)
+        for tp in self.open_trade_pairs:
+            last_poll_s = self.last_poll_s[tp]
+            if last_poll_s is not None and self.is_recently_ordered(tp, now_s, trade_pair_id_to_last_order_ms):
+                self.next_poll_s[tp] = min(self.next_poll_s[tp], self.aligned(last_poll_s, self.MIN_INTERVAL_S))
+
+        due_categories = {tp.trade_pair_category for tp in self.open_trade_pairs if self.next_poll_s[tp] <= now_s}
+        return [tp for tp in self.open_trade_pairs if tp.trade_pair_category in due_categories and
+                self.next_poll_s[tp] <= now_s + self.BATCH_WINDOW_S]
+
+    def record_poll(self, tp: TradePair, now_s: float, price_source: PriceSource | None,
+                    recently_ordered: bool = False) -> bool:
+        """
+        Schedules the next poll of the trade pair. Returns True if the price source differs from the last one seen.
+        """
+        prev = self.last_price.get(tp)
+        changed = False
+        if price_source is None:
+            interval_s = min(self.interval_s[tp] * 2, self.MAX_INTERVAL_S)
+        else:
+            cur = (price_source.start_ms, price_source.close)
+            changed = cur != prev
+            self.last_price[tp] = cur
+            if not changed:
+                interval_s = min(self.interval_s[tp] * 2, self.MAX_INTERVAL_S)
+            elif prev and prev[1] and abs(cur[1] / prev[1] - 1) > self.VOLATILE_RETURN:
+                interval_s = self.MIN_INTERVAL_S
+            else:
+                interval_s = self.BASE_INTERVAL_S
+        if recently_ordered:
+            interval_s = self.MIN_INTERVAL_S
+        self.interval_s[tp] = interval_s
+        self.last_poll_s[tp] = now_s
+        self.next_poll_s[tp] = self.aligned(now_s, interval_s)
+        return changed
+
+    @staticmethod
+    def aligned(now_s: float, interval_s: float) -> float:
+        # The first multiple of interval_s after now_s
+        return (now_s // interval_s + 1) * interval_s
+
+    def seconds_until_next_poll(self, now_s: float) -> float:
+        if not self.open_trade_pairs:
+            return self.MARKET_STATUS_REFRESH_S
+        return max(0.0, min(self.next_poll_s[tp] for tp in self.open_trade_pairs) - now_s)
+
@@ -9,6 +9,7 @@ from polygon.websocket import Market, EquityAgg, EquityTrade, CryptoTrade, Forex
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from data_generator.base_data_service import BaseDataService, POLYGON_PROVIDER_NAME
+from data_generator.candle_cache import CandleCache
 from time_util.time_util import TimeUtil
 from vali_objects.vali_config import TradePair, TradePairCategory
 import time
@@ -18,7 +19,7 @@ import bittensor as bt
 from polygon import RESTClient
 
 from vali_objects.vali_dataclasses.price_source import PriceSource
-from vali_objects.vali_dataclasses.recent_event_tracker import RecentEventTracker
+from vali_objects.vali_dataclasses.recent_event_tracker import RecentEventTracker, StreamingMedian
 
 DEBUG = 0
 
@@ -538,7 +539,7 @@ class PolygonDataService(BaseDataService):
                 start_time = epoch_miliseconds
                 candle = a
 
-        raw = self.unified_candle_fetcher(trade_pair, timestamp_ms - 1000 * 60 * 60 * 48, timestamp_ms + 1000 * 60 * 30, timespan)
+        raw = self.cached_candle_fetcher(trade_pair, timestamp_ms - 1000 * 60 * 60 * 48, timestamp_ms + 1000 * 60 * 30, timespan)
         for a in raw:
             n_responses += 1
             epoch_miliseconds = a.timestamp
@@ -577,7 +578,7 @@ class PolygonDataService(BaseDataService):
                 start_time = epoch_miliseconds
                 candle = a
 
-        raw = self.unified_candle_fetcher(trade_pair, timestamp_ms - 1000 * 60 * 30, timestamp_ms + 1000 * 60 * 30, timespan)
+        raw = self.cached_candle_fetcher(trade_pair, timestamp_ms - 1000 * 60 * 30, timestamp_ms + 1000 * 60 * 30, timespan)
         for a in raw:
             n_responses += 1
             epoch_miliseconds = a.timestamp
@@ -610,7 +611,7 @@ class PolygonDataService(BaseDataService):
                 smallest_delta = time_delta_ms
                 corresponding_price = p
 
-        raw = self.unified_candle_fetcher(trade_pair, target_timestamp_ms - 1000 * 10, target_timestamp_ms + 1000 * 10, timespan)
+        raw = self.cached_candle_fetcher(trade_pair, target_timestamp_ms - 1000 * 10, target_timestamp_ms + 1000 * 10, timespan)
         for a in raw:
             if return_aggs:
                 aggs.append(a)
@@ -654,7 +655,7 @@ class PolygonDataService(BaseDataService):
         # ans = {}
         # ub = 0
         # lb = float('inf')
-        raw = self.unified_candle_fetcher(trade_pair, start_timestamp_ms, end_timestamp_ms, "second")
+        raw = self.cached_candle_fetcher(trade_pair, start_timestamp_ms, end_timestamp_ms, "second")
         #for a in raw:
             #ans[a.timestamp // 1000] = a.close
             #ub = max(ub, a.timestamp)
@@ -662,6 +663,16 @@ class PolygonDataService(BaseDataService):
         return raw#, lb, ub
 
 
+    def cached_candle_fetcher(self, trade_pair: TradePair, start_timestamp_ms: int, end_timestamp_ms: int, timespan: str):
+        """
+        unified_candle_fetcher behind the process wide CandleCache, for historical windows. Returns the candles
+        starting within the window as a list. Live prices call unified_candle_fetcher directly.
+        """
+        return CandleCache.shared().get_candles(
+            (trade_pair.trade_pair_id, timespan), start_timestamp_ms, end_timestamp_ms, self.timespan_to_ms[timespan],
+            TimeUtil.now_in_millis(),
+            lambda start_ms, end_ms: self.unified_candle_fetcher(trade_pair, start_ms, end_ms, timespan))
+
     def unified_candle_fetcher(self, trade_pair: TradePair, start_timestamp_ms: int, end_timestamp_ms: int, timespan: str=None):
         def build_quotes(start_timestamp_ms, end_timestamp_ms):
             #nonlocal stats
@@ -676,21 +687,26 @@ class PolygonDataService(BaseDataService):
                                                                    order='asc',
                                                                    limit=self.N_CANDLES_LIMIT)
             n_quotes = 0
-            best_delta = float('inf')
+            # Median of the quotes at prev_t_ms. Written to the candle once its timestamp is done so only one
+            # timestamp's quotes are held while the pages of quotes stream in.
+            median = None
+
+            def finalize_candle():
+                if median is not None and len(median) > 1:
+                    ans[-1].open = ans[-1].close = ans[-1].low = ans[-1].high = median.median()
+
             for r in raw:
                 t_ms = r.participant_timestamp // 1000000
                 if t_ms != prev_t_ms:
-                    best_delta = float('inf')
-                    if ans and hasattr(ans[-1], 'temp'):
-                        del ans[-1].temp
+                    finalize_candle()
+                    median = None
                 n_quotes += 1
-                price, current_delta = self.parse_price_for_forex(r, stats=None)
+                price, _ = self.parse_price_for_forex(r, stats=None)
                 if price is None:
                     continue
 
-
-                if best_delta == float('inf'):
-                    best_delta = current_delta
+                if median is None:
+                    median = StreamingMedian()
                     ans.append(Agg(open=price,
                                    close=price,
                                    high=price,
@@ -698,20 +714,11 @@ class PolygonDataService(BaseDataService):
                                    volume=0,
                                    vwap=None,
                                    timestamp=t_ms))
-                    ans[-1].temp = [price]
-                else:
-                    best_delta = current_delta
-                    arr = ans[-1].temp
-                    arr.append(price)
-                    arr.sort()
-
-                    # Get the median value if the length is odd. Otherwise, average the two middle values
-                    median_price = RecentEventTracker.forex_median_price(arr)
-                    ans[-1].open = ans[-1].close = ans[-1].low = ans[-1].high = median_price
-
+                median.add(price)
                 ans[-1].volume += 1
                 prev_t_ms = t_ms
 
+            finalize_candle()
             return ans, n_quotes
 
         if self.POLYGON_CLIENT is None:
@@ -784,7 +791,7 @@ class PolygonDataService(BaseDataService):
         aggs = []
         prev_timestamp = None
         now_ms = TimeUtil.now_in_millis()
-        raw = self.unified_candle_fetcher(trade_pair, start_timestamp_ms, end_timestamp_ms, timespan)
+        raw = self.cached_candle_fetcher(trade_pair, start_timestamp_ms, end_timestamp_ms, timespan)
         for i, a in enumerate(raw):
             epoch_miliseconds = a.timestamp
             assert prev_timestamp is None or epoch_miliseconds >= prev_timestamp, ('candles not sorted', prev_timestamp, epoch_miliseconds)
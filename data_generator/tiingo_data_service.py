@@ -6,6 +6,7 @@ from typing import List
 import multiprocessing
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from data_generator.base_data_service import BaseDataService, TIINGO_PROVIDER_NAME, exception_handler_decorator
+from data_generator.poll_scheduler import PollScheduler
 from time_util.time_util import TimeUtil
 from vali_objects.vali_config import TradePair, TradePairCategory
 import time
@@ -36,6 +37,15 @@ class TiingoDataService(BaseDataService):
 
         self.config = {'api_key': self._api_key, 'session': True}
         self.TIINGO_CLIENT = None  # Instantiate the TiingoClient after process starts
+        self.base_url = 'https://api.tiingo.com'
+
+        # One scheduler polls every category for the pseudo websocket. Orders made in the validator process speed up
+        # polling of their trade pair in the websocket manager process.
+        self.poll_scheduler = PollScheduler([tp for tp in TradePair if tp.trade_pair_category in
+                                             (TradePairCategory.EQUITIES, TradePairCategory.FOREX,
+                                              TradePairCategory.CRYPTO)], self.market_calendar.is_market_open)
+        self.pseudo_websocket_thread = None
+        self.trade_pair_id_to_last_order_ms = ipc_manager.dict() if ipc_manager else {}
 
         self.subscribe_message = {
             'eventName': 'subscribe',
@@ -61,52 +71,51 @@ class TiingoDataService(BaseDataService):
     def instantiate_not_pickleable_objects(self):
         self.TIINGO_CLIENT = TiingoClient(self.config)
 
-    def run_pseudo_websocket(self, tpc: TradePairCategory):
-        verbose = False
-        POLLING_INTERVAL_S = 5
-        if tpc == TradePairCategory.EQUITIES:
-            desired_trade_pairs = [x for x in TradePair if x.is_equities]
-        elif tpc == TradePairCategory.FOREX:
-            desired_trade_pairs = [x for x in TradePair if x.is_forex]
-        elif tpc == TradePairCategory.CRYPTO:
-            desired_trade_pairs = [x for x in TradePair if x.is_crypto]
-        else:
-            raise ValueError(f'Unexpected trade pair category {tpc}')
-
-        last_poll_time = 0
-
-        while True:
-            current_time = time.time()
-            elapsed_time = current_time - last_poll_time
-
-            if elapsed_time < POLLING_INTERVAL_S:
-                time.sleep(1)
-                continue
-
-            trade_pairs_to_query = [pair for pair in desired_trade_pairs if self.is_market_open(pair)]
-            price_sources = self.get_closes_rest(trade_pairs_to_query, verbose=verbose)
-
-            for trade_pair, price_source in price_sources.items():
-                price_source.websocket = True
+    def poll_pseudo_websocket(self, now_s: float = None) -> float:
+        """
+        Polls the REST closes of the trade pairs the scheduler says are due, one request per category, and sends the
+        ones that changed to process_ps_from_websocket. Returns the number of seconds until the next poll is due.
+        """
+        if now_s is None:
+            now_s = time.time()
+        trade_pair_id_to_last_order_ms = dict(self.trade_pair_id_to_last_order_ms)
+        trade_pairs_to_query = self.poll_scheduler.due_trade_pairs(now_s, trade_pair_id_to_last_order_ms)
+        if trade_pairs_to_query:
+            price_sources = self.get_closes_rest(trade_pairs_to_query)
+            for trade_pair in trade_pairs_to_query:
+                price_source = price_sources.get(trade_pair)
+                recently_ordered = self.poll_scheduler.is_recently_ordered(trade_pair, now_s,
+                                                                           trade_pair_id_to_last_order_ms)
+                changed = self.poll_scheduler.record_poll(trade_pair, now_s, price_source, recently_ordered)
+                if price_source is None:
+                    continue
+                # Counted even if unchanged. The websocket manager restarts categories that stop receiving events.
                 self.tpc_to_n_events[trade_pair.trade_pair_category] += 1
-                self.process_ps_from_websocket(trade_pair, price_source)
-
-            last_poll_time = current_time
+                if changed:
+                    price_source.websocket = True
+                    self.process_ps_from_websocket(trade_pair, price_source)
+        return self.poll_scheduler.seconds_until_next_poll(now_s)
 
-            if verbose:
-                elapsed_since_last_poll = time.time() - current_time
-                print(f'Pseudo websocket update took {elapsed_since_last_poll:.2f} seconds for tpc {tpc}')
-
-
-    def main_forex(self):
-        #TiingoWebsocketClient(self.subscribe_message, endpoint="fx", on_msg_cb=self.handle_msg)
-        self.run_pseudo_websocket(TradePairCategory.FOREX)
-    def main_stocks(self):
-        #TiingoWebsocketClient(self.subscribe_message, endpoint="iex", on_msg_cb=self.handle_msg)
-        self.run_pseudo_websocket(TradePairCategory.EQUITIES)
-    def main_crypto(self):
-        #TiingoWebsocketClient(self.subscribe_message, endpoint="crypto", on_msg_cb=self.handle_msg)
-        self.run_pseudo_websocket(TradePairCategory.CRYPTO)
+    def run_pseudo_websocket(self):
+        while True:
+            try:
+                wait_s = self.poll_pseudo_websocket()
+            except Exception as e:
+                bt.logging.error(f"Failed to poll {TIINGO_PROVIDER_NAME} pseudo websocket with error: {e}, "
+                                 f"type: {type(e).__name__}")
+                bt.logging.error(traceback.format_exc())
+                wait_s = PollScheduler.BASE_INTERVAL_S
+            # Wake up at least every MIN_INTERVAL_S to pick up trade pairs that just received orders
+            time.sleep(min(wait_s, PollScheduler.MIN_INTERVAL_S))
+
+    def stop_start_websocket_threads(self, tpc: TradePairCategory = None):
+        # A single pseudo websocket thread serves every category. Only start it if it isn't running.
+        if self.pseudo_websocket_thread is None or not self.pseudo_websocket_thread.is_alive():
+            self.pseudo_websocket_thread = threading.Thread(target=self.run_pseudo_websocket, daemon=True)
+            self.pseudo_websocket_thread.start()
+
+    def record_order_activity(self, trade_pair: TradePair, time_ms: int):
+        self.trade_pair_id_to_last_order_ms[trade_pair.trade_pair_id] = time_ms
 
     def handle_msg(self, msg):
         """
@@ -314,7 +323,7 @@ class TiingoDataService(BaseDataService):
             return {tp: self.closed_market_prices[tp] for tp in trade_pairs}
 
         def tickers_to_tiingo_iex_url(tickers: List[str]) -> str:
-            return f"https://api.tiingo.com/iex/?tickers={','.join(tickers)}&token={self.config['api_key']}"
+            return f"{self.base_url}/iex/?tickers={','.join(tickers)}&token={self.config['api_key']}"
 
         url = tickers_to_tiingo_iex_url([self.trade_pair_to_tiingo_ticker(x) for x in trade_pairs])
         if verbose:
@@ -357,7 +366,7 @@ class TiingoDataService(BaseDataService):
     @exception_handler_decorator()
     def get_closes_forex(self, trade_pairs: List[TradePair], verbose=False) -> dict:
         def tickers_to_tiingo_forex_url(tickers: List[str]) -> str:
-            return f"https://api.tiingo.com/tiingo/fx/top?tickers={','.join(tickers)}&token={self.config['api_key']}"
+            return f"{self.base_url}/tiingo/fx/top?tickers={','.join(tickers)}&token={self.config['api_key']}"
 
         tp_to_price = {}
         if not trade_pairs:
@@ -417,7 +426,7 @@ class TiingoDataService(BaseDataService):
         assert all(tp.trade_pair_category == TradePairCategory.CRYPTO for tp in trade_pairs), trade_pairs
 
         def tickers_to_crypto_url(tickers: List[str]) -> str:
-            return f"https://api.tiingo.com/tiingo/crypto/top?tickers={','.join(tickers)}&token={self.config['api_key']}&exchanges={TIINGO_COINBASE_EXCHANGE_STR.upper()}"
+            return f"{self.base_url}/tiingo/crypto/top?tickers={','.join(tickers)}&token={self.config['api_key']}&exchanges={TIINGO_COINBASE_EXCHANGE_STR.upper()}"
 
         url = tickers_to_crypto_url([self.trade_pair_to_tiingo_ticker(x) for x in trade_pairs])
         if verbose:
@@ -5,6 +5,7 @@ import time
 
 from miner_config import MinerConfig
 from template.protocol import GetPositions
+from vali_objects.utils.position_digest import PositionDigest
 
 class PositionInspector:
     MAX_RETRIES = 1
@@ -19,6 +20,10 @@ class PositionInspector:
         self.recently_acked_validators = []
         self.stop_requested = False  # Flag to control the loop
         self.is_testnet = self.config.subtensor.network == "test"
+        # (trade_pair_id, digest) -> position dicts for that trade pair. Validators skip sending trade pairs whose
+        # digest is already in here, so steady state refreshes only transfer digests.
+        self.position_digest_cache = {}
+        self.position_digests_in_use = set()
 
     def run_update_loop(self):
         while not self.stop_requested:
@@ -47,7 +52,8 @@ class PositionInspector:
 
     def query_positions(self, validators, hotkey_to_positions):
         remaining_validators_to_query = [v for v in validators if v.hotkey not in hotkey_to_positions]
-        responses = bt.dendrite(wallet=self.wallet).query(remaining_validators_to_query, GetPositions(version=1), deserialize=True)
+        request = GetPositions(version=2, known_position_digests=self.known_position_digests())
+        responses = bt.dendrite(wallet=self.wallet).query(remaining_validators_to_query, request, deserialize=True)
         hotkey_to_v_trust = {neuron.hotkey: neuron.validator_trust for neuron in self.metagraph.neurons}
         ret = []
         for validator, response in zip(remaining_validators_to_query, responses):
@@ -55,10 +61,53 @@ class PositionInspector:
             if response.error_message and v_trust >= MinerConfig.HIGH_V_TRUST_THRESHOLD:
                 bt.logging.warning(f"Error getting positions from {validator}. v_trust {v_trust} Error message: {response.error_message}")
             if response.successfully_processed:
-                ret.append((validator, response.positions))
+                positions = self.resolve_positions(validator, response)
+                if positions is not None:
+                    ret.append((validator, positions))
 
         return ret
 
+    def known_position_digests(self):
+        known = defaultdict(list)
+        for trade_pair_id, digest in self.position_digest_cache:
+            known[trade_pair_id].append(digest)
+        return dict(known)
+
+    def resolve_positions(self, validator, response):
+        """
+        Rebuilds the validator's full position list from the trade pairs it sent and the cached trade pairs whose
+        digest it reported. Returns None if the validator reported a digest we never had.
+        """
+        if not response.position_digests:
+            # Validators that predate position digests send every position. This is also an empty portfolio.
+            return response.positions
+
+        sent_positions = defaultdict(list)
+        for position in response.positions:
+            sent_positions[PositionDigest.trade_pair_id_from_dict(position)].append(position)
+        for trade_pair_id, positions in sent_positions.items():
+            digest = PositionDigest.trade_pair_digests_from_dicts(positions)[trade_pair_id]
+            self.position_digest_cache[(trade_pair_id, digest)] = positions
+            self.position_digests_in_use.add((trade_pair_id, digest))
+
+        ret = []
+        for trade_pair_id, digest in response.position_digests.items():
+            if trade_pair_id in sent_positions:
+                ret.extend(sent_positions[trade_pair_id])
+                continue
+            key = (trade_pair_id, digest)
+            if key not in self.position_digest_cache:
+                bt.logging.warning(f"Validator {validator.hotkey} skipped {trade_pair_id} positions with unknown digest {digest}.")
+                return None
+            self.position_digests_in_use.add(key)
+            ret.extend(self.position_digest_cache[key])
+        return ret
+
+    def prune_position_digest_cache(self):
+        self.position_digest_cache = {k: v for k, v in self.position_digest_cache.items()
+                                      if k in self.position_digests_in_use}
+        self.position_digests_in_use = set()
+
     def reconcile_validator_positions(self, hotkey_to_positions, validators):
         hotkey_to_validator = {v.hotkey: v for v in validators}
         hotkey_to_v_trust = {neuron.hotkey: neuron.validator_trust for neuron in self.metagraph.neurons}
@@ -119,6 +168,8 @@ class PositionInspector:
         # We consider a validator acked if it successfully responded to the signal.
         # Note, a validator that has this miner blacklisted will not be added.
         self.recently_acked_validators = hotkey_to_positions.keys()
+        # Only keep the trade pair positions that some validator still reports
+        self.prune_position_digest_cache()
         position_most_orders = self.reconcile_validator_positions(hotkey_to_positions, validators_to_query)
         # Return the validator with the most orders
         return position_most_orders
@@ -2,21 +2,57 @@
 # Copyright © 2024 Yuma Rao
 # developer: jbonilla
 # Copyright © 2024 Taoshi Inc
+import asyncio
 import json
 import os
+import random
 import threading
-import time
+from collections import deque
+
+import aiohttp
 import bittensor as bt
 from miner_config import MinerConfig
 from template.protocol import SendSignal
 from vali_objects.vali_config import TradePair
 from vali_objects.utils.vali_bkp_utils import ValiBkpUtils
 
+
+class PooledDendrite(bt.dendrite):
+    """
+    A long-lived dendrite whose connection pool is sized for signal bursts. The session is created on first use, on
+    the event loop that sends the requests, and closed with the dendrite's own aclose_session.
+    """
+    def __init__(self, wallet, max_connections: int, max_connections_per_host: int, keepalive_timeout_seconds: float,
+                 synapse_history_size: int):
+        super().__init__(wallet=wallet)
+        # The dendrite appends every response to its history. Bound it since the dendrite is never rebuilt.
+        self.synapse_history = deque(maxlen=synapse_history_size)
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout_seconds = keepalive_timeout_seconds
+
+    @property
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host,
+                                             keepalive_timeout=self.keepalive_timeout_seconds)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+
 class PropNetOrderPlacer:
     # Constants for retry logic with exponential backoff. After trying 3 times, there will be a delay of ~ 3 minutes.
     # This time is sufficient for validators to go offline, update, and come back online.
     MAX_RETRIES = 3
     INITIAL_RETRY_DELAY_SECONDS = 20
+    # Retry delays are spread by +/- this fraction so that validators recovering together are not hit in lockstep.
+    RETRY_JITTER_FRACTION = 0.25
+    SEND_SIGNAL_TIMEOUT_SECONDS = 12
+    # Keep-alive connections are reused across signals. Limits bound the sockets opened during a burst.
+    MAX_CONNECTIONS = 256
+    MAX_CONNECTIONS_PER_VALIDATOR = 4
+    KEEPALIVE_TIMEOUT_SECONDS = 60
+    SYNAPSE_HISTORY_SIZE = 1000
 
     def __init__(self, wallet, metagraph, config, is_testnet, position_inspector=None):
         self.wallet = wallet
@@ -27,70 +63,108 @@ class PropNetOrderPlacer:
         self.trade_pair_id_to_last_order_send = {tp.trade_pair_id: 0 for tp in TradePair}
         self.used_miner_uuids = set()
         self.position_inspector = position_inspector
+        # Signals are dispatched on a single event loop running in a background thread. The dendrite (and its
+        # connection pool) lives as long as the loop instead of being rebuilt for every send attempt.
+        self.loop = None
+        self.loop_thread = None
+        self.dendrite = None
+        self.loop_start_lock = threading.Lock()
+        # (trade_pair_id, validator_hotkey) -> future resolved once the latest queued send to that validator finishes.
+        # Only touched from the event loop thread.
+        self.delivery_tails = {}
 
     def send_signals(self, signals, signal_file_names, recently_acked_validators: list[str]):
         """
-        Initiates the process of sending signals to all validators in parallel.
-        This method improves efficiency by leveraging concurrent processing,
-        which is especially effective during the initial phase where most signal
-        sending attempts are expected to succeed.
+        Queues the signals for sending to all validators without blocking the caller.
+
+        Every signal is sent to every validator concurrently, and each validator retries independently. Signals for
+        the same trade pair reach each validator in the order they were queued: a send waits until the previous
+        signal for that trade pair has been acked by (or given up on) the same validator.
+
+        Returns a list of concurrent.futures.Future, one per signal, resolving to the signal file path.
         """
         self.recently_acked_validators = recently_acked_validators
-
-        threads = []
+        loop = self.start_event_loop()
+        futures = []
         for (signal_data, signal_file_path) in zip(signals, signal_file_names):
-            thread = threading.Thread(target=self.process_a_signal, args=(signal_file_path, signal_data))
-            threads.append(thread)
-            thread.start()
-
-        # Wait for all threads to complete
-        #for thread in threads:
-        #    thread.join()
-
-        #time.sleep(3)
-
-    def process_a_signal(self, signal_file_path, signal_data):
+            future = asyncio.run_coroutine_threadsafe(self.process_a_signal(signal_file_path, signal_data), loop)
+            future.add_done_callback(self.log_signal_exception)
+            futures.append(future)
+        return futures
+
+    @staticmethod
+    def log_signal_exception(future):
+        if not future.cancelled() and future.exception() is not None:
+            bt.logging.error(f"Error processing signal: {future.exception()!r}")
+
+    def start_event_loop(self):
+        with self.loop_start_lock:
+            if self.loop is None:
+                self.dendrite = PooledDendrite(self.wallet, self.MAX_CONNECTIONS, self.MAX_CONNECTIONS_PER_VALIDATOR,
+                                               self.KEEPALIVE_TIMEOUT_SECONDS, self.SYNAPSE_HISTORY_SIZE)
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self.loop_thread.start()
+            return self.loop
+
+    def shutdown(self):
+        """Closes the validator connections and stops the event loop. Queued signals are abandoned."""
+        with self.loop_start_lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.dendrite.aclose_session(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            self.loop = None
+            self.loop_thread = None
+
+    async def process_a_signal(self, signal_file_path, signal_data):
         """
-        Processes a signal file by attempting to send it to the validators.
-        Manages retry attempts and employs exponential backoff for failed attempts.
+        Processes a signal file by sending it to the validators, then writes it to the processed or failed
+        directory depending on whether the high-trust validators received it.
         """
         hotkey_to_v_trust = {neuron.hotkey: neuron.validator_trust for neuron in self.metagraph.neurons}
         axons_to_try = self.position_inspector.get_possible_validators()
         axons_to_try.sort(key=lambda validator: hotkey_to_v_trust[validator.hotkey], reverse=True)
 
-        validator_hotkey_to_axon = {}
+        validator_hotkeys = set()
         for axon in axons_to_try:
-            assert axon.hotkey not in validator_hotkey_to_axon, f"Duplicate hotkey {axon.hotkey} in axons"
-            validator_hotkey_to_axon[axon.hotkey] = axon
-
+            assert axon.hotkey not in validator_hotkeys, f"Duplicate hotkey {axon.hotkey} in axons"
+            validator_hotkeys.add(axon.hotkey)
 
         retry_status = {
-                'retry_attempts': 0,
-                'retry_delay_seconds': self.INITIAL_RETRY_DELAY_SECONDS,
-                'validators_needing_retry': axons_to_try,
+                'validators_needing_retry': [],
                 'validator_error_messages': {}
         }
 
         # Track the high-trust validators for special checking after processing
         high_trust_validators = self.get_high_trust_validators(axons_to_try, hotkey_to_v_trust)
+        high_trust_hotkeys = {validator.hotkey for validator in high_trust_validators}
         miner_order_uuid = signal_file_path.split('/')[-1]
         assert miner_order_uuid not in self.used_miner_uuids, f"Duplicate miner order uuid {miner_order_uuid}"
         self.used_miner_uuids.add(miner_order_uuid)
         send_signal_request = SendSignal(signal=signal_data, miner_order_uuid=miner_order_uuid)
+        trade_pair_id = signal_data['trade_pair']['trade_pair_id']
 
-        # Continue retrying until the max number of retries is reached or no validators need retrying
-        while retry_status['retry_attempts'] < self.MAX_RETRIES and retry_status['validators_needing_retry']:
-            self.attempt_to_send_signal(send_signal_request, retry_status, high_trust_validators, validator_hotkey_to_axon)
+        bt.logging.info(f"Sending order for {trade_pair_id} uuid {miner_order_uuid} to {len(axons_to_try)} hotkeys...")
+        # Claim each validator's ordering slot before the first await so that slots follow the queueing order.
+        needs_retry = await asyncio.gather(*[
+            self.send_signal_to_validator(axon, send_signal_request, retry_status, high_trust_hotkeys,
+                                          hotkey_to_v_trust, self.claim_delivery_slot(trade_pair_id, axon.hotkey))
+            for axon in axons_to_try])
+        retry_status['validators_needing_retry'] = [axon for axon, failed in zip(axons_to_try, needs_retry) if failed]
 
         # After retries, check if all high-trust validators have processed the signal successfully
-        # This requires checking the current state of trust and response success
-        high_trust_processed = True
         n_high_trust_validators = len(high_trust_validators)
-        n_high_trust_validators_that_failed = 0
-        for validator in high_trust_validators:
-            if validator in retry_status['validators_needing_retry']:
-                high_trust_processed = False
-                n_high_trust_validators_that_failed += 1
+        n_high_trust_validators_that_failed = sum(1 for validator in retry_status['validators_needing_retry']
+                                                  if validator.hotkey in high_trust_hotkeys)
+        high_trust_processed = n_high_trust_validators_that_failed == 0
+        if high_trust_processed and high_trust_validators:
+            v_trust_floor = min([hotkey_to_v_trust[validator.hotkey] for validator in high_trust_validators])
+            bt.logging.success(f"Signal file {send_signal_request.signal} was successfully processed by"
+                               f" {n_high_trust_validators}/{n_high_trust_validators} high-trust validators with "
+                               f"min v_trust {v_trust_floor}. Total n_validators: {len(axons_to_try)}")
 
         if self.is_testnet and retry_status['validator_error_messages']:
             high_trust_processed = False
@@ -122,75 +196,71 @@ class PropNetOrderPlacer:
         else:
             return high_trust_validators
 
-
-    def attempt_to_send_signal(self, send_signal_request: SendSignal, retry_status: dict, high_trust_validators: list, validator_hotkey_to_axon: dict):
+    def claim_delivery_slot(self, trade_pair_id, validator_hotkey):
         """
-        Attempts to send a signal to the validators that need retrying, applying exponential backoff for each retry attempt.
-        Logs the retry attempt number, and the number of validators that successfully responded out of the total number of original validators.
+        Appends a send to the (trade pair, validator) queue. Returns the key, the future of the previous send that
+        must finish first (or None) and the future this send resolves when it is done.
         """
-        # Total number of axons being pinged this round. Used for percentage calculation
-        # total_n_validators_this_round = len(retry_status['validators_needing_retry'])
-        hotkey_to_v_trust = {neuron.hotkey: neuron.validator_trust for neuron in self.metagraph.neurons}
-
-        bt.logging.info(f"Attempt #{retry_status['retry_attempts']} for {send_signal_request.signal['trade_pair']['trade_pair_id']} uuid {send_signal_request.miner_order_uuid}."
-                        f" Sending order to {len(retry_status['validators_needing_retry'])} hotkeys...")
-
-        if retry_status['retry_attempts'] != 0:  # Apply exponential backoff after the first attempt
-            time.sleep(retry_status['retry_delay_seconds'])
-            retry_status['retry_delay_seconds'] *= 2  # Double the delay for the next attempt
-
-        dendrite = bt.dendrite(wallet=self.wallet)
-        validator_responses = dendrite.query(retry_status['validators_needing_retry'], send_signal_request)
-        #validator_responses = dendrite(retry_status['validators_needing_retry'], send_signal_request)
-
-        # Filtering validators for the next retry based on the current response.
-        all_high_trust_validators_succeeded = True
-
-        success_validators = set([response.validator_hotkey for response in validator_responses if
-                                  response.successfully_processed and response.validator_hotkey])
-
-        # Loop through responses for error messaging
-        for response in validator_responses:
+        key = (trade_pair_id, validator_hotkey)
+        previous = self.delivery_tails.get(key)
+        done = self.loop.create_future()
+        self.delivery_tails[key] = done
+        return key, previous, done
+
+    async def send_signal_to_validator(self, axon, send_signal_request: SendSignal, retry_status: dict,
+                                       high_trust_hotkeys: set, hotkey_to_v_trust: dict, delivery_slot) -> bool:
+        """
+        Sends a signal to one validator once the previous signal for the same trade pair has been handled by it,
+        retrying with jittered exponential backoff. Returns True if the validator still needs the signal.
+        """
+        key, previous, done = delivery_slot
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            return await self.attempt_to_send_signal(axon, send_signal_request, retry_status, high_trust_hotkeys,
+                                                     hotkey_to_v_trust)
+        finally:
+            if not done.done():
+                done.set_result(None)
+            if self.delivery_tails.get(key) is done:
+                del self.delivery_tails[key]
+
+    async def attempt_to_send_signal(self, axon, send_signal_request: SendSignal, retry_status: dict,
+                                     high_trust_hotkeys: set, hotkey_to_v_trust: dict) -> bool:
+        """
+        Sends a signal to one validator until it is processed, the retries run out, or the validator is not worth
+        retrying. Error messages from high-trust validators are collected in retry_status.
+        """
+        retry_delay_seconds = self.INITIAL_RETRY_DELAY_SECONDS
+        for retry_attempt in range(self.MAX_RETRIES):
+            if retry_attempt != 0:  # Apply exponential backoff after the first attempt
+                await asyncio.sleep(retry_delay_seconds * random.uniform(1 - self.RETRY_JITTER_FRACTION,
+                                                                         1 + self.RETRY_JITTER_FRACTION))
+                retry_delay_seconds *= 2  # Double the delay for the next attempt
+                bt.logging.info(f"Attempt #{retry_attempt} for {send_signal_request.signal['trade_pair']['trade_pair_id']}"
+                                f" uuid {send_signal_request.miner_order_uuid} to {axon.hotkey}")
+
+            response = await self.dendrite.call(axon, send_signal_request.model_copy(),
+                                                timeout=self.SEND_SIGNAL_TIMEOUT_SECONDS, deserialize=False)
             if response.successfully_processed:
-                continue
-
-            acked_axon = validator_hotkey_to_axon.get(response.validator_hotkey)
-            vtrust = hotkey_to_v_trust.get(response.validator_hotkey)
-            if acked_axon in high_trust_validators:
-                all_high_trust_validators_succeeded = False
-                if response.error_message:
-                    msg = f"Error sending order to axon {acked_axon} with v_trust {vtrust}. Error message: {response.error_message}"
-                    bt.logging.warning(msg)
-                    if acked_axon.hotkey not in retry_status['validator_error_messages']:
-                        retry_status['validator_error_messages'][acked_axon.hotkey] = []
-                    retry_status['validator_error_messages'][acked_axon.hotkey].append(response.error_message)
-
-
-        if all_high_trust_validators_succeeded:
-            v_trust_floor = min([hotkey_to_v_trust[validator.hotkey] for validator in high_trust_validators])
-            n_high_trust_validators = len(high_trust_validators)
-            bt.logging.success(f"Signal file {send_signal_request.signal} was successfully processed by"
-                               f" {n_high_trust_validators}/{n_high_trust_validators} high-trust validators with "
-                               f"min v_trust {v_trust_floor}. Total n_validators: {len(retry_status['validators_needing_retry'])}")
-
-        def _allow_retry(axon):
-            if axon.hotkey in success_validators:
                 return False
-            # Do not retry if the validator has 0 trust and is not in the recently acked list.
-            # Maybe another miner or inactive hotkey.
-            if axon.hotkey in self.recently_acked_validators:
-                return True
-            return hotkey_to_v_trust[axon.hotkey] > 0
 
-        new_validators_to_retry = [axon for axon in retry_status['validators_needing_retry'] if _allow_retry(axon)]
-        # Sort the new list of axons needing retry by trust, highest to lowest to reduce possible lag
-        new_validators_to_retry.sort(key=lambda validator: hotkey_to_v_trust[validator.hotkey], reverse=True)
+            if axon.hotkey in high_trust_hotkeys and response.error_message:
+                vtrust = hotkey_to_v_trust.get(axon.hotkey)
+                msg = f"Error sending order to axon {axon} with v_trust {vtrust}. Error message: {response.error_message}"
+                bt.logging.warning(msg)
+                retry_status['validator_error_messages'].setdefault(axon.hotkey, []).append(response.error_message)
 
-        retry_status['validators_needing_retry'] = new_validators_to_retry
-
-        # Calculating the number of successful responses
-        #n_fails = len([response for response in validator_responses if not response.successfully_processed])
-        retry_status['retry_attempts'] += 1  # Update the retry attempt count for this signal file
+            if not self.allow_retry(axon, hotkey_to_v_trust):
+                return False
+        return True
+
+    def allow_retry(self, axon, hotkey_to_v_trust):
+        # Do not retry if the validator has 0 trust and is not in the recently acked list.
+        # Maybe another miner or inactive hotkey.
+        if axon.hotkey in self.recently_acked_validators:
+            return True
+        return hotkey_to_v_trust[axon.hotkey] > 0
 
     def write_signal_to_processed_directory(self, signal_data, signal_file_path: str):
         """Moves a processed signal file to the processed directory."""
@@ -208,6 +208,7 @@ class Miner:
                     self.dashboard_frontend_process.terminate()  # Terminate the dashboard if it was started
                     self.dashboard_frontend_process.wait()
                     bt.logging.info("Dashboard terminated.")
+                self.prop_net_order_placer.shutdown()
                 self.metagraph_updater_thread.join()
                 self.position_inspector.stop_update_loop()
                 if self.position_inspector_thread:
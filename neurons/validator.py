@@ -30,6 +30,7 @@ from runnable.generate_request_outputs import RequestOutputGenerator
 from vali_objects.utils.auto_sync import PositionSyncer
 from vali_objects.utils.p2p_syncer import P2PSyncer
 from shared_objects.rate_limiter import RateLimiter
+from shared_objects.synapse_scheduler import SynapseScheduler
 from vali_objects.utils.position_lock import PositionLocks
 from vali_objects.utils.timestamp_manager import TimestampManager
 from vali_objects.uuid_tracker import UUIDTracker
@@ -44,6 +45,7 @@ from vali_objects.utils.mdd_checker import MDDChecker
 from vali_objects.utils.vali_bkp_utils import ValiBkpUtils, CustomEncoder
 from vali_objects.vali_dataclasses.perf_ledger import PerfLedgerManager
 from vali_objects.utils.position_manager import PositionManager
+from vali_objects.utils.position_digest import PositionDigest
 from vali_objects.utils.challengeperiod_manager import ChallengePeriodManager
 from vali_objects.vali_dataclasses.order import Order
 from vali_objects.position import Position
@@ -167,7 +169,8 @@ class Validator:
                                               n_orders_being_processed=self.n_orders_being_processed,
                                               ipc_manager=self.ipc_manager,
                                               position_manager=None,
-                                              auto_sync_enabled=self.auto_sync)  # Set after self.pm creation
+                                              auto_sync_enabled=self.auto_sync,
+                                              position_locks=self.position_locks)  # Set after self.pm creation
 
         self.p2p_syncer = P2PSyncer(wallet=self.wallet, metagraph=self.metagraph, is_testnet=not self.is_mainnet,
                                     shutdown_dict=shutdown_dict, signal_sync_lock=self.signal_sync_lock,
@@ -195,7 +198,8 @@ class Validator:
         self.challengeperiod_manager = ChallengePeriodManager(self.metagraph,
                                                               perf_ledger_manager=self.perf_ledger_manager,
                                                               position_manager=self.position_manager,
-                                                              ipc_manager=self.ipc_manager)
+                                                              ipc_manager=self.ipc_manager,
+                                                              persist_scores=True)
 
         # Attach the position manager to the other objects that need it
         for idx, obj in enumerate([self.perf_ledger_manager, self.position_manager, self.position_syncer,
@@ -266,23 +270,35 @@ class Validator:
         def rc_priority_fn(synapse: template.protocol.ValidatorCheckpoint) -> float:
             return Validator.priority_fn(synapse, self.metagraph)
 
+        # Each synapse method gets its own bounded worker pool so heavy dashboard/checkpoint requests can't delay signals
+        self.synapse_scheduler = SynapseScheduler()
+        self.synapse_scheduler.add_method(SynapseMethod.SIGNAL, ValiConfig.SIGNAL_MAX_WORKERS,
+                                          ValiConfig.SIGNAL_MAX_QUEUE_DEPTH)
+        self.synapse_scheduler.add_method(SynapseMethod.POSITION_INSPECTOR, ValiConfig.POSITION_INSPECTOR_MAX_WORKERS,
+                                          ValiConfig.POSITION_INSPECTOR_MAX_QUEUE_DEPTH)
+        self.synapse_scheduler.add_method(SynapseMethod.DASHBOARD, ValiConfig.DASHBOARD_MAX_WORKERS,
+                                          ValiConfig.DASHBOARD_MAX_QUEUE_DEPTH)
+        self.synapse_scheduler.add_method(SynapseMethod.CHECKPOINT, ValiConfig.CHECKPOINT_MAX_WORKERS,
+                                          ValiConfig.CHECKPOINT_MAX_QUEUE_DEPTH)
+        self.last_synapse_stats_log_ms = 0
+
         self.axon.attach(
-            forward_fn=self.receive_signal,
+            forward_fn=self.synapse_scheduler.wrap(SynapseMethod.SIGNAL, self.receive_signal),
             blacklist_fn=rs_blacklist_fn,
             priority_fn=rs_priority_fn,
         )
         self.axon.attach(
-            forward_fn=self.get_positions,
+            forward_fn=self.synapse_scheduler.wrap(SynapseMethod.POSITION_INSPECTOR, self.get_positions),
             blacklist_fn=gp_blacklist_fn,
             priority_fn=gp_priority_fn,
         )
         self.axon.attach(
-            forward_fn=self.get_data,
+            forward_fn=self.synapse_scheduler.wrap(SynapseMethod.DASHBOARD, self.get_data),
             blacklist_fn=gd_blacklist_fn,
             priority_fn=gd_priority_fn,
         )
         self.axon.attach(
-            forward_fn=self.receive_checkpoint,
+            forward_fn=self.synapse_scheduler.wrap(SynapseMethod.CHECKPOINT, self.receive_checkpoint),
             blacklist_fn=rc_blacklist_fn,
             priority_fn=rc_priority_fn,
         )
@@ -319,7 +335,8 @@ class Validator:
         self.weight_setter = SubtensorWeightSetter(self.config, self.metagraph, position_manager=self.position_manager)
 
         self.request_core_manager = RequestCoreManager(self.position_manager, self.weight_setter, self.plagiarism_detector)
-        self.miner_statistics_manager = MinerStatisticsManager(self.position_manager, self.weight_setter, self.plagiarism_detector)
+        self.miner_statistics_manager = MinerStatisticsManager(self.position_manager, self.weight_setter, self.plagiarism_detector,
+                                                               ipc_manager=self.ipc_manager)
 
         # Start the perf ledger updater loop in its own process. Make sure it happens after the position manager has chances to make any fixes
 
@@ -457,6 +474,7 @@ class Validator:
         bt.logging.warning("Performing graceful exit...")
         bt.logging.warning("Stopping axon...")
         self.axon.stop()
+        self.synapse_scheduler.shutdown()
         bt.logging.warning("Stopping metagrpah update...")
         self.metagraph_updater_thread.join()
         bt.logging.warning("Stopping live price fetcher...")
@@ -484,12 +502,12 @@ class Validator:
 
                 #print(f'@@@ {len(self.metagraph.hotkeys)} self.hktp {len(self.position_manager.hotkey_to_positions)} self.hktpl {self.perf_ledger_manager.hotkey_to_perf_ledger} self.elims {len(self.elimination_manager.get_eliminations_from_memory())}')
                 current_time = TimeUtil.now_in_millis()
-                self.mdd_checker.mdd_check()
+                self.mdd_checker.mdd_check(self.position_locks)
                 self.challengeperiod_manager.refresh(current_time=current_time)
                 self.elimination_manager.process_eliminations(self.position_locks)
                 self.weight_setter.set_weights(self.wallet, self.config.netuid, self.subtensor, current_time=current_time)
-                self.position_locks.cleanup_locks(self.metagraph.hotkeys)
                 self.p2p_syncer.sync_positions_with_cooldown()
+                self.log_synapse_stats_with_cooldown(current_time)
 
             # In case of unforeseen errors, the miner will log the error and continue operations.
             except Exception:
@@ -498,6 +516,12 @@ class Validator:
 
         self.check_shutdown()
 
+    def log_synapse_stats_with_cooldown(self, current_time_ms: int):
+        if current_time_ms - self.last_synapse_stats_log_ms < ValiConfig.SYNAPSE_STATS_LOG_INTERVAL_MS:
+            return
+        self.last_synapse_stats_log_ms = current_time_ms
+        bt.logging.info(f"Synapse scheduler stats: {json.dumps(self.synapse_scheduler.get_stats())}")
+
     def parse_trade_pair_from_signal(self, signal) -> TradePair | None:
         if not signal or not isinstance(signal, dict):
             return None
@@ -783,6 +807,9 @@ class Validator:
             hotkey = synapse.dendrite.hotkey
             # Return the last n positions
             positions = self.position_manager.get_positions_for_one_hotkey(hotkey, only_open_positions=True)
+            if synapse.version >= 2:
+                synapse.position_digests, positions = PositionDigest.positions_to_send(
+                    positions, synapse.known_position_digests)
             synapse.positions = [position.to_dict() for position in positions]
             n_positions_sent = len(synapse.positions)
         except Exception as e:
@@ -806,10 +833,16 @@ class Validator:
         if self.should_fail_early(synapse, SynapseMethod.DASHBOARD):
             return synapse
 
+        t0 = time.time()
         miner_hotkey = synapse.dendrite.hotkey
         error_message = ""
+        stats_cached = False
         try:
-            stats = self.miner_statistics_manager.generate_miner_statistics_data(time_now=TimeUtil.now_in_millis(), checkpoints=True, selected_miner_hotkeys=[miner_hotkey])
+            # Served from the last statistics generation cycle. Only computed here if no cycle has completed yet.
+            stats = self.miner_statistics_manager.get_cached_miner_statistics(miner_hotkey)
+            stats_cached = stats is not None
+            if not stats_cached:
+                stats = self.miner_statistics_manager.generate_miner_statistics_data(time_now=TimeUtil.now_in_millis(), checkpoints=True, selected_miner_hotkeys=[miner_hotkey])
             positions = self.request_core_manager.generate_request_core(time_now=TimeUtil.now_in_millis(), selected_miner_hotkeys=[miner_hotkey])
             dash_data = {"statistics": stats, **positions}
 
@@ -819,7 +852,8 @@ class Validator:
                 error_message = f"Validator {self.wallet.hotkey.ss58_address} has no positions for miner {miner_hotkey}"
 
             synapse.data = dash_data
-            bt.logging.info("Sending data back to miner: " + miner_hotkey)
+            bt.logging.info(f"Sending data back to miner: {miner_hotkey} in {round(time.time() - t0, 3)} seconds. "
+                            f"Statistics cached: {stats_cached}")
         except Exception as e:
             error_message = f"Error in GetData for [{miner_hotkey}] with error [{e}]."
             bt.logging.error(traceback.format_exc())
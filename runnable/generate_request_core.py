@@ -12,7 +12,6 @@ from vali_objects.utils.challengeperiod_manager import ChallengePeriodManager
 from vali_objects.utils.elimination_manager import EliminationManager
 from vali_objects.utils.plagiarism_detector import PlagiarismDetector
 from vali_objects.vali_config import ValiConfig
-from vali_objects.decoders.generalized_json_decoder import GeneralizedJSONDecoder
 from vali_objects.position import Position
 from vali_objects.utils.position_manager import PositionManager
 from vali_objects.utils.vali_bkp_utils import ValiBkpUtils, CustomEncoder
@@ -47,7 +46,7 @@ class RequestCoreManager:
 
     def filter_new_positions_random_sample(self, percent_new_positions_keep: float, hotkey_to_positions: dict[str:[dict]], time_of_position_read_ms:int) -> None:
         """
-        candidate_data['positions'][hk]['positions'] = [json.loads(str(p), cls=GeneralizedJSONDecoder) for p in positions_orig]
+        candidate_data['positions'][hk]['positions'] = [p.to_json_dict() for p in positions_orig]
         """
         def filter_orders(p: Position) -> bool:
             nonlocal stale_date_threshold_ms
@@ -81,7 +80,7 @@ class RequestCoreManager:
         stale_date_threshold_ms = time_of_position_read_ms - AUTO_SYNC_ORDER_LAG_MS
         for hotkey, positions in hotkey_to_positions.items():
             new_positions = []
-            positions_deserialized = [Position(**json_positions_dict) for json_positions_dict in positions['positions']]
+            positions_deserialized = [Position.from_trusted_dict(json_positions_dict) for json_positions_dict in positions['positions']]
             for position in positions_deserialized:
                 if filter_orders(position):
                     truncated_position = truncate_position(position)
@@ -91,7 +90,7 @@ class RequestCoreManager:
                     new_positions.append(position)
 
             # Turn the positions back into json dicts. Note we are overwriting the original positions
-            positions['positions'] = [json.loads(str(p), cls=GeneralizedJSONDecoder) for p in new_positions]
+            positions['positions'] = [p.to_json_dict() for p in new_positions]
 
     def compress_dict(self, data: dict) -> bytes:
         str_to_write = json.dumps(data, cls=CustomEncoder)
@@ -230,9 +229,7 @@ class RequestCoreManager:
 
                 self.position_manager.strip_old_price_sources(p, time_now)
 
-                dict_hotkey_position_map[k]["positions"].append(
-                    json.loads(str(p), cls=GeneralizedJSONDecoder)
-                )
+                dict_hotkey_position_map[k]["positions"].append(p.to_json_dict())
 
         ord_dict_hotkey_position_map = dict(
             sorted(
@@ -15,7 +15,7 @@ from vali_objects.vali_config import ValiConfig
 from vali_objects.utils.vali_bkp_utils import ValiBkpUtils
 from vali_objects.utils.subtensor_weight_setter import SubtensorWeightSetter
 from vali_objects.utils.position_utils import PositionUtils
-from vali_objects.utils.position_penalties import PositionPenalties
+from vali_objects.utils.position_penalties import PositionPenalties, PositionColumns
 from vali_objects.utils.position_filtering import PositionFiltering
 from vali_objects.utils.ledger_utils import LedgerUtils
 from vali_objects.scoring.scoring import Scoring
@@ -25,13 +25,21 @@ from vali_objects.vali_dataclasses.perf_ledger import PerfLedgerManager
 
 class MinerStatisticsManager:
 
-    def __init__(self, position_manager, subtensor_weight_setter, plagiarism_detector):
+    def __init__(self, position_manager, subtensor_weight_setter, plagiarism_detector, ipc_manager=None):
         self.position_manager = position_manager
         self.perf_ledger_manager = position_manager.perf_ledger_manager
         self.elimination_manager = position_manager.elimination_manager
         self.challengeperiod_manager = position_manager.challengeperiod_manager
         self.subtensor_weight_setter = subtensor_weight_setter
         self.plagiarism_detector = plagiarism_detector
+        # Per-hotkey statistics from the most recent full generation cycle. Shared with the validator process so
+        # dashboard requests don't need to recompute the whole network's statistics.
+        if ipc_manager:
+            self.miner_statistics_cache = ipc_manager.dict()  # {hotkey: miner_data}
+            self.miner_statistics_cache_meta = ipc_manager.dict()  # {version, created_timestamp_ms, created_date, constants}
+        else:
+            self.miner_statistics_cache = {}
+            self.miner_statistics_cache_meta = {}
 
     def rank_dictionary(self, d, ascending=False):
         """
@@ -278,9 +286,10 @@ class MinerStatisticsManager:
             statistical_confidence_dict[hotkey] = Metrics.statistical_confidence(miner_returns, bypass_confidence=True)
             concentration_dict[hotkey] = Metrics.concentration(miner_returns, positions=miner_lookback_positions)
 
-            # Positional penalties
-            miner_martingale_scores[hotkey] = PositionPenalties.martingale_score(miner_lookback_positions)
-            miner_martingale_penalties[hotkey] = PositionPenalties.martingale_penalty(miner_lookback_positions)
+            # Positional penalties. Positions are extracted to columns once and shared by all of the penalties.
+            miner_position_columns = PositionColumns(miner_lookback_positions)
+            miner_martingale_scores[hotkey] = PositionPenalties.martingale_score(miner_position_columns)
+            miner_martingale_penalties[hotkey] = PositionPenalties.martingale_penalty(miner_position_columns)
 
             short_return_dict[hotkey] = Metrics.base_return(short_term_miner_returns)
             return_dict[hotkey] = Metrics.base_return(miner_returns)
@@ -315,11 +324,11 @@ class MinerStatisticsManager:
             max_drawdown_threshold_penalties[hotkey] = LedgerUtils.max_drawdown_threshold_penalty(miner_checkpoints)
 
             # Positional consistency ratios
-            positional_realized_returns_ratios[hotkey] = PositionPenalties.returns_ratio(miner_lookback_positions)
-            positional_realized_returns_penalties[hotkey] = PositionPenalties.returns_ratio_penalty(miner_lookback_positions)
+            positional_realized_returns_ratios[hotkey] = PositionPenalties.returns_ratio(miner_position_columns)
+            positional_realized_returns_penalties[hotkey] = PositionPenalties.returns_ratio_penalty(miner_position_columns)
 
-            positional_return_time_consistency_ratios[hotkey] = PositionPenalties.time_consistency_ratio(miner_lookback_positions)
-            positional_return_time_consistency_penalty = PositionPenalties.time_consistency_penalty(miner_lookback_positions)
+            positional_return_time_consistency_ratios[hotkey] = PositionPenalties.time_consistency_ratio(miner_position_columns)
+            positional_return_time_consistency_penalty = PositionPenalties.time_consistency_penalty(miner_position_columns)
             positional_return_time_consistency_penalties[hotkey] = positional_return_time_consistency_penalty
 
             # Now for the ledger statistics
@@ -334,9 +343,10 @@ class MinerStatisticsManager:
         # Cumulative ledger, for printing
         cumulative_return_ledger = LedgerUtils.cumulative(filtered_ledger)
 
-        # This is when we only want to look at the successful miners
-        successful_ledger = self.subtensor_weight_setter.filtered_ledger(hotkeys=challengeperiod_success_hotkeys)
-        successful_positions = self.subtensor_weight_setter.filtered_positions(hotkeys=challengeperiod_success_hotkeys)
+        # This is when we only want to look at the successful miners. They are a subset of all miners filtered above.
+        challengeperiod_success_hotkeys_set = set(challengeperiod_success_hotkeys)
+        successful_ledger = {hotkey: ledger for hotkey, ledger in filtered_ledger.items() if hotkey in challengeperiod_success_hotkeys_set}
+        successful_positions = {hotkey: positions for hotkey, positions in filtered_positions.items() if hotkey in challengeperiod_success_hotkeys_set}
 
         # successful_ledger, successful_positions = subtensor_weight_setter.sync_ledger_positions(
         #     successful_ledger,
@@ -664,9 +674,33 @@ class MinerStatisticsManager:
         return final_dict
 
 
+    def update_miner_statistics_cache(self, final_dict: dict):
+        """
+        Store each miner's entry of a full generation cycle so it can be served without recomputing.
+        """
+        hotkey_to_miner_data = {miner_data["hotkey"]: miner_data for miner_data in final_dict["data"]}
+        stale_hotkeys = [hotkey for hotkey in self.miner_statistics_cache.keys() if hotkey not in hotkey_to_miner_data]
+
+        self.miner_statistics_cache.update(hotkey_to_miner_data)
+        for hotkey in stale_hotkeys:
+            self.miner_statistics_cache.pop(hotkey, None)
+        self.miner_statistics_cache_meta.update({k: v for k, v in final_dict.items() if k != "data"})
+
+    def get_cached_miner_statistics(self, hotkey: str) -> dict | None:
+        """
+        Returns the statistics for one hotkey in the same format as
+        generate_miner_statistics_data(selected_miner_hotkeys=[hotkey]), or None if no cycle has completed yet.
+        """
+        meta = dict(self.miner_statistics_cache_meta)
+        if not meta:
+            return None
+        miner_data = self.miner_statistics_cache.get(hotkey)
+        return {**meta, "data": [miner_data] if miner_data is not None else []}
+
     def generate_request_minerstatistics(self, time_now: int, checkpoints: bool = True):
 
         final_dict = self.generate_miner_statistics_data(time_now, checkpoints)
+        self.update_miner_statistics_cache(final_dict)
 
         output_file_path = ValiBkpUtils.get_vali_outputs_dir() + "minerstatistics.json"
         ValiBkpUtils.write_file(
@@ -2,6 +2,7 @@
 import os
 import datetime
 
+from shared_objects.metagraph_snapshot import MetagraphSnapshot
 from time_util.time_util import TimeUtil
 from vali_objects.vali_config import ValiConfig
 from vali_objects.utils.vali_bkp_utils import ValiBkpUtils
@@ -21,6 +22,7 @@ class CacheController:
         self.init_cache_files()
         self.metagraph = metagraph  # Refreshes happen on validator
         self._last_update_time_ms = 0
+        self._metagraph_snapshot = None
         self.DD_V2_TIME = TimeUtil.millis_to_datetime(1715359820000 + 1000 * 60 * 60 * 2)  # 5/10/24 TODO: Update before mainnet release
 
     def get_last_update_time_ms(self):
@@ -35,6 +37,18 @@ class CacheController:
         if not skip_message:
             bt.logging.success(f"Finished updating class {self.__class__.__name__} in {delta_time_s_formatted_3_decimals} seconds.")
 
+    def get_metagraph_snapshot(self) -> MetagraphSnapshot:
+        """
+        Returns the latest published metagraph snapshot. The snapshot is only fetched again when the version
+        changes. Metagraphs without a published snapshot (miners, unit tests) are snapshotted on every call.
+        """
+        version = getattr(self.metagraph, 'snapshot_version', None)
+        if version is None:
+            return MetagraphSnapshot.from_metagraph(self.metagraph)
+        if self._metagraph_snapshot is None or self._metagraph_snapshot.version != version:
+            self._metagraph_snapshot = self.metagraph.snapshot
+        return self._metagraph_snapshot
+
     @staticmethod
     def get_directory_names(query_dir):
         """
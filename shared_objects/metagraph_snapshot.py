@@ -0,0 +1,61 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+
+import numpy as np
+
+
+class MetagraphSnapshot:
+    """
+    Immutable, versioned copy of the metagraph fields that validator processes read on hot paths.
+
+    The metagraph updater publishes a new snapshot into the shared metagraph namespace whenever the metagraph changes.
+    Readers fetch the whole snapshot in a single IPC round trip and keep it until the version changes, instead of
+    paying a round trip for every element access on the manager list proxies.
+    """
+    __slots__ = ('version', 'hotkeys', 'uids', 'hotkey_to_uid', 'stake', 'trust', 'validator_trust', 'incentive')
+
+    def __init__(self, version, hotkeys, uids=None, stake=None, trust=None, validator_trust=None, incentive=None):
+        hotkeys = tuple(hotkeys)
+        # Metagraphs without uids (e.g. test mocks) are indexed by position, the same as hotkeys.index()
+        uids = tuple(int(x) for x in uids) if uids is not None and len(uids) == len(hotkeys) else tuple(range(len(hotkeys)))
+        hotkey_to_uid = {}
+        for hotkey, uid in zip(hotkeys, uids):
+            hotkey_to_uid.setdefault(hotkey, uid)
+
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'hotkeys', hotkeys)
+        object.__setattr__(self, 'uids', uids)
+        object.__setattr__(self, 'hotkey_to_uid', hotkey_to_uid)
+        for name, values in (('stake', stake), ('trust', trust), ('validator_trust', validator_trust),
+                             ('incentive', incentive)):
+            arr = np.array(values if values is not None else [], dtype=np.float64)
+            arr.flags.writeable = False
+            object.__setattr__(self, name, arr)
+
+    @classmethod
+    def from_metagraph(cls, metagraph, version=None):
+        return cls(version, metagraph.hotkeys, uids=getattr(metagraph, 'uids', None),
+                   stake=getattr(metagraph, 'stake', None), trust=getattr(metagraph, 'trust', None),
+                   validator_trust=getattr(metagraph, 'validator_trust', None),
+                   incentive=getattr(metagraph, 'incentive', None))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    def __reduce__(self):
+        return (self.__class__, (self.version, self.hotkeys, self.uids, self.stake, self.trust,
+                                 self.validator_trust, self.incentive))
+
+    def __contains__(self, hotkey):
+        return hotkey in self.hotkey_to_uid
+
+    def __len__(self):
+        return len(self.hotkeys)
+
+    def get_uid(self, hotkey):
+        return self.hotkey_to_uid.get(hotkey)
+
+    def same_contents(self, other) -> bool:
+        return (other is not None and self.hotkeys == other.hotkeys and self.uids == other.uids and
+                all(np.array_equal(getattr(self, name), getattr(other, name))
+                    for name in ('stake', 'trust', 'validator_trust', 'incentive')))
@@ -6,6 +6,7 @@ import traceback
 
 from vali_objects.vali_config import ValiConfig
 from shared_objects.cache_controller import CacheController
+from shared_objects.metagraph_snapshot import MetagraphSnapshot
 
 import bittensor as bt
 
@@ -88,22 +89,34 @@ class MetagraphUpdater(CacheController):
             shared_list.extend(updated_list)
             return
 
-        # Convert to sets for fast comparison
-        current_set = set(shared_list)
-        updated_set = set(updated_list)
-
-        # Find items to remove (in current but not in updated)
-        items_to_remove = current_set - updated_set
-        # Find items to add (in updated but not in current)
-        items_to_add = updated_set - current_set
-
-        # Remove items no longer present
-        for item in items_to_remove:
-            shared_list.remove(item)
-
-        # Add new items
-        for item in items_to_add:
-            shared_list.append(item)
+        # Positional diff so that index i keeps lining up with uid i. Only the slots that changed are written, and the
+        # current contents are fetched with a single slice instead of one round trip per element.
+        updated_list = list(updated_list)
+        current_list = shared_list[:]
+        n_updated = len(updated_list)
+        for i in range(min(len(current_list), n_updated)):
+            if current_list[i] != updated_list[i]:
+                shared_list[i] = updated_list[i]
+
+        if len(current_list) > n_updated:
+            del shared_list[n_updated:]
+        elif len(current_list) < n_updated:
+            shared_list.extend(updated_list[len(current_list):])
+
+    def publish_metagraph_snapshot(self, metagraph_clone):
+        """
+        Publish an immutable snapshot of the metagraph for the other processes. The version only changes when the
+        contents do, so readers keep their cached copy across no-op updates.
+        """
+        prev_snapshot = self._metagraph_snapshot
+        version = prev_snapshot.version + 1 if prev_snapshot and prev_snapshot.version is not None else 1
+        snapshot = MetagraphSnapshot.from_metagraph(metagraph_clone, version=version)
+        if snapshot.same_contents(prev_snapshot):
+            return
+        # Write the snapshot before the version so a reader that sees the new version always gets the new snapshot
+        self.metagraph.snapshot = snapshot
+        self.metagraph.snapshot_version = snapshot.version
+        self._metagraph_snapshot = snapshot
 
     def update_metagraph(self):
         if not self.refresh_allowed(ValiConfig.METAGRAPH_UPDATE_REFRESH_TIME_MS):
@@ -119,7 +132,7 @@ class MetagraphUpdater(CacheController):
             else:
                 recently_acked_miners = []
 
-        hotkeys_before = set(self.metagraph.hotkeys)
+        hotkeys_before = set(self.get_metagraph_snapshot().hotkeys)
         metagraph_clone = self.subtensor.metagraph(self.config.netuid)
         assert hasattr(metagraph_clone, 'hotkeys'), "Metagraph clone does not have hotkeys attribute"
         bt.logging.info("Updating metagraph...")
@@ -144,6 +157,7 @@ class MetagraphUpdater(CacheController):
             self.sync_lists(self.metagraph.neurons, list(metagraph_clone.neurons), brute_force=True)
             self.sync_lists(self.metagraph.uids, metagraph_clone.uids)
             self.sync_lists(self.metagraph.hotkeys, metagraph_clone.hotkeys)
+            self.publish_metagraph_snapshot(metagraph_clone)
 
         if recently_acked_miners:
             self.update_likely_miners(recently_acked_miners)
@@ -1,52 +1,76 @@
 # developer: jbonilla
 # Copyright © 2024 Taoshi Inc
 
+import threading
 import time
 
 class RateLimiter:
-    def __init__(self, max_requests_per_window=10, rate_limit_window_duration_seconds=60):
+    def __init__(self, max_requests_per_window=10, rate_limit_window_duration_seconds=60, ipc_manager=None):
         """
         Initializes the Rate Limiter with configurable limits and window sizes.
 
         Parameters:
         - max_requests_per_window: The maximum number of requests a miner is allowed to make in a given time window.
         - rate_limit_window_duration_seconds: The duration of the rate limiting window in seconds.
+        - ipc_manager: Optional multiprocessing manager. When provided, the request history and lock live in the
+          manager so that every process holding this limiter enforces the same budget.
 
-        The rate limiter uses a sliding window mechanism to determine whether new requests from miners are allowed
-        based on their request history within the current window.
+        The rate limiter uses the generic cell rate algorithm (GCRA), a token bucket that stores a single timestamp per
+        miner. A miner that has been idle may burst up to max_requests_per_window requests and is then held to one
+        request per emission interval (window / max_requests). Unlike a fixed window counter, a full burst at the end of
+        one window cannot be followed by a second full burst at the start of the next.
         """
         self.max_requests_per_window = max_requests_per_window
         self.rate_limit_window_duration_seconds = rate_limit_window_duration_seconds
-        # A dictionary to track the request history for each miner. The key is the miner's hotkey, and the value is a tuple
-        # containing the start timestamp of the current rate limit window and the number of requests made in this window.
-        self.requests_history = {}
+        self.emission_interval_seconds = rate_limit_window_duration_seconds / max_requests_per_window
+        self.burst_tolerance_seconds = rate_limit_window_duration_seconds - self.emission_interval_seconds
+        # A dictionary mapping each miner's hotkey to its theoretical arrival time (TAT): the time at which the miner
+        # will have its full burst available again. A TAT in the past is equivalent to a miner we have never seen, so
+        # those entries are evicted periodically to keep memory bounded by the number of recently active hotkeys.
+        if ipc_manager:
+            self.requests_history = ipc_manager.dict()
+            self.lock = ipc_manager.Lock()
+        else:
+            self.requests_history = {}
+            self.lock = threading.Lock()
+        self.last_eviction_time_s = 0
 
-    def is_allowed(self, miner_hotkey):
+    def is_allowed(self, miner_hotkey, current_time_s=None):
         """
         Evaluates if a request from the specified miner is allowed under the current rate limit policy.
 
         Parameters:
         - miner_hotkey: Unique identifier for the miner making the request.
+        - current_time_s: Time of the request. Defaults to now.
 
         Returns:
         - A tuple (is_request_allowed: bool, wait_time_seconds: float), where:
           - is_request_allowed indicates if the miner's request is within the rate limit.
           - wait_time_seconds is the time the miner should wait before making another request if the rate limit is exceeded.
         """
-        current_time_s = time.time()
-        window_start_timestamp, request_count = self.requests_history.get(miner_hotkey, (0, 0))
+        if current_time_s is None:
+            current_time_s = time.time()
 
-        # Determine if the current request is within the rate limit window.
-        if current_time_s - window_start_timestamp > self.rate_limit_window_duration_seconds:
-            # If outside the window, reset the count for this miner.
-            self.requests_history[miner_hotkey] = (current_time_s, 1)
-            return True, 0.0
+        with self.lock:
+            if current_time_s - self.last_eviction_time_s >= self.rate_limit_window_duration_seconds:
+                self._evict_idle_hotkeys(current_time_s)
+
+            tat = self.requests_history.get(miner_hotkey, current_time_s)
+            if tat < current_time_s:
+                tat = current_time_s
+
+            wait_time_seconds = tat - current_time_s - self.burst_tolerance_seconds
+            if wait_time_seconds > 0:
+                return False, wait_time_seconds
 
-        if request_count < self.max_requests_per_window:
-            # If within limits, increment the request count and allow the request.
-            self.requests_history[miner_hotkey] = (window_start_timestamp, request_count + 1)
+            self.requests_history[miner_hotkey] = tat + self.emission_interval_seconds
             return True, 0.0
-        else:
-            # If limit is exceeded, calculate the remaining wait time.
-            wait_time_seconds = self.rate_limit_window_duration_seconds - (current_time_s - window_start_timestamp)
-            return False, wait_time_seconds
+
+    def _evict_idle_hotkeys(self, current_time_s):
+        """
+        Drops hotkeys whose full burst is available again. Must be called with the lock held.
+        """
+        idle_hotkeys = [k for k, tat in self.requests_history.items() if tat <= current_time_s]
+        for k in idle_hotkeys:
+            del self.requests_history[k]
+        self.last_eviction_time_s = current_time_s
@@ -5,6 +5,9 @@ def get_ipc_metagraph(manager: Manager):
     metagraph.neurons = manager.list()
     metagraph.hotkeys = manager.list()
     metagraph.uids = manager.list()
+    # Versioned MetagraphSnapshot published by the MetagraphUpdater
+    metagraph.snapshot = None
+    metagraph.snapshot_version = None
     return metagraph
 
 def managerize_objects(cls, manager, obj_dict) -> None:
@@ -24,6 +27,8 @@ def managerize_objects(cls, manager, obj_dict) -> None:
             temp.neurons = manager.list()
             temp.hotkeys = manager.list()
             temp.uids = manager.list()
+            temp.snapshot = None
+            temp.snapshot_version = None
             return temp
 
         # Managerize dictionaries
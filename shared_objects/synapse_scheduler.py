@@ -0,0 +1,124 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+
+import asyncio
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. Each bucket counts observations less than or equal to its upper bound in seconds.
+    """
+    BUCKET_BOUNDS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bucket_counts = [0] * (len(self.BUCKET_BOUNDS_S) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum_s = 0.0
+
+    def observe(self, value_s: float):
+        idx = bisect.bisect_left(self.BUCKET_BOUNDS_S, value_s)
+        with self.lock:
+            self.bucket_counts[idx] += 1
+            self.count += 1
+            self.sum_s += value_s
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            buckets = {f"le_{bound}": self.bucket_counts[i] for i, bound in enumerate(self.BUCKET_BOUNDS_S)}
+            buckets["le_inf"] = self.bucket_counts[-1]
+            return {"buckets": buckets, "count": self.count, "sum_s": round(self.sum_s, 6)}
+
+
+class BoundedSynapseExecutor:
+    """
+    Worker pool dedicated to one synapse method. At most max_workers requests run at once and at most
+    max_queue_depth more wait for a worker. Anything beyond that is rejected without being queued.
+    """
+    def __init__(self, name: str, max_workers: int, max_queue_depth: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"synapse_{name}")
+        self.lock = threading.Lock()
+        self.n_admitted = 0  # running + queued
+        self.n_rejected = 0
+        self.queue_time_histogram = LatencyHistogram()
+        self.service_time_histogram = LatencyHistogram()
+
+    def try_admit(self) -> bool:
+        with self.lock:
+            if self.n_admitted >= self.max_workers + self.max_queue_depth:
+                self.n_rejected += 1
+                return False
+            self.n_admitted += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.n_admitted -= 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            n_admitted, n_rejected = self.n_admitted, self.n_rejected
+        return {"in_flight": n_admitted,
+                "rejected": n_rejected,
+                "queue_time_s": self.queue_time_histogram.to_dict(),
+                "service_time_s": self.service_time_histogram.to_dict()}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SynapseScheduler:
+    """
+    Serves each synapse method from its own bounded executor so that a slow method (e.g. dashboard or checkpoint
+    requests) cannot occupy the workers of another (e.g. order intake). Forward functions wrapped by the scheduler
+    are coroutines, so the axon awaits them instead of running them on its event loop.
+    """
+    def __init__(self):
+        self.executors = {}
+
+    def add_method(self, method, max_workers: int, max_queue_depth: int):
+        name = getattr(method, "value", str(method))
+        self.executors[method] = BoundedSynapseExecutor(name, max_workers, max_queue_depth)
+
+    def wrap(self, method, forward_fn):
+        executor = self.executors[method]
+
+        @wraps(forward_fn)
+        async def scheduled_forward_fn(synapse):
+            if not executor.try_admit():
+                synapse.successfully_processed = False
+                synapse.error_message = (f"Validator is at capacity for {executor.name} requests. "
+                                         f"Please try again later.")
+                return synapse
+
+            t_enqueued = time.time()
+
+            def run():
+                t_started = time.time()
+                executor.queue_time_histogram.observe(t_started - t_enqueued)
+                try:
+                    return forward_fn(synapse)
+                finally:
+                    executor.service_time_histogram.observe(time.time() - t_started)
+
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor.pool, run)
+            finally:
+                executor.release()
+
+        return scheduled_forward_fn
+
+    def get_stats(self) -> dict:
+        return {executor.name: executor.get_stats() for executor in self.executors.values()}
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown()
@@ -3,13 +3,27 @@
 # developer: Taoshidev
 # Copyright © 2024 Taoshi Inc
 
+import functools
 import typing
 import bittensor as bt
 from pydantic import Field
 
 from typing import List
 
-class SendSignal(bt.Synapse):
+class CachedSchemaSynapse(bt.Synapse):
+    """
+    bt.Synapse.to_headers looks up the required fields once per field, and every lookup regenerates the model's JSON
+    schema. The schema only depends on the class, so it is computed once per class instead of on every request.
+    """
+    @classmethod
+    @functools.cache
+    def required_fields(cls):
+        return tuple(cls.model_json_schema().get("required", []))
+
+    def get_required_fields(self):
+        return list(self.required_fields())
+
+class SendSignal(CachedSchemaSynapse):
     signal: typing.Dict = Field(default_factory=dict, title="Signal", frozen=False)
     successfully_processed: bool = Field(False, title="Successfully Processed", frozen=False)
     error_message: str = Field("", title="Error Message", frozen=False)
@@ -18,16 +32,20 @@ class SendSignal(bt.Synapse):
     computed_body_hash: str = Field("", title="Computed Body Hash", frozen=False)
 SendSignal.required_hash_fields = ["signal"]
 
-class GetPositions(bt.Synapse):
+class GetPositions(CachedSchemaSynapse):
     positions: List[typing.Dict] = Field(default_factory=list, title="Positions", frozen=False)
     successfully_processed: bool = Field(False, title="Successfully Processed", frozen=False)
     error_message: str = Field("", title="Error Message", frozen=False)
     computed_body_hash: str = Field("", title="Computed Body Hash", frozen=False)
     version: int = Field(0, title="Version", frozen=False)
+    # Version 2: the miner sends the trade pair digests it already has and the validator only returns positions for
+    # trade pairs whose digest changed, along with the digests of all its trade pairs.
+    known_position_digests: typing.Dict[str, List[str]] = Field(default_factory=dict, title="Known Position Digests", frozen=False)
+    position_digests: typing.Dict[str, str] = Field(default_factory=dict, title="Position Digests", frozen=False)
 
 GetPositions.required_hash_fields = ["positions"]
 
-class ValidatorCheckpoint(bt.Synapse):
+class ValidatorCheckpoint(CachedSchemaSynapse):
     checkpoint: str = Field("", title="Checkpoint", frozen=False)
     successfully_processed: bool = Field(False, title="Successfully Processed", frozen=False)
     error_message: str = Field("", title="Error Message", frozen=False)
@@ -35,7 +53,7 @@ class ValidatorCheckpoint(bt.Synapse):
     computed_body_hash: str = Field("", title="Computed Body Hash", frozen=False)
 ValidatorCheckpoint.required_hash_fields = ["checkpoint"]
 
-class GetDashData(bt.Synapse):
+class GetDashData(CachedSchemaSynapse):
     data: typing.Dict = Field(default_factory=dict, title="Dashboard Data", frozen=False)
     successfully_processed: bool = Field(False, title="Successfully Processed", frozen=False)
     error_message: str = Field("", title="Error Message", frozen=False)
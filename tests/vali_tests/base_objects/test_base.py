@@ -5,6 +5,14 @@ import os
 import unittest
 
 
+def benchmark(test):
+    """
+    Marks a test that times an optimization against the code it replaced. These are slow and their timings depend on
+    the machine, so they only run when RUN_BENCHMARKS is set. Equivalence is covered by the regular tests.
+    """
+    return unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")(test)
+
+
 class TestBase(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -9,6 +9,7 @@ from vali_objects.vali_config import TradePair
 from vali_objects.decoders.generalized_json_decoder import GeneralizedJSONDecoder
 from vali_objects.enums.order_type_enum import OrderType
 from vali_objects.position import Position
+from vali_objects.utils.position_lock import PositionLocks
 from vali_objects.utils.position_manager import PositionManager
 from vali_objects.utils.validator_sync_base import AUTO_SYNC_ORDER_LAG_MS
 from vali_objects.vali_dataclasses.order import Order
@@ -120,6 +121,54 @@ class TestPositions(TestBase):
         assert len(self.position_syncer.perf_ledger_hks_to_invalidate) == 1
         assert self.position_syncer.perf_ledger_hks_to_invalidate[self.DEFAULT_MINER_HOTKEY] == self.DEFAULT_OPEN_MS
 
+    def test_sync_with_position_locks_resolves_again_after_concurrent_order(self):
+        # The snapshot is taken before the miner's position was saved, simulating an order arriving mid-sync.
+        candidate_data = self.positions_to_candidate_data([self.default_position])
+        disk_positions = self.positions_to_disk_data([])
+        self.position_manager.save_miner_position(deepcopy(self.default_position))
+
+        self.position_syncer.sync_positions(shadow_mode=False, candidate_data=candidate_data, disk_positions=disk_positions,
+                                            position_locks=PositionLocks())
+        stats = self.position_syncer.global_stats
+        assert stats['n_trade_pairs_resolved_again'] == 1, stats
+        assert stats['n_miners_positions_inserted'] == 0, stats
+        assert stats['n_miners_positions_matched'] == 1, stats
+        assert stats['positions_inserted'] == 0, stats
+        assert stats['positions_matched'] == 1, stats
+        assert stats['orders_matched'] == 1, stats
+        assert len(self.position_syncer.perf_ledger_hks_to_invalidate) == 0
+        assert len(self.position_manager.get_positions_for_one_hotkey(self.DEFAULT_MINER_HOTKEY)) == 1
+
+        # Nothing changed since the snapshot, so the modifications are applied as resolved.
+        candidate_data = self.positions_to_candidate_data([self.default_position])
+        disk_positions = self.position_manager.get_positions_for_all_miners(sort_positions=True)
+        self.position_syncer.sync_positions(shadow_mode=False, candidate_data=candidate_data, disk_positions=disk_positions,
+                                            position_locks=PositionLocks())
+        stats = self.position_syncer.global_stats
+        assert stats['n_trade_pairs_resolved_again'] == 0, stats
+        assert stats['positions_matched'] == 1, stats
+
+        # A price correction keeps the orders but still invalidates the snapshot.
+        disk_positions = self.position_manager.get_positions_for_all_miners(sort_positions=True)
+        corrected_position = deepcopy(disk_positions[self.DEFAULT_MINER_HOTKEY][0])
+        corrected_position.orders[0].price *= 1.01
+        corrected_position.rebuild_position_with_updated_orders()
+        self.position_manager.save_miner_position(corrected_position)
+        # The candidate has an order the snapshot is missing
+        candidate_position = deepcopy(self.default_position)
+        candidate_position.orders.append(Order(price=1.1, processed_ms=self.DEFAULT_OPEN_MS + 1000, order_uuid='second_order',
+                                               trade_pair=self.DEFAULT_TRADE_PAIR, order_type=OrderType.LONG, leverage=0.1))
+        candidate_position.rebuild_position_with_updated_orders()
+        candidate_data = self.positions_to_candidate_data([candidate_position])
+        snapshot_dicts = [p.to_dict() for p in disk_positions[self.DEFAULT_MINER_HOTKEY]]
+        self.position_syncer.sync_positions(shadow_mode=False, candidate_data=candidate_data, disk_positions=disk_positions,
+                                            position_locks=PositionLocks())
+        stats = self.position_syncer.global_stats
+        assert stats['n_trade_pairs_resolved_again'] == 1, stats
+        assert stats['orders_inserted'] == 1, stats
+        # The stale snapshot was left untouched
+        assert [p.to_dict() for p in disk_positions[self.DEFAULT_MINER_HOTKEY]] == snapshot_dicts
+
     def test_position_deletion(self):
         dp1 = deepcopy(self.default_closed_position)
         dp1.position_uuid = 'to_delete'
@@ -801,5 +850,28 @@ class TestPositions(TestBase):
         assert len(self.position_syncer.perf_ledger_hks_to_invalidate) == 1
         assert self.position_syncer.perf_ledger_hks_to_invalidate[self.DEFAULT_MINER_HOTKEY] == order_to_insert.processed_ms
 
-
-
+    def test_order_heuristic_match_prefers_list_order_within_timebound(self):
+        existing_position = deepcopy(self.default_position)
+        e0 = deepcopy(self.default_order)
+        e0.order_uuid = "existing_0"
+        e0.processed_ms = self.default_order.processed_ms + 1000 * 60
+        e1 = deepcopy(self.default_order)
+        e1.order_uuid = "existing_1"
+        e2 = deepcopy(self.default_order)
+        e2.order_uuid = "existing_2"
+        e2.processed_ms = self.default_order.processed_ms + 1000 * 60 * 60
+        # Unsorted on purpose. Both e0 and e1 are within the timebound of the candidate.
+        existing_position.orders = [e2, e0, e1]
+
+        candidate_position = deepcopy(self.default_position)
+        c = deepcopy(self.default_order)
+        c.order_uuid = "candidate"
+        c.processed_ms = self.default_order.processed_ms + 1000 * 30
+        candidate_position.orders = [c]
+
+        hard_snap_cutoff_ms = self.default_order.processed_ms + 1000 * 60 * 60 * 2
+        orders, min_timestamp_of_change = self.position_syncer.sync_orders(existing_position, candidate_position,
+                                                                           self.DEFAULT_MINER_HOTKEY, self.DEFAULT_TRADE_PAIR,
+                                                                           hard_snap_cutoff_ms)
+        assert [o.order_uuid for o in orders] == ["existing_0"]
+        assert min_timestamp_of_change == e1.processed_ms
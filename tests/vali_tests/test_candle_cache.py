@@ -0,0 +1,288 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from data_generator.candle_cache import CandleCache, CandleSeries
+from data_generator.polygon_data_service import PolygonDataService, Agg
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.vali_config import TradePair
+
+DAY_START_MS = 1_700_006_400_000  # Midnight UTC
+TIMESPAN_TO_MS = {'second': 1000, 'minute': 1000 * 60, 'hour': 1000 * 60 * 60, 'day': 1000 * 60 * 60 * 24}
+
+
+def candle(t_ms, price=1.0):
+    return SimpleNamespace(timestamp=t_ms, close=price)
+
+
+class StubPolygonClient:
+    """
+    Deterministic aggs and forex quotes for any window. Counts requests the way they would be billed.
+    """
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.n_requests = 0
+        self.n_candles = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def price(ticker, t_ms):
+        return 100 + len(ticker) + (t_ms // 1000 * 7919 % 1000) / 1000
+
+    def count(self, n_candles):
+        with self.lock:
+            self.n_requests += 1
+            self.n_candles += n_candles
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def list_aggs(self, ticker, multiplier, timespan, from_, to, limit):
+        step_ms = TIMESPAN_TO_MS[timespan]
+        ans = []
+        for t_ms in range(-(-from_ // step_ms) * step_ms, to + 1, step_ms):
+            # Some seconds have no trades
+            if timespan == 'second' and t_ms // 1000 % 5 == 0:
+                continue
+            p = self.price(ticker, t_ms)
+            ans.append(Agg(open=p, close=p + .01, high=p + .02, low=p - .01, volume=1, vwap=p, timestamp=t_ms))
+        self.count(len(ans))
+        return ans
+
+    def list_quotes(self, ticker, timestamp_gte, timestamp_lte, sort, order, limit):
+        ans = []
+        # Three quotes a second
+        for t_ms in range(-(-timestamp_gte // 333_000_000) * 333, timestamp_lte // 1000000 + 1, 333):
+            bid = self.price(ticker, t_ms) + t_ms % 1000 / 1e6
+            ans.append(SimpleNamespace(participant_timestamp=t_ms * 1000000, bid_price=bid, ask_price=bid * 1.0001))
+        self.count(len(ans))
+        return ans
+
+
+class TestCandleCache(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        CandleCache.shared().clear()
+        self.rng = random.Random(5)
+
+    def test_gaps_and_merging(self):
+        series = CandleSeries()
+        self.assertEqual(series.gaps(0, 99), [(0, 99)])
+        series.add(10, 19, [candle(t) for t in range(5, 25)])
+        series.add(40, 49, [])
+        self.assertEqual(series.gaps(0, 99), [(0, 9), (20, 39), (50, 99)])
+        self.assertEqual(series.gaps(12, 45), [(20, 39)])
+        self.assertEqual(series.gaps(12, 18), [])
+        # Only candles starting within the added range are kept
+        self.assertEqual([c.timestamp for c in series.get(0, 99)], list(range(10, 20)))
+        # Touching and overlapping ranges merge
+        series.add(20, 39, [])
+        series.add(45, 60, [])
+        self.assertEqual(list(series.covered), [(10, 60)])
+        series.add(0, 100, [])
+        self.assertEqual(list(series.covered), [(0, 100)])
+
+    def test_trim_drops_oldest(self):
+        series = CandleSeries()
+        series.add(0, 99, [candle(t) for t in range(0, 100, 10)])
+        series.add(200, 299, [candle(t) for t in range(200, 300, 10)])
+        series.trim(15)
+        self.assertEqual([c.timestamp for c in series.get(0, 999)], list(range(50, 100, 10)) + list(range(200, 300, 10)))
+        self.assertEqual(list(series.covered), [(41, 99), (200, 299)])
+        series.trim(5)
+        self.assertEqual(list(series.covered), [(241, 299)])
+        self.assertEqual(series.gaps(0, 299), [(0, 240)])
+
+    def test_matches_random_queries(self):
+        cache = CandleCache(settle_ms=60_000)
+        all_candles = [candle(t, self.rng.random()) for t in range(0, 100_000, 1000) if self.rng.random() < .8]
+        n_fetches = 0
+
+        def fetch(lo, hi):
+            nonlocal n_fetches
+            n_fetches += 1
+            return [c for c in all_candles if lo <= c.timestamp <= hi]
+
+        for _ in range(500):
+            now_ms = self.rng.randint(0, 200_000)
+            start_ms = self.rng.randint(0, 100_000)
+            end_ms = start_ms + self.rng.randint(0, 20_000)
+            expected = [c for c in all_candles if start_ms <= c.timestamp <= end_ms]
+            self.assertEqual(expected, cache.get_candles('k', start_ms, end_ms, 1000, max(now_ms, end_ms), fetch))
+        self.assertEqual(n_fetches, cache.stats['n_upstream_requests'])
+        self.assertLess(n_fetches, 500)
+
+    def test_unsettled_candles_not_cached(self):
+        cache = CandleCache(settle_ms=60_000)
+        now_ms = 1_000_000
+        fetched = []
+
+        def fetch(lo, hi):
+            fetched.append((lo, hi))
+            return [candle(t) for t in range(lo - lo % 1000, hi + 1, 1000)]
+
+        cache.get_candles('k', now_ms - 120_000, now_ms, 1000, now_ms, fetch)
+        cache.get_candles('k', now_ms - 120_000, now_ms, 1000, now_ms, fetch)
+        settled_ms = now_ms - 1000 - cache.settle_ms
+        self.assertEqual(fetched, [(now_ms - 120_000, now_ms), (settled_ms + 1, now_ms)])
+        # The settled part is served from the cache
+        self.assertEqual(len(cache.get_candles('k', now_ms - 120_000, settled_ms, 1000, now_ms, fetch)), 60)
+        self.assertEqual(len(fetched), 2)
+
+    def test_empty_responses_not_cached(self):
+        cache = CandleCache(settle_ms=60_000)
+        fetched = []
+
+        def fetch(lo, hi):
+            fetched.append((lo, hi))
+            return [] if len(fetched) == 1 else [candle(t) for t in range(lo, hi + 1, 1000)]
+
+        # The feed was late the first time, so the window is fetched again
+        self.assertEqual(cache.get_candles('k', 0, 9000, 1000, 10 ** 9, fetch), [])
+        self.assertEqual(len(cache.get_candles('k', 0, 9000, 1000, 10 ** 9, fetch)), 10)
+        self.assertEqual(len(cache.get_candles('k', 0, 9000, 1000, 10 ** 9, fetch)), 10)
+        self.assertEqual(fetched, [(0, 9000), (0, 9000)])
+
+    def test_evicts_least_recently_queried_series(self):
+        cache = CandleCache(settle_ms=60_000, max_candles=25)
+
+        def fetch(lo, hi):
+            return [candle(t) for t in range(lo, hi + 1, 1000)]
+
+        for key in ['a', 'b', 'c']:
+            cache.get_candles(key, 0, 9000, 1000, 10 ** 9, fetch)
+        self.assertEqual(cache.n_candles, 20)
+        self.assertEqual(list(cache.series), ['b', 'c'])
+        # Querying b makes c the least recent
+        cache.get_candles('b', 0, 9000, 1000, 10 ** 9, fetch)
+        cache.get_candles('d', 0, 9000, 1000, 10 ** 9, fetch)
+        self.assertEqual(list(cache.series), ['b', 'd'])
+        # A series alone over the budget keeps its newest candles
+        cache.get_candles('e', 0, 99_000, 1000, 10 ** 9, fetch)
+        self.assertEqual(list(cache.series), ['e'])
+        self.assertEqual(cache.n_candles, 25)
+        self.assertEqual([c.timestamp for c in cache.series['e'].get(0, 10 ** 9)], list(range(75_000, 100_000, 1000)))
+
+    def test_single_flight(self):
+        cache = CandleCache()
+        fetched = []
+        release = threading.Event()
+
+        def fetch(lo, hi):
+            fetched.append((lo, hi))
+            release.wait(5)
+            return [candle(t) for t in range(lo, hi + 1, 1000)]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_candles('k', 0, 9000, 1000, 10 ** 9, fetch)))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        while cache.stats['n_single_flight_waits'] < 3:
+            time.sleep(.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(fetched, [(0, 9000)])
+        self.assertEqual([[c.timestamp for c in r] for r in results], [list(range(0, 9001, 1000))] * 4)
+
+    def test_failed_fetch_reaches_waiters(self):
+        cache = CandleCache()
+
+        def fetch(lo, hi):
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            cache.get_candles('k', 0, 9000, 1000, 10 ** 9, fetch)
+        self.assertEqual(cache.in_flight, {})
+        self.assertEqual(len(cache.get_candles('k', 0, 9000, 1000, 10 ** 9, lambda lo, hi: [candle(lo)])), 1)
+
+    def replay(self, pds, now, duration_ms):
+        """
+        The historical fetches a validator makes over duration_ms. Returns every result so runs can be compared.
+        """
+        rng = random.Random(9)
+        trade_pairs = [TradePair.BTCUSD, TradePair.ETHUSD, TradePair.SPX, TradePair.EURUSD]
+        miners = [rng.sample(trade_pairs, rng.randint(1, 2)) for _ in range(8)]
+        step_ms = 1000 * 60 * 10
+        results = []
+        last_update_ms = DAY_START_MS
+        orders = []
+        for now_ms in range(DAY_START_MS + step_ms, DAY_START_MS + duration_ms + 1, step_ms):
+            now[0] = now_ms
+            # MDD checker: live one second candles
+            results.append(pds.get_candles(trade_pairs, now_ms - 10_000, now_ms))
+            # Orders are priced when they arrive and again by the hourly price sweep
+            for _ in range(2):
+                order = (rng.choice(trade_pairs), now_ms - rng.randint(0, 5000))
+                orders.append(order)
+                results.append(pds.get_close_at_date_second(*order))
+            if now_ms % (1000 * 60 * 60) == 0:
+                for i, order in enumerate(orders[-24:]):
+                    results.append(pds.get_close_at_date_second(*order))
+                    if i % 4 == 0:
+                        results.append(pds.get_close_at_date_minute_fallback(*order))
+            # Perf ledgers update every miner in hour long windows, and one miner is rebuilt every two hours
+            rebuild = now_ms % (1000 * 60 * 60 * 2) == 0
+            for i, miner_trade_pairs in enumerate(miners):
+                start_ms = DAY_START_MS if rebuild and i == now_ms // (1000 * 60 * 60 * 2) % len(miners) else \
+                    last_update_ms
+                for tp in miner_trade_pairs:
+                    for window_start_ms in range(start_ms, now_ms, 1000 * 60 * 60):
+                        results.append(pds.get_candles_for_trade_pair_simple(
+                            tp, window_start_ms, min(window_start_ms + 1000 * 60 * 60, now_ms)))
+            last_update_ms = now_ms
+        return results
+
+    def run_replay(self, duration_ms, cached):
+        now = [DAY_START_MS]
+        pds = PolygonDataService(api_key='test', disable_ws=True)
+        pds.POLYGON_CLIENT = StubPolygonClient()
+        CandleCache.shared().clear()
+        t0 = time.perf_counter()
+        with patch('time_util.time_util.TimeUtil.now_in_millis', side_effect=lambda: now[0]), \
+                patch('builtins.print'):
+            if cached:
+                results = self.replay(pds, now, duration_ms)
+            else:
+                with patch.object(PolygonDataService, 'cached_candle_fetcher',
+                                  lambda self, tp, lo, hi, timespan: list(
+                                      self.unified_candle_fetcher(tp, lo, hi, timespan))):
+                    results = self.replay(pds, now, duration_ms)
+        return results, pds.POLYGON_CLIENT, time.perf_counter() - t0
+
+    def assert_replay_matches_uncached(self, duration_ms):
+        expected, uncached_client, uncached_s = self.run_replay(duration_ms, cached=False)
+        actual, client, cached_s = self.run_replay(duration_ms, cached=True)
+
+        def comparable(r):
+            if isinstance(r, dict):
+                return {tp: [ps.model_dump() for ps in v] for tp, v in r.items()}
+            if isinstance(r, list):
+                return [vars(a) for a in r]
+            return r
+
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertEqual(comparable(e), comparable(a))
+        self.assertEqual(client.n_requests, CandleCache.shared().stats['n_upstream_requests'])
+        # Queries that reach the unsettled last hour still cost one request each, but only for the missing candles
+        self.assertLessEqual(client.n_requests, uncached_client.n_requests)
+        self.assertLess(client.n_candles, uncached_client.n_candles)
+        return len(actual), uncached_client, client, uncached_s, cached_s
+
+    def test_replay_matches_uncached(self):
+        self.assert_replay_matches_uncached(1000 * 60 * 60 * 4)
+
+    @benchmark
+    def test_replay_day_benchmark(self):
+        n_queries, uncached_client, client, uncached_s, cached_s = self.assert_replay_matches_uncached(
+            1000 * 60 * 60 * 24)
+        stats = CandleCache.shared().stats
+        print(f"Replayed {n_queries} historical queries over one day. upstream requests: uncached "
+              f"{uncached_client.n_requests}, cached {client.n_requests}; candles from upstream: uncached "
+              f"{uncached_client.n_candles}, cached {client.n_candles}. hit rate "
+              f"{CandleCache.shared().hit_rate():.1%}, partial hits {stats['n_partial_hits']}, "
+              f"{stats['n_candles_from_cache']} candles from cache. {uncached_s:.2f}s uncached, {cached_s:.2f}s cached")
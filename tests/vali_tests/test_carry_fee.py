@@ -0,0 +1,146 @@
+import random
+import time
+
+from time_util.time_util import TimeUtil, MS_IN_8_HOURS, MS_IN_24_HOURS
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position, FEE_V6_TIME_MS, CRYPTO_CARRY_FEE_PER_INTERVAL, \
+    FOREX_CARRY_FEE_PER_INTERVAL, INDICES_CARRY_FEE_PER_INTERVAL
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order
+
+
+def reference_max_leverage_seen_in_interval(position, start_ms, end_ms):
+    interval_data = {'start_ms': start_ms, 'end_ms': end_ms, 'max_leverage': -float('inf')}
+    position.max_leverage_seen(interval_data=interval_data)
+    return interval_data['max_leverage']
+
+
+def reference_carry_fee(position, current_time_ms):
+    """
+    Carry fee computed by rescanning every order for each interval.
+    """
+    if position.is_closed_position and current_time_ms > position.close_ms:
+        current_time_ms = position.close_ms
+    start_ms = position.start_carry_fee_accrual_ms
+    if position.trade_pair.is_crypto:
+        n_intervals_elapsed, time_until_next_interval_ms = TimeUtil.n_intervals_elapsed_crypto(start_ms, current_time_ms)
+    else:
+        n_intervals_elapsed, time_until_next_interval_ms = TimeUtil.n_intervals_elapsed_forex_indices(start_ms, current_time_ms)
+    fee_product = 1.0
+    end_ms = start_ms + time_until_next_interval_ms
+    for n in range(n_intervals_elapsed):
+        if n != 0:
+            start_ms = end_ms
+            end_ms = start_ms + MS_IN_8_HOURS
+        max_lev = reference_max_leverage_seen_in_interval(position, start_ms, end_ms)
+        if position.trade_pair.is_crypto:
+            fee_product *= CRYPTO_CARRY_FEE_PER_INTERVAL ** max_lev
+            continue
+        day_of_week_index = TimeUtil.get_day_of_week_from_timestamp(end_ms)
+        if day_of_week_index in (5, 6):
+            continue
+        if position.trade_pair.is_forex:
+            fee = FOREX_CARRY_FEE_PER_INTERVAL ** max_lev
+        else:
+            fee = INDICES_CARRY_FEE_PER_INTERVAL ** max_lev
+        if day_of_week_index == 2:
+            fee = fee ** 3
+        fee_product *= fee
+    return fee_product
+
+
+class TestCarryFee(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(42)
+        self.START_MS = FEE_V6_TIME_MS + 7 * MS_IN_24_HOURS
+
+    def generate_position(self, trade_pair, n_orders, duration_ms, close=False):
+        """
+        Random orders over duration_ms. Some orders land on the same millisecond or exactly on an 8 hour boundary.
+        """
+        times_ms = sorted(self.START_MS + self.rng.randrange(duration_ms) for _ in range(n_orders - 1))
+        for i in range(1, len(times_ms)):
+            if self.rng.random() < .05:
+                times_ms[i] = times_ms[i - 1]
+            elif self.rng.random() < .05:
+                times_ms[i] = times_ms[i] - times_ms[i] % MS_IN_8_HOURS + 4 * 60 * 60 * 1000
+        times_ms = sorted([self.START_MS] + times_ms)
+
+        orders = []
+        net_leverage = 0.0
+        for i, t_ms in enumerate(times_ms):
+            if i == 0:
+                leverage = self.rng.uniform(.1, 1)
+            elif self.rng.random() < .4 and net_leverage > .1:
+                # Stay long. Only reduce the position by up to half.
+                leverage = -self.rng.uniform(.05, .5) * net_leverage
+            else:
+                leverage = self.rng.uniform(.1, 1)
+            net_leverage += leverage
+            orders.append(Order(order_type=OrderType.LONG if leverage > 0 else OrderType.SHORT, leverage=leverage,
+                                price=100, trade_pair=trade_pair, processed_ms=t_ms, order_uuid=str(i)))
+
+        if close:
+            close_ms = times_ms[-1] + self.rng.randrange(MS_IN_24_HOURS)
+            orders.append(Order(order_type=OrderType.FLAT, leverage=0, price=100, trade_pair=trade_pair,
+                                processed_ms=close_ms, order_uuid='flat'))
+
+        position = Position(miner_hotkey='miner', position_uuid='position', open_ms=self.START_MS,
+                            trade_pair=trade_pair, orders=orders)
+        if close:
+            position.is_closed_position = True
+            position.close_ms = close_ms
+        return position
+
+    def test_carry_fee_matches_reference(self):
+        for trade_pair in (TradePair.BTCUSD, TradePair.EURUSD, TradePair.SPX):
+            for close in (False, True):
+                for _ in range(10):
+                    duration_ms = self.rng.randrange(1, 90) * MS_IN_24_HOURS
+                    position = self.generate_position(trade_pair, self.rng.randrange(1, 60), duration_ms, close=close)
+                    for _ in range(10):
+                        t_ms = self.START_MS + self.rng.randrange(duration_ms + 3 * MS_IN_24_HOURS)
+                        self.assertEqual(position.get_carry_fee(t_ms)[0], reference_carry_fee(position, t_ms))
+
+    def test_max_leverage_in_interval_matches_reference(self):
+        position = self.generate_position(TradePair.BTCUSD, 50, 10 * MS_IN_24_HOURS, close=True)
+        # Intervals starting at the FLAT order have no leverage and are never charged
+        times_ms = [o.processed_ms for o in position.orders[:-1]]
+        for _ in range(500):
+            start_ms = self.rng.choice(times_ms + [self.rng.randrange(times_ms[0], times_ms[-1])])
+            end_ms = start_ms + self.rng.choice([0, 1, MS_IN_8_HOURS, self.rng.randrange(MS_IN_24_HOURS)])
+            self.assertEqual(position.max_leverage_seen_in_interval(start_ms, end_ms),
+                             reference_max_leverage_seen_in_interval(position, start_ms, end_ms))
+
+    def test_leverage_index_rebuilt_when_orders_change(self):
+        position = self.generate_position(TradePair.BTCUSD, 5, 2 * MS_IN_24_HOURS)
+        t_ms = self.START_MS + 5 * MS_IN_24_HOURS
+        position.get_carry_fee(t_ms)
+
+        position.orders.append(Order(order_type=OrderType.LONG, leverage=5, price=100, trade_pair=TradePair.BTCUSD,
+                                     processed_ms=self.START_MS + 3 * MS_IN_24_HOURS, order_uuid='appended'))
+        self.assertEqual(position.get_carry_fee(t_ms)[0], reference_carry_fee(position, t_ms))
+
+        position.orders = position.orders[:2]
+        self.assertEqual(position.get_carry_fee(t_ms)[0], reference_carry_fee(position, t_ms))
+
+    @benchmark
+    def test_carry_fee_benchmark(self):
+        positions = [self.generate_position(TradePair.BTCUSD, 300, 90 * MS_IN_24_HOURS) for _ in range(5)]
+        t_ms = self.START_MS + 90 * MS_IN_24_HOURS
+
+        t0 = time.time()
+        reference_fees = [reference_carry_fee(p, t_ms) for p in positions]
+        reference_s = time.time() - t0
+
+        t0 = time.time()
+        fees = [p.get_carry_fee(t_ms)[0] for p in positions]
+        indexed_s = time.time() - t0
+
+        print(f"carry fee for {len(positions)} positions with 300 orders over 90 days. "
+              f"rescan: {reference_s:.4f} s, indexed: {indexed_s:.4f} s")
+        self.assertEqual(fees, reference_fees)
+        self.assertLess(indexed_s, reference_s)
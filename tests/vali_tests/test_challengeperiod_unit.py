@@ -1,11 +1,13 @@
 # developer: trdougherty
 import copy
+import time
 from copy import deepcopy
 import numpy as np
 
-from tests.vali_tests.base_objects.test_base import TestBase
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
 from tests.shared_objects.test_utilities import generate_ledger
 from vali_objects.utils.elimination_manager import EliminationManager
+from vali_objects.utils.challengeperiod_manager import ChallengePeriodManager
 
 from vali_objects.vali_config import TradePair
 from vali_objects.position import Position
@@ -437,3 +439,68 @@ class TestChallengePeriodUnit(TestBase):
         self.assertNotIn("miner", failing)
 
 
+
+    def generate_scores_dict(self, rng, miner_names):
+        """Random metric scores on a coarse grid so that ties are common, with some penalized miners."""
+        scores_dict = {"metrics": {}}
+        for config_name, config in Scoring.scoring_config.items():
+            scores_dict["metrics"][config_name] = {'scores': [(miner, float(rng.integers(0, 20)) / 10) for miner in miner_names],
+                                                   'weight': config['weight']}
+        scores_dict["penalties"] = {miner: float(rng.choice([1, 1, 1, 0.5, 0.25])) for miner in miner_names}
+        return scores_dict
+
+    def test_batched_screening_matches_per_miner_screening(self):
+        rng = np.random.default_rng(0)
+        for n_success, n_inspection in [(0, 3), (1, 5), (4, 20), (100, 200)]:
+            success_scores_dict = self.generate_scores_dict(rng, [f"success{i}" for i in range(n_success)])
+            inspection_hotkeys = [f"testing{i}" for i in range(n_inspection)]
+            inspection_scores_dict = self.generate_scores_dict(rng, inspection_hotkeys)
+
+            batched_percentiles = Scoring.combined_percentiles_against_population(success_scores_dict, inspection_scores_dict)
+            expected_passing = set()
+            for hotkey in inspection_hotkeys:
+                trial_scores_dict = copy.deepcopy(success_scores_dict)
+                for config_name, config in trial_scores_dict["metrics"].items():
+                    config["scores"] += [x for x in inspection_scores_dict["metrics"][config_name]["scores"] if x[0] == hotkey]
+                trial_scores_dict["penalties"][hotkey] = inspection_scores_dict["penalties"][hotkey]
+                combined_scores = Scoring.combine_scores(scoring_dict=trial_scores_dict)
+                expected_percentile = dict(Scoring.miner_scores_percentiles(list(combined_scores.items())))[hotkey]
+                self.assertEqual(batched_percentiles[hotkey], expected_percentile)
+                if expected_percentile >= ValiConfig.CHALLENGE_PERIOD_PERCENTILE_THRESHOLD:
+                    expected_passing.add(hotkey)
+
+            passing = ChallengePeriodManager.screen_passing_criteria_batch(
+                positions={}, ledger={}, success_scores_dict=success_scores_dict, inspection_hotkeys=inspection_hotkeys,
+                current_time=self.CURRENTLY_IN_CHALLENGE, inspection_scores_dict=inspection_scores_dict)
+            self.assertEqual(passing, expected_passing)
+
+    @benchmark
+    def test_batched_screening_benchmark(self):
+        rng = np.random.default_rng(1)
+        success_scores_dict = self.generate_scores_dict(rng, [f"success{i}" for i in range(100)])
+        inspection_hotkeys = [f"testing{i}" for i in range(200)]
+        inspection_scores_dict = self.generate_scores_dict(rng, inspection_hotkeys)
+
+        t0 = time.time()
+        per_miner_passing = set()
+        for hotkey in inspection_hotkeys:
+            single_scores_dict = {
+                "metrics": {config_name: {"scores": [x for x in config["scores"] if x[0] == hotkey], "weight": config["weight"]}
+                            for config_name, config in inspection_scores_dict["metrics"].items()},
+                "penalties": {hotkey: inspection_scores_dict["penalties"][hotkey]}
+            }
+            if ChallengePeriodManager.screen_passing_criteria(
+                    positions={}, ledger={}, success_scores_dict=success_scores_dict, inspection_hotkey=hotkey,
+                    current_time=self.CURRENTLY_IN_CHALLENGE, inspection_scores_dict=single_scores_dict):
+                per_miner_passing.add(hotkey)
+        per_miner_s = time.time() - t0
+
+        t0 = time.time()
+        batched_passing = ChallengePeriodManager.screen_passing_criteria_batch(
+            positions={}, ledger={}, success_scores_dict=success_scores_dict, inspection_hotkeys=inspection_hotkeys,
+            current_time=self.CURRENTLY_IN_CHALLENGE, inspection_scores_dict=inspection_scores_dict)
+        batched_s = time.time() - t0
+
+        print(f"screening 200 testing against 100 success miners. per miner: {per_miner_s:.4f} s, batched: {batched_s:.4f} s")
+        self.assertEqual(batched_passing, per_miner_passing)
+        self.assertLess(batched_s, per_miner_s)
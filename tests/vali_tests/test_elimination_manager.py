@@ -0,0 +1,160 @@
+import os
+import random
+import time
+from copy import deepcopy
+
+from tests.shared_objects.mock_classes import MockMetagraph, MockPositionManager, MockChallengePeriodManager
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from time_util.time_util import TimeUtil
+from vali_objects.utils.elimination_manager import EliminationManager
+from vali_objects.utils.vali_bkp_utils import ValiBkpUtils
+from vali_objects.vali_config import ValiConfig
+
+
+def reference_hotkey_in_eliminations(eliminations, hotkey):
+    for x in eliminations:
+        if x['hotkey'] == hotkey:
+            return deepcopy(x)
+    return None
+
+
+class TestEliminationManager(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(7)
+        self.MINER_NAMES = [f"miner{i}" for i in range(10)]
+        self.mock_metagraph = MockMetagraph(list(self.MINER_NAMES))
+        self.elimination_manager = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        self.position_manager = MockPositionManager(self.mock_metagraph, perf_ledger_manager=None,
+                                                    elimination_manager=self.elimination_manager)
+        self.challengeperiod_manager = MockChallengePeriodManager(self.mock_metagraph,
+                                                                  position_manager=self.position_manager)
+        self.elimination_manager.position_manager = self.position_manager
+        self.elimination_manager.challengeperiod_manager = self.challengeperiod_manager
+        self.elimination_manager.clear_eliminations()
+        self.miner_dir = ValiBkpUtils.get_miner_dir(running_unit_tests=True)
+
+    def tearDown(self):
+        self.elimination_manager.clear_eliminations()
+        super().tearDown()
+
+    def make_miner_dir(self, hotkey):
+        os.makedirs(self.miner_dir + hotkey, exist_ok=True)
+
+    def test_index_matches_eliminations(self):
+        now_ms = TimeUtil.now_in_millis()
+        self.elimination_manager.append_elimination_row("miner1", 0.1, "MAX_TOTAL_DRAWDOWN", t_ms=now_ms)
+        self.elimination_manager.append_elimination_row("miner2", -1, "plagiarism", t_ms=now_ms)
+        # A second elimination for the same hotkey does not replace the first one
+        self.elimination_manager.append_elimination_row("miner1", 0.2, "FAILED_CHALLENGE_PERIOD", t_ms=now_ms + 1)
+
+        eliminations = self.elimination_manager.get_eliminations_from_memory()
+        for hotkey in ("miner1", "miner2", "miner3"):
+            self.assertEqual(self.elimination_manager.hotkey_in_eliminations(hotkey),
+                             reference_hotkey_in_eliminations(eliminations, hotkey))
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), {"miner1", "miner2"})
+
+        self.elimination_manager.delete_eliminations({"miner1"})
+        self.assertIsNone(self.elimination_manager.hotkey_in_eliminations("miner1"))
+        self.assertEqual([x['hotkey'] for x in self.elimination_manager.get_eliminations_from_memory()], ["miner2"])
+        self.assertEqual([x['hotkey'] for x in self.elimination_manager.get_eliminations_from_disk()], ["miner2"])
+
+        # Index is rebuilt from disk on startup
+        restarted = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        self.assertEqual(restarted.hotkey_in_eliminations("miner2"), self.elimination_manager.hotkey_in_eliminations("miner2"))
+
+        self.elimination_manager.clear_eliminations()
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), set())
+
+    def test_is_zombie_hotkey(self):
+        self.elimination_manager.append_elimination_row("deregistered_miner", -1, "plagiarism")
+        self.assertFalse(self.elimination_manager.is_zombie_hotkey("miner1"))
+        self.assertFalse(self.elimination_manager.is_zombie_hotkey("deregistered_miner"))
+        self.assertTrue(self.elimination_manager.is_zombie_hotkey("unknown_miner"))
+
+    def test_deletion_waits_for_delay_and_deregistration(self):
+        now_ms = TimeUtil.now_in_millis()
+        expired_ms = now_ms - ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS - 1
+        self.mock_metagraph.hotkeys.remove("miner1")
+        self.elimination_manager.append_elimination_row("miner1", 0.1, "MAX_TOTAL_DRAWDOWN", t_ms=expired_ms)
+        self.elimination_manager.append_elimination_row("miner2", 0.1, "MAX_TOTAL_DRAWDOWN", t_ms=expired_ms)
+        self.elimination_manager.append_elimination_row("miner3", 0.1, "MAX_TOTAL_DRAWDOWN", t_ms=now_ms)
+        self.mock_metagraph.hotkeys.remove("miner3")
+        for hotkey in ("miner1", "miner2", "miner3", "zombie_miner"):
+            self.make_miner_dir(hotkey)
+
+        self.elimination_manager._delete_eliminated_expired_miners()
+        # miner1 is expired and deregistered. miner2 is still registered. miner3 has not hit the deletion delay.
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), {"miner2", "miner3"})
+        self.assertFalse(os.path.exists(self.miner_dir + "miner1"))
+        self.assertFalse(os.path.exists(self.miner_dir + "zombie_miner"))
+        self.assertTrue(os.path.exists(self.miner_dir + "miner2"))
+        self.assertTrue(os.path.exists(self.miner_dir + "miner3"))
+
+        self.mock_metagraph.hotkeys.remove("miner2")
+        self.elimination_manager._delete_eliminated_expired_miners()
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), {"miner3"})
+        self.assertFalse(os.path.exists(self.miner_dir + "miner2"))
+
+    def test_elimination_added_by_other_process_is_scheduled(self):
+        expired_ms = TimeUtil.now_in_millis() - ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS - 1
+        self.elimination_manager._delete_eliminated_expired_miners()
+        # Simulate another process sharing the same eliminations list and index
+        other_process = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        other_process.eliminations = self.elimination_manager.eliminations
+        other_process.eliminations_by_hotkey = self.elimination_manager.eliminations_by_hotkey
+        other_process.append_elimination_row("deregistered_miner", -1, "plagiarism", t_ms=expired_ms)
+
+        self.elimination_manager._delete_eliminated_expired_miners()
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), set())
+
+    @benchmark
+    def test_replay_elimination_stream_benchmark(self):
+        n_events = 10_000
+        now_ms = TimeUtil.now_in_millis()
+        hotkeys = [f"stream_miner{i}" for i in range(n_events)]
+        # Half of the miners stay registered. Elimination times straddle the deletion delay.
+        self.mock_metagraph.hotkeys.extend(hotkeys[::2])
+        events = [self.elimination_manager.generate_elimination_row(
+            hk, self.rng.random(), "MAX_TOTAL_DRAWDOWN",
+            t_ms=now_ms - self.rng.randrange(2 * ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS)) for hk in hotkeys]
+
+        t0, cpu0 = time.time(), time.process_time()
+        publish_latencies_s = []
+        for i, e in enumerate(events):
+            t_event = time.time()
+            self.elimination_manager._add_elimination(e)
+            assert self.elimination_manager.hotkey_in_eliminations(e['hotkey'])
+            publish_latencies_s.append(time.time() - t_event)
+            if i % 1000 == 999:
+                self.elimination_manager.save_eliminations()
+        publish_s, publish_cpu_s = time.time() - t0, time.process_time() - cpu0
+
+        eliminations = self.elimination_manager.get_eliminations_from_memory()
+        lookup_hotkeys = [self.rng.choice(hotkeys) for _ in range(1000)]
+        t0 = time.time()
+        reference_results = [reference_hotkey_in_eliminations(eliminations, hk) for hk in lookup_hotkeys]
+        scan_lookup_s = time.time() - t0
+        t0 = time.time()
+        indexed_results = [self.elimination_manager.hotkey_in_eliminations(hk) for hk in lookup_hotkeys]
+        indexed_lookup_s = time.time() - t0
+        self.assertEqual(indexed_results, reference_results)
+
+        expected_deleted = {e['hotkey'] for i, e in enumerate(events) if i % 2 == 1 and
+                            now_ms - e['elimination_initiated_time_ms'] >= ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS}
+        t0, cpu0 = time.time(), time.process_time()
+        self.elimination_manager._delete_eliminated_expired_miners()
+        first_pass_s, first_pass_cpu_s = time.time() - t0, time.process_time() - cpu0
+        t0, cpu0 = time.time(), time.process_time()
+        self.elimination_manager._delete_eliminated_expired_miners()
+        idle_pass_s, idle_pass_cpu_s = time.time() - t0, time.process_time() - cpu0
+
+        self.assertEqual(self.elimination_manager.get_eliminated_hotkeys(), set(hotkeys) - expected_deleted)
+        publish_latencies_s.sort()
+        print(f"{n_events} elimination events. publish: {publish_s:.3f} s wall, {publish_cpu_s:.3f} s cpu, "
+              f"p50 {publish_latencies_s[n_events // 2] * 1e6:.1f} us, p99 {publish_latencies_s[int(n_events * .99)] * 1e6:.1f} us. "
+              f"1000 lookups scan: {scan_lookup_s:.4f} s, indexed: {indexed_lookup_s:.4f} s. "
+              f"deletion pass ({len(expected_deleted)} deleted): {first_pass_s:.3f} s wall, {first_pass_cpu_s:.3f} s cpu. "
+              f"idle pass: {idle_pass_s:.4f} s wall, {idle_pass_cpu_s:.4f} s cpu")
+        self.assertLess(indexed_lookup_s, scan_lookup_s)
@@ -0,0 +1,171 @@
+import random
+import time
+
+from time_util.time_util import MS_IN_8_HOURS, MS_IN_24_HOURS, TimeUtil
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position, FEE_V6_TIME_MS
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order
+from vali_objects.vali_dataclasses.perf_ledger import FeeCache
+
+
+class LegacyFeeCache:
+    """
+    FeeCache before the carry fee tables. Recomputes the carry fee whenever an interval boundary passes.
+    """
+    def __init__(self):
+        self.spread_fee = 1.0
+        self.spread_fee_last_order_processed_ms = 0
+        self.carry_fee = 1.0
+        self.carry_fee_next_increase_time_ms = 0
+
+    def get_spread_fee(self, position):
+        if position.orders[-1].processed_ms == self.spread_fee_last_order_processed_ms:
+            return self.spread_fee
+        self.spread_fee = position.get_spread_fee()
+        self.spread_fee_last_order_processed_ms = position.orders[-1].processed_ms
+        return self.spread_fee
+
+    def get_carry_fee(self, current_time_ms, position):
+        if position.is_closed_position:
+            current_time_ms = min(current_time_ms, position.close_ms)
+        interval_ms = MS_IN_8_HOURS if position.trade_pair.is_crypto else MS_IN_24_HOURS
+        if self.carry_fee_next_increase_time_ms - interval_ms <= current_time_ms < self.carry_fee_next_increase_time_ms:
+            return self.carry_fee
+        self.carry_fee, self.carry_fee_next_increase_time_ms = position.get_carry_fee(current_time_ms)
+        return self.carry_fee
+
+
+class TestFeeCache(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(8)
+        # Odd milliseconds so boundaries don't line up with the open time
+        self.START_MS = FEE_V6_TIME_MS + 7 * MS_IN_24_HOURS + 1234567
+
+    def generate_position(self, trade_pair, n_orders, duration_ms, close=False):
+        times_ms = sorted([self.START_MS] + [self.START_MS + self.rng.randrange(duration_ms) for _ in range(n_orders - 1)])
+        orders = []
+        net_leverage = 0.0
+        for i, t_ms in enumerate(times_ms):
+            if i and self.rng.random() < .4 and net_leverage > .1:
+                leverage = -self.rng.uniform(.05, .5) * net_leverage
+            else:
+                leverage = self.rng.uniform(.1, 1)
+            net_leverage += leverage
+            orders.append(Order(order_type=OrderType.LONG if leverage > 0 else OrderType.SHORT, leverage=leverage,
+                                price=100, trade_pair=trade_pair, processed_ms=t_ms, order_uuid=str(i)))
+        position = Position(miner_hotkey='miner', position_uuid='position', open_ms=self.START_MS,
+                            trade_pair=trade_pair, orders=orders)
+        if close:
+            close_ms = times_ms[-1] + self.rng.randrange(MS_IN_24_HOURS)
+            position.orders.append(Order(order_type=OrderType.FLAT, leverage=0, price=100, trade_pair=trade_pair,
+                                         processed_ms=close_ms, order_uuid='flat'))
+            position.is_closed_position = True
+            position.close_ms = close_ms
+        return position
+
+    @staticmethod
+    def boundaries_ms(position, end_ms):
+        n_intervals_elapsed = TimeUtil.n_intervals_elapsed_crypto if position.trade_pair.is_crypto else \
+            TimeUtil.n_intervals_elapsed_forex_indices
+        t_ms = position.start_carry_fee_accrual_ms
+        while t_ms <= end_ms:
+            t_ms += n_intervals_elapsed(position.start_carry_fee_accrual_ms, t_ms)[1]
+            yield t_ms
+
+    def test_matches_position_at_boundaries(self):
+        for trade_pair in (TradePair.BTCUSD, TradePair.EURUSD, TradePair.SPX, TradePair.NVDA):
+            for close in (False, True):
+                for _ in range(4):
+                    duration_ms = self.rng.randrange(1, 30) * MS_IN_24_HOURS
+                    position = self.generate_position(trade_pair, self.rng.randrange(1, 30), duration_ms, close)
+                    fee_cache = FeeCache()
+                    end_ms = self.START_MS + duration_ms + 2 * MS_IN_24_HOURS
+                    carry_fee = position.crypto_carry_fee if trade_pair.is_crypto else position.forex_indices_carry_fee
+                    prev_expected = 1.0
+                    for t_ms in self.boundaries_ms(position, end_ms):
+                        expected = position.get_carry_fee(t_ms)[0]
+                        if not close or t_ms < position.close_ms:
+                            self.assertEqual(carry_fee(t_ms)[0], expected)
+                        self.assertEqual(fee_cache.get_carry_fee(t_ms, position), expected)
+                        # The fee holds until the next boundary or the close
+                        t_before_ms = t_ms - self.rng.randrange(1, MS_IN_8_HOURS)
+                        if not close or t_ms <= position.close_ms:
+                            self.assertEqual(fee_cache.get_carry_fee(t_ms - 1, position), prev_expected)
+                        if not close or t_before_ms < position.close_ms:
+                            self.assertEqual(fee_cache.get_carry_fee(t_before_ms, position), prev_expected)
+                        prev_expected = expected
+                    if close:
+                        self.assertEqual(fee_cache.get_carry_fee(position.close_ms, position),
+                                         position.get_carry_fee(position.close_ms)[0])
+                    self.assertEqual(fee_cache.get_spread_fee(position), position.get_spread_fee())
+
+    def test_constant_leverage_matches_position(self):
+        # Without leverage changes the crypto fee doesn't depend on where the intervals start. Forex and indices
+        # intervals are charged by the weekday they end on, which does.
+        for trade_pair in (TradePair.BTCUSD, TradePair.ETHUSD):
+            position = self.generate_position(trade_pair, 1, MS_IN_24_HOURS)
+            fee_cache = FeeCache()
+            for _ in range(300):
+                t_ms = self.START_MS + self.rng.randrange(60 * MS_IN_24_HOURS)
+                self.assertAlmostEqual(fee_cache.get_carry_fee(t_ms, position), position.get_carry_fee(t_ms)[0],
+                                       places=15)
+            self.assertEqual(fee_cache.get_carry_fee(self.START_MS - 1, position), 1.0)
+
+    def test_order_changes_rebuild_tables(self):
+        position = self.generate_position(TradePair.BTCUSD, 5, 2 * MS_IN_24_HOURS)
+        fee_cache = FeeCache()
+        boundaries_ms = list(self.boundaries_ms(position, self.START_MS + 10 * MS_IN_24_HOURS))
+        fee_cache.get_carry_fee(boundaries_ms[-1], position)
+        fee_cache.get_spread_fee(position)
+
+        position.orders.append(Order(order_type=OrderType.LONG, leverage=5, price=100, trade_pair=TradePair.BTCUSD,
+                                     processed_ms=self.START_MS + 3 * MS_IN_24_HOURS, order_uuid='appended'))
+        self.assertEqual(fee_cache.get_spread_fee(position), position.get_spread_fee())
+        for t_ms in boundaries_ms:
+            self.assertEqual(fee_cache.get_carry_fee(t_ms, position), position.get_carry_fee(t_ms)[0])
+
+        position.orders.append(Order(order_type=OrderType.FLAT, leverage=0, price=100, trade_pair=TradePair.BTCUSD,
+                                     processed_ms=self.START_MS + 4 * MS_IN_24_HOURS, order_uuid='flat'))
+        position.is_closed_position = True
+        position.close_ms = position.orders[-1].processed_ms
+        for t_ms in boundaries_ms:
+            self.assertEqual(fee_cache.get_carry_fee(t_ms, position), position.get_carry_fee(t_ms)[0])
+
+    @benchmark
+    def test_replay_benchmark(self):
+        """
+        The per second replay of build_perf_ledger, sampled every 10 seconds, over a miner's positions.
+        """
+        duration_ms = 60 * MS_IN_24_HOURS
+        positions = [self.generate_position(trade_pair, 30, duration_ms, close=i % 2 == 0)
+                     for i, trade_pair in enumerate([TradePair.BTCUSD, TradePair.ETHUSD, TradePair.EURUSD,
+                                                     TradePair.SPX, TradePair.NVDA, TradePair.USDJPY])]
+        times_ms = range(self.START_MS, self.START_MS + duration_ms, 10_000)
+
+        def replay(fee_cache_cls):
+            fee_caches = [fee_cache_cls() for _ in positions]
+            t0 = time.perf_counter()
+            fees = []
+            for t_ms in times_ms:
+                total_fee = 1.0
+                for position, fee_cache in zip(positions, fee_caches):
+                    fee = fee_cache.get_spread_fee(position) * fee_cache.get_carry_fee(t_ms, position)
+                    fees.append(fee)
+                    total_fee *= fee
+            return time.perf_counter() - t0, fees
+
+        legacy_s, legacy_fees = replay(LegacyFeeCache)
+        table_s, fees = replay(FeeCache)
+        # The legacy cache computes the fee at the first call after a boundary, which here is within 10 seconds of it.
+        # After the close it kept that value where the tables use the fee at the close.
+        for i, (legacy_fee, fee) in enumerate(zip(legacy_fees, fees)):
+            position = positions[i % len(positions)]
+            if position.is_open_position or times_ms[i // len(positions)] < position.close_ms:
+                self.assertEqual(legacy_fee, fee)
+        print(f"Replayed {len(times_ms)} timestamps over {len(positions)} positions with 30 orders over 60 days. "
+              f"legacy FeeCache {legacy_s:.2f}s, carry fee tables {table_s:.2f}s")
+        self.assertLess(table_s, legacy_s)
@@ -0,0 +1,203 @@
+import threading
+import time
+from unittest.mock import patch
+
+from tests.shared_objects.mock_classes import MockMetagraph, MockMDDChecker
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from time_util.time_util import TimeUtil
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.utils.elimination_manager import EliminationManager
+from vali_objects.utils.live_price_fetcher import LivePriceFetcher
+from vali_objects.utils.position_lock import PositionLocks
+from vali_objects.utils.position_manager import PositionManager
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order
+from vali_objects.vali_dataclasses.price_source import PriceSource
+
+
+class StubPriceService:
+    """
+    Stands in for the Polygon and Tiingo data services. Websockets have nothing recent so every price needs a REST
+    request, which takes latency_s and is counted.
+    """
+    def __init__(self, source, now_ms, latency_s):
+        self.source = source
+        self.now_ms = now_ms
+        self.latency_s = latency_s
+        self.n_rest_requests = 0
+        self.lock = threading.Lock()
+
+    def is_market_open(self, trade_pair):
+        return True
+
+    def get_closes_websocket(self, trade_pairs, trade_pair_to_last_order_time_ms):
+        return {}
+
+    def get_closes_rest(self, trade_pairs):
+        with self.lock:
+            self.n_rest_requests += 1
+        time.sleep(self.latency_s)
+        ans = {}
+        for tp in trade_pairs:
+            price = 100.0 + list(TradePair).index(tp)
+            ans[tp] = PriceSource(source=f'{self.source}_rest', timespan_ms=1000, open=price, close=price, high=price,
+                                  low=price, start_ms=self.now_ms, websocket=False, lag_ms=0)
+        return ans
+
+
+class StubLivePriceFetcher(LivePriceFetcher):
+    def __init__(self, now_ms, latency_s):
+        self.polygon_data_service = StubPriceService('Polygon', now_ms, latency_s)
+        self.tiingo_data_service = StubPriceService('Tiingo', now_ms, latency_s)
+
+    @property
+    def n_rest_requests(self):
+        return self.polygon_data_service.n_rest_requests + self.tiingo_data_service.n_rest_requests
+
+
+class UncachedStubLivePriceFetcher(StubLivePriceFetcher):
+    """
+    Makes a REST request for every price like the MDD checker did before price sources were cached per shard.
+    """
+    def fetch_prices(self, tps, trade_pair_to_last_order_time_ms, ws_only=False, rest_price_cache=None):
+        return super().fetch_prices(tps, trade_pair_to_last_order_time_ms, ws_only=ws_only)
+
+
+class TestMDDShards(TestBase):
+
+    N_MINERS = 256
+    N_POSITIONS_PER_MINER = 20
+
+    def setUp(self):
+        super().setUp()
+        self.hotkeys = [f"miner{i}" for i in range(self.N_MINERS)]
+        self.mock_metagraph = MockMetagraph(list(self.hotkeys))
+        self.elimination_manager = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        self.position_manager = PositionManager(metagraph=self.mock_metagraph, running_unit_tests=True,
+                                                elimination_manager=self.elimination_manager)
+        self.elimination_manager.position_manager = self.position_manager
+        self.elimination_manager.clear_eliminations()
+        self.position_manager.clear_all_miner_positions()
+        self.position_locks = PositionLocks()
+        self.now_ms = TimeUtil.now_in_millis()
+        self.logging_patch = patch('vali_objects.utils.mdd_checker.bt.logging')
+        self.logging_patch.start()
+
+    def tearDown(self):
+        self.logging_patch.stop()
+        self.position_manager.clear_all_miner_positions()
+        super().tearDown()
+
+    def generate_positions(self, n_miners):
+        positions = []
+        for hotkey in self.hotkeys[:n_miners]:
+            for tp in list(TradePair)[:self.N_POSITIONS_PER_MINER]:
+                order = Order(order_type=OrderType.LONG, leverage=tp.min_leverage, price=90.0, trade_pair=tp,
+                              processed_ms=self.now_ms - 1000, order_uuid=f"{hotkey}_{tp.trade_pair_id}")
+                position = Position(miner_hotkey=hotkey, position_uuid=f"{hotkey}_{tp.trade_pair_id}_position",
+                                    open_ms=order.processed_ms, trade_pair=tp, orders=[order])
+                position.rebuild_position_with_updated_orders()
+                positions.append(position)
+        return positions
+
+    def reset_positions(self, positions):
+        self.position_manager.clear_all_miner_positions()
+        for p in positions:
+            self.position_manager.save_miner_position(p)
+
+    def make_checker(self, live_price_fetcher, n_shards=None):
+        checker = MockMDDChecker(self.mock_metagraph, self.position_manager, live_price_fetcher)
+        if n_shards:
+            checker.n_shards = n_shards
+        return checker
+
+    def sweep(self, checker):
+        t0 = time.time()
+        with patch('vali_objects.vali_dataclasses.price_source.bt.logging'):
+            checker.mdd_check(self.position_locks)
+        sweep_s = time.time() - t0
+        positions = {p.position_uuid: p.to_dict() for ps in self.position_manager.get_positions_for_hotkeys(
+            self.hotkeys).values() for p in ps}
+        return sweep_s, positions
+
+    def corrected_uuids(self):
+        return {p.position_uuid for ps in self.position_manager.get_positions_for_hotkeys(self.hotkeys).values()
+                for p in ps if p.orders[0].price_sources}
+
+    def test_position_lock_is_respected(self):
+        positions = self.generate_positions(4)
+        self.reset_positions(positions)
+        checker = self.make_checker(StubLivePriceFetcher(self.now_ms, latency_s=0))
+        locked = positions[0]
+        other_miner_uuids = {p.position_uuid for p in positions if p.miner_hotkey != locked.miner_hotkey}
+        with self.position_locks.get_lock(locked.miner_hotkey, locked.trade_pair.trade_pair_id):
+            sweep_thread = threading.Thread(target=self.sweep, args=(checker,))
+            sweep_thread.start()
+            # Shards of other miners finish while another writer holds the lock of one position
+            deadline = time.time() + 30
+            while not other_miner_uuids <= self.corrected_uuids() and time.time() < deadline:
+                time.sleep(.01)
+            self.assertLessEqual(other_miner_uuids, self.corrected_uuids())
+            self.assertNotIn(locked.position_uuid, self.corrected_uuids())
+            self.assertTrue(sweep_thread.is_alive())
+        sweep_thread.join(timeout=30)
+        self.assertFalse(sweep_thread.is_alive())
+        self.assertEqual(self.corrected_uuids(), {p.position_uuid for p in positions})
+        self.assertEqual(checker.n_orders_corrected, len(positions))
+
+    def test_cached_rest_sources_are_not_shared(self):
+        fetcher = StubLivePriceFetcher(self.now_ms, latency_s=0)
+        tp = TradePair.BTCUSD
+        rest_price_cache = {}
+        sources_a = fetcher.fetch_prices([tp], {tp: self.now_ms - 5_000_000}, rest_price_cache=rest_price_cache)[tp][1]
+        sources_b = fetcher.fetch_prices([tp], {tp: self.now_ms - 9_000_000}, rest_price_cache=rest_price_cache)[tp][1]
+        self.assertEqual(fetcher.n_rest_requests, 2)
+        self.assertIsNot(sources_a[0], sources_b[0])
+        self.assertEqual([ps.lag_ms for ps in sources_a], [5_000_000, 5_000_000])
+        self.assertEqual([ps.lag_ms for ps in sources_b], [9_000_000, 9_000_000])
+
+    def test_eliminated_miners_counted_across_shards(self):
+        positions = self.generate_positions(16)
+        self.reset_positions(positions)
+        for hotkey in self.hotkeys[:10]:
+            self.elimination_manager.append_elimination_row(hotkey, -1, "MAX_TOTAL_DRAWDOWN", t_ms=self.now_ms)
+        checker = self.make_checker(StubLivePriceFetcher(self.now_ms, latency_s=0), n_shards=4)
+        self.sweep(checker)
+        self.assertEqual(checker.n_miners_skipped_already_eliminated, 10)
+        self.assertEqual(len(checker.miners_corrected), 6)
+
+    def compare_sweeps(self, n_miners, latency_s):
+        """
+        Sweeps the same positions sequentially without the shared price cache and then in shards, and checks they
+        correct the positions the same way.
+        """
+        positions = self.generate_positions(n_miners)
+
+        self.reset_positions(positions)
+        reference_fetcher = UncachedStubLivePriceFetcher(self.now_ms, latency_s=latency_s)
+        reference_s, reference_positions = self.sweep(self.make_checker(reference_fetcher, n_shards=1))
+
+        self.reset_positions(positions)
+        sharded_fetcher = StubLivePriceFetcher(self.now_ms, latency_s=latency_s)
+        sharded_checker = self.make_checker(sharded_fetcher)
+        sharded_s, sharded_positions = self.sweep(sharded_checker)
+
+        self.assertEqual(sharded_positions, reference_positions)
+        self.assertEqual(sharded_checker.n_orders_corrected, len(positions))
+        self.assertEqual(len(sharded_checker.miners_corrected), n_miners)
+        # One bulk request per price service seeds every shard
+        self.assertEqual(sharded_fetcher.n_rest_requests, 2)
+        self.assertLess(sharded_fetcher.n_rest_requests, reference_fetcher.n_rest_requests)
+        return reference_s, reference_fetcher, sharded_s, sharded_fetcher, sharded_checker
+
+    def test_sharded_sweep_matches_sequential(self):
+        self.compare_sweeps(16, latency_s=0)
+
+    @benchmark
+    def test_sharded_sweep_benchmark(self):
+        reference_s, reference_fetcher, sharded_s, sharded_fetcher, sharded_checker = self.compare_sweeps(
+            self.N_MINERS, latency_s=0.001)
+        print(f"{self.N_MINERS} miners x {self.N_POSITIONS_PER_MINER} open positions. "
+              f"sequential uncached sweep: {reference_s:.2f} s, {reference_fetcher.n_rest_requests} REST requests. "
+              f"{sharded_checker.n_shards} shards: {sharded_s:.2f} s, {sharded_fetcher.n_rest_requests} REST requests")
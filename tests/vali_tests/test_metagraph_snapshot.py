@@ -0,0 +1,182 @@
+import pickle
+import time
+from multiprocessing import Manager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+from shared_objects.cache_controller import CacheController
+from shared_objects.metagraph_snapshot import MetagraphSnapshot
+from shared_objects.metagraph_updater import MetagraphUpdater
+from shared_objects.sn8_multiprocessing import get_ipc_metagraph
+from tests.shared_objects.mock_classes import MockMetagraph
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.scoring.scoring import Scoring
+from vali_objects.utils.challengeperiod_manager import ChallengePeriodManager
+from vali_objects.utils.subtensor_weight_setter import SubtensorWeightSetter
+from vali_objects.vali_config import ValiConfig
+
+
+def reference_weight_uids(metagraph, checkpoint_results, testing_hotkeys):
+    """
+    Weight setting uid lookup against the manager list proxies, one round trip per membership check and index.
+    """
+    metagraph_hotkeys = metagraph.hotkeys
+    ans = []
+    for miner, score in checkpoint_results:
+        if miner in metagraph_hotkeys:
+            ans.append((metagraph_hotkeys.index(miner), score))
+    for miner in testing_hotkeys:
+        if miner in metagraph_hotkeys:
+            ans.append((metagraph_hotkeys.index(miner), ValiConfig.CHALLENGE_PERIOD_WEIGHT))
+    return ans
+
+
+class FakeSubtensor:
+    def __init__(self):
+        self.calls = []
+
+    def set_weights(self, netuid, wallet, uids, weights, version_key):
+        # Weights are set as float32 whether they are passed as a list or an array
+        self.calls.append(list(zip(np.asarray(uids, dtype=np.int64).tolist(),
+                                   np.asarray(weights, dtype=np.float32).tolist())))
+        return True, None
+
+
+class TestMetagraphSnapshot(TestBase):
+
+    N_UIDS = 256
+
+    def setUp(self):
+        super().setUp()
+        self.ipc_manager = Manager()
+        self.metagraph = get_ipc_metagraph(self.ipc_manager)
+        with patch('shared_objects.metagraph_updater.bt.subtensor'):
+            self.updater = MetagraphUpdater(None, self.metagraph, "validator", is_miner=False)
+        self.hotkeys = [f"miner{i}" for i in range(self.N_UIDS)]
+
+    def tearDown(self):
+        self.ipc_manager.shutdown()
+        super().tearDown()
+
+    def make_metagraph_clone(self, hotkeys):
+        n = len(hotkeys)
+        return SimpleNamespace(hotkeys=list(hotkeys), uids=np.arange(n), neurons=[],
+                               stake=np.linspace(1, 2, n), trust=np.zeros(n),
+                               validator_trust=np.zeros(n), incentive=np.full(n, 1 / max(n, 1)))
+
+    def publish(self, hotkeys):
+        clone = self.make_metagraph_clone(hotkeys)
+        self.updater.sync_lists(self.metagraph.uids, clone.uids)
+        self.updater.sync_lists(self.metagraph.hotkeys, clone.hotkeys)
+        self.updater.publish_metagraph_snapshot(clone)
+
+    def test_snapshot_is_read_only(self):
+        snapshot = MetagraphSnapshot.from_metagraph(self.make_metagraph_clone(self.hotkeys), version=3)
+        with self.assertRaises(AttributeError):
+            snapshot.version = 4
+        with self.assertRaises(ValueError):
+            snapshot.stake[0] = 10
+        restored = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(restored.version, 3)
+        self.assertTrue(restored.same_contents(snapshot))
+        self.assertEqual(restored.get_uid("miner7"), 7)
+        self.assertIsNone(restored.get_uid("unknown"))
+
+    def test_sync_lists_keeps_uid_positions(self):
+        self.publish(self.hotkeys)
+        # Replace a hotkey at uid 5 and drop the last uid
+        updated_hotkeys = list(self.hotkeys[:-1])
+        updated_hotkeys[5] = "new_miner"
+        self.publish(updated_hotkeys)
+        self.assertEqual(self.metagraph.hotkeys[:], updated_hotkeys)
+        self.assertEqual(self.metagraph.uids[:], list(range(self.N_UIDS - 1)))
+        self.assertEqual(self.metagraph.snapshot.get_uid("new_miner"), 5)
+
+    def test_version_only_changes_with_contents(self):
+        self.publish(self.hotkeys)
+        self.assertEqual(self.metagraph.snapshot_version, 1)
+        self.publish(self.hotkeys)
+        self.assertEqual(self.metagraph.snapshot_version, 1)
+        self.publish(self.hotkeys + ["new_miner"])
+        self.assertEqual(self.metagraph.snapshot_version, 2)
+
+    def test_reader_refetches_on_version_change(self):
+        self.publish(self.hotkeys)
+        reader = CacheController(self.metagraph, running_unit_tests=True)
+        snapshot = reader.get_metagraph_snapshot()
+        self.assertIs(reader.get_metagraph_snapshot(), snapshot)
+        self.publish(self.hotkeys[1:])
+        self.assertEqual(reader.get_metagraph_snapshot().hotkeys, tuple(self.hotkeys[1:]))
+
+    def test_unpublished_metagraph_falls_back_to_lists(self):
+        reader = CacheController(MockMetagraph(["a", "b", "c"]), running_unit_tests=True)
+        snapshot = reader.get_metagraph_snapshot()
+        self.assertIsNone(snapshot.version)
+        self.assertEqual(snapshot.get_uid("c"), 2)
+
+    def compare_with_proxy_lookups(self):
+        """
+        Weight setting and challenge period pruning from the snapshot against the same lookups on the metagraph
+        proxy. Returns the timings of both.
+        """
+        self.publish(self.hotkeys)
+        # Scored miners, challenge period miners and a few deregistered miners
+        checkpoint_results = [(hk, 1 / (i + 1)) for i, hk in enumerate(self.hotkeys[:200])] + [("gone", 0.5)]
+        testing_hotkeys = self.hotkeys[200:] + ["gone_testing"]
+
+        weight_setter = SubtensorWeightSetter(None, self.metagraph, SimpleNamespace(
+            perf_ledger_manager=None, challengeperiod_manager=SimpleNamespace(
+                challengeperiod_testing={hk: 0 for hk in testing_hotkeys},
+                challengeperiod_success={hk: 0 for hk, _ in checkpoint_results})), running_unit_tests=True)
+        subtensor = FakeSubtensor()
+
+        t0 = time.time()
+        reference_uids = reference_weight_uids(self.metagraph, checkpoint_results, testing_hotkeys)
+        proxy_set_weights_s = time.time() - t0
+        reference_subtensor = FakeSubtensor()
+        reference_subtensor.set_weights(8, None, [uid for uid, _ in reference_uids],
+                                        [weight for _, weight in reference_uids], 200)
+
+        with patch.object(weight_setter, 'filtered_ledger', return_value={"ledger": None}), \
+                patch.object(weight_setter, 'filtered_positions', return_value={}), \
+                patch.object(Scoring, 'compute_results_checkpoint_arrays', return_value=(
+                    [hk for hk, _ in checkpoint_results], np.array([score for _, score in checkpoint_results]))):
+            t0 = time.time()
+            weight_setter.set_weights(None, 8, subtensor)
+            snapshot_set_weights_s = time.time() - t0
+        self.assertEqual(subtensor.calls, reference_subtensor.calls)
+
+        challengeperiod_manager = ChallengePeriodManager(self.metagraph, running_unit_tests=True,
+                                                         position_manager=SimpleNamespace(elimination_manager=None))
+        deregistered = {f"deregistered{i}": 0 for i in range(10)}
+
+        def reset_challengeperiod():
+            challengeperiod_manager.challengeperiod_testing = {**{hk: 0 for hk in self.hotkeys[128:]}, **deregistered}
+            challengeperiod_manager.challengeperiod_success = {hk: 0 for hk in self.hotkeys[:128]}
+
+        reset_challengeperiod()
+        t0 = time.time()
+        self.assertTrue(challengeperiod_manager._prune_deregistered_metagraph(hotkeys=self.metagraph.hotkeys))
+        proxy_prune_s = time.time() - t0
+        expected_testing = dict(challengeperiod_manager.challengeperiod_testing)
+
+        reset_challengeperiod()
+        t0 = time.time()
+        self.assertTrue(challengeperiod_manager._prune_deregistered_metagraph())
+        snapshot_prune_s = time.time() - t0
+        self.assertEqual(challengeperiod_manager.challengeperiod_testing, expected_testing)
+
+        return proxy_set_weights_s, snapshot_set_weights_s, proxy_prune_s, snapshot_prune_s
+
+    def test_matches_proxy_lookups(self):
+        self.compare_with_proxy_lookups()
+
+    @benchmark
+    def test_metagraph_snapshot_benchmark(self):
+        proxy_set_weights_s, snapshot_set_weights_s, proxy_prune_s, snapshot_prune_s = self.compare_with_proxy_lookups()
+        print(f"{self.N_UIDS} uids. set_weights uid lookup proxy: {proxy_set_weights_s:.4f} s, "
+              f"snapshot (full set_weights): {snapshot_set_weights_s:.4f} s. "
+              f"_prune_deregistered_metagraph proxy: {proxy_prune_s:.4f} s, snapshot: {snapshot_prune_s:.4f} s")
+        self.assertLess(snapshot_prune_s, proxy_prune_s)
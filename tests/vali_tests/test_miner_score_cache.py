@@ -0,0 +1,194 @@
+import os
+import random
+import tempfile
+import time
+
+from tests.shared_objects.mock_classes import MockChallengePeriodManager, MockMetagraph, MockPositionManager
+from tests.shared_objects.test_utilities import checkpoint_generator, ledger_generator
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.scoring.miner_score_cache import MinerScoreCache
+from vali_objects.scoring.scoring import Scoring
+from vali_objects.utils.elimination_manager import EliminationManager
+from vali_objects.vali_config import TradePair, ValiConfig
+from vali_objects.vali_dataclasses.order import Order
+
+CP_MS = ValiConfig.TARGET_CHECKPOINT_DURATION_MS
+END_MS = ValiConfig.TARGET_LEDGER_WINDOW_MS
+MINUTE_MS = 1000 * 60
+
+
+class TestMinerScoreCache(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(4)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_location = os.path.join(self.tmp_dir.name, 'challengeperiod_scores.jsonl')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_checkpoint(self, last_update_ms):
+        return checkpoint_generator(last_update_ms=last_update_ms, gain=self.rng.uniform(0, .02),
+                                    loss=-self.rng.uniform(0, .02), mdd=self.rng.uniform(.92, 1), accum_ms=CP_MS,
+                                    open_ms=CP_MS)
+
+    def make_position(self, hotkey, i, open_ms, is_open=False):
+        return_at_close = self.rng.uniform(.9, .999) if is_open else self.rng.uniform(.95, 1.05)
+        leverages = [self.rng.uniform(.1, .5) for _ in range(self.rng.randint(1, 4))]
+        orders = [Order(price=60000 * self.rng.uniform(.95, 1.05), processed_ms=open_ms + j * MINUTE_MS,
+                        order_uuid=f'{hotkey}_{i}_{j}', trade_pair=TradePair.BTCUSD, order_type=OrderType.LONG,
+                        leverage=leverage) for j, leverage in enumerate(leverages)]
+        return Position(miner_hotkey=hotkey, position_uuid=f'{hotkey}_{i}', orders=orders, open_ms=open_ms,
+                        close_ms=None if is_open else open_ms + CP_MS, trade_pair=TradePair.BTCUSD,
+                        is_closed_position=not is_open, return_at_close=return_at_close)
+
+    def make_miners(self, n_miners):
+        ledgers = {}
+        positions = {}
+        for m in range(n_miners):
+            hotkey = f'miner{m}'
+            start_ms = self.rng.randrange(CP_MS, END_MS // 2, CP_MS)
+            ledgers[hotkey] = ledger_generator(checkpoints=[self.make_checkpoint(t_ms)
+                                                            for t_ms in range(start_ms, END_MS, CP_MS)])
+            # The first order opens the ledger's first checkpoint
+            open_times_ms = [start_ms - CP_MS] + [self.rng.randrange(start_ms, END_MS) for _ in range(self.rng.randint(1, 30))]
+            positions[hotkey] = sorted([self.make_position(hotkey, i, open_ms, is_open=i == 0 and self.rng.random() < .3)
+                                        for i, open_ms in enumerate(open_times_ms)], key=lambda p: p.open_ms)
+        # A miner without a ledger
+        ledgers['no_ledger'] = None
+        positions['no_ledger'] = [self.make_position('no_ledger', 0, END_MS // 2)]
+        return ledgers, positions
+
+    def change_miner(self, ledger, positions, hotkey, now_ms):
+        """
+        One of the changes a miner sees between refreshes.
+        """
+        change = self.rng.randrange(4)
+        if change == 0 and ledger.cps:
+            ledger.cps.append(self.make_checkpoint(ledger.cps[-1].last_update_ms + CP_MS))
+        elif change == 1 and ledger.cps:
+            # The ledger update extends the last checkpoint
+            ledger.cps[-1] = self.make_checkpoint(ledger.cps[-1].last_update_ms + MINUTE_MS)
+        elif change == 2 and positions:
+            positions[-1].orders.append(Order(price=60000, processed_ms=now_ms, order_uuid=f'{hotkey}_{now_ms}',
+                                              trade_pair=TradePair.BTCUSD, order_type=OrderType.LONG, leverage=.1))
+        else:
+            positions.append(self.make_position(hotkey, len(positions), now_ms))
+
+    def test_matches_score_miners(self):
+        ledgers, positions = self.make_miners(40)
+        cache = MinerScoreCache()
+        now_ms = END_MS
+        for tick in range(30):
+            for hotkey in self.rng.sample([h for h in ledgers if ledgers[h]], self.rng.randint(0, 4)):
+                self.change_miner(ledgers[hotkey], positions[hotkey], hotkey, now_ms)
+            # Open positions move with the market and closed positions age out of the lookback window
+            if tick % 5 == 0:
+                hotkey = self.rng.choice([h for h, ps in positions.items() if ps and ps[0].is_open_position] or [None])
+                if hotkey:
+                    positions[hotkey][0].return_at_close = self.rng.uniform(.9, 1.1)
+            now_ms += self.rng.choice([MINUTE_MS, 3 * 24 * 60 * MINUTE_MS])
+            subset = self.rng.sample(list(ledgers), 30)
+            ledger_subset = {hotkey: ledgers[hotkey] for hotkey in subset}
+            expected = Scoring.score_miners(ledger_subset, positions, now_ms)
+            self.assertEqual(expected, cache.score_miners(ledger_subset, positions, now_ms))
+        self.assertGreater(cache.stats['n_hits'], cache.stats['n_misses'])
+
+    def test_log_replay(self):
+        ledgers, positions = self.make_miners(20)
+        cache = MinerScoreCache(self.file_location)
+        now_ms = END_MS
+        for _ in range(10):
+            for hotkey in self.rng.sample(list(ledgers)[:-1], 2):
+                self.change_miner(ledgers[hotkey], positions[hotkey], hotkey, now_ms)
+            now_ms += MINUTE_MS
+            cache.score_miners(ledgers, positions, now_ms)
+        cache.retain(set(list(ledgers)[5:]))
+        self.assertEqual(cache.stats['n_compactions'], 1)
+
+        replayed = MinerScoreCache(self.file_location)
+        self.assertEqual(cache.entries, replayed.entries)
+        self.assertEqual(replayed.score_miners(ledgers, positions, now_ms), Scoring.score_miners(ledgers, positions, now_ms))
+        self.assertEqual(replayed.stats['n_misses'], 5)
+
+        # A crash in the middle of an append loses only that line
+        with open(self.file_location, 'a') as f:
+            f.write('["miner3", [1, 2')
+        truncated = MinerScoreCache(self.file_location)
+        self.assertEqual(cache.entries.keys() | {f'miner{m}' for m in range(5)}, truncated.entries.keys())
+        self.assertEqual(truncated.entries, MinerScoreCache(self.file_location).entries)
+
+    def test_log_compaction_and_config_changes(self):
+        ledgers, positions = self.make_miners(10)
+        cache = MinerScoreCache(self.file_location)
+        cache.COMPACTION_MIN_LINES = 30
+        cache.COMPACTION_FACTOR = 2
+        now_ms = END_MS
+        for _ in range(40):
+            hotkey = self.rng.choice(list(ledgers)[:-1])
+            self.change_miner(ledgers[hotkey], positions[hotkey], hotkey, now_ms)
+            cache.score_miners(ledgers, positions, now_ms)
+            with open(self.file_location) as f:
+                self.assertLessEqual(len(f.readlines()), 30)
+        self.assertGreater(cache.stats['n_compactions'], 1)
+        self.assertEqual(cache.entries, MinerScoreCache(self.file_location).entries)
+
+        original_version = ValiConfig.VERSION
+        try:
+            ValiConfig.VERSION = 'next'
+            self.assertEqual(MinerScoreCache(self.file_location).entries, {})
+        finally:
+            ValiConfig.VERSION = original_version
+
+    @benchmark
+    def test_refresh_benchmark(self):
+        """
+        The scoring done by ChallengePeriodManager.refresh with 400 successful and 100 testing miners, when 1% of
+        the miners change between ticks.
+        """
+        ledgers, positions = self.make_miners(500)
+        del ledgers['no_ledger'], positions['no_ledger']
+        hotkeys = list(ledgers)
+        success_hotkeys = hotkeys[:400]
+        inspection_hotkeys = {hotkey: END_MS - ValiConfig.CHALLENGE_PERIOD_MS // 2 for hotkey in hotkeys[400:]}
+
+        metagraph = MockMetagraph(hotkeys)
+        elimination_manager = EliminationManager(metagraph, None, None, running_unit_tests=True)
+        position_manager = MockPositionManager(metagraph, perf_ledger_manager=None,
+                                               elimination_manager=elimination_manager)
+        manager = MockChallengePeriodManager(metagraph, position_manager=position_manager)
+        manager.score_cache = MinerScoreCache()
+        n_ticks = 20
+        tick_times_ms = [END_MS + (i + 1) * MINUTE_MS for i in range(n_ticks)]
+        changes = [self.rng.sample(hotkeys, len(hotkeys) // 100) for _ in range(n_ticks)]
+
+        def replay(reset_cache):
+            results = []
+            elapsed_s = 0
+            for now_ms, changed in zip(tick_times_ms, changes):
+                for hotkey in changed:
+                    self.change_miner(ledgers[hotkey], positions[hotkey], hotkey, now_ms)
+                if reset_cache:
+                    manager.score_cache = MinerScoreCache()
+                t0 = time.perf_counter()
+                results.append(manager.inspect(positions, ledgers, success_hotkeys, inspection_hotkeys, now_ms))
+                elapsed_s += time.perf_counter() - t0
+            return elapsed_s / n_ticks * 1000, results
+
+        # Both replays start from the same miners
+        rng_state = self.rng.getstate()
+        snapshot = ({h: ledger_generator(checkpoints=list(ledger.cps)) for h, ledger in ledgers.items()},
+                    {h: [p.model_copy(deep=True) for p in ps] for h, ps in positions.items()})
+        full_ms, expected = replay(reset_cache=True)
+        self.rng.setstate(rng_state)
+        ledgers, positions = snapshot
+        manager.score_cache = MinerScoreCache(self.file_location)
+        manager.score_cache.score_miners(ledgers, positions, END_MS)
+        cached_ms, results = replay(reset_cache=False)
+        self.assertEqual(expected, results)
+        print(f"Challenge period scoring of 500 miners with 1% changing per tick: full rescore {full_ms:.1f} ms/tick, "
+              f"incremental {cached_ms:.1f} ms/tick")
+        self.assertLess(cached_ms * 5, full_ms)
@@ -0,0 +1,42 @@
+from runnable.generate_request_minerstatistics import MinerStatisticsManager
+from tests.shared_objects.mock_classes import MockMetagraph, MockPositionManager
+from tests.vali_tests.base_objects.test_base import TestBase
+from vali_objects.utils.elimination_manager import EliminationManager
+
+
+class TestMinerStatisticsCache(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.mock_metagraph = MockMetagraph(["miner0", "miner1"])
+        self.elimination_manager = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        self.position_manager = MockPositionManager(self.mock_metagraph,
+                                                    perf_ledger_manager=None,
+                                                    elimination_manager=self.elimination_manager)
+        self.msm = MinerStatisticsManager(self.position_manager, None, None)
+
+    def final_dict(self, hotkeys, version="1"):
+        return {"version": version,
+                "created_timestamp_ms": 123,
+                "created_date": "1970-01-01 00:00:00",
+                "constants": {"a": 1},
+                "data": [{"hotkey": hk, "weight": {"value": i}} for i, hk in enumerate(hotkeys)]}
+
+    def test_cache_empty_before_first_cycle(self):
+        assert self.msm.get_cached_miner_statistics("miner0") is None
+
+    def test_cache_matches_selected_hotkey_format(self):
+        self.msm.update_miner_statistics_cache(self.final_dict(["miner0", "miner1"]))
+        stats = self.msm.get_cached_miner_statistics("miner1")
+        assert stats["version"] == "1"
+        assert stats["constants"] == {"a": 1}
+        assert stats["data"] == [{"hotkey": "miner1", "weight": {"value": 1}}]
+
+        # Unknown hotkeys get an empty data list, as with selected_miner_hotkeys
+        assert self.msm.get_cached_miner_statistics("unknown")["data"] == []
+
+    def test_cache_drops_stale_hotkeys(self):
+        self.msm.update_miner_statistics_cache(self.final_dict(["miner0", "miner1"]))
+        self.msm.update_miner_statistics_cache(self.final_dict(["miner1"], version="2"))
+        assert self.msm.get_cached_miner_statistics("miner0")["data"] == []
+        assert self.msm.get_cached_miner_statistics("miner1")["version"] == "2"
@@ -423,6 +423,43 @@ class TestPositions(TestBase):
         assert len(self.p2p_syncer.golden["positions"][self.DEFAULT_MINER_HOTKEY]["positions"]) == 1
         assert len(self.p2p_syncer.golden["positions"][self.DEFAULT_MINER_HOTKEY]["positions"][0]["orders"]) == 1
 
+    def test_partition_checkpoints_by_miner(self):
+        position = deepcopy(self.default_position)
+        position.rebuild_position_with_updated_orders()
+        position_dict = json.loads(position.to_json_string())
+
+        checkpoint1 = {"positions": {self.DEFAULT_MINER_HOTKEY: {"positions": [position_dict]}}}
+        checkpoint2 = {"positions": {self.DEFAULT_MINER_HOTKEY: {"positions": [position_dict]}, "diff_miner": {"positions": [position_dict]}}}
+        checkpoint3 = {}
+
+        checkpoints = {"test_validator1": checkpoint1, "test_validator2": checkpoint2, "test_validator3": checkpoint3}
+        partitions = dict(self.p2p_syncer.partition_checkpoints_by_miner(checkpoints))
+
+        assert list(partitions.keys()) == [self.DEFAULT_MINER_HOTKEY, "diff_miner"]
+        assert list(partitions[self.DEFAULT_MINER_HOTKEY].keys()) == ["test_validator1", "test_validator2"]
+        assert list(partitions["diff_miner"].keys()) == ["test_validator2"]
+        assert partitions["diff_miner"]["test_validator2"] is checkpoint2["positions"]["diff_miner"]
+
+    def test_golden_positions_keep_first_seen_miner_order(self):
+        position = deepcopy(self.default_position)
+        position.rebuild_position_with_updated_orders()
+        position_dict = json.loads(position.to_json_string())
+
+        miner_hotkeys = [f"miner{i}" for i in range(20)]
+        checkpoints = {}
+        for v in range(3):
+            positions = {}
+            for miner_hotkey in miner_hotkeys:
+                miner_position = {**position_dict, "miner_hotkey": miner_hotkey,
+                                  "position_uuid": f"{miner_hotkey}_position",
+                                  "orders": [{**o, "order_uuid": f"{miner_hotkey}_order"} for o in position_dict["orders"]]}
+                positions[miner_hotkey] = {"positions": [miner_position]}
+            checkpoints[f"test_validator{v}"] = {"positions": positions}
+
+        for _ in range(3):
+            golden_positions = self.p2p_syncer.p2p_sync_positions(checkpoints)
+            assert list(golden_positions.keys()) == miner_hotkeys
+
     def test_heuristic_resolve_positions(self):
         order1 = deepcopy(self.default_order)
         order1.order_uuid = "test_order1"
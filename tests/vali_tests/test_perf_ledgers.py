@@ -1,3 +1,4 @@
+import pickle
 from unittest.mock import patch
 
 from tests.vali_tests.base_objects.test_base import TestBase
@@ -8,7 +9,8 @@ from vali_objects.vali_config import TradePair
 from vali_objects.enums.order_type_enum import OrderType
 from vali_objects.position import Position
 from vali_objects.vali_dataclasses.order import Order
-from vali_objects.vali_dataclasses.perf_ledger import PerfLedgerManager
+from vali_objects.vali_dataclasses.perf_ledger import PerfLedgerManager, PerfLedgerView
+from tests.shared_objects.test_utilities import generate_ledger
 
 class TestPerfLedgers(TestBase):
 
@@ -45,3 +47,31 @@ class TestPerfLedgers(TestBase):
         print('max_perf_ledger_return:', ans[self.DEFAULT_MINER_HOTKEY].max_return)
         assert len(ans) == 1, ans
 
+    def test_perf_ledger_views(self):
+        ledger = generate_ledger(0.1)
+        self.perf_ledger_manager.save_perf_ledgers({self.DEFAULT_MINER_HOTKEY: ledger})
+
+        views = self.perf_ledger_manager.get_perf_ledger_views()
+        view = views[self.DEFAULT_MINER_HOTKEY]
+        assert isinstance(view, PerfLedgerView)
+        # Checkpoints are shared with memory rather than copied
+        assert view.cps[0] is ledger.cps[0]
+        assert view.to_dict() == ledger.to_dict()
+        assert view.get_total_product() == ledger.get_total_product()
+        assert view.last_update_ms == ledger.last_update_ms
+        with self.assertRaises(AttributeError):
+            view.max_return = 2.0
+
+        # Reused until the ledgers are written again
+        assert self.perf_ledger_manager.get_perf_ledger_views()[self.DEFAULT_MINER_HOTKEY] is view
+        self.perf_ledger_manager.save_perf_ledgers({self.DEFAULT_MINER_HOTKEY: generate_ledger(0.2)})
+        new_view = self.perf_ledger_manager.get_perf_ledger_views()[self.DEFAULT_MINER_HOTKEY]
+        assert new_view is not view
+        assert new_view.generation > view.generation
+
+        # Mutating requires a copy, which leaves memory untouched
+        ledger_copy = new_view.copy()
+        ledger_copy.cps.pop()
+        assert len(new_view.cps) == len(ledger_copy.cps) + 1
+
+        assert pickle.loads(pickle.dumps(new_view)).to_dict() == new_view.to_dict()
@@ -0,0 +1,144 @@
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.utils import fast_json
+from vali_objects.utils.vali_bkp_utils import CustomEncoder
+from vali_objects.vali_config import TradePair, ValiConfig
+from vali_objects.vali_dataclasses.order import Order
+from vali_objects.vali_dataclasses.price_source import PriceSource
+
+
+def reference_to_json_string(position: Position) -> str:
+    """
+    Position.to_json_string before the orjson encoder, a round trip through pydantic's JSON and the stdlib encoder.
+    """
+    return json.dumps(position._handle_trade_pair_encoding(json.loads(position.model_dump_json())))
+
+
+def generate_positions(rng, n_positions):
+    trade_pairs = [TradePair.BTCUSD, TradePair.ETHUSD, TradePair.EURUSD, TradePair.SPX, TradePair.USDJPY]
+    positions = []
+    for i in range(n_positions):
+        trade_pair = trade_pairs[i % len(trade_pairs)]
+        position = Position(miner_hotkey=f"miner{i % 7}", position_uuid=f"position{i}", open_ms=1_700_000_000_000 + i,
+                            trade_pair=trade_pair)
+        for k in range(rng.randint(1, 3)):
+            price = rng.uniform(1, 100)
+            price_sources = [PriceSource(source='Polygon_rest', start_ms=position.open_ms + k, timespan_ms=1000,
+                                         open=price, close=price, high=price, low=price, vwap=price, lag_ms=12)]
+            position.orders.append(Order(order_type=rng.choice([OrderType.LONG, OrderType.SHORT]), leverage=0.1,
+                                         price=price, trade_pair=trade_pair, processed_ms=position.open_ms + k,
+                                         order_uuid=f"{i}_{k}", price_sources=price_sources))
+        if rng.random() < .5:
+            position.orders.append(Order(order_type=OrderType.FLAT, leverage=0, price=rng.uniform(1, 100),
+                                         trade_pair=trade_pair, processed_ms=position.open_ms + 10,
+                                         order_uuid=f"{i}_flat"))
+        position.rebuild_position_with_updated_orders()
+        positions.append(position)
+    return positions
+
+
+class TestPositionCodec(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(5)
+        with open(ValiConfig.BASE_DIR + "/data/positions_overrides/"
+                                        "5GhCxfBcA7Ur5iiAS343xwvrYHTUfBjBi4JimiL5LhujRT9t.json") as f:
+            # Position files written by an older release. Orders predate the src field.
+            self.legacy_position_strings = json.load(f)
+
+    def assert_same_position(self, expected: Position, actual: Position):
+        self.assertEqual(expected, actual)
+        self.assertEqual(expected.model_dump(), actual.model_dump())
+        self.assertEqual(expected.model_fields_set, actual.model_fields_set)
+        for expected_order, actual_order in zip(expected.orders, actual.orders):
+            self.assertIs(actual_order.trade_pair, expected.trade_pair)
+            self.assertEqual(expected_order.model_fields_set, actual_order.model_fields_set)
+            self.assertEqual([ps.model_dump() for ps in expected_order.price_sources],
+                             [ps.model_dump() for ps in actual_order.price_sources])
+
+    def test_legacy_files_round_trip(self):
+        for position_string in self.legacy_position_strings:
+            validated = Position.model_validate_json(position_string)
+            self.assert_same_position(validated, Position.from_json_string(position_string))
+
+            position_json = validated.to_json_string()
+            self.assertEqual(json.loads(position_json), json.loads(reference_to_json_string(validated)))
+            self.assertEqual(json.loads(position_json), validated.to_json_dict())
+            # Rewritten files hold every field, including the ones the legacy file predates
+            revalidated = Position.model_validate_json(position_json)
+            self.assertEqual(revalidated.model_dump(), validated.model_dump())
+            self.assert_same_position(revalidated, Position.from_json_string(position_json))
+
+    def test_generated_positions_round_trip(self):
+        for position in generate_positions(self.rng, 200):
+            position_json = position.to_json_string()
+            self.assertEqual(json.loads(position_json), json.loads(reference_to_json_string(position)))
+            self.assert_same_position(Position.model_validate_json(position_json),
+                                      Position.from_json_string(position_json))
+            self.assert_same_position(Position(**position.to_json_dict()),
+                                      Position.from_trusted_dict(position.to_json_dict()))
+
+    def test_trusted_dict_is_not_aliased(self):
+        position_dict = generate_positions(self.rng, 1)[0].to_json_dict()
+        expected = json.loads(json.dumps(position_dict))
+        position = Position.from_trusted_dict(position_dict)
+        position.orders[0].price_sources[0].close = -1.0
+        position.orders.append(position.orders[0])
+        position.net_leverage = 100.0
+        self.assertEqual(position_dict, expected)
+
+    def test_ints_are_coerced_to_floats(self):
+        position_dict = json.loads(self.legacy_position_strings[0])
+        position_dict['current_return'] = 1
+        position_dict['orders'][0]['price'] = 2
+        position = Position.from_trusted_dict(position_dict)
+        self.assertIsInstance(position.current_return, float)
+        self.assertIsInstance(position.orders[0].price, float)
+        self.assert_same_position(Position(**json.loads(json.dumps(position_dict))), position)
+
+    def test_encoder_matches_custom_encoder(self):
+        data = {'n': np.int64(3), 'x': np.float64(0.25), 'arr': np.arange(3), 7: [1.5, None, "a"],
+                'price_source': PriceSource(source='test', open=1.0, close=2.0)}
+        expected = json.loads(json.dumps({**data, 'arr': [0, 1, 2]}, cls=CustomEncoder))
+        self.assertEqual(fast_json.loads(fast_json.dumps(data)), expected)
+        # Files written by the stdlib encoder may hold NaN
+        self.assertTrue(math.isnan(fast_json.loads('{"x": NaN}')['x']))
+
+    @benchmark
+    def test_load_100k_positions_benchmark(self):
+        n_positions = 100_000
+        # Serializing is the slow part of building the test data. Reuse a few thousand distinct files.
+        positions = generate_positions(self.rng, 2000)
+        t0 = time.time()
+        reference_strings = [reference_to_json_string(p) for p in positions]
+        reference_dump_s = time.time() - t0
+        t0 = time.time()
+        position_strings = [p.to_json_string() for p in positions]
+        dump_s = time.time() - t0
+        position_strings = (position_strings * (n_positions // len(position_strings)))[:n_positions]
+
+        t0 = time.time()
+        validated = [Position.model_validate_json(s) for s in position_strings]
+        validated_s = time.time() - t0
+        t0 = time.time()
+        trusted = [Position.from_json_string(s) for s in position_strings]
+        trusted_s = time.time() - t0
+        for i in range(0, n_positions, 997):
+            self.assert_same_position(validated[i], trusted[i])
+        self.assertEqual([json.loads(s) for s in reference_strings[:100]],
+                         [json.loads(s) for s in position_strings[:100]])
+
+        n_orders = sum(len(p.orders) for p in trusted)
+        print(f"{n_positions} positions, {n_orders} orders. load with validation: {validated_s:.2f} s, "
+              f"trusted: {trusted_s:.2f} s. encode {len(positions)} positions reference: {reference_dump_s:.3f} s, "
+              f"orjson: {dump_s:.3f} s")
+        self.assertLess(dump_s, reference_dump_s)
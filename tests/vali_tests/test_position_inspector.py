@@ -0,0 +1,200 @@
+import random
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from miner_objects.position_inspector import PositionInspector
+from template.protocol import GetPositions
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.utils.position_digest import PositionDigest
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order
+
+
+class MockValidator:
+    """
+    Answers GetPositions the same way Validator.get_positions does, from an in memory list of positions.
+    """
+    def __init__(self, hotkey, positions, position_dicts):
+        self.hotkey = hotkey
+        self.positions = positions
+        # Position.to_dict is deterministic, so share the serialized positions between validators to keep the test fast
+        self.position_dicts = position_dicts
+
+    def to_dict(self, position):
+        key = (position.position_uuid, len(position.orders))
+        if key not in self.position_dicts:
+            self.position_dicts[key] = position.to_dict()
+        return self.position_dicts[key]
+
+    def get_positions(self, synapse):
+        positions = self.positions
+        if synapse.version >= 2:
+            synapse.position_digests, positions = PositionDigest.positions_to_send(
+                positions, synapse.known_position_digests)
+        synapse.positions = [self.to_dict(p) for p in positions]
+        synapse.successfully_processed = True
+        return synapse
+
+
+class FakeDendrite:
+    """
+    Delivers GetPositions requests to mock validators and counts the bytes of every request and response body.
+    """
+    def __init__(self, validators):
+        self.hotkey_to_validator = {v.hotkey: v for v in validators}
+        self.bytes_transferred = 0
+
+    def __call__(self, wallet=None):
+        return self
+
+    def query(self, axons, synapse, deserialize=True):
+        responses = []
+        request_json = synapse.model_dump_json()
+        for axon in axons:
+            self.bytes_transferred += len(request_json)
+            response = self.hotkey_to_validator[axon.hotkey].get_positions(GetPositions.model_validate_json(request_json))
+            self.bytes_transferred += len(response.model_dump_json())
+            responses.append(response)
+        return responses
+
+
+def generate_open_positions(rng, n_positions, trade_pairs):
+    positions = []
+    for i in range(n_positions):
+        trade_pair = trade_pairs[i % len(trade_pairs)]
+        orders = [Order.model_construct(order_type=OrderType.LONG, leverage=0.1, price=100.0, trade_pair=trade_pair,
+                                        processed_ms=1_700_000_000_000 + i * 1000 + k, order_uuid=f"{i}_{k}")
+                  for k in range(rng.randint(1, 4))]
+        positions.append(Position.model_construct(miner_hotkey="miner", position_uuid=f"position{i}",
+                                                  open_ms=orders[0].processed_ms, trade_pair=trade_pair,
+                                                  orders=orders, net_leverage=0.1 * len(orders)))
+    return positions
+
+
+def add_order(position):
+    position = position.model_copy(update={'orders': position.orders + [position.orders[-1]]})
+    return position
+
+
+class TestPositionInspector(TestBase):
+
+    N_VALIDATORS = 10
+    N_POSITIONS = 1500
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(3)
+        self.trade_pairs = [tp for tp in TradePair][:30]
+        self.make_validators(self.N_VALIDATORS, self.N_POSITIONS)
+
+    def make_validators(self, n_validators, n_positions):
+        self.positions = generate_open_positions(self.rng, n_positions, self.trade_pairs)
+        self.axons = [SimpleNamespace(hotkey=f"validator{i}") for i in range(n_validators)]
+        position_dicts = {}
+        self.validators = [MockValidator(axon.hotkey, list(self.positions), position_dicts) for axon in self.axons]
+        metagraph = SimpleNamespace(neurons=[SimpleNamespace(hotkey=axon.hotkey, validator_trust=0.9)
+                                             for axon in self.axons])
+        config = SimpleNamespace(subtensor=SimpleNamespace(network="finney"))
+        self.inspector = PositionInspector(None, metagraph, config)
+        self.legacy_inspector = PositionInspector(None, metagraph, config)
+        self.dendrite = FakeDendrite(self.validators)
+
+    def run_round(self, inspector, version=2):
+        self.dendrite.bytes_transferred = 0
+        with patch('miner_objects.position_inspector.bt.dendrite', self.dendrite), \
+                patch('miner_objects.position_inspector.GetPositions',
+                      lambda **kwargs: GetPositions(**{**kwargs, 'version': version})), \
+                patch('miner_objects.position_inspector.bt.logging'):
+            t0 = time.time()
+            result = inspector.get_positions_with_retry(self.axons)
+            elapsed_s = time.time() - t0
+        return result, self.dendrite.bytes_transferred, elapsed_s
+
+    def assert_matches_legacy(self, result):
+        legacy_result, legacy_bytes, legacy_s = self.run_round(self.legacy_inspector, version=1)
+        def sort_key(p):
+            return p['position_uuid']
+
+        self.assertEqual(sorted(result, key=sort_key), sorted(legacy_result, key=sort_key))
+        return legacy_bytes, legacy_s
+
+    def test_digests(self):
+        positions = self.positions[:100]
+        digests = PositionDigest.trade_pair_digests(positions)
+        self.assertEqual(digests, PositionDigest.trade_pair_digests_from_dicts([p.to_dict() for p in positions]))
+        # Order does not matter, order counts do
+        self.assertEqual(digests, PositionDigest.trade_pair_digests(positions[::-1]))
+        changed = [add_order(positions[0])] + positions[1:]
+        changed_digests = PositionDigest.trade_pair_digests(changed)
+        changed_tp = positions[0].trade_pair.trade_pair_id
+        self.assertEqual({tp for tp in digests if digests[tp] != changed_digests[tp]}, {changed_tp})
+
+        sent_digests, to_send = PositionDigest.positions_to_send(changed, {tp: [d] for tp, d in digests.items()})
+        self.assertEqual(sent_digests, changed_digests)
+        self.assertEqual({p.trade_pair.trade_pair_id for p in to_send}, {changed_tp})
+
+        # Price corrections and eliminations change positions without adding orders
+        for update in [{'return_at_close': 0.97}, {'is_closed_position': True}]:
+            changed = [positions[0].model_copy(update=update)] + positions[1:]
+            changed_digests = PositionDigest.trade_pair_digests(changed)
+            self.assertEqual({tp for tp in digests if digests[tp] != changed_digests[tp]}, {changed_tp})
+            self.assertEqual(changed_digests,
+                             PositionDigest.trade_pair_digests_from_dicts([p.to_dict() for p in changed]))
+
+    def test_legacy_validator_response(self):
+        # Validators that ignore the digest fields send every position and no digests
+        result, _, _ = self.run_round(self.inspector, version=1)
+        self.assertEqual(len(result), self.N_POSITIONS)
+        self.assertEqual(self.inspector.position_digest_cache, {})
+
+    def reconcile(self):
+        """
+        A cold round, a steady state round and a round after some positions changed, each checked against the full
+        payload. Returns the bytes moved and the time taken by each.
+        """
+        cold_result, cold_bytes, cold_s = self.run_round(self.inspector)
+        legacy_bytes, legacy_s = self.assert_matches_legacy(cold_result)
+
+        steady_result, steady_bytes, steady_s = self.run_round(self.inspector)
+        self.assert_matches_legacy(steady_result)
+        # Only digests move once the miner has every trade pair
+        self.assertLess(steady_bytes * 100, legacy_bytes)
+
+        # Some validators see an extra order, one validator missed a newly opened position
+        changed_index = self.rng.randrange(len(self.positions))
+        changed_position = add_order(self.positions[changed_index])
+        for validator in self.validators[:5]:
+            validator.positions[changed_index] = changed_position
+        new_position = generate_open_positions(self.rng, 1, self.trade_pairs[-1:])[0]
+        new_position.position_uuid = "new_position"
+        for validator in self.validators[1:]:
+            validator.positions.append(new_position)
+        changed_result, changed_bytes, changed_s = self.run_round(self.inspector)
+        self.assertIn(changed_position.position_uuid, [p['position_uuid'] for p in changed_result])
+        _, changed_legacy_s = self.assert_matches_legacy(changed_result)
+        self.assertLess(changed_bytes * 10, legacy_bytes)
+        # Only trade pair digests some validator still reports stay cached
+        self.assertEqual(set(self.inspector.position_digest_cache),
+                         {(tp, digest) for v in self.validators
+                          for tp, digest in PositionDigest.trade_pair_digests(v.positions).items()})
+
+        return legacy_bytes, legacy_s, cold_bytes, cold_s, steady_bytes, steady_s, changed_bytes, changed_s, changed_legacy_s
+
+    def test_reconciliation_matches_full_payload(self):
+        self.reconcile()
+
+    @benchmark
+    def test_reconciliation_benchmark(self):
+        n_validators, n_positions = 30, 5000
+        self.make_validators(n_validators, n_positions)
+        legacy_bytes, legacy_s, cold_bytes, cold_s, steady_bytes, steady_s, changed_bytes, changed_s, changed_legacy_s = \
+            self.reconcile()
+        print(f"{n_validators} validators, {n_positions} positions. "
+              f"full payload: {legacy_bytes / 1e6:.2f} MB in {legacy_s:.3f} s. "
+              f"digest cold: {cold_bytes / 1e6:.2f} MB in {cold_s:.3f} s. "
+              f"steady state: {steady_bytes / 1e3:.1f} KB in {steady_s:.3f} s. "
+              f"two trade pairs changed: {changed_bytes / 1e3:.1f} KB in {changed_s:.3f} s "
+              f"(full payload {changed_legacy_s:.3f} s, mostly logging the mis-synced positions)")
@@ -0,0 +1,263 @@
+import multiprocessing
+import random
+import threading
+import time
+from copy import deepcopy
+from unittest.mock import patch
+
+from tests.shared_objects.mock_classes import MockMetagraph, MockChallengePeriodManager
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.utils.auto_sync import PositionSyncer
+from vali_objects.utils.elimination_manager import EliminationManager
+from vali_objects.utils.position_lock import PositionLocks, ReaderWriterLock
+from vali_objects.utils.position_manager import PositionManager
+from vali_objects.utils.validator_sync_base import AUTO_SYNC_ORDER_LAG_MS
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order
+
+
+class LegacyPositionLocks:
+    """
+    PositionLocks before the lock table was striped. A global lock guards a dict holding one lock per key.
+    """
+    def __init__(self):
+        self.locks = {}
+        self.global_lock = multiprocessing.Lock()
+
+    def get_lock(self, miner_hotkey, trade_pair):
+        lock_key = (miner_hotkey, trade_pair)
+        with self.global_lock:
+            if lock_key not in self.locks:
+                self.locks[lock_key] = multiprocessing.Lock()
+        return self.locks[lock_key]
+
+    def get_read_lock(self, miner_hotkey, trade_pair):
+        return self.get_lock(miner_hotkey, trade_pair)
+
+
+def stripe_in_new_process(miner_hotkey, trade_pair):
+    return PositionLocks().get_stripe(miner_hotkey, trade_pair)
+
+
+def hold_lock(lock, acquired_event, release_event):
+    with lock:
+        acquired_event.set()
+        release_event.wait(30)
+
+
+class TestPositionLock(TestBase):
+
+    N_THREADS = 64
+    N_OPS_PER_THREAD = 200
+    N_HOTKEYS = 256
+
+    def setUp(self):
+        super().setUp()
+        self.trade_pair_ids = [tp.trade_pair_id for tp in TradePair]
+
+    def test_stripe_is_stable(self):
+        locks = PositionLocks()
+        self.assertEqual(len(locks.locks), PositionLocks.N_STRIPES)
+        self.assertIs(locks.get_lock("miner", "BTCUSD"), locks.get_lock("miner", "BTCUSD"))
+        stripes = {locks.get_stripe(f"miner{i}", tp) for i in range(self.N_HOTKEYS) for tp in self.trade_pair_ids}
+        # Keys spread over the whole table
+        self.assertGreater(len(stripes), PositionLocks.N_STRIPES * .9)
+        # Other processes pick the same stripe for a key
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            self.assertEqual(pool.apply(stripe_in_new_process, ("miner", "BTCUSD")), locks.get_stripe("miner", "BTCUSD"))
+
+    def test_exclusive_lock_across_processes(self):
+        for locks in [PositionLocks(), PositionLocks(reader_writer=True)]:
+            acquired, release = multiprocessing.Event(), multiprocessing.Event()
+            child = multiprocessing.Process(target=hold_lock, args=(locks.get_lock("miner", "BTCUSD"), acquired,
+                                                                    release))
+            child.start()
+            self.assertTrue(acquired.wait(30))
+            self.assertFalse(locks.get_lock("miner", "BTCUSD").acquire(block=False))
+            self.assertFalse(locks.get_read_lock("miner", "BTCUSD").acquire(timeout=.05))
+            release.set()
+            child.join(30)
+            self.assertTrue(locks.get_lock("miner", "BTCUSD").acquire(timeout=30))
+            locks.get_lock("miner", "BTCUSD").release()
+
+    def test_readers_share_writers_exclude(self):
+        rw_lock = ReaderWriterLock()
+        acquired, release = multiprocessing.Event(), multiprocessing.Event()
+        child = multiprocessing.Process(target=hold_lock, args=(rw_lock.reader, acquired, release))
+        child.start()
+        self.assertTrue(acquired.wait(30))
+        # A reader in another process doesn't block readers here
+        self.assertTrue(rw_lock.acquire_read(block=False))
+        rw_lock.release_read()
+        self.assertFalse(rw_lock.acquire_write(timeout=.05))
+        # A waiting writer holds back new readers so it can't be starved
+        writer = threading.Thread(target=lambda: rw_lock.writer.acquire())
+        writer.start()
+        time.sleep(.1)
+        self.assertFalse(rw_lock.acquire_read(timeout=.05))
+        release.set()
+        child.join(30)
+        writer.join(30)
+        self.assertFalse(writer.is_alive())
+        self.assertFalse(rw_lock.acquire_read(block=False))
+        rw_lock.release_write()
+        self.assertTrue(rw_lock.acquire_read(block=False))
+        rw_lock.release_read()
+        self.assertEqual(list(rw_lock.state), [0, 0, 0])
+
+    def run_contention(self, locks, read_fraction, n_hotkeys, n_ops_per_thread=None):
+        """
+        Each thread reads or writes a random (hotkey, trade pair). Writers check that nobody else is inside the
+        critical section of their key. Returns operations per second.
+        """
+        n_ops_per_thread = n_ops_per_thread or self.N_OPS_PER_THREAD
+        in_section = {}
+        violations = []
+        counter_lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(n_ops_per_thread):
+                key = (f"miner{rng.randrange(n_hotkeys)}", rng.choice(self.trade_pair_ids[:8]))
+                is_read = rng.random() < read_fraction
+                lock = locks.get_read_lock(*key) if is_read else locks.get_lock(*key)
+                with lock:
+                    with counter_lock:
+                        readers, writers = in_section.get(key, (0, 0))
+                        if writers or (not is_read and readers):
+                            violations.append(key)
+                        in_section[key] = (readers + is_read, writers + (not is_read))
+                    # Disk IO of a position read or write
+                    time.sleep(.0002)
+                    with counter_lock:
+                        readers, writers = in_section[key]
+                        in_section[key] = (readers - is_read, writers - (not is_read))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.N_THREADS)]
+        t0 = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(120)
+        elapsed_s = time.time() - t0
+        self.assertFalse(any(t.is_alive() for t in threads))
+        self.assertEqual(violations, [])
+        return self.N_THREADS * n_ops_per_thread / elapsed_s
+
+    def test_locks_exclude_under_contention(self):
+        for locks in [PositionLocks(), PositionLocks(reader_writer=True)]:
+            self.run_contention(locks, .5, 2, n_ops_per_thread=20)
+
+    @benchmark
+    def test_contention_benchmark(self):
+        msg = f"{self.N_THREADS} threads x {self.N_OPS_PER_THREAD} ops, 8 trade pairs."
+        # A busy validator, and a few miners hammering the same positions
+        for n_hotkeys, read_fraction in [(self.N_HOTKEYS, .5), (self.N_HOTKEYS, .9), (2, .9)]:
+            legacy_locks = LegacyPositionLocks()
+            legacy_ops = self.run_contention(legacy_locks, read_fraction, n_hotkeys)
+            striped_ops = self.run_contention(PositionLocks(), read_fraction, n_hotkeys)
+            rw_ops = self.run_contention(PositionLocks(reader_writer=True), read_fraction, n_hotkeys)
+            msg += (f" {n_hotkeys} miners, {read_fraction:.0%} reads:"
+                    f" legacy {legacy_ops:.0f} ops/s, {len(legacy_locks.locks)} locks."
+                    f" striped {striped_ops:.0f} ops/s, {PositionLocks.N_STRIPES} locks."
+                    f" reader-writer {rw_ops:.0f} ops/s, {PositionLocks.N_READER_WRITER_STRIPES} locks.")
+        print(msg)
+
+
+class TestPositionLockDeadlocks(TestBase):
+
+    MINER_HOTKEY = "test_miner"
+    OPEN_MS = 1718071209000
+    N_WRITERS = 16
+
+    def setUp(self):
+        super().setUp()
+        self.mock_metagraph = MockMetagraph([self.MINER_HOTKEY])
+        self.elimination_manager = EliminationManager(self.mock_metagraph, None, None, running_unit_tests=True)
+        self.position_manager = PositionManager(metagraph=self.mock_metagraph, running_unit_tests=True,
+                                                elimination_manager=self.elimination_manager)
+        self.elimination_manager.position_manager = self.position_manager
+        self.position_manager.challengeperiod_manager = MockChallengePeriodManager(
+            self.mock_metagraph, position_manager=self.position_manager)
+        self.position_manager.clear_all_miner_positions()
+        self.position_syncer = PositionSyncer(running_unit_tests=True, position_manager=self.position_manager)
+        self.position_locks = PositionLocks()
+        self.trade_pairs = [TradePair.BTCUSD, TradePair.ETHUSD, TradePair.EURUSD, TradePair.SPX]
+        self.positions = []
+        for tp in self.trade_pairs:
+            order = Order(price=1, processed_ms=self.OPEN_MS, order_uuid=f"{tp.trade_pair_id}_order", trade_pair=tp,
+                          order_type=OrderType.LONG, leverage=tp.min_leverage)
+            position = Position(miner_hotkey=self.MINER_HOTKEY, position_uuid=f"{tp.trade_pair_id}_position",
+                                open_ms=self.OPEN_MS, trade_pair=tp, orders=[order])
+            position.rebuild_position_with_updated_orders()
+            self.positions.append(position)
+
+    def tearDown(self):
+        self.position_manager.clear_all_miner_positions()
+        super().tearDown()
+
+    def candidate_data(self):
+        return {'positions': {self.MINER_HOTKEY: {'positions': [p.to_dict() for p in self.positions]}},
+                'eliminations': [], 'created_timestamp_ms': self.OPEN_MS + AUTO_SYNC_ORDER_LAG_MS}
+
+    def write_orders(self, stop_event, seed):
+        """
+        Takes position locks the way receive_signal does and rewrites the miner's positions until stopped.
+        """
+        rng = random.Random(seed)
+        while not stop_event.is_set():
+            tp = rng.choice(self.trade_pairs)
+            with self.position_locks.get_lock(self.MINER_HOTKEY, tp.trade_pair_id):
+                position = self.position_manager.get_open_position_for_a_miner_trade_pair(self.MINER_HOTKEY,
+                                                                                          tp.trade_pair_id)
+                if position is not None:
+                    self.position_manager.save_miner_position(deepcopy(position))
+
+    def run_with_concurrent_writers(self, target):
+        stop_event = threading.Event()
+        writers = [threading.Thread(target=self.write_orders, args=(stop_event, i), daemon=True)
+                   for i in range(self.N_WRITERS)]
+        for w in writers:
+            w.start()
+        errors = []
+
+        def run_target():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run_target, daemon=True)
+        with patch('vali_objects.utils.validator_sync_base.bt.logging'), \
+                patch('vali_objects.utils.position_manager.bt.logging'):
+            thread.start()
+            thread.join(60)
+            stop_event.set()
+            for w in writers:
+                w.join(60)
+        self.assertFalse(thread.is_alive(), "deadlocked")
+        self.assertFalse(any(w.is_alive() for w in writers), "deadlocked")
+        self.assertEqual(errors, [])
+
+    def test_sync_does_not_deadlock(self):
+        for p in self.positions[:2]:
+            self.position_manager.save_miner_position(deepcopy(p))
+
+        def sync():
+            for _ in range(5):
+                disk_positions = self.position_manager.get_positions_for_all_miners(sort_positions=True)
+                self.position_syncer.sync_positions(shadow_mode=False, candidate_data=self.candidate_data(),
+                                                    disk_positions=disk_positions,
+                                                    position_locks=self.position_locks)
+
+        self.run_with_concurrent_writers(sync)
+        self.assertEqual({p.position_uuid for p in self.position_manager.get_positions_for_one_hotkey(
+            self.MINER_HOTKEY)}, {p.position_uuid for p in self.positions})
+
+    def test_order_corrections_do_not_deadlock(self):
+        for p in self.positions:
+            self.position_manager.save_miner_position(deepcopy(p))
+        self.run_with_concurrent_writers(self.position_manager.apply_order_corrections)
@@ -0,0 +1,135 @@
+import pickle
+import random
+import time
+from copy import deepcopy
+
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from time_util.time_util import MS_IN_8_HOURS
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position, FEE_V6_TIME_MS
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.order import Order, ORDER_SRC_ELIMINATION_FLAT
+from vali_objects.vali_dataclasses.price_source import PriceSource
+
+
+def make_position(rng, n_orders, trade_pair=TradePair.BTCUSD, close=False):
+    open_ms = FEE_V6_TIME_MS + rng.randint(0, MS_IN_8_HOURS)
+    position = Position(miner_hotkey='test_miner', position_uuid=f'test_position_{n_orders}', open_ms=open_ms,
+                        trade_pair=trade_pair)
+    net_leverage = 0.0
+    for i in range(n_orders):
+        # Add to or trim a long position without closing it
+        leverage = .1 if net_leverage < .2 else rng.choice([.1, .05, -.05])
+        net_leverage += leverage
+        position.orders.append(Order(order_type=OrderType.LONG if leverage > 0 else OrderType.SHORT,
+                                     leverage=leverage, price=100 + rng.random(), trade_pair=trade_pair,
+                                     processed_ms=open_ms + i * MS_IN_8_HOURS // 4, order_uuid=str(i)))
+    if close:
+        last_ms = position.orders[-1].processed_ms
+        src = rng.choice([0, ORDER_SRC_ELIMINATION_FLAT])
+        position.orders.append(Order(order_type=OrderType.FLAT, leverage=0, price=0 if src else 101,
+                                     trade_pair=trade_pair, processed_ms=last_ms + 1000, order_uuid='flat', src=src))
+    position.rebuild_position_with_updated_orders()
+    return position
+
+
+class TestPositionRebuild(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(7)
+
+    def assert_same_as_full_rebuild(self, position):
+        expected = deepcopy(position)
+        expected._order_states = None
+        expected.rebuild_position_with_updated_orders()
+        position.rebuild_position_with_updated_orders()
+        self.assertEqual(expected.model_dump(), position.model_dump())
+
+    def test_price_changes_match_full_rebuild(self):
+        for _ in range(100):
+            trade_pair = self.rng.choice([TradePair.BTCUSD, TradePair.EURUSD, TradePair.SPX])
+            position = make_position(self.rng, self.rng.randint(1, 30), trade_pair, close=self.rng.random() < .5)
+            for _ in range(5):
+                n_changes = self.rng.randint(0, 3)
+                for order in self.rng.sample(position.orders, min(n_changes, len(position.orders))):
+                    if order.price:
+                        order.price = 100 + self.rng.random()
+                # Returns set after the rebuild are replaced by the orders' state
+                position.set_returns(100 + self.rng.random(), time_ms=position.orders[-1].processed_ms + 1)
+                self.assert_same_as_full_rebuild(position)
+
+    def test_liquidation_and_flip_match_full_rebuild(self):
+        position = make_position(self.rng, 20)
+        position.orders[0].leverage = 2.0
+        self.assert_same_as_full_rebuild(position)
+        # A crash liquidates the position partway through
+        position.orders[10].price = 1
+        self.assert_same_as_full_rebuild(position)
+        self.assertTrue(position.is_closed_position)
+        position.orders[10].price = 100
+        self.assert_same_as_full_rebuild(position)
+        self.assertFalse(position.is_closed_position)
+        # Leverage changes make the cached states unusable
+        position.orders[5].leverage = -5.0
+        self.assert_same_as_full_rebuild(position)
+        self.assertTrue(position.is_closed_position)
+
+    def test_order_changes_invalidate_states(self):
+        position = make_position(self.rng, 10)
+        for mutate in [lambda p: p.orders.append(Order(order_type=OrderType.LONG, leverage=.1, price=101,
+                                                       trade_pair=p.trade_pair, order_uuid='new',
+                                                       processed_ms=p.orders[-1].processed_ms + 1)),
+                       lambda p: p.orders.pop(),
+                       lambda p: setattr(p.orders[3], 'processed_ms', p.orders[3].processed_ms + 1),
+                       lambda p: setattr(p.orders[0], 'price', 50)]:
+            mutate(position)
+            self.assert_same_as_full_rebuild(position)
+
+    def test_states_not_pickled(self):
+        position = make_position(self.rng, 10)
+        self.assertEqual(position._first_changed_order_idx()[0], 10)
+        position = pickle.loads(pickle.dumps(position))
+        self.assertIsNone(position._order_states)
+        position.orders[-1].price = 99
+        self.assert_same_as_full_rebuild(position)
+        # The rebuild caches the states again
+        self.assertEqual(position._first_changed_order_idx()[0], 10)
+
+    def test_update_order_with_newest_price_sources(self):
+        order = Order(order_type=OrderType.LONG, leverage=.1, price=100, trade_pair=TradePair.BTCUSD,
+                      processed_ms=10_000, order_uuid='0')
+        ws = PriceSource(source='Polygon_ws', start_ms=9_000, open=100, close=100, websocket=True)
+        rest = PriceSource(source='Polygon_rest', start_ms=9_000, timespan_ms=1000, open=101, close=101)
+        self.assertTrue(PriceSource.update_order_with_newest_price_sources(order, [ws], 'test_miner', 'BTCUSD'))
+        self.assertEqual(order.price_sources, [ws])
+        # The same sources again are not a change
+        self.assertFalse(PriceSource.update_order_with_newest_price_sources(order, [ws.model_copy()], 'test_miner',
+                                                                            'BTCUSD'))
+        # Equal except for the websocket flag, which changes the time delta
+        self.assertTrue(PriceSource.update_order_with_newest_price_sources(
+            order, [ws.model_copy(update={'websocket': False, 'timespan_ms': 1000})], 'test_miner', 'BTCUSD'))
+        self.assertTrue(PriceSource.update_order_with_newest_price_sources(order, [rest], 'test_miner', 'BTCUSD'))
+        self.assertEqual(order.price, 101)
+        self.assertEqual({ps.source for ps in order.price_sources}, {'Polygon_ws', 'Polygon_rest'})
+
+    @benchmark
+    def test_tail_price_change_benchmark(self):
+        position = make_position(self.rng, 200)
+        full = deepcopy(position)
+        n_rebuilds = 20
+        t0 = time.perf_counter()
+        for i in range(n_rebuilds):
+            full.orders[-1].price = 100 + i / 100
+            full._order_states = None
+            full.rebuild_position_with_updated_orders()
+        full_ms = (time.perf_counter() - t0) / n_rebuilds * 1000
+        t0 = time.perf_counter()
+        for i in range(n_rebuilds):
+            position.orders[-1].price = 100 + i / 100
+            position.rebuild_position_with_updated_orders()
+        incremental_ms = (time.perf_counter() - t0) / n_rebuilds * 1000
+        self.assertEqual(full.model_dump(), position.model_dump())
+        print(f"Rebuild of a 200 order position after a tail price change: full replay {full_ms:.2f} ms, "
+              f"incremental {incremental_ms:.2f} ms")
+        self.assertLess(incremental_ms * 5, full_ms)
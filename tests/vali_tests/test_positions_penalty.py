@@ -1,17 +1,127 @@
+import math
+import time
 from copy import deepcopy
+
+import pandas as pd
+
 from tests.shared_objects.mock_classes import MockMetagraph
 from tests.shared_objects.test_utilities import add_orders_to_position
-from tests.vali_tests.base_objects.test_base import TestBase
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
 from vali_objects.vali_config import TradePair
 from vali_objects.enums.order_type_enum import OrderType
 from vali_objects.position import Position
 from vali_objects.utils.position_manager import PositionManager
 from vali_objects.vali_dataclasses.order import Order
-from vali_objects.utils.position_penalties import PositionPenalties
+from vali_objects.utils.position_penalties import PositionPenalties, PositionColumns
+from vali_objects.utils.position_utils import PositionUtils
+from vali_objects.utils.functional_utils import FunctionalUtils
+from vali_objects.vali_config import ValiConfig
 import numpy as np
 import random
 
 
+def reference_martingale_percentile(positions):
+    """
+    Martingale percentile computed by iterating over the orders of each position.
+    """
+    if len(positions) < 1:
+        return 0.0
+    position_is_martingale = []
+    positional_returns = []
+    for position in positions:
+        step_count = 0
+        entry_order = position.orders[0]
+        max_leverage = abs(entry_order.leverage)
+        for order in position.orders[1:]:
+            leverage = abs(order.leverage)
+            losing = order.price < entry_order.price and entry_order.leverage > 0 or \
+                order.price > entry_order.price and entry_order.leverage < 0
+            if losing and leverage > max_leverage:
+                step_count += 1
+                max_leverage = max(max_leverage, leverage)
+        positional_returns.append(position.return_at_close ** ValiConfig.MARTINGALE_CONCENTRATION)
+        position_is_martingale.append(step_count > ValiConfig.MARTINGALE_STEP_THRESHOLD)
+    return np.average(np.array(position_is_martingale, dtype=int), weights=np.array(positional_returns))
+
+
+def reference_martingale_score(positions, evaluation_time_ms):
+    return reference_martingale_percentile(PositionUtils.cumulative_leverage_position(positions, evaluation_time_ms))
+
+
+def reference_time_consistency_ratio(positions):
+    if len(positions) == 0:
+        return 1
+    close_times = np.array([position.close_ms for position in positions])
+    returns = np.log([max(position.return_at_close, .00001) for position in positions])
+    total_return = np.sum(returns)
+    if total_return == 0:
+        return 1
+    sums_in_window = [returns[(close_times >= t) & (close_times < t + ValiConfig.POSITIONAL_RETURN_TIME_WINDOW_MS)].sum()
+                      for t in close_times]
+    largest_windowed_contribution = max(sums_in_window) if total_return > 0 else min(sums_in_window)
+    return np.clip(largest_windowed_contribution / total_return, 0, 1)
+
+
+def reference_returns_ratio(positions):
+    closed_position_returns = [math.log(max(position.return_at_close, .00001))
+                               for position in positions if position.is_closed_position]
+    closed_return = sum(closed_position_returns)
+    if closed_return == 0:
+        return 1
+    numerator = max(closed_position_returns) if closed_return > 0 else min(closed_position_returns)
+    return np.clip(numerator / closed_return, 0, 1)
+
+
+def reference_martingale_metrics(positions):
+    ans = {k: [] for k in ("losing_value_percents", "entry_holding_timing", "losing_leverages_decimal_multiplier",
+                           "positional_returns", "times_readable", "position_times", "steps")}
+    for position in positions:
+        entry_order = position.orders[0]
+        entry_leverage = abs(entry_order.leverage)
+        entry_time = entry_order.processed_ms
+        exit_time = position.orders[-1].processed_ms
+        direction_is_long = entry_order.leverage > 0
+        for step in range(1, len(position.orders)):
+            order = position.orders[step]
+            leverage = abs(order.leverage)
+            losing = order.price < entry_order.price and direction_is_long or \
+                order.price > entry_order.price and not direction_is_long
+            if losing and leverage > 0:
+                ans["losing_value_percents"].append((1 - (order.price / entry_order.price)) * 100)
+                ans["losing_leverages_decimal_multiplier"].append(leverage / entry_leverage)
+                ans["entry_holding_timing"].append((order.processed_ms - entry_time) / (exit_time - entry_time))
+                ans["times_readable"].append(pd.to_datetime(order.processed_ms, unit='ms', utc=True))
+                ans["position_times"].append(pd.to_datetime(entry_time, unit='ms', utc=True))
+                ans["positional_returns"].append(position.return_at_close)
+                ans["steps"].append(step)
+    return ans
+
+
+def generate_positions(rng, n_positions, start_ms=1_700_000_000_000):
+    """
+    Random closed and open positions with 1-6 orders, built without validation so large batches stay cheap.
+    """
+    positions = []
+    t_ms = start_ms
+    for i in range(n_positions):
+        n_orders = rng.choice([1, 2, 2, 3, 4, 6])
+        direction = rng.choice([1, -1])
+        orders = []
+        for k in range(n_orders):
+            t_ms += rng.randrange(1, 36_000_000)
+            is_flat = 0 < k == n_orders - 1 and rng.random() < .7
+            leverage = 0.0 if is_flat else direction * rng.choice([0.1, 0.2, 0.5, 1.0]) * (-0.5 if rng.random() < .1 else 1)
+            order_type = OrderType.FLAT if is_flat else (OrderType.LONG if leverage > 0 else OrderType.SHORT)
+            orders.append(Order.model_construct(order_type=order_type, leverage=leverage,
+                                                price=rng.choice([100.0, 100 * (1 + rng.uniform(-.05, .05))]),
+                                                trade_pair=TradePair.BTCUSD, processed_ms=t_ms, order_uuid=f"{i}_{k}"))
+        positions.append(Position.model_construct(miner_hotkey="miner", position_uuid=str(i), open_ms=orders[0].processed_ms,
+                                                  trade_pair=TradePair.BTCUSD, orders=orders,
+                                                  close_ms=orders[-1].processed_ms, is_closed_position=rng.random() < .9,
+                                                  return_at_close=rng.uniform(.9, 1.1)))
+    return positions
+
+
 class TestPositionsPenalty(TestBase):
     """
     This class will only test the positions and the consistency metrics associated with positions.
@@ -261,6 +371,50 @@ class TestPositionsPenalty(TestBase):
         # Reminder that a return value of 1 => no penalty and return value of 0 => max penalty
         self.assertGreater(PositionPenalties.martingale_penalty([position1, position2, position3]), penalty_two_martingale)
 
-
-
-
+    def test_vectorized_penalties_match_reference(self):
+        rng = random.Random(1)
+        for n_positions in (0, 1, 2, 5, 50, 300):
+            for _ in range(5):
+                positions = generate_positions(rng, n_positions)
+                columns = PositionColumns(positions)
+                evaluation_time_ms = positions[-1].orders[-1].processed_ms + 1 if positions else None
+                self.assertEqual(PositionPenalties.martingale_score(positions, evaluation_time_ms),
+                                 reference_martingale_score(positions, evaluation_time_ms))
+                self.assertEqual(PositionPenalties.martingale_percentile(positions),
+                                 reference_martingale_percentile(positions))
+                self.assertAlmostEqual(PositionPenalties.returns_ratio(columns), reference_returns_ratio(positions), places=9)
+                self.assertAlmostEqual(PositionPenalties.time_consistency_ratio(columns),
+                                       reference_time_consistency_ratio(positions), places=9)
+                if positions:
+                    self.assertEqual(PositionPenalties.martingale_metrics(positions), reference_martingale_metrics(positions))
+
+    def test_batched_martingale_penalties_match_per_miner(self):
+        rng = random.Random(2)
+        hotkey_positions = {f"miner{i}": generate_positions(rng, rng.randrange(0, 40)) for i in range(20)}
+        batched = PositionPenalties.martingale_penalties(hotkey_positions)
+        self.assertEqual(list(batched.keys()), list(hotkey_positions.keys()))
+        for miner, positions in hotkey_positions.items():
+            self.assertEqual(batched[miner], PositionPenalties.martingale_penalty(positions))
+
+    @benchmark
+    def test_martingale_penalties_benchmark(self):
+        rng = random.Random(3)
+        # 256 miners x 2,000 positions. Position lists are shared between miners to keep the setup cheap.
+        distinct_positions = [generate_positions(rng, 2000) for _ in range(8)]
+        hotkey_positions = {f"miner{i}": distinct_positions[i % 8] for i in range(256)}
+
+        t0 = time.time()
+        batched = PositionPenalties.martingale_penalties(hotkey_positions)
+        batched_s = time.time() - t0
+
+        n_reference_miners = 8
+        t0 = time.time()
+        for miner in list(hotkey_positions)[:n_reference_miners]:
+            reference = FunctionalUtils.sigmoid(reference_martingale_score(hotkey_positions[miner], None),
+                                                ValiConfig.MARTINGALE_SHIFT, ValiConfig.MARTINGALE_SPREAD)
+            self.assertEqual(batched[miner], reference)
+        reference_s = (time.time() - t0) * len(hotkey_positions) / n_reference_miners
+
+        print(f"martingale penalties for 256 miners x 2000 positions. per-miner deepcopy and loop (extrapolated from "
+              f"{n_reference_miners} miners): {reference_s:.2f} s, batched columns: {batched_s:.2f} s")
+        self.assertLess(batched_s, reference_s)
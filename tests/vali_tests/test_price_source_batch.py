@@ -0,0 +1,166 @@
+import random
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.utils.live_price_fetcher import LivePriceFetcher
+from vali_objects.utils.vali_utils import ValiUtils
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.price_source import PriceSource
+from vali_objects.vali_dataclasses.price_source_batch import PriceSourceBatch
+
+NOW_MS = 1_700_000_000_000
+
+
+def reference_filter_outliers(unique_data):
+    """
+    LivePriceFetcher.filter_outliers before PriceSourceBatch.
+    """
+    if not unique_data:
+        return []
+    close_prices = np.array([x.close for x in unique_data])
+    median = np.median(close_prices)
+    filtered_data = [x for x in unique_data if median * 0.95 <= x.close <= median * 1.05]
+    filtered_data.sort(key=lambda x: x.start_ms, reverse=True)
+    return filtered_data
+
+
+def random_price_source(rng):
+    websocket = rng.random() < .5
+    price = rng.choice([100.0, 100.0 + rng.random(), 120.0, 80.0])
+    # Few distinct offsets so time deltas often tie
+    return PriceSource(source=rng.choice(['Polygon_ws', 'Tiingo_ws', 'Polygon_rest', 'Tiingo_rest']),
+                       start_ms=NOW_MS + rng.choice([-5000, -2001, -1000, -500, 0, 500, 2000]),
+                       timespan_ms=0 if websocket else rng.choice([1000, 60000]), websocket=websocket,
+                       open=price, close=price * rng.choice([1.0, 1.001]), lag_ms=-1)
+
+
+def random_events(rng, n_keys):
+    return [[rng.choice([None, random_price_source(rng)]) for _ in range(rng.randint(0, 4))] for _ in range(n_keys)]
+
+
+class TestPriceSourceBatch(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(11)
+        secrets = ValiUtils.get_secrets(running_unit_tests=True)
+        self.live_price_fetcher = LivePriceFetcher(secrets=secrets, disable_ws=True)
+
+    def assert_same_result(self, expected, actual):
+        self.assertEqual(expected[0], actual[0])
+        if expected[1] is None:
+            self.assertIsNone(actual[1])
+            return
+        self.assertEqual([ps.model_dump() for ps in expected[1]], [ps.model_dump() for ps in actual[1]])
+
+    def test_best_prices_match_list_logic(self):
+        for _ in range(200):
+            events_per_key = random_events(self.rng, self.rng.randint(0, 12))
+            now_ms_per_key = [NOW_MS + self.rng.choice([0, 100, -100]) for _ in events_per_key]
+            for filter_recent_only in [True, False]:
+                reference_events = deepcopy(events_per_key)
+                batch_events = deepcopy(events_per_key)
+                batch = PriceSourceBatch(list(range(len(batch_events))), batch_events, now_ms_per_key)
+                ans = batch.best_prices(
+                    max_time_delta_ms=LivePriceFetcher.MAX_RECENT_TIME_DELTA_MS if filter_recent_only else None)
+                for i, events in enumerate(reference_events):
+                    expected = self.live_price_fetcher.determine_best_price(events, now_ms_per_key[i],
+                                                                            filter_recent_only=filter_recent_only)
+                    self.assert_same_result(expected, ans[i])
+                # lag_ms is only set on the sources of keys that got a price
+                self.assertEqual([[ps.model_dump() for ps in events if ps] for events in reference_events],
+                                 [[ps.model_dump() for ps in events if ps] for events in batch_events])
+
+    def test_filter_outliers_match_list_logic(self):
+        for _ in range(200):
+            events_per_key = [[ps for ps in events if ps] for events in random_events(self.rng, 6)]
+            # Long candle lists
+            events_per_key.append([random_price_source(self.rng) for _ in range(self.rng.randint(0, 300))])
+            ans = PriceSourceBatch(list(range(len(events_per_key))), events_per_key).filter_outliers()
+            for i, events in enumerate(events_per_key):
+                self.assertEqual([id(x) for x in reference_filter_outliers(events)], [id(x) for x in ans[i]])
+                self.assertEqual([id(x) for x in reference_filter_outliers(events)],
+                                 [id(x) for x in self.live_price_fetcher.filter_outliers(events)])
+
+    def test_fetch_prices_paths_match(self):
+        tps = list(TradePair)[:30]
+        polygon_ws = {tp: random_price_source(self.rng) for tp in tps if self.rng.random() < .8}
+        tiingo_ws = {tp: random_price_source(self.rng) for tp in tps if self.rng.random() < .8}
+        polygon_rest = {tp: random_price_source(self.rng) for tp in tps}
+        tiingo_rest = {tp: random_price_source(self.rng) for tp in tps}
+        tp_to_time_ms = {tp: NOW_MS + self.rng.choice([0, 1000, -3000]) for tp in tps}
+
+        def fetch(batch_min_trade_pairs):
+            fetcher = self.live_price_fetcher
+            fetcher.BATCH_MIN_TRADE_PAIRS = batch_min_trade_pairs
+            ws = [deepcopy(polygon_ws), deepcopy(tiingo_ws)]
+            rest = [deepcopy(polygon_rest), deepcopy(tiingo_rest)]
+            fetcher.polygon_data_service.get_closes_websocket = lambda trade_pairs, trade_pair_to_last_order_time_ms: ws[0]
+            fetcher.tiingo_data_service.get_closes_websocket = lambda trade_pairs, trade_pair_to_last_order_time_ms: ws[1]
+            fetcher.polygon_data_service.get_closes_rest = lambda trade_pairs: rest[0]
+            fetcher.tiingo_data_service.get_closes_rest = lambda trade_pairs: rest[1]
+            return fetcher.fetch_prices(tps, tp_to_time_ms)
+
+        expected = fetch(batch_min_trade_pairs=len(tps) + 1)
+        actual = fetch(batch_min_trade_pairs=0)
+        self.assertEqual(list(expected), list(actual))
+        for tp in tps:
+            self.assert_same_result(expected[tp], actual[tp])
+
+    def test_nan_price_is_no_price(self):
+        tps = list(TradePair)[:10]
+        nan_ws = {tp: PriceSource(source='Polygon_ws', start_ms=NOW_MS - 1500, timespan_ms=0, websocket=True,
+                                  open=float('nan'), close=float('nan'), lag_ms=-1) for tp in tps}
+        rest = {tp: PriceSource(source='Polygon_rest', start_ms=NOW_MS - 59999, timespan_ms=60000, websocket=False,
+                                open=99.0, close=100.0, lag_ms=-1) for tp in tps}
+        tp_to_time_ms = {tp: NOW_MS for tp in tps}
+        fetcher = self.live_price_fetcher
+        fetcher.polygon_data_service.get_closes_websocket = lambda trade_pairs, trade_pair_to_last_order_time_ms: nan_ws
+        fetcher.tiingo_data_service.get_closes_websocket = lambda trade_pairs, trade_pair_to_last_order_time_ms: {}
+        fetcher.polygon_data_service.get_closes_rest = lambda trade_pairs: rest
+        fetcher.tiingo_data_service.get_closes_rest = lambda trade_pairs: {}
+        for batch_min_trade_pairs in [len(tps) + 1, 0]:
+            fetcher.BATCH_MIN_TRADE_PAIRS = batch_min_trade_pairs
+            best_prices = fetcher.determine_best_prices({tp: [nan_ws[tp]] for tp in tps}, tp_to_time_ms)
+            self.assertEqual({tp: price for tp, (price, _) in best_prices.items()}, {tp: None for tp in tps})
+            # The recent websocket price is passed over for the REST candle ending now
+            prices = fetcher.fetch_prices(tps, tp_to_time_ms)
+            self.assertEqual({tp: price for tp, (price, _) in prices.items()}, {tp: 100.0 for tp in tps})
+
+    @benchmark
+    def test_latency_benchmark(self):
+        msg = "per call latency:"
+        for n_keys in [1, 8, 40, 400]:
+            events_per_key = [[random_price_source(self.rng) for _ in range(4)] for _ in range(n_keys)]
+            now_ms_per_key = [NOW_MS] * n_keys
+            n_calls = max(1, 4000 // n_keys)
+            t0 = time.perf_counter()
+            for _ in range(n_calls):
+                for events, now_ms in zip(events_per_key, now_ms_per_key):
+                    self.live_price_fetcher.determine_best_price(events, now_ms, filter_recent_only=False)
+            list_us = (time.perf_counter() - t0) / n_calls * 1e6
+            t0 = time.perf_counter()
+            for _ in range(n_calls):
+                PriceSourceBatch(list(range(n_keys)), events_per_key, now_ms_per_key).best_prices()
+            batch_us = (time.perf_counter() - t0) / n_calls * 1e6
+
+            # One second candles of each trade pair, as in LivePriceFetcher.get_candles
+            candles_per_key = [[random_price_source(self.rng) for _ in range(20)] for _ in range(n_keys)]
+            t0 = time.perf_counter()
+            for _ in range(n_calls):
+                for candles in candles_per_key:
+                    self.live_price_fetcher.filter_outliers(candles)
+            list_filter_us = (time.perf_counter() - t0) / n_calls * 1e6
+            t0 = time.perf_counter()
+            for _ in range(n_calls):
+                PriceSourceBatch(list(range(n_keys)), candles_per_key).filter_outliers()
+            batch_filter_us = (time.perf_counter() - t0) / n_calls * 1e6
+            msg += (f" {n_keys} trade pairs: best price list {list_us:.0f} us, batch {batch_us:.0f} us;"
+                    f" outlier filter list {list_filter_us:.0f} us, batch {batch_filter_us:.0f} us.")
+            if n_keys >= 40:
+                self.assertLess(batch_us, list_us)
+                self.assertLess(batch_filter_us, list_filter_us)
+        print(msg)
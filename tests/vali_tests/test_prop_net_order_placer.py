@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import bittensor as bt
+from aiohttp import web
+from bittensor.core.chain_data import AxonInfo
+
+from miner_config import MinerConfig
+from miner_objects.prop_net_order_placer import PropNetOrderPlacer
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+
+
+class FakeAxons:
+    """
+    Local HTTP servers answering SendSignal requests the way validator axons do. Each validator records the order in
+    which it received signals, the time it received them and the client connections they arrived on.
+    """
+    def __init__(self, n_validators, max_latency_s=0.02, failures=None):
+        self.hotkeys = [f"validator{i}" for i in range(n_validators)]
+        self.max_latency_s = max_latency_s
+        # hotkey -> number of leading requests to reject. -1 rejects all requests.
+        self.failures = failures or {}
+        self.received = defaultdict(list)  # hotkey -> [(trade_pair_id, miner_order_uuid, receive time)]
+        self.connections = defaultdict(set)  # hotkey -> client (ip, port)
+        self.attempts = defaultdict(int)
+        self.ports = {}
+        self.rng = random.Random(11)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runners = []
+
+    def make_handler(self, hotkey):
+        async def handler(request):
+            body = await request.json()
+            self.attempts[hotkey] += 1
+            self.connections[hotkey].add(request.transport.get_extra_info('peername'))
+            await asyncio.sleep(self.rng.uniform(0, self.max_latency_s))
+            n_failures = self.failures.get(hotkey, 0)
+            if n_failures == -1 or self.attempts[hotkey] <= n_failures:
+                body['error_message'] = f"{hotkey} rejected the order"
+            else:
+                self.received[hotkey].append((body['signal']['trade_pair']['trade_pair_id'], body['miner_order_uuid'],
+                                              time.time()))
+                body['successfully_processed'] = True
+                body['validator_hotkey'] = hotkey
+            return web.json_response(body)
+        return handler
+
+    async def start_servers(self):
+        for hotkey in self.hotkeys:
+            app = web.Application()
+            app.router.add_post('/SendSignal', self.make_handler(hotkey))
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            self.runners.append(runner)
+            self.ports[hotkey] = runner.addresses[0][1]
+
+    async def stop_servers(self):
+        for runner in self.runners:
+            await runner.cleanup()
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start_servers(), self.loop).result()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.stop_servers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def axons(self):
+        return [AxonInfo(version=1, ip='127.0.0.1', port=self.ports[hk], ip_type=4, hotkey=hk, coldkey=hk)
+                for hk in self.hotkeys]
+
+
+class TestPropNetOrderPlacer(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.signals_dir = tempfile.TemporaryDirectory()
+        processed_dir = os.path.join(self.signals_dir.name, 'processed_signals/')
+        failed_dir = os.path.join(self.signals_dir.name, 'failed_signals/')
+        self.patches = [
+            patch.object(MinerConfig, 'get_miner_processed_signals_dir', lambda: processed_dir),
+            patch.object(MinerConfig, 'get_miner_failed_signals_dir', lambda: failed_dir),
+            # The dendrite looks up its external ip on creation. The fake axons are local so any other address works.
+            patch('bittensor.utils.networking.get_external_ip', return_value='203.0.113.1'),
+        ]
+        for p in self.patches:
+            p.start()
+        self.processed_dir, self.failed_dir = processed_dir, failed_dir
+        self.placer = None
+
+    def tearDown(self):
+        if self.placer:
+            self.placer.shutdown()
+        for p in self.patches:
+            p.stop()
+        self.signals_dir.cleanup()
+        super().tearDown()
+
+    def make_placer(self, fake_axons, v_trust=None):
+        v_trust = v_trust or {}
+        axons = fake_axons.axons()
+        metagraph = SimpleNamespace(neurons=[SimpleNamespace(hotkey=axon.hotkey, axon_info=axon,
+                                                             validator_trust=v_trust.get(axon.hotkey, 0.9))
+                                             for axon in axons])
+        position_inspector = SimpleNamespace(get_possible_validators=lambda: list(axons))
+        self.placer = PropNetOrderPlacer(bt.Keypair.create_from_uri('//Alice'), metagraph,
+                                         SimpleNamespace(write_failed_signal_logs=True), False,
+                                         position_inspector=position_inspector)
+        return self.placer
+
+    @staticmethod
+    def make_signals(trade_pair_ids, n_signals, prefix="order"):
+        signals, signal_file_names = [], []
+        for i in range(n_signals):
+            trade_pair_id = trade_pair_ids[i % len(trade_pair_ids)]
+            signals.append({'trade_pair': {'trade_pair_id': trade_pair_id}, 'order_type': 'LONG', 'leverage': 0.1})
+            signal_file_names.append(f"mining/received_signals/{prefix}{i:04d}")
+        return signals, signal_file_names
+
+    def send_burst(self, n_validators, n_signals):
+        """
+        Sends a burst of signals to every validator and checks they were all delivered in order per trade pair.
+        Returns the time of the whole burst, each validator's ack latencies and each signal's latency.
+        """
+        trade_pair_ids = ['BTCUSD', 'ETHUSD', 'EURUSD', 'GBPUSD', 'SPX']
+        with FakeAxons(n_validators) as fake_axons:
+            placer = self.make_placer(fake_axons)
+            signals, signal_file_names = self.make_signals(trade_pair_ids, n_signals)
+            # Warm up the dendrite and the validator connections
+            placer.send_signals(*self.make_signals(['AUDUSD'], 1, prefix="warmup"), [])[0].result(timeout=30)
+            fake_axons.received.clear()
+
+            t_submit = time.time()
+            signal_latencies_s = []
+            futures = placer.send_signals(signals, signal_file_names, [])
+            for future in futures:
+                future.add_done_callback(lambda _: signal_latencies_s.append(time.time() - t_submit))
+            for future in futures:
+                future.result(timeout=60)
+            burst_s = time.time() - t_submit
+
+        # Every validator acked every signal, and signals for a trade pair arrived in the order they were queued
+        expected_order = defaultdict(list)
+        for signal, file_name in zip(signals, signal_file_names):
+            expected_order[signal['trade_pair']['trade_pair_id']].append(os.path.basename(file_name))
+        ack_latencies_s = []
+        for hotkey in fake_axons.hotkeys:
+            received_order = defaultdict(list)
+            for trade_pair_id, miner_order_uuid, t_received in fake_axons.received[hotkey]:
+                received_order[trade_pair_id].append(miner_order_uuid)
+                ack_latencies_s.append(t_received - t_submit)
+            self.assertEqual(received_order, expected_order)
+            # Signals reuse keep-alive connections instead of opening one per request
+            self.assertLessEqual(len(fake_axons.connections[hotkey]), PropNetOrderPlacer.MAX_CONNECTIONS_PER_VALIDATOR)
+        self.assertEqual(len(os.listdir(self.processed_dir)), n_signals + 1)
+        self.assertFalse(os.path.exists(self.failed_dir))
+        self.assertEqual(placer.delivery_tails, {})
+
+        return burst_s, sorted(ack_latencies_s), sorted(signal_latencies_s)
+
+    def test_burst_keeps_per_trade_pair_order(self):
+        self.send_burst(n_validators=10, n_signals=20)
+
+    @benchmark
+    def test_burst_latency_benchmark(self):
+        n_validators, n_signals = 30, 50
+        burst_s, ack_latencies_s, signal_latencies_s = self.send_burst(n_validators, n_signals)
+        n_acks = len(ack_latencies_s)
+        print(f"{n_signals} signals x {n_validators} validators in {burst_s:.3f} s. "
+              f"signal-to-ack p50 {ack_latencies_s[n_acks // 2] * 1e3:.1f} ms, "
+              f"p99 {ack_latencies_s[int(n_acks * .99)] * 1e3:.1f} ms. "
+              f"all validators acked p50 {signal_latencies_s[n_signals // 2] * 1e3:.1f} ms, "
+              f"p99 {signal_latencies_s[int(n_signals * .99)] * 1e3:.1f} ms")
+
+    def test_retries_and_failed_signal(self):
+        with FakeAxons(4, failures={'validator0': 2, 'validator1': -1, 'validator2': -1}) as fake_axons:
+            # validator2 has no trust and has not acked recently, so it is not retried or waited on
+            placer = self.make_placer(fake_axons, v_trust={'validator2': 0})
+            placer.INITIAL_RETRY_DELAY_SECONDS = 0.01
+            signals, signal_file_names = self.make_signals(['BTCUSD'], 1)
+            self.assertEqual(placer.send_signals(signals, signal_file_names, [])[0].result(timeout=30),
+                             signal_file_names[0])
+
+        self.assertEqual(dict(fake_axons.attempts), {'validator0': 3, 'validator1': 3, 'validator2': 1, 'validator3': 1})
+        self.assertFalse(os.path.exists(self.processed_dir))
+        # write_signal_to_failure_directory hands write_file an already serialized string, which it serializes again
+        with open(os.path.join(self.failed_dir, 'order0000')) as f:
+            failure = json.loads(json.load(f))
+        self.assertEqual(failure['original_signal'], signals[0])
+        self.assertEqual([v['hotkey'] for v in failure['validators_needing_retry']], ['validator1'])
+        self.assertEqual(failure['error_messages_dict'], {'validator0': ["validator0 rejected the order"] * 2,
+                                                          'validator1': ["validator1 rejected the order"] * 3})
@@ -0,0 +1,110 @@
+import threading
+import time
+from multiprocessing import Manager
+
+from shared_objects.rate_limiter import RateLimiter
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+
+
+class TestRateLimiter(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.T0 = 1_700_000_000.0
+
+    def test_single_request_window(self):
+        rate_limiter = RateLimiter(max_requests_per_window=1, rate_limit_window_duration_seconds=60)
+        self.assertEqual(rate_limiter.is_allowed("miner", self.T0), (True, 0.0))
+        allowed, wait_time = rate_limiter.is_allowed("miner", self.T0 + 20)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait_time, 40, places=5)
+        self.assertEqual(rate_limiter.is_allowed("miner", self.T0 + 60), (True, 0.0))
+        # Other miners have their own budget
+        self.assertEqual(rate_limiter.is_allowed("other_miner", self.T0 + 61), (True, 0.0))
+
+    def test_no_double_burst_at_window_boundary(self):
+        rate_limiter = RateLimiter(max_requests_per_window=10, rate_limit_window_duration_seconds=60)
+        # A fixed window counter would allow 10 requests just before the window ends and 10 more just after it.
+        for _ in range(10):
+            self.assertTrue(rate_limiter.is_allowed("miner", self.T0 + 59.9)[0])
+        allowed, wait_time = rate_limiter.is_allowed("miner", self.T0 + 60.1)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait_time, 5.8, places=5)
+
+        # Budget refills one request per emission interval
+        self.assertTrue(rate_limiter.is_allowed("miner", self.T0 + 65.9)[0])
+        self.assertFalse(rate_limiter.is_allowed("miner", self.T0 + 66)[0])
+        self.assertTrue(rate_limiter.is_allowed("miner", self.T0 + 71.9)[0])
+
+    def test_burst_then_steady_rate(self):
+        max_requests, window_s = 5, 10
+        rate_limiter = RateLimiter(max_requests_per_window=max_requests, rate_limit_window_duration_seconds=window_s)
+        allowed_times = []
+        t = self.T0
+        for _ in range(5000):
+            t += 0.05
+            if rate_limiter.is_allowed("miner", t)[0]:
+                allowed_times.append(t)
+        emission_interval_s = window_s / max_requests
+        for i in range(len(allowed_times)):
+            # Beyond the initial burst, every extra request costs one emission interval
+            for k in range(max_requests, min(3 * max_requests, len(allowed_times) - i)):
+                self.assertGreaterEqual(allowed_times[i + k] - allowed_times[i],
+                                        (k + 1 - max_requests) * emission_interval_s - 1e-3)
+        # Sustained rate matches the configured limit
+        self.assertAlmostEqual(len(allowed_times), max_requests + (t - self.T0) / emission_interval_s, delta=2)
+
+    def test_full_burst_after_idle(self):
+        rate_limiter = RateLimiter(max_requests_per_window=3, rate_limit_window_duration_seconds=30)
+        for _ in range(3):
+            self.assertTrue(rate_limiter.is_allowed("miner", self.T0)[0])
+        self.assertFalse(rate_limiter.is_allowed("miner", self.T0)[0])
+        for _ in range(3):
+            self.assertTrue(rate_limiter.is_allowed("miner", self.T0 + 30)[0])
+        self.assertFalse(rate_limiter.is_allowed("miner", self.T0 + 30)[0])
+
+    def test_idle_hotkeys_evicted(self):
+        rate_limiter = RateLimiter(max_requests_per_window=1, rate_limit_window_duration_seconds=60)
+        for i in range(1000):
+            rate_limiter.is_allowed(f"miner_{i}", self.T0)
+        self.assertEqual(len(rate_limiter.requests_history), 1000)
+        rate_limiter.is_allowed("active_miner", self.T0 + 59)
+        self.assertEqual(len(rate_limiter.requests_history), 1001)
+        rate_limiter.is_allowed("active_miner", self.T0 + 120)
+        self.assertEqual(set(rate_limiter.requests_history.keys()), {"active_miner"})
+
+    def test_threads_share_one_budget(self):
+        rate_limiter = RateLimiter(max_requests_per_window=100, rate_limit_window_duration_seconds=3600)
+        n_allowed = []
+
+        def hammer():
+            n_allowed.append(sum(rate_limiter.is_allowed("miner", self.T0)[0] for _ in range(1000)))
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(n_allowed), 100)
+
+    def test_ipc_manager_backing(self):
+        with Manager() as ipc_manager:
+            rate_limiter = RateLimiter(max_requests_per_window=2, rate_limit_window_duration_seconds=60,
+                                       ipc_manager=ipc_manager)
+            self.assertTrue(rate_limiter.is_allowed("miner", self.T0)[0])
+            self.assertTrue(rate_limiter.is_allowed("miner", self.T0 + 1)[0])
+            self.assertFalse(rate_limiter.is_allowed("miner", self.T0 + 2)[0])
+            self.assertEqual(list(rate_limiter.requests_history.keys()), ["miner"])
+
+    @benchmark
+    def test_is_allowed_benchmark(self):
+        rate_limiter = RateLimiter()
+        hotkeys = [f"miner_{i}" for i in range(256)]
+        n_calls = 1_000_000
+        t0 = time.time()
+        for i in range(n_calls):
+            rate_limiter.is_allowed(hotkeys[i & 255])
+        elapsed_s = time.time() - t0
+        print(f"{n_calls} is_allowed calls in {elapsed_s:.3f} s ({n_calls / elapsed_s:,.0f} calls/s). "
+              f"{len(rate_limiter.requests_history)} hotkeys tracked")
+        self.assertLessEqual(len(rate_limiter.requests_history), len(hotkeys))
@@ -20,7 +20,8 @@ class TestRecentEventTracker(unittest.TestCase):
         self.tracker.add_event(event, is_forex_quote=True)
         existing_event = self.tracker.get_event_by_timestamp(mock_time.return_value)
         self.assertEqual(existing_event[0], event)
-        self.assertEqual(existing_event[1], [event.close])
+        self.assertEqual(len(existing_event[1]), 1)
+        self.assertEqual(existing_event[1].median(), event.close)
 
         # Assert the first event is added correctly
         self.assertEqual(len(self.tracker.events), 1)
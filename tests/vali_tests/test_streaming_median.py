@@ -0,0 +1,177 @@
+import random
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+from data_generator.polygon_data_service import PolygonDataService, Agg
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.vali_config import TradePair
+from vali_objects.vali_dataclasses.price_source import PriceSource
+from vali_objects.vali_dataclasses.recent_event_tracker import RecentEventTracker, StreamingMedian
+
+START_MS = 1_700_000_000_000
+
+
+def legacy_update_prices_for_median(tracker, t_ms, new_price):
+    """
+    RecentEventTracker.update_prices_for_median before StreamingMedian. The tracker must store plain lists.
+    """
+    existing_event, prices = tracker.get_event_by_timestamp(t_ms)
+    if prices:
+        prices.append(new_price)
+        prices.sort()
+        median_price = RecentEventTracker.forex_median_price(prices)
+        existing_event.open = existing_event.close = existing_event.high = existing_event.low = median_price
+
+
+def legacy_build_quotes(pds, raw):
+    """
+    The forex quote loop of PolygonDataService.unified_candle_fetcher before StreamingMedian.
+    """
+    ans = []
+    prev_t_ms = None
+    best_delta = float('inf')
+    for r in raw:
+        t_ms = r.participant_timestamp // 1000000
+        if t_ms != prev_t_ms:
+            best_delta = float('inf')
+            if ans and hasattr(ans[-1], 'temp'):
+                del ans[-1].temp
+        price, current_delta = pds.parse_price_for_forex(r, stats=None)
+        if price is None:
+            continue
+        if best_delta == float('inf'):
+            best_delta = current_delta
+            ans.append(Agg(open=price, close=price, high=price, low=price, volume=0, vwap=None, timestamp=t_ms))
+            ans[-1].temp = [price]
+        else:
+            best_delta = current_delta
+            arr = ans[-1].temp
+            arr.append(price)
+            arr.sort()
+            median_price = RecentEventTracker.forex_median_price(arr)
+            ans[-1].open = ans[-1].close = ans[-1].low = ans[-1].high = median_price
+        ans[-1].volume += 1
+        prev_t_ms = t_ms
+    return ans
+
+
+def quote_stream(rng, n_quotes, quotes_per_s, ms_resolution=1):
+    """
+    Polygon REST forex quotes in participant_timestamp order. A few have a wide spread and get dropped.
+    """
+    quotes = []
+    mid = 1.1
+    for i in range(n_quotes):
+        t_ms = START_MS + (i * 1000 // quotes_per_s) // ms_resolution * ms_resolution
+        mid *= 1 + rng.gauss(0, 0.00002)
+        bid = round(mid, 5) if rng.random() < .9 else round(mid, 4)
+        ask = bid * (1.0001 if rng.random() < .98 else 1.01)
+        quotes.append(SimpleNamespace(participant_timestamp=t_ms * 1000000, bid_price=bid, ask_price=ask))
+    return quotes
+
+
+class FakePolygonClient:
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def list_quotes(self, ticker, timestamp_gte, timestamp_lte, sort, order, limit):
+        # The real client is a generator that requests the next page as it is consumed
+        return (q for q in self.quotes if timestamp_gte <= q.participant_timestamp <= timestamp_lte)
+
+
+class TestStreamingMedian(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(3)
+
+    def test_matches_np_median(self):
+        for _ in range(300):
+            n = self.rng.randint(1, 60)
+            # Few distinct values so duplicates are common
+            prices = [self.rng.choice([1.1, 1.10001, 1.10002, 1.2, self.rng.random()]) for _ in range(n)]
+            median = StreamingMedian()
+            for i, price in enumerate(prices):
+                median.add(price)
+                self.assertEqual(len(median), i + 1)
+                self.assertAlmostEqual(median.median(), np.median(prices[:i + 1]), places=12)
+                self.assertEqual(median.median(), RecentEventTracker.forex_median_price(sorted(prices[:i + 1])))
+
+    @patch('time_util.time_util.TimeUtil.now_in_millis')
+    def test_tracker_matches_sorted_lists(self, mock_time):
+        mock_time.return_value = START_MS
+        tracker = RecentEventTracker()
+        legacy_tracker = RecentEventTracker()
+        for second in range(5):
+            t_ms = START_MS + second * 1000
+            price = 1.1 + self.rng.random() / 100
+            tracker.add_event(PriceSource(start_ms=t_ms, open=price, close=price), is_forex_quote=True)
+            legacy_event = PriceSource(start_ms=t_ms, open=price, close=price)
+            legacy_tracker.add_event(legacy_event)
+            legacy_tracker.timestamp_to_event[t_ms] = (legacy_event, [price])
+            for _ in range(self.rng.randint(0, 50)):
+                price = 1.1 + self.rng.random() / 100
+                tracker.update_prices_for_median(t_ms, price)
+                legacy_update_prices_for_median(legacy_tracker, t_ms, price)
+                event, legacy_event = tracker.get_event_by_timestamp(t_ms)[0], legacy_tracker.get_event_by_timestamp(t_ms)[0]
+                self.assertEqual(legacy_event.model_dump(), event.model_dump())
+
+    def test_rest_quotes_match_sorted_lists(self):
+        pds = PolygonDataService(api_key='test', disable_ws=True)
+        for ms_resolution in [1, 50, 1000]:
+            quotes = quote_stream(self.rng, 3000, 2000, ms_resolution)
+            pds.POLYGON_CLIENT = FakePolygonClient(quotes)
+            aggs = pds.unified_candle_fetcher(TradePair.EURUSD, START_MS, START_MS + 10_000, timespan='second')
+            expected = legacy_build_quotes(pds, quotes)
+            # The old loop left its price list on the last candle
+            self.assertEqual([{k: v for k, v in vars(a).items() if k != 'temp'} for a in expected],
+                             [vars(a) for a in aggs])
+
+    @benchmark
+    def test_quote_replay_benchmark(self):
+        """
+        Replays 2000 quotes per second for one pair through the websocket median path, where Tiingo forex quotes
+        are rounded to the second, and through the REST quote path.
+        """
+        quotes_per_s = 2000
+        n_seconds = 5
+        prices = [1.1 + self.rng.random() / 100 for _ in range(quotes_per_s * n_seconds)]
+
+        def replay(update, make_prices):
+            with patch('time_util.time_util.TimeUtil.now_in_millis', return_value=START_MS):
+                tracker = RecentEventTracker()
+                t0 = time.perf_counter()
+                for i, price in enumerate(prices):
+                    t_ms = START_MS + i // quotes_per_s * 1000
+                    if tracker.timestamp_exists(t_ms):
+                        update(tracker, t_ms, price)
+                    else:
+                        event = PriceSource(start_ms=t_ms, open=price, close=price)
+                        tracker.add_event(event)
+                        tracker.timestamp_to_event[t_ms] = (event, make_prices(price))
+                return time.perf_counter() - t0, tracker
+
+        legacy_s, legacy_tracker = replay(legacy_update_prices_for_median, lambda p: [p])
+        streaming_s, tracker = replay(RecentEventTracker.update_prices_for_median, lambda p: StreamingMedian([p]))
+        for t_ms in tracker.timestamp_to_event:
+            self.assertEqual(legacy_tracker.get_event_by_timestamp(t_ms)[0].close,
+                             tracker.get_event_by_timestamp(t_ms)[0].close)
+
+        pds = PolygonDataService(api_key='test', disable_ws=True)
+        quotes = quote_stream(self.rng, quotes_per_s * n_seconds, quotes_per_s, ms_resolution=100)
+        pds.POLYGON_CLIENT = FakePolygonClient(quotes)
+        t0 = time.perf_counter()
+        legacy_build_quotes(pds, quotes)
+        legacy_rest_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        pds.unified_candle_fetcher(TradePair.EURUSD, START_MS, START_MS + n_seconds * 1000, timespan='second')
+        rest_s = time.perf_counter() - t0
+
+        print(f"Replayed {len(prices)} quotes ({quotes_per_s}/s for one pair). websocket median: sorted lists "
+              f"{legacy_s * 1e6 / len(prices):.1f} us/quote, streaming {streaming_s * 1e6 / len(prices):.1f} us/quote. "
+              f"REST quotes in 100 ms buckets: sorted lists {legacy_rest_s * 1e6 / len(quotes):.1f} us/quote, "
+              f"streaming {rest_s * 1e6 / len(quotes):.1f} us/quote")
+        self.assertLess(streaming_s, legacy_s)
@@ -0,0 +1,201 @@
+import random
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from bittensor.utils import weight_utils
+
+from tests.shared_objects.mock_classes import MockMetagraph
+from tests.shared_objects.test_utilities import checkpoint_generator, ledger_generator
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.position import Position
+from vali_objects.scoring.scoring import Scoring
+from vali_objects.utils.position_filtering import PositionFiltering
+from vali_objects.utils.subtensor_weight_setter import SubtensorWeightSetter
+from vali_objects.vali_config import TradePair, ValiConfig
+from vali_objects.vali_dataclasses.order import Order
+
+CP_MS = ValiConfig.TARGET_CHECKPOINT_DURATION_MS
+END_MS = ValiConfig.TARGET_LEDGER_WINDOW_MS
+
+
+def legacy_compute_results_checkpoint(ledger_dict, full_positions, evaluation_time_ms):
+    """
+    Scoring.compute_results_checkpoint before the array path.
+    """
+    if len(ledger_dict) == 0:
+        return []
+    if len(ledger_dict) == 1:
+        return [(list(ledger_dict.keys())[0], 1.0)]
+    filtered_positions = PositionFiltering.filter(full_positions, evaluation_time_ms=evaluation_time_ms)
+    miner_penalties = Scoring.miner_penalties(filtered_positions, ledger_dict)
+    full_penalty_miner_scores = [(miner, 0) for miner, penalty in miner_penalties.items() if penalty == 0]
+    penalized_scores_dict = Scoring.score_miners(ledger_dict=ledger_dict, positions=full_positions,
+                                                 evaluation_time_ms=evaluation_time_ms)
+    combined_scores = Scoring.combine_scores(penalized_scores_dict)
+    combined_weighed = Scoring.softmax_scores(list(combined_scores.items())) + full_penalty_miner_scores
+    normalized_scores = Scoring.normalize_scores(dict(combined_weighed))
+    return sorted(normalized_scores.items(), key=lambda x: x[1], reverse=True)
+
+
+def legacy_weight_list(metagraph_snapshot, checkpoint_results, testing_hotkeys):
+    """
+    The (uid, weight) list SubtensorWeightSetter.set_weights built before the array path.
+    """
+    ans = []
+    for miner, score in checkpoint_results:
+        if miner in metagraph_snapshot:
+            ans.append((metagraph_snapshot.get_uid(miner), score))
+    for miner in testing_hotkeys:
+        if miner in metagraph_snapshot:
+            ans.append((metagraph_snapshot.get_uid(miner), ValiConfig.CHALLENGE_PERIOD_WEIGHT))
+    return ans
+
+
+class MockSubtensor:
+    """
+    Records what set_weights would emit on chain, converting lists the way the bittensor extrinsic does.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def set_weights(self, netuid, wallet, uids, weights, version_key):
+        if isinstance(uids, list):
+            uids = np.array(uids, dtype=np.int64)
+        if isinstance(weights, list):
+            weights = np.array(weights, dtype=np.float32)
+        self.calls.append((uids.dtype, weights.dtype, uids.tolist(), weights.tolist(),
+                           weight_utils.convert_weights_and_uids_for_emit(uids, weights)))
+        return True, None
+
+
+class TestSubtensorWeightSetter(TestBase):
+
+    N_UIDS = 1024
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(6)
+        self.hotkeys = [f"miner{i}" for i in range(self.N_UIDS)]
+        self.metagraph = MockMetagraph(self.hotkeys)
+        # Mostly successful miners, a few of which deregistered, and testing miners
+        self.success_hotkeys = self.hotkeys[:800] + ["deregistered0", "deregistered1"]
+        self.testing_hotkeys = self.hotkeys[800:] + ["deregistered_testing"]
+        self.weight_setter = SubtensorWeightSetter(None, self.metagraph, SimpleNamespace(
+            perf_ledger_manager=None, challengeperiod_manager=SimpleNamespace(
+                challengeperiod_testing={hotkey: 0 for hotkey in self.testing_hotkeys},
+                challengeperiod_success={hotkey: 0 for hotkey in self.success_hotkeys})), running_unit_tests=True)
+
+    def make_miners(self, hotkeys):
+        ledgers = {}
+        positions = {}
+        for hotkey in hotkeys:
+            start_ms = self.rng.randrange(CP_MS, END_MS // 2, CP_MS)
+            # Some miners draw down past the limit and get the full penalty
+            mdd_floor = .85 if self.rng.random() < .05 else .95
+            ledgers[hotkey] = ledger_generator(checkpoints=[
+                checkpoint_generator(last_update_ms=t_ms, gain=self.rng.uniform(0, .02), loss=-self.rng.uniform(0, .02),
+                                     mdd=self.rng.uniform(mdd_floor, 1), accum_ms=CP_MS, open_ms=CP_MS)
+                for t_ms in range(start_ms, END_MS, CP_MS)])
+            positions[hotkey] = []
+            for i in range(self.rng.randint(1, 20)):
+                open_ms = self.rng.randrange(start_ms, END_MS)
+                positions[hotkey].append(Position(
+                    miner_hotkey=hotkey, position_uuid=f'{hotkey}_{i}', open_ms=open_ms, close_ms=open_ms + CP_MS,
+                    trade_pair=TradePair.BTCUSD, is_closed_position=True, return_at_close=self.rng.uniform(.95, 1.05),
+                    orders=[Order(price=60000, processed_ms=open_ms, order_uuid=f'{hotkey}_{i}',
+                                  trade_pair=TradePair.BTCUSD, order_type=OrderType.LONG, leverage=.1)]))
+        return ledgers, positions
+
+    def set_weights(self, checkpoint_results=None, ledgers=None, positions=None):
+        subtensor = MockSubtensor()
+        # Allow a refresh every call
+        self.weight_setter._last_update_time_ms = 0
+        with patch.object(self.weight_setter, 'filtered_ledger', return_value=ledgers or {"ledger": None}), \
+                patch.object(self.weight_setter, 'filtered_positions', return_value=positions or {}):
+            if checkpoint_results is None:
+                self.weight_setter.set_weights(None, 8, subtensor, current_time=END_MS)
+            else:
+                with patch.object(Scoring, 'compute_results_checkpoint_arrays', return_value=(
+                        [miner for miner, _ in checkpoint_results],
+                        np.array([score for _, score in checkpoint_results], dtype=np.float64))):
+                    self.weight_setter.set_weights(None, 8, subtensor, current_time=END_MS)
+        return subtensor.calls
+
+    def legacy_calls(self, checkpoint_results):
+        subtensor = MockSubtensor()
+        weight_list = legacy_weight_list(self.weight_setter.get_metagraph_snapshot(), checkpoint_results,
+                                         self.testing_hotkeys)
+        subtensor.set_weights(8, None, [x[0] for x in weight_list], [x[1] for x in weight_list], 200)
+        return subtensor.calls
+
+    def test_checkpoint_results_match_legacy(self):
+        for n_miners in [0, 1, 2, 5, 40]:
+            ledgers, positions = self.make_miners(self.hotkeys[:n_miners])
+            expected = legacy_compute_results_checkpoint(ledgers, positions, END_MS)
+            self.assertEqual(expected, Scoring.compute_results_checkpoint(ledgers, positions, END_MS))
+            miners, weights = Scoring.compute_results_checkpoint_arrays(ledgers, positions, END_MS)
+            self.assertEqual([miner for miner, _ in expected], miners)
+            self.assertEqual([weight for _, weight in expected], weights.tolist())
+
+    def test_ties_and_full_penalties_keep_legacy_order(self):
+        ledgers, positions = self.make_miners(self.hotkeys[:30])
+        # Identical miners tie, and a miner that drew down past the limit is fully penalized
+        for hotkey in self.hotkeys[1:10]:
+            ledgers[hotkey] = ledgers[self.hotkeys[0]]
+            positions[hotkey] = positions[self.hotkeys[0]]
+        for cp in ledgers[self.hotkeys[20]].cps:
+            cp.mdd = .5
+        expected = legacy_compute_results_checkpoint(ledgers, positions, END_MS)
+        self.assertEqual(expected[-1], (self.hotkeys[20], 0.0))
+        self.assertEqual(expected, Scoring.compute_results_checkpoint(ledgers, positions, END_MS))
+
+    def test_set_weights_matches_legacy(self):
+        # Miners missing from the metagraph are dropped from both the scored and the challenge period weights
+        checkpoint_results = [(hotkey, self.rng.random() / 800) for hotkey in self.success_hotkeys]
+        checkpoint_results.sort(key=lambda x: x[1], reverse=True)
+        calls = self.set_weights(checkpoint_results)
+        self.assertEqual(self.legacy_calls(checkpoint_results), calls)
+        uids_dtype, weights_dtype, uids, _, _ = calls[0]
+        self.assertEqual((uids_dtype, weights_dtype), (np.int64, np.float32))
+        self.assertEqual(len(uids), self.N_UIDS)
+
+    @benchmark
+    def test_set_weights_benchmark(self):
+        """
+        Weight setting for 1,024 uids, end to end with scoring and for the uid and weight assembly alone.
+        """
+        success_hotkeys = self.success_hotkeys[:-2]
+        ledgers, positions = self.make_miners(success_hotkeys)
+        t0 = time.perf_counter()
+        checkpoint_results = legacy_compute_results_checkpoint(ledgers, positions, END_MS)
+        expected = self.legacy_calls(checkpoint_results)
+        legacy_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        calls = self.set_weights(ledgers=ledgers, positions=positions)
+        array_s = time.perf_counter() - t0
+        self.assertEqual(expected, calls)
+
+        # The uid lookup and weight vector alone, up to the arrays the extrinsic emits from
+        snapshot = self.weight_setter.get_metagraph_snapshot()
+        miners = [miner for miner, _ in checkpoint_results]
+        checkpoint_weights = np.array([weight for _, weight in checkpoint_results])
+        n_repeats = 200
+        t0 = time.perf_counter()
+        for _ in range(n_repeats):
+            weight_list = legacy_weight_list(snapshot, checkpoint_results, self.testing_hotkeys)
+            np.array([x[0] for x in weight_list], dtype=np.int64), np.array([x[1] for x in weight_list], dtype=np.float32)
+        legacy_assembly_ms = (time.perf_counter() - t0) / n_repeats * 1000
+        with patch('vali_objects.utils.subtensor_weight_setter.bt.logging'):
+            t0 = time.perf_counter()
+            for _ in range(n_repeats):
+                uids, weights = SubtensorWeightSetter.uids_and_weights(snapshot, miners, checkpoint_weights,
+                                                                       self.testing_hotkeys)
+                weights.astype(np.float32)
+            array_assembly_ms = (time.perf_counter() - t0) / n_repeats * 1000
+        print(f"set_weights for {self.N_UIDS} uids: legacy {legacy_s:.2f}s, arrays {array_s:.2f}s end to end. "
+              f"uid and weight assembly: legacy {legacy_assembly_ms:.3f} ms, arrays {array_assembly_ms:.3f} ms")
+        # Scoring dominates end to end, so only the assembly is compared
+        self.assertLess(array_assembly_ms, legacy_assembly_ms)
@@ -0,0 +1,77 @@
+import asyncio
+import inspect
+import threading
+import time
+
+from shared_objects.synapse_scheduler import SynapseScheduler
+from template.protocol import GetDashData, SendSignal
+from tests.vali_tests.base_objects.test_base import TestBase
+
+
+class TestSynapseScheduler(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.scheduler = SynapseScheduler()
+        self.scheduler.add_method("signal", max_workers=2, max_queue_depth=2)
+        self.scheduler.add_method("dash", max_workers=1, max_queue_depth=1)
+        self.release_dash = threading.Event()
+
+    def tearDown(self):
+        self.release_dash.set()
+        self.scheduler.shutdown()
+
+    def receive_signal(self, synapse: SendSignal) -> SendSignal:
+        synapse.successfully_processed = True
+        return synapse
+
+    def get_data(self, synapse: GetDashData) -> GetDashData:
+        self.release_dash.wait(timeout=5)
+        synapse.successfully_processed = True
+        return synapse
+
+    def test_wrapped_signature_matches_forward_fn(self):
+        wrapped = self.scheduler.wrap("signal", self.receive_signal)
+        assert inspect.iscoroutinefunction(wrapped)
+        assert inspect.signature(wrapped) == inspect.signature(self.receive_signal)
+
+    def test_queue_depth_rejects_fast(self):
+        wrapped = self.scheduler.wrap("dash", self.get_data)
+
+        async def run():
+            tasks = [asyncio.create_task(wrapped(GetDashData())) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            # One running and one queued. The third request is over capacity.
+            t0 = time.time()
+            rejected = await wrapped(GetDashData())
+            reject_time_s = time.time() - t0
+            self.release_dash.set()
+            return await asyncio.gather(*tasks), rejected, reject_time_s
+
+        served, rejected, reject_time_s = asyncio.run(run())
+        assert all(s.successfully_processed for s in served)
+        assert not rejected.successfully_processed
+        assert "capacity" in rejected.error_message
+        assert reject_time_s < 0.5
+
+        stats = self.scheduler.get_stats()["dash"]
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 0
+        assert stats["service_time_s"]["count"] == 2
+        assert stats["queue_time_s"]["count"] == 2
+
+    def test_signals_not_blocked_by_saturated_method(self):
+        wrapped_dash = self.scheduler.wrap("dash", self.get_data)
+        wrapped_signal = self.scheduler.wrap("signal", self.receive_signal)
+
+        async def run():
+            dash_tasks = [asyncio.create_task(wrapped_dash(GetDashData())) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            signals = await asyncio.wait_for(asyncio.gather(*[wrapped_signal(SendSignal()) for _ in range(4)]), timeout=1)
+            self.release_dash.set()
+            await asyncio.gather(*dash_tasks)
+            return signals
+
+        signals = asyncio.run(run())
+        assert all(s.successfully_processed for s in signals)
+        assert self.scheduler.get_stats()["signal"]["rejected"] == 0
@@ -0,0 +1,257 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from unittest.mock import patch
+
+import orjson
+
+from data_generator.poll_scheduler import PollScheduler
+from data_generator.tiingo_data_service import TiingoDataService
+from tests.vali_tests.base_objects.test_base import TestBase, benchmark
+from time_util.time_util import TimeUtil
+from vali_objects.vali_config import TradePair, TradePairCategory
+
+
+class SimClock:
+    def __init__(self, now_s):
+        self.now_s = now_s
+
+    def now_in_millis(self):
+        return int(self.now_s * 1000)
+
+
+class FakeTiingoMarket:
+    """
+    Simulated upstream prices. Each ticker moves in steps of change_period_s with a random return of sigma per step.
+    Prices only depend on the simulated time so every poller sees the same market.
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.ticker_params = {}
+        forex = [tp for tp in TradePair if tp.is_forex]
+        for tp in TradePair:
+            if tp.is_crypto:
+                params = (1, 0.00015)
+            elif tp.is_equities:
+                params = (1, 0.0001)
+            elif tp in forex[:8]:
+                params = (2, 0.00005)
+            else:
+                # Quiet forex pairs barely update
+                params = (30, 0.00005)
+            self.ticker_params[tp.trade_pair_id.lower()] = params
+        self.price_cache = {}
+
+    def step_price(self, ticker, step):
+        key = (ticker, step)
+        if key not in self.price_cache:
+            sigma = self.ticker_params[ticker][1]
+            prev = self.step_price(ticker, step - 1) if step > 0 and (ticker, step - 1) in self.price_cache \
+                else 100.0 * (1 + sigma * ((step % 7) - 3))
+            self.price_cache[key] = round(prev * (1 + random.Random(f"{ticker}_{step}").gauss(0, sigma)), 6)
+        return self.price_cache[key]
+
+    def quote(self, ticker, now_s=None):
+        """
+        Returns (price, time the price was set in ms) at now_s.
+        """
+        if now_s is None:
+            now_s = self.clock.now_s
+        period_s = self.ticker_params[ticker][0]
+        step = int(now_s // period_s)
+        return self.step_price(ticker, step), step * period_s * 1000
+
+    def warm(self, start_s, end_s):
+        # Walk the prices forward once so step_price never recurses deeply
+        for ticker, (period_s, _) in self.ticker_params.items():
+            for step in range(int(start_s // period_s) - 1, int(end_s // period_s) + 2):
+                self.step_price(ticker, step)
+
+
+class FakeTiingoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        market = self.server.market
+        url = urlparse(self.path)
+        tickers = parse_qs(url.query)['tickers'][0].split(',')
+        self.server.n_requests[url.path] += 1
+        self.server.request_times_s.append(market.clock.now_s)
+        self.server.n_tickers_requested += len(tickers)
+        body = []
+        for ticker in tickers:
+            price, price_ms = market.quote(ticker)
+            iso = datetime.fromtimestamp(price_ms / 1000, tz=timezone.utc).isoformat()
+            if url.path == '/iex/':
+                body.append({'ticker': ticker, 'timestamp': iso, 'tngoLast': price})
+            elif url.path == '/tiingo/fx/top':
+                body.append({'ticker': ticker, 'quoteTimestamp': iso, 'bidPrice': price})
+            else:
+                body.append({'ticker': ticker, 'topOfBookData': [
+                    {'quoteTimestamp': iso, 'lastSaleTimestamp': iso, 'bidPrice': price, 'askPrice': price,
+                     'lastPrice': price, 'bidExchange': 'GDAX', 'askExchange': 'GDAX', 'lastExchange': 'GDAX'}]})
+        payload = orjson.dumps(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTiingoPoller(TestBase):
+
+    # Wednesday 2024-11-20 14:00 to 15:30 UTC. US equities open at 14:30.
+    START_S = datetime(2024, 11, 20, 14, 0, tzinfo=timezone.utc).timestamp()
+    EQUITIES_OPEN_S = datetime(2024, 11, 20, 14, 30, tzinfo=timezone.utc).timestamp()
+    DURATION_S = 90 * 60
+    ORDER_TRADE_PAIRS = [TradePair.BTCUSD, TradePair.EURUSD, TradePair.NVDA]
+    ORDER_EVERY_S = 600
+    ORDER_BURST_S = 60
+
+    def setUp(self):
+        super().setUp()
+        self.clock = SimClock(self.START_S)
+        self.market = FakeTiingoMarket(self.clock)
+        self.market.warm(self.START_S, self.START_S + self.DURATION_S)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTiingoHandler)
+        self.server.market = self.market
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.time_patch = patch.object(TimeUtil, 'now_in_millis', self.clock.now_in_millis)
+        self.time_patch.start()
+
+    def tearDown(self):
+        self.time_patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def make_data_service(self):
+        self.server.n_requests = defaultdict(int)
+        self.server.n_tickers_requested = 0
+        self.server.request_times_s = []
+        tds = TiingoDataService(api_key='test', disable_ws=True)
+        tds.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        events = []
+        process_ps_from_websocket = tds.process_ps_from_websocket
+
+        def record_event(tp, ps):
+            events.append((tp, self.clock.now_s, ps))
+            process_ps_from_websocket(tp, ps)
+
+        tds.process_ps_from_websocket = record_event
+        return tds, events
+
+    def place_orders(self, tds, now_s):
+        # Miners trade a few trade pairs in bursts
+        if (now_s - self.START_S) % self.ORDER_EVERY_S < self.ORDER_BURST_S:
+            for tp in self.ORDER_TRADE_PAIRS:
+                tds.record_order_activity(tp, int(now_s * 1000))
+
+    def is_ordering(self, now_s):
+        # Includes the window after the last order in which the scheduler keeps polling fast
+        return ((now_s - self.START_S) % self.ORDER_EVERY_S <
+                self.ORDER_BURST_S + PollScheduler.ORDER_ACTIVITY_WINDOW_S + PollScheduler.MIN_INTERVAL_S)
+
+    def n_requests_while_quiet(self):
+        return sum(not self.is_ordering(t) for t in self.server.request_times_s)
+
+    def run_legacy(self):
+        """
+        The pseudo websocket before the scheduler. One loop per category polls every open trade pair each 5 seconds
+        and forwards every price.
+        """
+        tds, events = self.make_data_service()
+        categories = [TradePairCategory.EQUITIES, TradePairCategory.FOREX, TradePairCategory.CRYPTO]
+        category_to_trade_pairs = {tpc: [tp for tp in TradePair if tp.trade_pair_category == tpc] for tpc in categories}
+        now_s = self.START_S
+        while now_s < self.START_S + self.DURATION_S:
+            self.clock.now_s = now_s
+            self.place_orders(tds, now_s)
+            for tpc in categories:
+                trade_pairs = [tp for tp in category_to_trade_pairs[tpc] if tds.is_market_open(tp)]
+                for tp, ps in tds.get_closes_rest(trade_pairs).items():
+                    ps.websocket = True
+                    tds.process_ps_from_websocket(tp, ps)
+            now_s += 5
+        return tds, events
+
+    def run_scheduler(self, duration_s=DURATION_S):
+        tds, events = self.make_data_service()
+        now_s = self.START_S
+        while now_s < self.START_S + duration_s:
+            self.clock.now_s = now_s
+            self.place_orders(tds, now_s)
+            wait_s = tds.poll_pseudo_websocket(now_s)
+            now_s += min(max(wait_s, .1), PollScheduler.MIN_INTERVAL_S)
+        return tds, events
+
+    def freshness(self, events, ordering=None):
+        """
+        Mean seconds between the upstream price change and the event carrying it reaching the validator.
+        """
+        lags = [now_s - ps.start_ms / 1000 for tp, now_s, ps in events
+                if ordering is None or (tp in self.ORDER_TRADE_PAIRS and self.is_ordering(now_s) == ordering)]
+        return sum(lags) / len(lags)
+
+    def check_scheduler_events(self, tds, events):
+        # Only changes are forwarded
+        last_seen = {}
+        for tp, _, ps in events:
+            self.assertTrue(ps.websocket)
+            self.assertNotEqual(last_seen.get(tp), (ps.start_ms, ps.close))
+            last_seen[tp] = (ps.start_ms, ps.close)
+        self.assertEqual(len({(tp, ps.start_ms) for tp, _, ps in events}), len(events))
+        # Equities are picked up soon after the open
+        first_nvda_s = min(now_s for tp, now_s, _ in events if tp == TradePair.NVDA)
+        self.assertLess(first_nvda_s - self.EQUITIES_OPEN_S,
+                        PollScheduler.MARKET_STATUS_REFRESH_S + PollScheduler.MIN_INTERVAL_S + 1)
+        self.assertFalse(any(tp.is_equities and now_s < self.EQUITIES_OPEN_S for tp, now_s, _ in events))
+        # Every category is polled through one request at a time
+        self.assertLessEqual(set(self.server.n_requests), {'/iex/', '/tiingo/fx/top', '/tiingo/crypto/top'})
+        for tp in TradePair:
+            if tds.poll_scheduler.last_price.get(tp):
+                self.assertEqual(tds.latest_websocket_events[tp.trade_pair].close,
+                                 tds.poll_scheduler.last_price[tp][1])
+
+    def test_simulated_trading_day(self):
+        # Through the equities open
+        tds, events = self.run_scheduler(duration_s=40 * 60)
+        self.check_scheduler_events(tds, events)
+
+    @benchmark
+    def test_simulated_trading_day_benchmark(self):
+        t0 = time.time()
+        legacy_tds, legacy_events = self.run_legacy()
+        legacy_requests, legacy_tickers = sum(self.server.n_requests.values()), self.server.n_tickers_requested
+        legacy_quiet_requests = self.n_requests_while_quiet()
+        legacy_s = time.time() - t0
+
+        t0 = time.time()
+        tds, events = self.run_scheduler()
+        requests, tickers = sum(self.server.n_requests.values()), self.server.n_tickers_requested
+        quiet_requests = self.n_requests_while_quiet()
+        scheduler_s = time.time() - t0
+        self.check_scheduler_events(tds, events)
+
+        legacy_ordering_lag_s = self.freshness(legacy_events, ordering=True)
+        ordering_lag_s = self.freshness(events, ordering=True)
+        print(f"Simulated {self.DURATION_S / 60:.0f} minutes. "
+              f"legacy: {legacy_requests} requests ({legacy_quiet_requests} without recent orders) for "
+              f"{legacy_tickers} tickers, {len(legacy_events)} events, "
+              f"freshness {self.freshness(legacy_events):.2f} s, "
+              f"while ordering {legacy_ordering_lag_s:.2f} s (ran in {legacy_s:.1f} s). "
+              f"scheduler: {requests} requests ({quiet_requests} without recent orders) for "
+              f"{tickers} tickers, {len(events)} events, "
+              f"freshness {self.freshness(events):.2f} s, "
+              f"while ordering {ordering_lag_s:.2f} s (ran in {scheduler_s:.1f} s)")
+        # Fast polls cost requests while miners trade. Otherwise the scheduler makes about as many requests as before,
+        # plus a few polls of volatile trade pairs.
+        self.assertLess(quiet_requests, legacy_quiet_requests * 1.05)
+        self.assertLess(len(events), len(legacy_events))
+        self.assertLess(ordering_lag_s, legacy_ordering_lag_s)
@@ -37,4 +37,6 @@ class OrderType(Enum):
 
     def __json__(self):
         # Provide a dictionary representation for JSON serialization
-        return self.__str__()
\ No newline at end of file
+        return self.__str__()
+
+ORDER_TYPE_BY_VALUE = {ot.value: ot for ot in OrderType}
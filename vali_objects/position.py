@@ -1,14 +1,14 @@
-import json
+import bisect
 import logging
-from copy import deepcopy
+from itertools import islice
 from typing import Optional, List
-from pydantic import model_validator, BaseModel, Field
+from pydantic import model_validator, BaseModel, Field, PrivateAttr
 
 from time_util.time_util import TimeUtil, MS_IN_8_HOURS, MS_IN_24_HOURS
 from vali_objects.vali_config import TradePair, ValiConfig
 from vali_objects.vali_dataclasses.order import Order, ORDER_SRC_ELIMINATION_FLAT
-from vali_objects.enums.order_type_enum import OrderType
-from vali_objects.utils import leverage_utils
+from vali_objects.enums.order_type_enum import OrderType, ORDER_TYPE_BY_VALUE
+from vali_objects.utils import leverage_utils, fast_json
 import bittensor as bt
 import math
 
@@ -16,6 +16,9 @@ CRYPTO_CARRY_FEE_PER_INTERVAL = math.exp(math.log(1 - 0.1095) / (365.0*3.0))  #
 FOREX_CARRY_FEE_PER_INTERVAL = math.exp(math.log(1 - .03) / 365.0)  # 3% per year for 1x leverage. Each interval is 24 hrs
 INDICES_CARRY_FEE_PER_INTERVAL = math.exp(math.log(1 - .0525) / 365.0)  # 5.25% per year for 1x leverage. Each interval is 24 hrs
 FEE_V6_TIME_MS = 1720843707000  # V6 PR merged
+# Fields set by _update_position. Together they are the position's state after an order.
+ORDER_STATE_FIELDS = ('open_ms', 'current_return', 'close_ms', 'return_at_close', 'net_leverage',
+                      'average_entry_price', 'position_type', 'is_closed_position')
 
 class Position(BaseModel):
     """Represents a position in a trading system.
@@ -49,6 +52,11 @@ class Position(BaseModel):
     average_entry_price: float = 0.0
     position_type: Optional[OrderType] = None
     is_closed_position: bool = False
+    # Step function of |leverage| over order time used for carry fee intervals. Rebuilt when the orders change.
+    _leverage_index: Optional[dict] = PrivateAttr(default=None)
+    # Position state after each replayed order and the order inputs it was computed from. Lets a rebuild resume from
+    # the first order whose price changed instead of replaying every order.
+    _order_states: Optional[dict] = PrivateAttr(default=None)
 
     @model_validator(mode='before')
     def add_trade_pair_to_orders_and_self(cls, values):
@@ -102,20 +110,51 @@ class Position(BaseModel):
     def get_spread_fee(self) -> float:
         return 1.0 - (self.get_cumulative_leverage() * self.trade_pair.fees * 0.5)
 
+    def carry_fee_interval_fees(self, first_interval_ms: int, is_crypto: bool = None):
+        """
+        Fee of each carry fee interval in order, starting at start_carry_fee_accrual_ms. The first interval is
+        first_interval_ms long and the rest are 8 hours. Forex and indices intervals ending on a weekend yield None.
+        Leverage is only looked up for the intervals consumed. is_crypto picks the fee schedule, by default the one of
+        the trade pair.
+        """
+        if is_crypto is None:
+            is_crypto = self.trade_pair.is_crypto
+        start_ms = self.start_carry_fee_accrual_ms
+        end_ms = start_ms + first_interval_ms
+        order_idx = 0
+        while True:
+            if is_crypto:
+                max_lev, order_idx = self._max_leverage_seen_in_interval(start_ms, end_ms, order_idx)
+                yield CRYPTO_CARRY_FEE_PER_INTERVAL ** max_lev
+            else:
+                # Monday == 0...Sunday == 6
+                day_of_week_index = TimeUtil.get_day_of_week_from_timestamp(end_ms)
+                assert day_of_week_index in range(7)
+                if day_of_week_index in (5, 6):
+                    yield None  # no fees on Saturday, Sunday
+                else:
+                    fee = 1.0
+                    max_lev, order_idx = self._max_leverage_seen_in_interval(start_ms, end_ms, order_idx)
+                    if self.trade_pair.is_forex:
+                        fee *= FOREX_CARRY_FEE_PER_INTERVAL ** max_lev
+                    elif self.trade_pair.is_indices or self.trade_pair.is_equities:
+                        fee *= INDICES_CARRY_FEE_PER_INTERVAL ** max_lev
+                    else:
+                        raise ValueError(f"Unexpected trade pair: {self.trade_pair.trade_pair_id}")
+                    if day_of_week_index == 2:
+                        fee = fee ** 3  # triple fee on Wednesday
+                    yield fee
+            start_ms = end_ms
+            end_ms = start_ms + MS_IN_8_HOURS
+
     def crypto_carry_fee(self, current_time_ms: int) -> (float, int):
         #print(f'accrual time {TimeUtil.millis_to_formatted_date_str(self.start_carry_fee_accrual_ms)} now {TimeUtil.millis_to_formatted_date_str(current_time_ms)}')
         # Fees every 8 hrs. 4 UTC, 12 UTC, 20 UTC
         n_intervals_elapsed, time_until_next_interval_ms = TimeUtil.n_intervals_elapsed_crypto(self.start_carry_fee_accrual_ms, current_time_ms)
         fee_product = 1.0
-        start_ms = self.start_carry_fee_accrual_ms
-        end_ms = start_ms + time_until_next_interval_ms
-        for n in range(n_intervals_elapsed):
-            if n != 0:
-                start_ms = end_ms
-                end_ms = start_ms + MS_IN_8_HOURS
-
-            max_lev = self.max_leverage_seen_in_interval(start_ms, end_ms)
-            fee_product *= CRYPTO_CARRY_FEE_PER_INTERVAL ** max_lev
+        for fee in islice(self.carry_fee_interval_fees(time_until_next_interval_ms, is_crypto=True),
+                          max(n_intervals_elapsed, 0)):
+            fee_product *= fee
 
         final_fee = fee_product
         #ct_formatted = TimeUtil.millis_to_formatted_date_str(current_time_ms)
@@ -127,30 +166,10 @@ class Position(BaseModel):
         # Fees M-F where W gets triple fee.
         n_intervals_elapsed, time_until_next_interval_ms = TimeUtil.n_intervals_elapsed_forex_indices(self.start_carry_fee_accrual_ms, current_time_ms)
         fee_product = 1.0
-        start_ms = self.start_carry_fee_accrual_ms
-        end_ms = start_ms + time_until_next_interval_ms
-        for n in range(n_intervals_elapsed):
-            if n != 0:
-                start_ms = end_ms
-                end_ms = start_ms + MS_IN_8_HOURS
-            # Monday == 0...Sunday == 6
-            day_of_week_index = TimeUtil.get_day_of_week_from_timestamp(end_ms)
-            assert day_of_week_index in range(7)
-            if day_of_week_index in (5, 6):
-                continue  # no fees on Saturday, Sunday
-            else:
-                fee = 1.0
-                max_lev = self.max_leverage_seen_in_interval(start_ms, end_ms)
-                if self.trade_pair.is_forex:
-                    fee *= FOREX_CARRY_FEE_PER_INTERVAL ** max_lev
-                elif self.trade_pair.is_indices or self.trade_pair.is_equities:
-                    fee *= INDICES_CARRY_FEE_PER_INTERVAL ** max_lev
-                else:
-                    raise ValueError(f"Unexpected trade pair: {self.trade_pair.trade_pair_id}")
-                if day_of_week_index == 2:
-                    fee = fee ** 3  # triple fee on Wednesday
-
-            fee_product *= fee
+        for fee in islice(self.carry_fee_interval_fees(time_until_next_interval_ms, is_crypto=False),
+                          max(n_intervals_elapsed, 0)):
+            if fee is not None:
+                fee_product *= fee
 
         next_update_time_ms = current_time_ms + time_until_next_interval_ms
         assert next_update_time_ms > current_time_ms, (next_update_time_ms, current_time_ms, fee_product, n_intervals_elapsed, time_until_next_interval_ms)
@@ -203,6 +222,15 @@ class Position(BaseModel):
                 self.initial_entry_price == other.initial_entry_price and
                 self.trade_pair.trade_pair == other.trade_pair.trade_pair)
 
+    def __getstate__(self):
+        # Both caches are rebuilt lazily and the order states are large. Don't ship them when positions are pickled
+        # between processes.
+        state = super().__getstate__()
+        if state.get('__pydantic_private__'):
+            state['__pydantic_private__'] = {**state['__pydantic_private__'], '_leverage_index': None,
+                                             '_order_states': None}
+        return state
+
     def _handle_trade_pair_encoding(self, d):
         # Remove trade_pair from orders
         if 'orders' in d:
@@ -223,7 +251,15 @@ class Position(BaseModel):
         return d
 
     def to_dict(self):
-        d = deepcopy(self.dict())
+        # model_dump builds fresh dicts and lists so there is nothing to copy
+        return self._handle_trade_pair_encoding(self.dict())
+
+    def to_json_dict(self) -> dict:
+        """
+        The position as JSON compatible types in the on-disk and wire schema. Same as json.loads(self.to_json_string())
+        without the round trip through a string.
+        """
+        d = self.model_dump(mode='json', exclude={'orders': {'__all__': {'trade_pair'}}})
         return self._handle_trade_pair_encoding(d)
 
     @property
@@ -239,12 +275,37 @@ class Position(BaseModel):
         return self.to_json_string()
 
     def to_json_string(self) -> str:
-        # Using pydantic's json method with built-in validation
-        json_str = self.json()
-        # Unfortunately, we can't tell pydantic v1 to strip certain fields so we do that here
-        json_loaded = json.loads(json_str)
-        json_compressed = self._handle_trade_pair_encoding(json_loaded)
-        return json.dumps(json_compressed)
+        return fast_json.dumps(self.to_json_dict())
+
+    @classmethod
+    def from_json_string(cls, json_str: str | bytes) -> 'Position':
+        """
+        Trusted counterpart of to_json_string for files this validator wrote itself.
+        """
+        return cls.from_trusted_dict(fast_json.loads(json_str))
+
+    @classmethod
+    def from_trusted_dict(cls, position_dict: dict) -> 'Position':
+        """
+        Build a Position from JSON this codebase wrote itself (position files, checkpoints being built) without
+        running pydantic validation, which dominates load time for large position sets. Resolves the trade pair and
+        coerces types the same way validation does. Anything received from the network, other validators or a backup
+        must go through the regular constructor instead.
+        """
+        values = dict(position_dict)
+        trade_pair = values['trade_pair']
+        if not isinstance(trade_pair, TradePair):
+            trade_pair = TradePair.get_latest_trade_pair_from_trade_pair_id(trade_pair[0])
+        values['trade_pair'] = trade_pair
+        values['orders'] = [o.model_copy(update={'trade_pair': trade_pair}) if isinstance(o, Order) else
+                            Order.from_trusted_dict(o, trade_pair) for o in values.get('orders', [])]
+        for k in ('current_return', 'return_at_close', 'net_leverage', 'average_entry_price'):
+            if k in values and type(values[k]) is not float:
+                values[k] = float(values[k])
+        position_type = values.get('position_type')
+        if position_type is not None:
+            values['position_type'] = ORDER_TYPE_BY_VALUE.get(position_type) or OrderType(position_type)
+        return fast_json.construct_trusted(cls, values)
 
     @classmethod
     def from_dict(cls, position_dict):
@@ -269,6 +330,15 @@ class Position(BaseModel):
         return self.net_leverage
 
     def rebuild_position_with_updated_orders(self):
+        start_idx, states = self._first_changed_order_idx()
+        if start_idx:
+            # Orders before start_idx are unchanged. Resume from the state after the last of them.
+            for k, v in zip(ORDER_STATE_FIELDS, states[start_idx - 1]):
+                setattr(self, k, v)
+            if start_idx < len(states):
+                self._update_position(start_idx)
+            return
+
         self.current_return = 1.0
         self.close_ms = None
         self.return_at_close = 1.0
@@ -280,6 +350,27 @@ class Position(BaseModel):
 
         self._update_position()
 
+    def _order_inputs(self) -> list:
+        # Everything about the orders a replay depends on except prices. Fees look at every order's leverage and time
+        # so a state is only reusable if all of these match.
+        return [(order.order_type, order.leverage, order.processed_ms, order.src) for order in self.orders]
+
+    def _first_changed_order_idx(self) -> (int, list):
+        """
+        Returns the index of the first replayed order whose price differs from when the order states were cached and
+        the cached states. The index is the number of replayed orders if no price changed and 0 if the cache can't be
+        used.
+        """
+        cache = self._order_states
+        if cache is None or cache['trade_pair'] != self.trade_pair or cache['order_inputs'] != self._order_inputs():
+            return 0, None
+        states = cache['states']
+        prices = cache['prices']
+        for i in range(len(states)):
+            if self.orders[i].price != prices[i]:
+                return i, states
+        return len(states), states
+
     def log_position_status(self):
         bt.logging.debug(
             f"position details: "
@@ -347,13 +438,50 @@ class Position(BaseModel):
         return prev_leverage * cur_leverage < 0 or prev_leverage != 0 and cur_leverage == 0
 
     def max_leverage_seen_in_interval(self, start_ms: int, end_ms: int) -> float:
-        #print(f"Seeking max leverage between {TimeUtil.millis_to_formatted_date_str(start_ms)} and {TimeUtil.millis_to_formatted_date_str(end_ms)}")
-        #for x in self.orders:
-        #    print(f"    Found order at time {TimeUtil.millis_to_formatted_date_str(x.processed_ms)}")
         """
         Returns the max leverage seen in the interval [start_ms, end_ms] (inclusive). If no orders are in the interval,
         raise an exception
         """
+        return self._max_leverage_seen_in_interval(start_ms, end_ms)[0]
+
+    def _get_leverage_index(self) -> dict:
+        """
+        Running leverage after each order as walked by max_leverage_seen, up to and including the order that closes
+        the position. Built once and reused until the orders are changed or replaced.
+        """
+        orders = self.orders
+        index = self._leverage_index
+        if (index is not None and index['orders'] is orders and index['n_orders'] == len(orders)
+                and index['first_order'] is orders[0] and index['last_order'] is orders[-1]):
+            return index
+
+        times_ms = []
+        prev_abs_leverages = []
+        abs_leverages = []
+        current_leverage = 0
+        for order in orders:
+            prev_leverage = current_leverage
+            current_leverage += order.leverage
+            stop_signaled = order.order_type == OrderType.FLAT or self._leverage_flipped(prev_leverage, current_leverage)
+            if stop_signaled:
+                current_leverage = 0
+            times_ms.append(order.processed_ms)
+            prev_abs_leverages.append(abs(prev_leverage))
+            abs_leverages.append(abs(current_leverage))
+            if stop_signaled:
+                break
+
+        index = {'orders': orders, 'n_orders': len(orders), 'first_order': orders[0], 'last_order': orders[-1],
+                 'times_ms': times_ms, 'prev_abs_leverages': prev_abs_leverages, 'abs_leverages': abs_leverages,
+                 'is_sorted': all(times_ms[i] <= times_ms[i + 1] for i in range(len(times_ms) - 1))}
+        self._leverage_index = index
+        return index
+
+    def _max_leverage_seen_in_interval(self, start_ms: int, end_ms: int, order_idx: int = 0) -> (float, int):
+        """
+        Same as max_leverage_seen_in_interval but also returns the index of the first order at or after start_ms.
+        Passing it back for the next (later) interval avoids searching the orders before it again.
+        """
         # check valid bounds and throw ValueError if bad data
         if start_ms > end_ms:
             raise ValueError(f"start_ms [{start_ms}] is greater than end_ms [{end_ms}]")
@@ -369,13 +497,45 @@ class Position(BaseModel):
             raise ValueError(f"Position closed before interval start_ms [{start_ms}]")
 
 
-        interval_data = {'start_ms': start_ms, 'end_ms': end_ms, 'max_leverage': -float('inf')}
-        self.max_leverage_seen(interval_data=interval_data)
+        index = self._get_leverage_index()
+        if index['is_sorted']:
+            max_leverage, order_idx = self._max_leverage_from_index(index, start_ms, end_ms, order_idx)
+        else:
+            interval_data = {'start_ms': start_ms, 'end_ms': end_ms, 'max_leverage': -float('inf')}
+            self.max_leverage_seen(interval_data=interval_data)
+            max_leverage, order_idx = interval_data['max_leverage'], 0
 
-        if interval_data['max_leverage'] == -float('inf'):
+        if max_leverage == -float('inf'):
             raise ValueError('Unable to find max leverage in interval')
-        assert interval_data['max_leverage'] > 0, (interval_data['max_leverage'], self.orders)
-        return interval_data['max_leverage']
+        assert max_leverage > 0, (max_leverage, self.orders)
+        return max_leverage, order_idx
+
+    @staticmethod
+    def _max_leverage_from_index(index: dict, start_ms: int, end_ms: int, order_idx: int) -> (float, int):
+        # Mirrors the interval bookkeeping in max_leverage_seen for orders sorted by processed_ms
+        times_ms = index['times_ms']
+        prev_abs_leverages = index['prev_abs_leverages']
+        abs_leverages = index['abs_leverages']
+        n = len(times_ms)
+        first_idx = bisect.bisect_left(times_ms, start_ms, order_idx)
+        max_leverage = -float('inf')
+        i = first_idx
+        while i < n and times_ms[i] <= end_ms:
+            if times_ms[i] == start_ms:
+                max_leverage = max(abs_leverages[i], max_leverage)
+            else:
+                max_leverage = max(abs_leverages[i], max_leverage, prev_abs_leverages[i])
+            i += 1
+
+        # An order passes the interval for the first time
+        if i < n:
+            max_leverage = max(prev_abs_leverages[i], max_leverage)
+
+        # The position's last order is way before the interval start. Use the last known position leverage
+        if max_leverage == -float('inf'):
+            max_leverage = abs_leverages[-1]
+
+        return max_leverage, first_idx
 
     def max_leverage_seen(self, interval_data=None):
         max_leverage = 0
@@ -572,10 +732,19 @@ class Position(BaseModel):
 
         return should_ignore_order
 
-    def _update_position(self):
-        self.net_leverage = 0.0
+    def _update_position(self, start_idx: int = 0):
+        """
+        Replays the orders from start_idx onward. With start_idx > 0 the position must already hold the state after
+        order start_idx - 1, which rebuild_position_with_updated_orders restores from the cached order states.
+        """
+        if start_idx == 0:
+            self.net_leverage = 0.0
+            self._leverage_index = None
+            states = []
+        else:
+            states = self._order_states['states'][:start_idx]
         bt.logging.trace(f"Updating position {self.trade_pair.trade_pair_id} with n orders: {len(self.orders)}")
-        for order in self.orders:
+        for order in self.orders[start_idx:]:
             if self.position_type is None:
                 self.initialize_position_from_first_order(order)
 
@@ -604,7 +773,11 @@ class Position(BaseModel):
             #    f"Updating position state for new order {order} with adjusted leverage {adjusted_leverage}"
             #)
             self.update_position_state_for_new_order(order, adjusted_leverage)
+            states.append(tuple(getattr(self, k) for k in ORDER_STATE_FIELDS))
 
             # If the position is already closed, we don't need to process any more orders. break in case there are more orders.
             if self.position_type == OrderType.FLAT:
                 break
+
+        self._order_states = {'trade_pair': self.trade_pair, 'order_inputs': self._order_inputs(),
+                              'prices': [order.price for order in self.orders[:len(states)]], 'states': states}
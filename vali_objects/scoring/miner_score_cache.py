@@ -0,0 +1,176 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+import json
+import os
+from collections import defaultdict
+
+import bittensor as bt
+
+from vali_objects.position import Position
+from vali_objects.scoring.scoring import Scoring
+from vali_objects.utils.position_filtering import PositionFiltering
+from vali_objects.utils.vali_bkp_utils import ValiBkpUtils
+from vali_objects.vali_config import ValiConfig
+from vali_objects.vali_dataclasses.perf_ledger import PerfLedger
+
+
+class MinerScoreCache:
+    """
+    Per-miner results of Scoring.score_miners, so the challenge period refresh only rescores miners whose ledger or
+    positions changed since the last tick. A miner's metric scores and penalty depend only on its own ledger, its own
+    positions and which of them the evaluation time filters in, which is what fingerprint captures.
+
+    The cache is persisted as a log of JSON lines, one per rescored or removed miner, appended to on every change.
+    The file is rewritten in full only when the log has grown to COMPACTION_FACTOR times the miners it holds. A log
+    written by another version or scoring config is discarded.
+    """
+    COMPACTION_FACTOR = 4
+    COMPACTION_MIN_LINES = 1000
+
+    def __init__(self, file_location: str = None):
+        self.file_location = file_location
+        self.entries: dict[str, tuple[list, dict]] = {}  # hotkey -> (fingerprint, {"scores": {metric: score}, "penalty": p})
+        self.n_log_lines = 0
+        self.stats = defaultdict(int)
+        if file_location:
+            self._load()
+
+    @staticmethod
+    def header() -> dict:
+        return {
+            "version": ValiConfig.VERSION,
+            "metrics": {config_name: config["weight"] for config_name, config in Scoring.scoring_config.items()},
+            "penalties": list(Scoring.penalties_config)
+        }
+
+    @staticmethod
+    def fingerprint(ledger: PerfLedger | None, positions: list[Position], evaluation_time_ms: int) -> list:
+        """
+        Changes whenever the miner's scoring inputs do. Ledger updates only append checkpoints or change the last one,
+        and positions only change by adding orders or by returns moving, which also moves the filtered sum.
+        """
+        cps = ledger.cps if ledger else ()
+        filtered_positions = PositionFiltering.filter_single_miner(positions, evaluation_time_ms)
+        return [
+            ledger.initialization_time_ms if ledger else None,
+            len(cps),
+            list(cps[-1].to_dict().values()) if cps else None,
+            len(positions),
+            sum(len(p.orders) for p in positions),
+            len(filtered_positions),
+            sum(p.return_at_close for p in filtered_positions)
+        ]
+
+    def score_miners(
+            self,
+            ledger_dict: dict[str, PerfLedger],
+            positions: dict[str, list[Position]],
+            evaluation_time_ms: int
+    ) -> dict[str, dict]:
+        """
+        Same result as Scoring.score_miners. Only miners whose fingerprint changed are scored, in one batch.
+        """
+        fingerprints = {}
+        stale_hotkeys = []
+        for hotkey, ledger in ledger_dict.items():
+            fingerprint = self.fingerprint(ledger, positions.get(hotkey, []), evaluation_time_ms)
+            fingerprints[hotkey] = fingerprint
+            entry = self.entries.get(hotkey)
+            if entry is None or entry[0] != fingerprint:
+                stale_hotkeys.append(hotkey)
+
+        self.stats['n_hits'] += len(ledger_dict) - len(stale_hotkeys)
+        self.stats['n_misses'] += len(stale_hotkeys)
+        if stale_hotkeys:
+            stale_scores_dict = Scoring.score_miners(
+                ledger_dict={hotkey: ledger_dict[hotkey] for hotkey in stale_hotkeys},
+                positions={hotkey: positions.get(hotkey, []) for hotkey in stale_hotkeys},
+                evaluation_time_ms=evaluation_time_ms
+            )
+            results = {hotkey: {"scores": {}, "penalty": stale_scores_dict["penalties"][hotkey]}
+                       for hotkey in stale_hotkeys}
+            for config_name, config in stale_scores_dict["metrics"].items():
+                for hotkey, score in config["scores"]:
+                    results[hotkey]["scores"][config_name] = score
+            for hotkey, result in results.items():
+                self.entries[hotkey] = (fingerprints[hotkey], result)
+            self._append([[hotkey, fingerprints[hotkey], result] for hotkey, result in results.items()])
+
+        # Miners with full penalty have no metric scores and are left out of the competition like in score_miners
+        scores_dict = {"metrics": {config_name: {"scores": [], "weight": config["weight"]}
+                                   for config_name, config in Scoring.scoring_config.items()},
+                       "penalties": {}}
+        for hotkey in ledger_dict:
+            result = self.entries[hotkey][1]
+            for config_name, score in result["scores"].items():
+                scores_dict["metrics"][config_name]["scores"].append((hotkey, score))
+            scores_dict["penalties"][hotkey] = result["penalty"]
+        return scores_dict
+
+    def retain(self, hotkeys: set[str]):
+        """
+        Drops the miners not in hotkeys, such as eliminated or deregistered ones.
+        """
+        removed = [hotkey for hotkey in self.entries if hotkey not in hotkeys]
+        for hotkey in removed:
+            del self.entries[hotkey]
+        self._append([[hotkey, None, None] for hotkey in removed])
+
+    def clear(self):
+        self.entries.clear()
+        if self.file_location:
+            self._compact()
+
+    def _append(self, lines: list):
+        if not lines or not self.file_location:
+            return
+        # Start a new log when there is no usable one yet
+        if not self.n_log_lines or self.n_log_lines + len(lines) > max(self.COMPACTION_MIN_LINES, self.COMPACTION_FACTOR * len(self.entries)):
+            self._compact()
+            return
+        try:
+            with open(self.file_location, 'a') as f:
+                f.write(''.join(json.dumps(line) + '\n' for line in lines))
+            self.n_log_lines += len(lines)
+        except Exception as e:
+            bt.logging.error(f"Error appending miner scores to {self.file_location}: {e}")
+
+    def _compact(self):
+        lines = [self.header()] + [[hotkey, fingerprint, result] for hotkey, (fingerprint, result) in self.entries.items()]
+        try:
+            ValiBkpUtils.write_file(self.file_location, ''.join(json.dumps(line) + '\n' for line in lines).encode(),
+                                    is_binary=True)
+            self.n_log_lines = len(lines)
+            self.stats['n_compactions'] += 1
+        except Exception as e:
+            bt.logging.error(f"Error writing miner scores to {self.file_location}: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.file_location):
+            return
+        try:
+            with open(self.file_location, 'r') as f:
+                lines = f.readlines()
+        except Exception as e:
+            bt.logging.error(f"Error loading miner scores from {self.file_location}: {e}")
+            return
+        try:
+            header = json.loads(lines[0]) if lines else None
+        except ValueError:
+            header = None
+        if header != self.header():
+            bt.logging.info(f"Discarding miner scores from {self.file_location} written by another scoring config.")
+            return
+        for i, line in enumerate(lines[1:]):
+            try:
+                hotkey, fingerprint, result = json.loads(line)
+            except ValueError:
+                # A write that was cut short. Rewrite the log so appends don't land after the partial line.
+                bt.logging.warning(f"Truncated miner scores log {self.file_location} at line {i + 1}")
+                self._compact()
+                return
+            if fingerprint is None:
+                self.entries.pop(hotkey, None)
+            else:
+                self.entries[hotkey] = (fingerprint, result)
+        self.n_log_lines = len(lines)
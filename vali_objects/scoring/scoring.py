@@ -30,6 +30,7 @@ class PenaltyInputType(Enum):
 class PenaltyConfig:
     function: Callable
     input_type: PenaltyInputType
+    batch_function: Callable = None  # Optional. Takes {miner: input} and returns {miner: penalty} in one pass
 
 
 class Scoring:
@@ -69,7 +70,8 @@ class Scoring:
         ),
         'martingale': PenaltyConfig(
             function=PositionPenalties.martingale_penalty,
-            input_type=PenaltyInputType.POSITIONS
+            input_type=PenaltyInputType.POSITIONS,
+            batch_function=PositionPenalties.martingale_penalties
         ),
     }
 
@@ -80,31 +82,34 @@ class Scoring:
             evaluation_time_ms: int = None,
             verbose=True
     ) -> List[Tuple[str, float]]:
+        miners, weights = Scoring.compute_results_checkpoint_arrays(ledger_dict, full_positions, evaluation_time_ms,
+                                                                    verbose=verbose)
+        return list(zip(miners, weights.tolist()))
+
+    @staticmethod
+    def compute_results_checkpoint_arrays(
+            ledger_dict: dict[str, PerfLedger],
+            full_positions: dict[str, list[Position]],
+            evaluation_time_ms: int = None,
+            verbose=True
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        compute_results_checkpoint as a list of miners and an array of their normalized weights, sorted by weight
+        from highest to lowest.
+        """
         if len(ledger_dict) == 0:
             bt.logging.debug("No results to compute, returning empty list")
-            return []
+            return [], np.empty(0)
 
         if len(ledger_dict) == 1:
             miner = list(ledger_dict.keys())[0]
             if verbose:
                 bt.logging.info(f"Only one miner: {miner}, returning 1.0 for the solo miner weight")
-            return [(miner, 1.0)]
+            return [miner], np.ones(1)
         
         if evaluation_time_ms is None:
             evaluation_time_ms = TimeUtil.now_in_millis()
-        
-        filtered_positions = PositionFiltering.filter(
-            full_positions,
-            evaluation_time_ms=evaluation_time_ms
-        )
-
-        # Compute miner penalties
-        miner_penalties = Scoring.miner_penalties(filtered_positions, ledger_dict)
 
-        # Miners with full penalty
-        full_penalty_miner_scores: list[tuple[str, float]] = [
-            (miner, 0) for miner, penalty in miner_penalties.items() if penalty == 0
-        ]
         # Run all scoring functions
         penalized_scores_dict = Scoring.score_miners(
             ledger_dict=ledger_dict,
@@ -112,16 +117,27 @@ class Scoring:
             evaluation_time_ms=evaluation_time_ms
         )
 
+        # Miners with full penalty
+        full_penalty_miners = [miner for miner, penalty in penalized_scores_dict["penalties"].items() if penalty == 0]
+
         # Combine and penalize scores
         combined_scores = Scoring.combine_scores(penalized_scores_dict)
 
         # Force good performance of all error metrics
-        combined_weighed = Scoring.softmax_scores(list(combined_scores.items())) + full_penalty_miner_scores
-        combined_scores = dict(combined_weighed)
+        miners = list(combined_scores) + full_penalty_miners
+        weights = np.zeros(len(miners))
+        weights[:len(combined_scores)] = Scoring.softmax_array(
+            np.fromiter(combined_scores.values(), dtype=np.float64, count=len(combined_scores)))
+
+        # Normalize the scores. The sum is accumulated in order like normalize_scores so the weights match exactly.
+        sum_scores = np.cumsum(weights)[-1] if len(weights) else 0
+        if sum_scores == 0:
+            bt.logging.info("sum_scores is 0, returning empty list")
+            return [], np.empty(0)
+        weights /= sum_scores
 
-        # Normalize the scores
-        normalized_scores = Scoring.normalize_scores(combined_scores)
-        return sorted(normalized_scores.items(), key=lambda x: x[1], reverse=True)
+        order = np.argsort(-weights, kind='stable')
+        return [miners[i] for i in order], weights[order]
 
     @staticmethod
     def score_miners(
@@ -208,6 +224,78 @@ class Scoring:
 
         return combined_scores
 
+    @staticmethod
+    def combined_percentiles_against_population(
+            population_scores_dict: dict[str, dict],
+            candidate_scores_dict: dict[str, dict]
+    ) -> dict[str, float] | None:
+        """
+        For each miner in candidate_scores_dict, the percentile of its combined score when it alone is added to the
+        population. Equivalent to running combine_scores and miner_scores_percentiles once per candidate on the
+        population plus that candidate, but evaluates all candidates together against presorted population scores.
+
+        Candidates without metric scores (full penalty) are omitted, as they would be missing from combine_scores.
+        Returns None if the inputs can't be evaluated this way (NaN scores, inconsistent metrics or a miner in both
+        populations).
+        """
+        population_miners = None
+        candidate_miners = None
+        metric_arrays = []
+        candidate_values = []
+        for config_name, config in population_scores_dict["metrics"].items():
+            miners = [miner for miner, _ in config["scores"]]
+            candidate_scores = candidate_scores_dict["metrics"][config_name]["scores"]
+            if population_miners is None:
+                population_miners = miners
+                candidate_miners = [miner for miner, _ in candidate_scores]
+            elif miners != population_miners or [miner for miner, _ in candidate_scores] != candidate_miners:
+                return None
+
+            values = np.array([score for _, score in config["scores"]], dtype=np.float64)
+            sorted_values = np.sort(values)
+            metric_arrays.append((config["weight"], values, sorted_values,
+                                  np.searchsorted(sorted_values, values, side='left'),
+                                  np.searchsorted(sorted_values, values, side='right')))
+            candidate_values.append(np.array([score for _, score in candidate_scores], dtype=np.float64))
+
+        if not candidate_miners:
+            return {}
+        if (len(set(candidate_miners)) != len(candidate_miners) or set(candidate_miners) & set(population_miners)
+                or any(np.isnan(x).any() for _, x, _, _, _ in metric_arrays)
+                or any(np.isnan(x).any() for x in candidate_values)):
+            return None
+
+        n_population = len(population_miners)
+        # Each metric ranks the population plus one candidate. Rows are candidates, columns are population miners.
+        metric_scale = 50.0 / (n_population + 1)
+        population_combined = np.zeros((len(candidate_miners), n_population))
+        candidate_combined = np.zeros(len(candidate_miners))
+        for (weight, values, sorted_values, left, right), candidate_metric_values in zip(metric_arrays, candidate_values):
+            c = candidate_metric_values[:, None]
+            population_left = left + (c < values)
+            population_right = right + (c <= values)
+            population_percentiles = (population_left + population_right + (population_left < population_right)) * metric_scale / 100
+            population_combined += weight * population_percentiles
+
+            candidate_left = np.searchsorted(sorted_values, candidate_metric_values, side='left')
+            candidate_right = np.searchsorted(sorted_values, candidate_metric_values, side='right') + 1
+            candidate_percentiles = (candidate_left + candidate_right + (candidate_left < candidate_right)) * metric_scale / 100
+            candidate_combined += weight * candidate_percentiles
+
+        population_penalties = population_scores_dict["penalties"]
+        candidate_penalties = candidate_scores_dict["penalties"]
+        population_combined *= np.array([population_penalties.get(miner, 1.0) for miner in population_miners], dtype=np.float64)
+        candidate_combined *= np.array([candidate_penalties.get(miner, 1.0) for miner in candidate_miners], dtype=np.float64)
+        if np.isnan(population_combined).any() or np.isnan(candidate_combined).any():
+            return None
+
+        c = candidate_combined[:, None]
+        combined_left = (population_combined < c).sum(axis=1)
+        combined_right = (population_combined <= c).sum(axis=1) + 1
+        percentiles = (combined_left + combined_right + (combined_left < combined_right)) * (50.0 / (n_population + 1)) / 100
+
+        return dict(zip(candidate_miners, percentiles))
+
     @staticmethod
     def miner_penalties(
             hotkey_positions: dict[str, list[Position]],
@@ -216,6 +304,12 @@ class Scoring:
         # Compute miner penalties
         miner_penalties = {}
 
+        batch_penalties = {}
+        for penalty_name, penalty_config in Scoring.penalties_config.items():
+            if penalty_config.batch_function and penalty_config.input_type == PenaltyInputType.POSITIONS:
+                batch_penalties[penalty_name] = penalty_config.batch_function(
+                    {miner: hotkey_positions.get(miner, []) for miner in ledger_dict})
+
         for miner, ledger in ledger_dict.items():
             positions = hotkey_positions.get(miner, [])
             if not ledger:
@@ -226,7 +320,9 @@ class Scoring:
             for penalty_name, penalty_config in Scoring.penalties_config.items():
                 # Apply penalty based on its input type
                 penalty = 1
-                if penalty_config.input_type == PenaltyInputType.LEDGER:
+                if penalty_name in batch_penalties:
+                    penalty = batch_penalties[penalty_name][miner]
+                elif penalty_config.input_type == PenaltyInputType.LEDGER:
                     penalty = penalty_config.function(ledger_checkpoints)
                 elif penalty_config.input_type == PenaltyInputType.POSITIONS:
                     penalty = penalty_config.function(positions)
@@ -367,9 +463,6 @@ class Scoring:
         Returns:
         list[tuple[str, float]]: List of tuples with miner names and their softmax weights.
         """
-        epsilon = ValiConfig.EPSILON
-        temperature = ValiConfig.SOFTMAX_TEMPERATURE
-    
         if not returns:
             bt.logging.debug("No returns to score, returning empty list")
             return []
@@ -379,16 +472,27 @@ class Scoring:
             return [(returns[0][0], 1.0)]
     
         # Extract scores and apply softmax with temperature
-        scores = np.array([score for _, score in returns])
-        max_score = np.max(scores)
-        exp_scores = np.exp((scores - max_score) / temperature)
-        softmax_scores = exp_scores / max(np.sum(exp_scores), epsilon)
+        softmax_scores = Scoring.softmax_array(np.array([score for _, score in returns]))
     
         # Combine miners with their respective softmax scores
         weighted_returns = [(miner, float(softmax_scores[i])) for i, (miner, _) in enumerate(returns)]
     
         return weighted_returns
 
+    @staticmethod
+    def softmax_array(scores: np.ndarray) -> np.ndarray:
+        """
+        softmax_scores over an array of scores.
+        """
+        if len(scores) <= 1:
+            return np.ones(len(scores))
+
+        epsilon = ValiConfig.EPSILON
+        temperature = ValiConfig.SOFTMAX_TEMPERATURE
+        max_score = np.max(scores)
+        exp_scores = np.exp((scores - max_score) / temperature)
+        return exp_scores / max(np.sum(exp_scores), epsilon)
+
     @staticmethod
     def exponential_decay_returns(scale: int) -> np.ndarray:
         """
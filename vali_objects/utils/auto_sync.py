@@ -1,6 +1,7 @@
 import gzip
 import io
 import json
+import time
 import traceback
 import zipfile
 
@@ -19,10 +20,11 @@ import bittensor as bt
 class PositionSyncer(ValidatorSyncBase):
     def __init__(self, shutdown_dict=None, signal_sync_lock=None, signal_sync_condition=None,
                  n_orders_being_processed=None, running_unit_tests=False, position_manager=None,
-                 ipc_manager=None, auto_sync_enabled=False):
+                 ipc_manager=None, auto_sync_enabled=False, position_locks=None):
         super().__init__(shutdown_dict, signal_sync_lock, signal_sync_condition, n_orders_being_processed,
                          running_unit_tests=running_unit_tests, position_manager=position_manager,
                          ipc_manager=ipc_manager)
+        self.position_locks = position_locks
 
         self.force_ran_on_boot = True
         print(f'PositionSyncer: auto_sync_enabled: {auto_sync_enabled}')
@@ -70,19 +72,47 @@ class PositionSyncer(ValidatorSyncBase):
         return None
 
     def perform_sync(self):
-        with self.signal_sync_lock:
-            while self.n_orders_being_processed[0] > 0:
-                self.signal_sync_condition.wait()
-            # Ready to perform in-flight refueling
+        """
+        Download and parse the checkpoint without holding any lock. With position_locks, the diff is computed against
+        a snapshot and each (hotkey, trade pair) is applied under its own lock so order intake is never blocked for
+        the whole sync. Without position_locks, new signals are blocked for the duration of the sync.
+        """
+        t0 = time.time()
+        candidate_data = None
+        try:
+            candidate_data = self.read_validator_checkpoint_from_gcloud_zip()
+        except Exception as e:
+            bt.logging.error(f"Error reading validator checkpoint: {e}")
+            bt.logging.error(traceback.format_exc())
+        t_downloaded = time.time()
+
+        if not candidate_data:
+            bt.logging.error("Unable to read validator checkpoint file. Sync canceled")
+        elif self.position_locks is not None:
             try:
-                candidate_data = self.read_validator_checkpoint_from_gcloud_zip()
-                if not candidate_data:
-                    bt.logging.error("Unable to read validator checkpoint file. Sync canceled")
-                else:
-                    self.sync_positions(False, candidate_data=candidate_data)
+                self.sync_positions(False, candidate_data=candidate_data, position_locks=self.position_locks)
             except Exception as e:
                 bt.logging.error(f"Error syncing positions: {e}")
                 bt.logging.error(traceback.format_exc())
+            bt.logging.info(f"perform_sync download {t_downloaded - t0:.3f} s, sync {time.time() - t_downloaded:.3f} s. "
+                            f"Max position lock held {self.global_stats['max_position_lock_held_ms']:.1f} ms")
+        else:
+            with self.signal_sync_lock:
+                t_lock_acquired = time.time()
+                while self.n_orders_being_processed[0] > 0:
+                    self.signal_sync_condition.wait()
+                t_orders_drained = time.time()
+                # Ready to perform in-flight refueling
+                try:
+                    self.sync_positions(False, candidate_data=candidate_data)
+                except Exception as e:
+                    bt.logging.error(f"Error syncing positions: {e}")
+                    bt.logging.error(traceback.format_exc())
+
+            t_lock_released = time.time()
+            bt.logging.info(f"perform_sync held signal_sync_lock for {t_lock_released - t_lock_acquired:.3f} seconds. "
+                            f"Lock wait {t_lock_acquired - t_downloaded:.3f} s, order drain wait {t_orders_drained - t_lock_acquired:.3f} s, "
+                            f"sync {t_lock_released - t_orders_drained:.3f} s")
 
         self.last_signal_sync_time_ms = TimeUtil.now_in_millis()
 
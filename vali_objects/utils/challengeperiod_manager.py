@@ -8,6 +8,7 @@ from vali_objects.utils.vali_utils import ValiUtils
 from vali_objects.vali_config import ValiConfig
 from shared_objects.cache_controller import CacheController
 from vali_objects.scoring.scoring import Scoring
+from vali_objects.scoring.miner_score_cache import MinerScoreCache
 from time_util.time_util import TimeUtil
 from vali_objects.vali_dataclasses.perf_ledger import PerfLedgerManager, PerfLedger
 from vali_objects.utils.ledger_utils import LedgerUtils
@@ -17,12 +18,18 @@ from vali_objects.position import Position
 
 class ChallengePeriodManager(CacheController):
     def __init__(self, metagraph, perf_ledger_manager : PerfLedgerManager =None, running_unit_tests=False,
-                 position_manager: PositionManager =None, ipc_manager=None):
+                 position_manager: PositionManager =None, ipc_manager=None, persist_scores=False):
         super().__init__(metagraph, running_unit_tests=running_unit_tests)
         self.perf_ledger_manager = perf_ledger_manager if perf_ledger_manager else \
             PerfLedgerManager(metagraph, running_unit_tests=running_unit_tests)
         self.position_manager = position_manager
         self.elimination_manager = self.position_manager.elimination_manager
+        # Scores of the miners last inspected. Only those whose ledger or positions changed are rescored on refresh.
+        # The score log is unlocked, so only the validator's own instance persists it. Scripts and other processes
+        # keep their scores in memory.
+        self.score_cache = MinerScoreCache(
+            ValiBkpUtils.get_challengeperiod_scores_file_location(running_unit_tests=running_unit_tests)
+            if persist_scores else None)
         disk_challenegeperiod_testing = self.get_challengeperiod_testing(from_disk=True)
         disk_challenegeperiod_success = self.get_challengeperiod_success(from_disk=True)
         self.using_ipc = bool(ipc_manager)
@@ -82,7 +89,7 @@ class ChallengePeriodManager(CacheController):
 
         # challenge period adds to testing if not in eliminated, already in the challenge period, or in the new eliminations list from disk
         self._add_challengeperiod_testing_in_memory_and_disk(
-            new_hotkeys=self.metagraph.hotkeys,
+            new_hotkeys=self.get_metagraph_snapshot().hotkeys,
             eliminations=eliminations,
             current_time=current_time
         )
@@ -96,7 +103,7 @@ class ChallengePeriodManager(CacheController):
             all_miners,
             sort_positions=True
         )
-        ledger = self.perf_ledger_manager.get_perf_ledgers_from_memory()
+        ledger = self.perf_ledger_manager.get_perf_ledger_views()
         ledger = {hotkey: ledger.get(hotkey, None) for hotkey in all_miners}
 
         challengeperiod_success, challengeperiod_eliminations = self.inspect(
@@ -107,6 +114,7 @@ class ChallengePeriodManager(CacheController):
             current_time=current_time
         )
 
+        self.score_cache.retain(set(all_miners))
         any_changes = bool(challengeperiod_success) or bool(challengeperiod_eliminations)
 
         # Moves challenge period testing to challenge period success in memory
@@ -127,7 +135,7 @@ class ChallengePeriodManager(CacheController):
         """
         any_changes = False
         if hotkeys is None:
-            hotkeys = self.metagraph.hotkeys
+            hotkeys = self.get_metagraph_snapshot().hotkey_to_uid
 
         for hotkey in list(self.challengeperiod_testing.keys()):
             if hotkey not in hotkeys:
@@ -200,11 +208,13 @@ class ChallengePeriodManager(CacheController):
             success_ledger = dict((hotkey, ledger_data) for hotkey, ledger_data in ledger.items() if hotkey in success_hotkeys)
 
             # Get the penalized scores of all successful miners
-            success_scores_dict = Scoring.score_miners(ledger_dict=success_ledger,
-                                                            positions=success_positions,
-                                                            evaluation_time_ms=current_time)
+            success_scores_dict = self.score_cache.score_miners(ledger_dict=success_ledger,
+                                                                positions=success_positions,
+                                                                evaluation_time_ms=current_time)
         
 
+        # Hotkeys which are still in the competition and need to be scored against the successful miners
+        screening_hotkeys = []
         for hotkey, inspection_time in inspection_hotkeys.items():
             if self.is_recently_re_registered(ledger.get(hotkey), positions.get(hotkey), hotkey):
                 miners_rrr.add(hotkey)
@@ -237,29 +247,36 @@ class ChallengePeriodManager(CacheController):
                 bt.logging.info(f'Hotkey {hotkey} has failed the challenge period due to drawdown {recorded_drawdown_percentage}. cp_failed')
                 failing_miners.append(hotkey)
                 continue
-            
 
-            # The main logic loop. They are in the competition but haven't passed yet, need to check the time after.
-            passing_criteria = ChallengePeriodManager.screen_passing_criteria(
-                positions=positions,
-                ledger=ledger,
-                inspection_hotkey=hotkey,
-                success_scores_dict=success_scores_dict,
-                current_time=current_time,
-                inspection_scores_dict=inspection_scores_dict
-            )
+            screening_hotkeys.append(hotkey)
+
+        # The main logic loop. They are in the competition but haven't passed yet, need to check the time after.
+        passing_hotkeys = ChallengePeriodManager.screen_passing_criteria_batch(
+            positions=positions,
+            ledger=ledger,
+            inspection_hotkeys=screening_hotkeys,
+            success_scores_dict=success_scores_dict,
+            current_time=current_time,
+            inspection_scores_dict=inspection_scores_dict,
+            score_cache=self.score_cache
+        )
 
+        for hotkey in screening_hotkeys:
             # If they pass here, then they meet the criteria for passing within the challenge period
-            if passing_criteria:
+            if hotkey in passing_hotkeys:
                 passing_miners.append(hotkey)
                 continue
 
             # If their time is ever up, they fail
-            if not time_criteria:
+            if current_time - inspection_hotkeys[hotkey] > ValiConfig.CHALLENGE_PERIOD_MS:
                 bt.logging.info(f'Hotkey {hotkey} has failed the challenge period due to time. cp_failed')
                 failing_miners.append(hotkey)
                 continue
 
+        # Keep the failures in inspection order
+        inspection_order = {hotkey: i for i, hotkey in enumerate(inspection_hotkeys)}
+        failing_miners.sort(key=inspection_order.get)
+
         bt.logging.info(f'Challenge Period - n_miners_passing: {len(passing_miners)}'
                         f' n_miners_failing: {len(failing_miners)} '
                         f'recently_re_registered: {miners_rrr} '
@@ -331,6 +348,58 @@ class ChallengePeriodManager(CacheController):
 
         return passed
 
+    @staticmethod
+    def screen_passing_criteria_batch(
+        positions: dict[str, list[Position]],
+        ledger: dict[str, PerfLedger],
+        success_scores_dict: dict[str, dict],
+        inspection_hotkeys: list[str],
+        current_time: int,
+        inspection_scores_dict=None,
+        score_cache: MinerScoreCache = None
+    ) -> set[str]:
+        """
+        Same criteria as screen_passing_criteria for many inspection miners at once. All of them are scored in a
+        single pass and each is ranked against the successful miners on its own. Returns the hotkeys that passed.
+        """
+        # inspection_scores_dict is used to bypass running scoring when testing
+        if inspection_scores_dict is None:
+            if positions is None or len(positions) == 0:
+                return set()
+
+            # We need at least more than 1 position and a ledger to evaluate the challenge period
+            inspection_hotkeys = [hotkey for hotkey in inspection_hotkeys
+                                  if len(positions.get(hotkey) or []) > 1 and ledger.get(hotkey) is not None]
+            if not inspection_hotkeys:
+                return set()
+
+            # Get penalized scores of all inspection miners
+            score_miners = score_cache.score_miners if score_cache else Scoring.score_miners
+            inspection_scores_dict = score_miners(
+                ledger_dict={hotkey: ledger[hotkey] for hotkey in inspection_hotkeys},
+                positions={hotkey: positions[hotkey] for hotkey in inspection_hotkeys},
+                evaluation_time_ms=current_time)
+
+        percentile_dict = Scoring.combined_percentiles_against_population(success_scores_dict, inspection_scores_dict)
+        if percentile_dict is not None:
+            return set(hotkey for hotkey in inspection_hotkeys
+                       if percentile_dict.get(hotkey, 0) >= ValiConfig.CHALLENGE_PERIOD_PERCENTILE_THRESHOLD)
+
+        # Scores can't be ranked together. Screen one miner at a time, handing each only its own scores
+        passing_hotkeys = set()
+        for hotkey in inspection_hotkeys:
+            single_scores_dict = {
+                "metrics": {config_name: {"scores": [(miner, score) for miner, score in config["scores"] if miner == hotkey],
+                                          "weight": config["weight"]}
+                            for config_name, config in inspection_scores_dict["metrics"].items()},
+                "penalties": {miner: penalty for miner, penalty in inspection_scores_dict["penalties"].items() if miner == hotkey}
+            }
+            if ChallengePeriodManager.screen_passing_criteria(positions, ledger, success_scores_dict, hotkey,
+                                                              current_time, inspection_scores_dict=single_scores_dict):
+                passing_hotkeys.add(hotkey)
+
+        return passing_hotkeys
+
     @staticmethod
     def screen_failing_criteria(
         ledger_element: PerfLedger
@@ -409,6 +478,7 @@ class ChallengePeriodManager(CacheController):
         )
 
     def _clear_challengeperiod_in_memory_and_disk(self):
+        self.score_cache.clear()
         for k in list(self.challengeperiod_testing.keys()):
             del self.challengeperiod_testing[k]
         for k in list(self.challengeperiod_success.keys()):
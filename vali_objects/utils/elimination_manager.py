@@ -1,5 +1,6 @@
 # developer: jbonilla
 # Copyright © 2024 Taoshi Inc
+import heapq
 import shutil
 from copy import deepcopy
 from typing import Dict
@@ -32,9 +33,18 @@ class EliminationManager(CacheController):
 
         if ipc_manager:
             self.eliminations = ipc_manager.list()
+            self.eliminations_by_hotkey = ipc_manager.dict()
         else:
             self.eliminations = []
-        self.eliminations.extend(self.get_eliminations_from_disk())
+            self.eliminations_by_hotkey = {}
+        # Timer heap of (deletion eligible time ms, hotkey) local to the process that runs process_eliminations.
+        # scheduled_deletions maps each scheduled hotkey to the elimination time its heap entry was pushed for.
+        self.deletion_heap = []
+        self.scheduled_deletions = {}
+        self.awaiting_deregistration = set()
+        self.last_zombie_sweep_metagraph_version = None
+        for elimination_row in self.get_eliminations_from_disk():
+            self._add_elimination(elimination_row)
         if len(self.eliminations) == 0:
             ValiBkpUtils.write_file(
                 ValiBkpUtils.get_eliminations_dir(running_unit_tests=self.running_unit_tests),
@@ -49,7 +59,7 @@ class EliminationManager(CacheController):
                 continue
 
             n_eliminations += 1
-            self.eliminations.append(e)
+            self._add_elimination(e)
 
             price_info = e['price_info']
             trade_pair_to_price_source_used_for_elimination_check = {}
@@ -108,35 +118,68 @@ class EliminationManager(CacheController):
                 bt.logging.info(
                     f"miner eliminated with hotkey [{miner_hotkey}] with plagiarism score of [{current_plagiarism_score}]")
 
-    def is_zombie_hotkey(self, hotkey):
-        if hotkey in self.metagraph.hotkeys:
+    def is_zombie_hotkey(self, hotkey, metagraph_snapshot=None):
+        if metagraph_snapshot is None:
+            metagraph_snapshot = self.get_metagraph_snapshot()
+        if hotkey in metagraph_snapshot:
             return False
 
-        if any(x['hotkey'] == hotkey for x in self.eliminations):
+        if hotkey in self.eliminations_by_hotkey:
             return False
 
         return True
 
     def hotkey_in_eliminations(self, hotkey):
-        for x in self.eliminations:
-            if x['hotkey'] == hotkey:
-                return deepcopy(x)
-        return None
+        x = self.eliminations_by_hotkey.get(hotkey)
+        return deepcopy(x) if x else None
+
+    def _add_elimination(self, elimination_row):
+        """
+        Adds an elimination to memory and the hotkey index. The caller is responsible for saving to disk.
+        """
+        self.eliminations.append(elimination_row)
+        # hotkey_in_eliminations returns the first elimination for a hotkey
+        if elimination_row['hotkey'] not in self.eliminations_by_hotkey:
+            self.eliminations_by_hotkey[elimination_row['hotkey']] = elimination_row
+
+    def _schedule_expired_eliminations(self, eliminations_by_hotkey, now_ms):
+        """
+        Schedule eliminations added since the last pass, possibly by another process, on the deletion timer heap and
+        move every elimination whose deletion delay has passed to the awaiting_deregistration set.
+        """
+        for hotkey in self.scheduled_deletions.keys() - eliminations_by_hotkey.keys():
+            del self.scheduled_deletions[hotkey]
+            self.awaiting_deregistration.discard(hotkey)
+
+        for hotkey, x in eliminations_by_hotkey.items():
+            elimination_initiated_time_ms = x['elimination_initiated_time_ms']
+            if self.scheduled_deletions.get(hotkey) != elimination_initiated_time_ms:
+                self.scheduled_deletions[hotkey] = elimination_initiated_time_ms
+                heapq.heappush(self.deletion_heap,
+                               (elimination_initiated_time_ms + ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS, hotkey))
+
+        while self.deletion_heap and self.deletion_heap[0][0] <= now_ms:
+            _, hotkey = heapq.heappop(self.deletion_heap)
+            self.awaiting_deregistration.add(hotkey)
 
     def _delete_eliminated_expired_miners(self):
         deleted_hotkeys = set()
-        # self.eliminations were just refreshed in process_eliminations
         any_challenege_period_changes = False
-        for x in self.eliminations:
+        now_ms = TimeUtil.now_in_millis()
+        eliminations_by_hotkey = self.eliminations_by_hotkey.copy()
+        self._schedule_expired_eliminations(eliminations_by_hotkey, now_ms)
+        metagraph_snapshot = self.get_metagraph_snapshot()
+        for hotkey in sorted(self.awaiting_deregistration):
             if self.shutdown_dict:
                 return
-            hotkey = x['hotkey']
-            elimination_initiated_time_ms = x['elimination_initiated_time_ms']
-            # Don't delete this miner until it hits the minimum elimination time.
-            if TimeUtil.now_in_millis() - elimination_initiated_time_ms < ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS:
+            x = eliminations_by_hotkey.get(hotkey)
+            # Don't delete this miner until it hits the minimum elimination time. Stale heap entries for miners that
+            # were deleted or eliminated again are dropped here. The current elimination has its own heap entry.
+            if x is None or now_ms - x['elimination_initiated_time_ms'] < ValiConfig.ELIMINATION_FILE_DELETION_DELAY_MS:
+                self.awaiting_deregistration.discard(hotkey)
                 continue
             # We will not delete this miner's cache until it has been deregistered by BT
-            if hotkey in self.metagraph.hotkeys:
+            if hotkey in metagraph_snapshot:
                 bt.logging.trace(f"miner [{hotkey}] has not been deregistered by BT yet. Not deleting miner dir.")
                 continue
 
@@ -162,6 +205,7 @@ class EliminationManager(CacheController):
                 f"Removing miner dir [{miner_dir}]"
             )
             deleted_hotkeys.add(hotkey)
+            self.awaiting_deregistration.discard(hotkey)
 
         # Write the challengeperiod information to disk
         if any_challenege_period_changes:
@@ -170,12 +214,19 @@ class EliminationManager(CacheController):
         if deleted_hotkeys:
             self.delete_eliminations(deleted_hotkeys)
 
+        # Miner dirs can only become zombies when a hotkey leaves the metagraph or an elimination is deleted, so skip
+        # the directory walk otherwise. Metagraphs without a published snapshot are always swept.
+        if (not deleted_hotkeys and metagraph_snapshot.version is not None and
+                metagraph_snapshot.version == self.last_zombie_sweep_metagraph_version):
+            return
+        self.last_zombie_sweep_metagraph_version = metagraph_snapshot.version
+
         all_miners_dir = ValiBkpUtils.get_miner_dir(running_unit_tests=self.running_unit_tests)
         for hotkey in CacheController.get_directory_names(all_miners_dir):
             if self.shutdown_dict:
                 return
             miner_dir = all_miners_dir + hotkey
-            if self.is_zombie_hotkey(hotkey):
+            if self.is_zombie_hotkey(hotkey, metagraph_snapshot=metagraph_snapshot):
                 try:
                     shutil.rmtree(miner_dir)
                     bt.logging.info(f"Zombie miner dir removed [{miner_dir}]")
@@ -197,12 +248,13 @@ class EliminationManager(CacheController):
         ValiBkpUtils.write_file(ValiBkpUtils.get_eliminations_dir(running_unit_tests=self.running_unit_tests),
                                 {CacheController.ELIMINATIONS: []})
         del self.eliminations[:]
+        self.eliminations_by_hotkey.clear()
 
     def get_eliminated_hotkeys(self):
-        return set([x['hotkey'] for x in self.eliminations]) if self.eliminations else set()
+        return set(self.eliminations_by_hotkey.keys())
 
     def get_eliminations_from_memory(self):
-        return list(self.eliminations)  #  ListProxy is not JSON serializable
+        return self.eliminations[:]  # ListProxy is not JSON serializable. Slicing copies it in one round trip
 
     def get_eliminations_from_disk(self) -> list:
         #with self.eliminations_lock:
@@ -215,13 +267,16 @@ class EliminationManager(CacheController):
         #with self.eliminations_lock:
             elimination_row = self.generate_elimination_row(hotkey, current_dd, mdd_failure, t_ms=t_ms,
                                                             price_info=price_info, return_info=return_info)
-            self.eliminations.append(elimination_row)
+            self._add_elimination(elimination_row)
             self.eliminations[-1] = elimination_row  # ipc list does not update the object without using __setitem__
             self.save_eliminations()
 
     def delete_eliminations(self, deleted_hotkeys):
         #with self.eliminations_lock:
-        items_to_remove = [x for x in self.eliminations if x['hotkey'] in deleted_hotkeys]
-        for item in items_to_remove:
-            self.eliminations.remove(item)
+        eliminations = self.eliminations[:]
+        remaining_eliminations = [x for x in eliminations if x['hotkey'] not in deleted_hotkeys]
+        if len(remaining_eliminations) != len(eliminations):
+            self.eliminations[:] = remaining_eliminations
+        for hotkey in deleted_hotkeys:
+            self.eliminations_by_hotkey.pop(hotkey, None)
         self.save_eliminations()
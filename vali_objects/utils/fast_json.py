@@ -0,0 +1,73 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+import json
+from multiprocessing.managers import DictProxy
+
+import numpy as np
+import orjson
+from pydantic import BaseModel
+
+from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.vali_config import TradePair
+
+DUMPS_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+_object_setattr = object.__setattr__
+_FIELD_NAMES = {}  # model class -> frozenset of field names
+
+
+def json_default(obj):
+    """
+    Serializes the types the stdlib encoder and orjson don't know about. Shared by CustomEncoder so both encoders
+    write the same JSON.
+    """
+    if isinstance(obj, TradePair) or isinstance(obj, OrderType):
+        return obj.__json__()
+    elif isinstance(obj, BaseModel):
+        return obj.dict()
+    elif hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    elif isinstance(obj, DictProxy):
+        return dict(obj)
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> str:
+    """
+    orjson backed json.dumps for the position schemas. Output is compact, NaN/Infinity are written as null the same
+    way pydantic serializes them and enums are written by value, so only use it for data that went through pydantic's
+    JSON mode or can't hold those.
+    """
+    return orjson.dumps(obj, default=json_default, option=DUMPS_OPTIONS).decode('utf-8')
+
+
+def construct_trusted(cls, values: dict):
+    """
+    BaseModel.model_construct for dicts holding exactly the model's fields, which is what this codebase's own
+    serializers write. Skips model_construct's per field alias and default handling. Anything else, such as files
+    written before a field was added, goes through model_construct.
+    """
+    field_names = _FIELD_NAMES.get(cls)
+    if field_names is None:
+        field_names = _FIELD_NAMES[cls] = frozenset(cls.__pydantic_fields__)
+    if values.keys() != field_names:
+        return cls.model_construct(**values)
+    m = cls.__new__(cls)
+    _object_setattr(m, '__dict__', values)
+    _object_setattr(m, '__pydantic_fields_set__', set(values))
+    _object_setattr(m, '__pydantic_extra__', None)
+    if cls.__pydantic_post_init__:
+        # Initializes private attributes
+        m.model_post_init(None)
+    else:
+        _object_setattr(m, '__pydantic_private__', None)
+    return m
+
+
+def loads(s: str | bytes):
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        # orjson rejects the NaN/Infinity literals older files written by the stdlib encoder may contain
+        return json.loads(s)
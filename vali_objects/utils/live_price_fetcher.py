@@ -13,10 +13,16 @@ from vali_objects.utils.vali_utils import ValiUtils
 import bittensor as bt
 
 from vali_objects.vali_dataclasses.price_source import PriceSource
+from vali_objects.vali_dataclasses.price_source_batch import PriceSourceBatch
 from statistics import median
 
 
 class LivePriceFetcher:
+    # Websocket prices further than this from the requested time are replaced by REST prices
+    MAX_RECENT_TIME_DELTA_MS = 2000
+    # Below this many trade pairs, numpy's per call overhead outweighs what PriceSourceBatch saves
+    BATCH_MIN_TRADE_PAIRS = 8
+
     def __init__(self, secrets, disable_ws=False, ipc_manager=None):
         if "tiingo_apikey" in secrets:
             self.tiingo_data_service = TiingoDataService(api_key=secrets["tiingo_apikey"], disable_ws=disable_ws,
@@ -41,7 +47,8 @@ class LivePriceFetcher:
     def determine_best_price(self, price_events: List[PriceSource | None], current_time_ms: int,
                              filter_recent_only=True) -> Tuple:
         """
-        Determines the best price from a list of price events based on their recency and validity.
+        Determines the best price from a list of price events based on their recency and validity. A nan price is
+        returned as None, the same as a missing one.
         """
         valid_events = [event for event in price_events if event]
         if not valid_events:
@@ -51,15 +58,33 @@ class LivePriceFetcher:
         if not best_event:
             return None, None
 
-        if filter_recent_only and best_event.time_delta_from_now_ms(current_time_ms) > 2000:
+        if filter_recent_only and best_event.time_delta_from_now_ms(current_time_ms) > self.MAX_RECENT_TIME_DELTA_MS:
             return None, None
 
-        return best_event.parse_best_price(current_time_ms), PriceSource.non_null_events_sorted(valid_events, current_time_ms)
+        price = best_event.parse_best_price(current_time_ms)
+        return (None if price != price else price), PriceSource.non_null_events_sorted(valid_events, current_time_ms)
 
-    def fetch_prices(self, tps: List[TradePair], trade_pair_to_last_order_time_ms, ws_only=False) -> (
+    def determine_best_prices(self, trade_pair_to_events: Dict[TradePair, List[PriceSource | None]],
+                              trade_pair_to_time_ms: Dict[TradePair, int], filter_recent_only=True) -> Dict:
+        """
+        determine_best_price for many trade pairs at once.
+        """
+        tps = list(trade_pair_to_events)
+        if len(tps) < self.BATCH_MIN_TRADE_PAIRS:
+            return {tp: self.determine_best_price(trade_pair_to_events[tp], trade_pair_to_time_ms[tp],
+                                                  filter_recent_only=filter_recent_only) for tp in tps}
+        batch = PriceSourceBatch(tps, [trade_pair_to_events[tp] for tp in tps],
+                                 [trade_pair_to_time_ms[tp] for tp in tps])
+        return batch.best_prices(max_time_delta_ms=self.MAX_RECENT_TIME_DELTA_MS if filter_recent_only else None)
+
+    def fetch_prices(self, tps: List[TradePair], trade_pair_to_last_order_time_ms, ws_only=False,
+                     rest_price_cache: Dict[TradePair, Tuple] = None) -> (
             dict[str: Tuple[float, List[PriceSource]]] | dict[str: Tuple[None, None]]):
         """
         Fetches data using WebSockets first; uses REST APIs if WebSocket data is outdated or missing.
+
+        rest_price_cache maps trade pairs to the (polygon, tiingo) REST price sources already fetched by the caller.
+        REST requests are only made for trade pairs missing from it, and their results are added to it.
         """
         websocket_prices_polygon = self.polygon_data_service.get_closes_websocket(trade_pairs=tps, trade_pair_to_last_order_time_ms=trade_pair_to_last_order_time_ms)
         websocket_prices_tiingo_data = self.tiingo_data_service.get_closes_websocket(trade_pairs=tps, trade_pair_to_last_order_time_ms=trade_pair_to_last_order_time_ms)
@@ -68,10 +93,9 @@ class LivePriceFetcher:
         results = {}
 
         # Initial check using WebSocket data
-        for trade_pair in tps:
-            current_time_ms = trade_pair_to_last_order_time_ms[trade_pair]
-            events = [websocket_prices_polygon.get(trade_pair), websocket_prices_tiingo_data.get(trade_pair)]
-            price, sources = self.determine_best_price(events, current_time_ms)
+        websocket_events = {tp: [websocket_prices_polygon.get(tp), websocket_prices_tiingo_data.get(tp)] for tp in tps}
+        for trade_pair, (price, sources) in self.determine_best_prices(websocket_events,
+                                                                       trade_pair_to_last_order_time_ms).items():
             if price:
                 results[trade_pair] = (price, sources)
             else:
@@ -81,19 +105,22 @@ class LivePriceFetcher:
         if not trade_pairs_needing_rest_data or ws_only:
             return results
 
-        rest_prices_polygon = self.polygon_data_service.get_closes_rest(trade_pairs_needing_rest_data)
-        rest_prices_tiingo_data = self.tiingo_data_service.get_closes_rest(trade_pairs_needing_rest_data)
-
-        for trade_pair in trade_pairs_needing_rest_data:
-            current_time_ms = trade_pair_to_last_order_time_ms[trade_pair]
-            events = [
-                websocket_prices_polygon.get(trade_pair),
-                websocket_prices_tiingo_data.get(trade_pair),
-                rest_prices_polygon.get(trade_pair),
-                rest_prices_tiingo_data.get(trade_pair)
-            ]
-            results[trade_pair] = self.determine_best_price(events, current_time_ms, filter_recent_only=False)
-
+        if rest_price_cache is None:
+            rest_price_cache = {}
+        trade_pairs_to_request = [tp for tp in trade_pairs_needing_rest_data if tp not in rest_price_cache]
+        if trade_pairs_to_request:
+            rest_prices_polygon = self.polygon_data_service.get_closes_rest(trade_pairs_to_request)
+            rest_prices_tiingo_data = self.tiingo_data_service.get_closes_rest(trade_pairs_to_request)
+            for trade_pair in trade_pairs_to_request:
+                rest_price_cache[trade_pair] = (rest_prices_polygon.get(trade_pair),
+                                                rest_prices_tiingo_data.get(trade_pair))
+
+        # Picking the best price sets lag_ms on the sources, and orders keep them. Each call gets its own copies of the
+        # cached sources so one order's lag doesn't overwrite another's.
+        rest_events = {tp: websocket_events[tp] + [s.model_copy() for s in rest_price_cache[tp] if s]
+                       for tp in trade_pairs_needing_rest_data}
+        results.update(self.determine_best_prices(rest_events, trade_pair_to_last_order_time_ms,
+                                                  filter_recent_only=False))
         return results
 
     def get_ws_price_sources_in_window(self, trade_pair: TradePair, start_ms: int, end_ms: int) -> List[PriceSource]:
@@ -111,18 +138,21 @@ class LivePriceFetcher:
         """
         if not time_ms:
             time_ms = TimeUtil.now_in_millis()
+        # Poll this trade pair faster while it's receiving orders
+        self.tiingo_data_service.record_order_activity(trade_pair, time_ms)
         return self.fetch_prices([trade_pair], {trade_pair: time_ms})[trade_pair]
 
     @timeme
     def get_latest_prices(self, trade_pairs: List[TradePair],
-                          trade_pair_to_last_order_time_ms: Dict[TradePair, int] = None) -> Dict:
+                          trade_pair_to_last_order_time_ms: Dict[TradePair, int] = None,
+                          rest_price_cache: Dict[TradePair, Tuple] = None) -> Dict:
         """
         Retrieves the latest prices for multiple trade pairs, leveraging both WebSocket and REST APIs as needed.
         """
         if not trade_pair_to_last_order_time_ms:
             current_time_ms = TimeUtil.now_in_millis()
             trade_pair_to_last_order_time_ms = {tp: current_time_ms for tp in trade_pairs}
-        return self.fetch_prices(trade_pairs, trade_pair_to_last_order_time_ms)
+        return self.fetch_prices(trade_pairs, trade_pair_to_last_order_time_ms, rest_price_cache=rest_price_cache)
 
     def time_since_last_ws_ping_s(self, trade_pair: TradePair) -> float | None:
         if trade_pair in self.polygon_data_service.UNSUPPORTED_TRADE_PAIRS:
@@ -216,11 +246,17 @@ class LivePriceFetcher:
         one_second_rest_candles = self.polygon_data_service.get_candles(
             trade_pairs=trade_pairs, start_time_ms=start_time_ms, end_time_ms=end_time_ms)
 
+        tp_to_sources = {}
         for tp in trade_pairs:
             rest_candles = one_second_rest_candles.get(tp, [])
             ws_candles = self.get_ws_price_sources_in_window(tp, start_time_ms, end_time_ms)
-            non_null_sources = list(set(rest_candles + ws_candles))
-            filtered_sources = self.filter_outliers(non_null_sources)
+            tp_to_sources[tp] = (rest_candles, ws_candles, list(set(rest_candles + ws_candles)))
+        tp_to_filtered_sources = PriceSourceBatch(list(trade_pairs), [tp_to_sources[tp][2] for tp in trade_pairs]
+                                                  ).filter_outliers()
+
+        for tp in trade_pairs:
+            rest_candles, ws_candles, non_null_sources = tp_to_sources[tp]
+            filtered_sources = tp_to_filtered_sources[tp]
             # Get the sources removed to debug
             removed_sources = [x for x in non_null_sources if x not in filtered_sources]
             ans[tp] = filtered_sources
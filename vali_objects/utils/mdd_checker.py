@@ -1,6 +1,7 @@
 # developer: jbonilla
 # Copyright © 2024 Taoshi Inc
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
 from time_util.time_util import TimeUtil
@@ -19,6 +20,24 @@ import bittensor as bt
 from vali_objects.vali_dataclasses.price_source import PriceSource
 
 
+class MDDShard:
+    """
+    A slice of the metagraph's hotkeys swept by one MDD checker worker. Each shard has its own REST price source cache,
+    seeded with the REST sources fetched for the sweep's bulk price fetch, so workers never share mutable state.
+    """
+    def __init__(self, hotkeys: List[str], rest_price_cache: Dict[TradePair, tuple]):
+        self.hotkeys = hotkeys
+        self.rest_price_cache = dict(rest_price_cache)
+        self.n_seeded_trade_pairs = len(self.rest_price_cache)
+        self.n_orders_corrected = 0
+        self.miners_corrected = set()
+        self.n_miners_skipped_already_eliminated = 0
+
+    @property
+    def n_rest_trade_pairs_fetched(self) -> int:
+        return len(self.rest_price_cache) - self.n_seeded_trade_pairs
+
+
 class MDDChecker(CacheController):
 
     def __init__(self, metagraph, position_manager, running_unit_tests=False,
@@ -38,6 +57,9 @@ class MDDChecker(CacheController):
         self.reset_debug_counters()
         self.shutdown_dict = shutdown_dict
         self.n_poly_api_requests = 0
+        self.n_shards = ValiConfig.MDD_CHECK_N_SHARDS
+        # trade pair -> REST price sources fetched for this sweep's bulk price fetch
+        self.rest_price_cache = {}
         self.hotkeys_with_flat_orders_added = set()
         self.eliminated_hotkeys = self.elimination_manager.get_eliminated_hotkeys()
 
@@ -65,16 +87,32 @@ class MDDChecker(CacheController):
                         required_trade_pairs_for_candles.add(tp)
 
         now = TimeUtil.now_in_millis()
-        candle_data = self.live_price_fetcher.get_latest_prices(list(required_trade_pairs_for_candles))
+        self.rest_price_cache = {}
+        candle_data = self.live_price_fetcher.get_latest_prices(list(required_trade_pairs_for_candles),
+                                                                rest_price_cache=self.rest_price_cache)
         #bt.logging.info(f"Got candle data for {len(candle_data)} {candle_data}")
-        for tp, price_and_sources in candle_data.items():
-            sources = price_and_sources[1]
-            if sources and any(x and not x.websocket for x in sources):
-                self.n_poly_api_requests += 1
+        self.n_poly_api_requests += len(self.rest_price_cache)
 
         self.last_price_fetch_time_ms = now
         return candle_data
 
+    def shard_hotkeys(self, hotkeys: List[str]) -> List[MDDShard]:
+        n_shards = max(1, min(self.n_shards, len(hotkeys)))
+        return [MDDShard(hotkeys[i::n_shards], self.rest_price_cache) for i in range(n_shards)]
+
+    def add_shard_counters(self, shard: MDDShard):
+        self.n_orders_corrected += shard.n_orders_corrected
+        self.miners_corrected |= shard.miners_corrected
+        self.n_miners_skipped_already_eliminated += shard.n_miners_skipped_already_eliminated
+        self.n_poly_api_requests += shard.n_rest_trade_pairs_fetched
+
+    def check_shard(self, shard: MDDShard, hotkey_to_positions, candle_data, position_locks) -> MDDShard:
+        for hotkey in shard.hotkeys:
+            if self.shutdown_dict:
+                break
+            self.perform_price_corrections(hotkey, hotkey_to_positions[hotkey], candle_data, position_locks, shard)
+        return shard
+
     
     def mdd_check(self, position_locks):
         self.n_poly_api_requests = 0
@@ -98,17 +136,25 @@ class MDDChecker(CacheController):
             eliminations=[{'hotkey': x} for x in self.hotkeys_with_flat_orders_added]
         )
         candle_data = self.get_candle_data(hotkey_to_positions)
-        for hotkey, sorted_positions in hotkey_to_positions.items():
-            if self.shutdown_dict:
-                return
-            self.perform_price_corrections(hotkey, sorted_positions, candle_data, position_locks)
+        # Price corrections block on REST requests and disk writes. Sweep shards of hotkeys concurrently. A hotkey is
+        # only ever handled by one shard and position locks still guard each (hotkey, trade pair).
+        shards = self.shard_hotkeys(list(hotkey_to_positions))
+        with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='mdd_shard') as executor:
+            futures = [executor.submit(self.check_shard, shard, hotkey_to_positions, candle_data, position_locks)
+                       for shard in shards]
+            shards = [f.result() for f in futures]
+        for shard in shards:
+            self.add_shard_counters(shard)
+        if self.shutdown_dict:
+            return
 
         bt.logging.info(f"mdd checker completed."
                         f" n orders corrected: {self.n_orders_corrected}. n miners corrected: {len(self.miners_corrected)}."
                         f" n_poly_api_requests: {self.n_poly_api_requests}")
         self.set_last_update_time(skip_message=False)
 
-    def _update_position_returns_and_persist_to_disk(self, hotkey, position, candle_data_dict, position_locks):
+    def _update_position_returns_and_persist_to_disk(self, hotkey, position, candle_data_dict, position_locks,
+                                                     shard: MDDShard):
         """
         Setting the latest returns and persisting to disk for accurate MDD calculation and logging in get_positions
 
@@ -117,13 +163,12 @@ class MDDChecker(CacheController):
         """
 
         def _get_sources_for_order(order, trade_pair, is_last_order):
-            # Only fall back to REST if the order is the latest. Don't want to get slowed down
-            # By a flurry of recent orders.
-            #ws_only = not is_last_order
-            self.n_poly_api_requests += 1#0 if ws_only else 1
+            # Websocket sources are looked up at the order's time. REST sources only depend on the trade pair so
+            # each shard requests them at most once per sweep.
             sources = self.live_price_fetcher.fetch_prices([trade_pair],
                                                         {trade_pair: order.processed_ms},
-                                                        ws_only=False).get(trade_pair, (None, None))[1]
+                                                        ws_only=False,
+                                                        rest_price_cache=shard.rest_price_cache).get(trade_pair, (None, None))[1]
             return sources
 
         trade_pair = position.trade_pair
@@ -178,8 +223,8 @@ class MDDChecker(CacheController):
             if n_orders_updated or ret_changed:
                 is_liquidated = position.current_return == 0
                 self.position_manager.save_miner_position(position, delete_open_position_if_exists=is_liquidated)
-                self.n_orders_corrected += n_orders_updated
-                self.miners_corrected.add(hotkey)
+                shard.n_orders_corrected += n_orders_updated
+                shard.miners_corrected.add(hotkey)
 
 
 
@@ -222,16 +267,24 @@ class MDDChecker(CacheController):
         if not any_changes_attempted:
             bt.logging.info(f'No flat order additions attempted for miner {hotkey} that has been eliminated. No open positions.')
 
-    def perform_price_corrections(self, hotkey, sorted_positions, candle_data, position_locks) -> bool:
+    def perform_price_corrections(self, hotkey, sorted_positions, candle_data, position_locks,
+                                  shard: MDDShard = None) -> bool:
         if len(sorted_positions) == 0:
             return False
+        # Called outside of a sweep. Count on a shard of its own and add the counters when done.
+        if shard is None:
+            shard = MDDShard([hotkey], self.rest_price_cache)
+            try:
+                return self.perform_price_corrections(hotkey, sorted_positions, candle_data, position_locks, shard)
+            finally:
+                self.add_shard_counters(shard)
         # Already eliminated?
         corresponding_elimination = self.elimination_manager.hotkey_in_eliminations(hotkey)
         if corresponding_elimination:
             if hotkey not in self.hotkeys_with_flat_orders_added:
                 self.add_manual_flat_orders(hotkey, sorted_positions, corresponding_elimination, position_locks)
                 self.hotkeys_with_flat_orders_added.add(hotkey)
-            self.n_miners_skipped_already_eliminated += 1
+            shard.n_miners_skipped_already_eliminated += 1
             return False
 
         now_ms = TimeUtil.now_in_millis()
@@ -240,7 +293,7 @@ class MDDChecker(CacheController):
                 return False
             # Perform needed updates
             if self._position_is_candidate_for_price_correction(position, now_ms):
-                self._update_position_returns_and_persist_to_disk(hotkey, position, candle_data, position_locks)
+                self._update_position_returns_and_persist_to_disk(hotkey, position, candle_data, position_locks, shard)
 
 
 
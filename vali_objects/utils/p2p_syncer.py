@@ -188,9 +188,44 @@ class P2PSyncer(ValidatorSyncBase):
             If a position’s uuid exists on the majority of validators, that position is kept.
             If an order uuid exists in the majority of positions, that order is kept.
                 Choose the order with the median price.
+
+        Consensus is computed independently for each miner hotkey, one miner at a time, so only that miner's counts
+        and matrices are held in memory. Miners are added to the golden positions in the order they are first seen in
+        the trust ordered checkpoints.
+        """
+        golden_positions = {}
+        num_checkpoints = len(valid_checkpoints)
+        positions_threshold = self.consensus_threshold(num_checkpoints)
+
+        for miner_hotkey, miner_checkpoints in self.partition_checkpoints_by_miner(valid_checkpoints):
+            # miner does not appear in the majority of checkpoints
+            if len(miner_checkpoints) < positions_threshold:
+                continue
+            golden_positions[miner_hotkey] = {
+                "positions": self.p2p_sync_miner_positions(miner_hotkey, miner_checkpoints, num_checkpoints)}
+
+        return golden_positions
+
+    def partition_checkpoints_by_miner(self, valid_checkpoints: dict):
+        """
+        yields (miner hotkey, {validator hotkey: miner positions}) for every miner found in the checkpoints.
+        validators keep the trust order of valid_checkpoints. the positions are referenced, not copied.
+        """
+        miner_to_checkpoints = defaultdict(dict)  # {miner hotkey: {validator hotkey: {positions: [positions]}}}
+        for validator_hotkey, checkpoint in valid_checkpoints.items():
+            for miner_hotkey, miner_positions in checkpoint.get("positions", {}).items():
+                miner_to_checkpoints[miner_hotkey][validator_hotkey] = miner_positions
+
+        while miner_to_checkpoints:
+            miner_hotkey = next(iter(miner_to_checkpoints))
+            yield miner_hotkey, miner_to_checkpoints.pop(miner_hotkey)
+
+    def p2p_sync_miner_positions(self, miner_hotkey: str, miner_checkpoints: dict, num_checkpoints: int) -> List[dict]:
         """
-        golden_positions = defaultdict(lambda: defaultdict(list))
+        build the golden positions for a single miner.
 
+        miner_checkpoints = {validator hotkey: {positions: [positions]}}
+        """
         position_counts = defaultdict(int)                      # {position_uuid: count}
         order_counts = defaultdict(lambda: defaultdict(int))    # {position_uuid: {order_uuid: count}}
         order_data = defaultdict(list)                          # {order_uuid: [{order}]}
@@ -201,38 +236,32 @@ class P2PSyncer(ValidatorSyncBase):
         orders_matrix = defaultdict(lambda: defaultdict(list))                          # {position_uuid: {validator hotkey: [all orders on validator]}}
 
         # parse each checkpoint to count occurrences of each position and order
-        for hotkey, checkpoint in valid_checkpoints.items():
-            self.parse_checkpoint_positions(hotkey, checkpoint, position_counts, order_counts, order_data, miner_to_uuids, miner_counts, positions_matrix, orders_matrix)
+        for validator_hotkey, miner_positions in miner_checkpoints.items():
+            checkpoint = {"positions": {miner_hotkey: miner_positions}}
+            self.parse_checkpoint_positions(validator_hotkey, checkpoint, position_counts, order_counts, order_data, miner_to_uuids, miner_counts, positions_matrix, orders_matrix)
         self.prune_position_orders(order_counts, orders_matrix)
 
         # miners who are still running legacy code. do not want to include them in checkpoint
-        self.find_legacy_miners(len(valid_checkpoints), order_counts, miner_to_uuids, position_counts, order_data)
+        self.find_legacy_miners(num_checkpoints, order_counts, miner_to_uuids, position_counts, order_data)
 
         # get the set of position_uuids that appear in the majority of checkpoints
-        positions_threshold = self.consensus_threshold(len(valid_checkpoints))
+        positions_threshold = self.consensus_threshold(num_checkpoints)
         majority_positions = {position_uuid for position_uuid, count in position_counts.items() if count >= positions_threshold}
         seen_positions = set()
         seen_orders = set()
 
-        for validator_hotkey, checkpoint in valid_checkpoints.items():
-            positions = checkpoint.get("positions", {})
-            for miner_hotkey, miner_positions in positions.items():
-                if miner_counts[miner_hotkey] < positions_threshold:
-                    continue
-
-                # combinations where the position_uuid appears in the majority
-                uuid_matched_positions = self.construct_positions_uuid_in_majority(miner_positions, majority_positions, seen_positions, seen_orders, position_counts, order_counts, order_data, orders_matrix, validator_hotkey)
-                golden_positions[miner_hotkey]["positions"].extend(uuid_matched_positions)
+        golden_miner_positions = []
+        for validator_hotkey, miner_positions in miner_checkpoints.items():
+            # combinations where the position_uuid appears in the majority
+            uuid_matched_positions = self.construct_positions_uuid_in_majority(miner_positions, majority_positions, seen_positions, seen_orders, position_counts, order_counts, order_data, orders_matrix, validator_hotkey)
+            golden_miner_positions.extend(uuid_matched_positions)
 
         # combinations where the position_uuid does not appear in the majority, instead we use a heuristic match to combine positions
-        for position in self.heuristic_resolve_positions(positions_matrix, len(valid_checkpoints), seen_positions):
+        for position in self.heuristic_resolve_positions(positions_matrix, num_checkpoints, seen_positions):
             bt.logging.info(f"Position {position['position_uuid']} on miner {position['miner_hotkey']} matched, adding back in")
-            miner_hotkey = position["miner_hotkey"]
-            golden_positions[miner_hotkey]["positions"].append(position)
-
-        # convert defaultdict to dict
-        return {miner: dict(golden_positions[miner]) for miner in golden_positions}
+            golden_miner_positions.append(position)
 
+        return golden_miner_positions
 
     def construct_positions_uuid_in_majority(self, miner_positions: dict, majority_positions: Set[str], seen_positions: Set[str], seen_orders: Set[str], position_counts: dict, order_counts: dict, order_data: dict, orders_matrix: dict, validator_hotkey: str) -> List[dict]:
         """
@@ -426,6 +455,7 @@ class P2PSyncer(ValidatorSyncBase):
 
         legacy_miners = set()            # position/order uuids are all unique across validators
         legacy_miner_candidates = set()  # at least one position/order uuid is unique across validators
+        legacy_uuid_summaries = {}       # miner hotkey -> counts of its position/order uuids unique across validators
 
         if num_checkpoints > 1:
             for miner_hotkey, uuids in miner_to_uuids.items():
@@ -443,12 +473,12 @@ class P2PSyncer(ValidatorSyncBase):
                         legacy_miners.add(miner_hotkey)
                     elif newest_unique_order_timestamp == newest_order_timestamp:
                         legacy_miner_candidates.add(miner_hotkey)
-                    bt.logging.info(
-                        f"Miner {miner_hotkey} has [{(len(uuids['positions']) - num_repeated_pos)}/{len(uuids['positions'])} legacy positions, {(len(uuids['orders']) - num_repeated_orders)}/{len(uuids['orders'])} legacy orders]. Newest legacy order {newest_unique_order_uuid} at timestamp {newest_unique_order_timestamp}")
-                else:
-                    bt.logging.info(f"Miner {miner_hotkey} has 0 legacy positions or orders")
-        bt.logging.info(f"legacy_miners: {legacy_miners}")
-        bt.logging.info(f"legacy_miner_candidates: {legacy_miner_candidates}")
+                    legacy_uuid_summaries[miner_hotkey] = (
+                        f"{(len(uuids['positions']) - num_repeated_pos)}/{len(uuids['positions'])} legacy positions, {(len(uuids['orders']) - num_repeated_orders)}/{len(uuids['orders'])} legacy orders, newest legacy order {newest_unique_order_uuid} at timestamp {newest_unique_order_timestamp}")
+        # One line per sync rather than one per miner
+        bt.logging.info(f"{len(legacy_uuid_summaries)}/{len(miner_to_uuids)} miners have legacy positions or orders. "
+                        f"legacy_miners: {legacy_miners} legacy_miner_candidates: {legacy_miner_candidates} "
+                        f"by miner: {legacy_uuid_summaries}")
         return legacy_miners
 
     def heuristic_resolve_positions(self, positions_matrix: dict, num_checkpoints: int, seen_positions: set) -> List[dict]:
@@ -0,0 +1,63 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+import hashlib
+
+from vali_objects.position import Position
+
+
+class PositionDigest:
+    """
+    Two level Merkle-style digest of a miner's positions, used by the position inspector to skip transferring trade
+    pairs it already has.
+
+    Each leaf is a position's uuid, order count, last order time, close state and return at close. Leaves are hashed
+    together per trade pair. Besides new orders, positions change through price corrections and eliminations, which
+    move the return or close the position without necessarily adding an order. A matching trade pair digest means
+    the validator and miner hold the same positions for that trade pair.
+    """
+    DIGEST_SIZE_BYTES = 16
+
+    @staticmethod
+    def digest_leaves(leaves) -> str:
+        h = hashlib.blake2b(digest_size=PositionDigest.DIGEST_SIZE_BYTES)
+        for leaf in sorted(leaves):
+            h.update((':'.join(repr(x) for x in leaf) + '\n').encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def _trade_pair_digests(trade_pair_to_leaves: dict) -> dict[str, str]:
+        return {tp_id: PositionDigest.digest_leaves(leaves) for tp_id, leaves in trade_pair_to_leaves.items()}
+
+    @staticmethod
+    def trade_pair_digests(positions: list[Position]) -> dict[str, str]:
+        trade_pair_to_leaves = {}
+        for p in positions:
+            trade_pair_to_leaves.setdefault(p.trade_pair.trade_pair_id, []).append(
+                (p.position_uuid, len(p.orders), p.orders[-1].processed_ms if p.orders else 0, p.is_closed_position,
+                 p.return_at_close))
+        return PositionDigest._trade_pair_digests(trade_pair_to_leaves)
+
+    @staticmethod
+    def trade_pair_digests_from_dicts(position_dicts: list[dict]) -> dict[str, str]:
+        trade_pair_to_leaves = {}
+        for p in position_dicts:
+            trade_pair_to_leaves.setdefault(PositionDigest.trade_pair_id_from_dict(p), []).append(
+                (p['position_uuid'], len(p['orders']), p['orders'][-1]['processed_ms'] if p['orders'] else 0,
+                 p['is_closed_position'], p['return_at_close']))
+        return PositionDigest._trade_pair_digests(trade_pair_to_leaves)
+
+    @staticmethod
+    def trade_pair_id_from_dict(position_dict: dict) -> str:
+        # Position.to_dict writes the trade pair in the legacy list format with the trade pair id first
+        return position_dict['trade_pair'][0]
+
+    @staticmethod
+    def positions_to_send(positions: list[Position], known_position_digests: dict[str, list[str]]):
+        """
+        Validator side of the exchange. Returns the digest of every trade pair and the positions of the trade pairs
+        whose digest the requester does not already know.
+        """
+        digests = PositionDigest.trade_pair_digests(positions)
+        changed_trade_pairs = {tp_id for tp_id, digest in digests.items()
+                               if digest not in known_position_digests.get(tp_id, ())}
+        return digests, [p for p in positions if p.trade_pair.trade_pair_id in changed_trade_pairs]
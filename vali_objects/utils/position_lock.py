@@ -1,24 +1,108 @@
-from multiprocessing import Lock
+import zlib
+from multiprocessing import Lock, Condition
+from multiprocessing.sharedctypes import RawArray
+
+
+class ReaderWriterLock:
+    """
+    Writer-preferring reader-writer lock that works across processes. The counters live in shared memory and are only
+    touched while holding the condition's lock. Use the reader and writer sides as context managers.
+    """
+    READERS, WRITERS_WAITING, WRITER_ACTIVE = range(3)
+
+    def __init__(self):
+        self.condition = Condition()
+        self.state = RawArray('i', 3)
+        self.reader = LockSide(self.acquire_read, self.release_read)
+        self.writer = LockSide(self.acquire_write, self.release_write)
+
+    def acquire_read(self, block=True, timeout=None) -> bool:
+        state = self.state
+        with self.condition:
+            # Waiting writers go first so a steady stream of readers can't starve them
+            if not self.condition.wait_for(lambda: not state[self.WRITER_ACTIVE] and not state[self.WRITERS_WAITING],
+                                           timeout if block else 0):
+                return False
+            state[self.READERS] += 1
+            return True
+
+    def release_read(self):
+        with self.condition:
+            self.state[self.READERS] -= 1
+            if self.state[self.READERS] == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self, block=True, timeout=None) -> bool:
+        state = self.state
+        with self.condition:
+            state[self.WRITERS_WAITING] += 1
+            acquired = self.condition.wait_for(lambda: not state[self.WRITER_ACTIVE] and not state[self.READERS],
+                                               timeout if block else 0)
+            state[self.WRITERS_WAITING] -= 1
+            if acquired:
+                state[self.WRITER_ACTIVE] = 1
+            else:
+                # Readers held back by this writer can go ahead
+                self.condition.notify_all()
+            return acquired
+
+    def release_write(self):
+        with self.condition:
+            self.state[self.WRITER_ACTIVE] = 0
+            self.condition.notify_all()
+
+
+class LockSide:
+    """
+    One side of a ReaderWriterLock with the acquire/release/context manager interface of multiprocessing.Lock.
+    """
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
 class PositionLocks:
     """
     Updating positions in the validator is vulnerable to race conditions on a per-miner and per-trade-pair basis. This
     class aims to solve that problem by locking the positions for a given miner and trade pair.
+
+    Locks are striped: a fixed table of locks is created up front and each (miner, trade pair) maps to one of them by a
+    stable hash. Getting a lock takes no global lock, the number of OS semaphores is bounded and, because every lock
+    exists before the validator starts its other processes, the table is shared with them. Two keys can share a stripe,
+    so never hold a position lock while acquiring another one.
+
+    With reader_writer=True, get_read_lock returns a shared lock for paths that only read positions. Otherwise it
+    returns the same exclusive lock as get_lock.
     """
-    def __init__(self):
-        self.locks = {}
-        self.global_lock = Lock()
+    N_STRIPES = 1024
+    N_READER_WRITER_STRIPES = 256
+
+    def __init__(self, n_stripes: int = None, reader_writer: bool = False):
+        self.reader_writer = reader_writer
+        if n_stripes is None:
+            n_stripes = self.N_READER_WRITER_STRIPES if reader_writer else self.N_STRIPES
+        if reader_writer:
+            self.rw_locks = [ReaderWriterLock() for _ in range(n_stripes)]
+            self.locks = [rw_lock.writer for rw_lock in self.rw_locks]
+            self.read_locks = [rw_lock.reader for rw_lock in self.rw_locks]
+        else:
+            self.locks = [Lock() for _ in range(n_stripes)]
+            self.read_locks = self.locks
+
+    def get_stripe(self, miner_hotkey, trade_pair) -> int:
+        # Python's str hash is salted per process. crc32 maps a key to the same stripe in every process.
+        return zlib.crc32(f"{miner_hotkey}|{trade_pair}".encode()) % len(self.locks)
 
     def get_lock(self, miner_hotkey, trade_pair):
         #bt.logging.info(f"Getting lock for miner_hotkey [{miner_hotkey}] and trade_pair [{trade_pair}].")
-        lock_key = (miner_hotkey, trade_pair)
-        with self.global_lock:  # Ensure thread-safe access to the locks dictionary
-            if lock_key not in self.locks:
-                self.locks[lock_key] = Lock()
-        return self.locks[lock_key]
-
-    def cleanup_locks(self, active_miner_hotkeys):
-        with self.global_lock:  # Ensure thread-safe modification of the locks dictionary
-            keys_to_delete = [key for key in self.locks.keys() if key[0] not in active_miner_hotkeys]
-            for key in keys_to_delete:
-                del self.locks[key]
+        return self.locks[self.get_stripe(miner_hotkey, trade_pair)]
 
+    def get_read_lock(self, miner_hotkey, trade_pair):
+        return self.read_locks[self.get_stripe(miner_hotkey, trade_pair)]
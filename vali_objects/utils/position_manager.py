@@ -904,7 +904,8 @@ class PositionManager(CacheController):
         file_string = None
         try:
             file_string = ValiBkpUtils.get_file(file)
-            ans = Position.model_validate_json(file_string)
+            # Position files are only ever written by this validator so skip pydantic validation
+            ans = Position.from_json_string(file_string)
             if not ans.orders:
                 bt.logging.warning(f"Anomalous position has no orders: {ans.to_dict()}")
             return ans
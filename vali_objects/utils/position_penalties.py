@@ -1,19 +1,85 @@
 # developer: trdougherty
 from typing import Union
 import numpy as np
-import math
 import pandas as pd
 
+from vali_objects.enums.order_type_enum import OrderType
 from vali_objects.vali_config import ValiConfig
 from vali_objects.position import Position
 from vali_objects.utils.functional_utils import FunctionalUtils
-from vali_objects.utils.position_utils import PositionUtils
+
+
+class PositionColumns:
+    """
+    Columnar copy of a list of positions, extracted once so the penalty kernels never touch Position or Order objects.
+    Order fields are concatenated across positions, and the orders of position i are
+    order_offsets[i]:order_offsets[i + 1]. When built for several miners, the positions of miner j are
+    miner_offsets[j]:miner_offsets[j + 1].
+    """
+    def __init__(self, positions: list[Position], miner_offsets: np.ndarray = None):
+        orders = [order for position in positions for order in position.orders]
+        self.order_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum([len(position.orders) for position in positions], out=self.order_offsets[1:])
+        self.order_times_ms = np.array([order.processed_ms for order in orders], dtype=np.int64)
+        self.order_leverages = np.array([order.leverage for order in orders], dtype=np.float64)
+        self.order_prices = np.array([order.price for order in orders], dtype=np.float64)
+        self.order_is_flat = np.array([order.order_type == OrderType.FLAT for order in orders], dtype=bool)
+        self.close_ms = np.array([position.close_ms for position in positions])
+        self.return_at_close = np.array([position.return_at_close for position in positions], dtype=np.float64)
+        self.is_closed_position = np.array([position.is_closed_position for position in positions], dtype=bool)
+        if miner_offsets is None:
+            miner_offsets = np.array([0, len(positions)], dtype=np.int64)
+        self.miner_offsets = miner_offsets
+
+    @classmethod
+    def from_miners(cls, hotkey_positions: dict[str, list[Position]]) -> 'PositionColumns':
+        """
+        Concatenates the positions of all miners, in dict order.
+        """
+        miner_offsets = np.zeros(len(hotkey_positions) + 1, dtype=np.int64)
+        np.cumsum([len(positions) for positions in hotkey_positions.values()], out=miner_offsets[1:])
+        return cls([p for positions in hotkey_positions.values() for p in positions], miner_offsets=miner_offsets)
+
+    @staticmethod
+    def of(positions: Union[list[Position], 'PositionColumns']) -> 'PositionColumns':
+        return positions if isinstance(positions, PositionColumns) else PositionColumns(positions)
+
+    def __len__(self):
+        return len(self.return_at_close)
+
+    def orders_by_index(self):
+        """
+        Yields (k, position_indices, order_indices) for k = 0, 1, ... where order_indices are the k-th orders of the
+        positions that have more than k orders. Running state per position can be carried across k with
+        vectorized updates, applied in the same order as a per-position loop over the orders.
+        """
+        lengths = np.diff(self.order_offsets)
+        position_order = np.argsort(-lengths, kind='stable')
+        sorted_neg_lengths = -lengths[position_order]
+        starts = self.order_offsets[:-1][position_order]
+        max_length = int(lengths.max()) if len(lengths) else 0
+        for k in range(max_length):
+            n_active = np.searchsorted(sorted_neg_lengths, -k, side='left')
+            yield k, position_order[:n_active], starts[:n_active] + k
+
+    def cumulative_leverages(self) -> np.ndarray:
+        """
+        Running leverage after each order, reset to 0 by FLAT orders, as in PositionUtils.translate_current_leverage.
+        """
+        running_leverages = np.zeros(len(self), dtype=np.float64)
+        cumulative_leverages = np.empty(len(self.order_leverages), dtype=np.float64)
+        for _, position_indices, order_indices in self.orders_by_index():
+            running = running_leverages[position_indices] + self.order_leverages[order_indices]
+            running[self.order_is_flat[order_indices]] = 0
+            running_leverages[position_indices] = running
+            cumulative_leverages[order_indices] = running
+        return cumulative_leverages
 
 
 class PositionPenalties:
     @staticmethod
     def time_consistency_penalty(
-            positions: list[Position]
+            positions: Union[list[Position], PositionColumns]
     ) -> float:
         """
         Returns the penalty associated with uneven distributions for realized returns
@@ -36,7 +102,7 @@ class PositionPenalties:
 
     @staticmethod
     def time_consistency_ratio(
-            positions: list[Position],
+            positions: Union[list[Position], PositionColumns],
             time_window: Union[int, None] = None
     ) -> float:
         """
@@ -54,33 +120,23 @@ class PositionPenalties:
         if time_window is None:
             time_window = ValiConfig.POSITIONAL_RETURN_TIME_WINDOW_MS
 
-        close_times = np.array([position.close_ms for position in positions])
-        returns = np.log([
-            max(position.return_at_close, .00001)  # Prevent math domain error
-            for position in positions])
+        columns = PositionColumns.of(positions)
+        close_times = columns.close_ms
+        returns = np.log(np.maximum(columns.return_at_close, .00001))  # Prevent math domain error
         total_return = np.sum(returns)
 
         # If there is no return, the ratio is 1, as our denominator is invalid
         if total_return == 0:
             return 1
 
-        # Initialize an empty list to store the results
-        sums_in_window = []
-
-        # Iterate through each time point
-        for i in range(len(close_times)):
-            # Define the start and end of the sliding window
-            start_time: int = close_times[i]
-            end_time: int = start_time + time_window
-
-            # Sum values within the window
-            sum_values = returns[
-                (close_times >= start_time) &
-                (close_times < end_time)
-                ].sum()
-
-            # Store the result
-            sums_in_window.append(sum_values)
+        # Sum of returns closed in [close_time, close_time + time_window) for each close time, from prefix sums over
+        # the returns sorted by close time
+        sort_order = np.argsort(close_times, kind='stable')
+        sorted_close_times = close_times[sort_order]
+        prefix_returns = np.concatenate(([0.0], np.cumsum(returns[sort_order])))
+        window_starts = np.searchsorted(sorted_close_times, close_times, side='left')
+        window_ends = np.searchsorted(sorted_close_times, close_times + time_window, side='left')
+        sums_in_window = prefix_returns[window_ends] - prefix_returns[window_starts]
 
         if total_return > 0:
             largest_windowed_contribution = max(sums_in_window)
@@ -92,7 +148,7 @@ class PositionPenalties:
 
     @staticmethod
     def returns_ratio_penalty(
-            positions: list[Position]
+            positions: Union[list[Position], PositionColumns]
     ) -> float:
         """
         Returns the penalty associated with uneven distributions for realized returns
@@ -116,7 +172,7 @@ class PositionPenalties:
 
     @staticmethod
     def martingale_penalty(
-            positions: list[Position],
+            positions: Union[list[Position], PositionColumns],
             evaluation_time_ms: int = None
     ) -> float:
         """
@@ -132,9 +188,23 @@ class PositionPenalties:
             ValiConfig.MARTINGALE_SPREAD
         )
 
+    @staticmethod
+    def martingale_penalties(
+            hotkey_positions: dict[str, list[Position]],
+            evaluation_time_ms: int = None
+    ) -> dict[str, float]:
+        """
+        Batch variant of martingale_penalty. The positions of all miners are extracted and scored in one pass.
+        """
+        martingale_scores = PositionPenalties.martingale_scores(hotkey_positions, evaluation_time_ms)
+        return {
+            miner: FunctionalUtils.sigmoid(score, ValiConfig.MARTINGALE_SHIFT, ValiConfig.MARTINGALE_SPREAD)
+            for miner, score in martingale_scores.items()
+        }
+
     @staticmethod
     def martingale_score(
-            positions: list[Position],
+            positions: Union[list[Position], PositionColumns],
             evaluation_time_ms: int = None,
     ) -> float:
         """
@@ -143,14 +213,28 @@ class PositionPenalties:
         Args:
             positions: dict[str, list[Position]] - the list of positions with translated leverage
         """
-        cumulative_leverage_positions = PositionUtils.cumulative_leverage_position(positions, evaluation_time_ms)
-        return PositionPenalties.martingale_percentile(cumulative_leverage_positions)
-        # return FunctionalUtils.martingale_score(martingale_metrics, cumulative_leverage_positions)
+        # Scoring the positions translated to cumulative leverage (PositionUtils.cumulative_leverage_position) without
+        # copying them. The final order that translation appends at evaluation_time_ms repeats the last order's price
+        # and leverage, so it can never add a martingale step.
+        columns = PositionColumns.of(positions)
+        return PositionPenalties._martingale_percentiles(columns, columns.cumulative_leverages())[0]
+
+    @staticmethod
+    def martingale_scores(
+            hotkey_positions: dict[str, list[Position]],
+            evaluation_time_ms: int = None
+    ) -> dict[str, float]:
+        """
+        Batch variant of martingale_score
+        """
+        columns = PositionColumns.from_miners(hotkey_positions)
+        scores = PositionPenalties._martingale_percentiles(columns, columns.cumulative_leverages())
+        return dict(zip(hotkey_positions.keys(), scores))
 
     # what we want to do is determine for each position is to determine the relative drawdown percentage
     @staticmethod
     def martingale_percentile(
-            positions: list[Position]
+            positions: Union[list[Position], PositionColumns]
     ) -> float:
         """
         Returns the penalty associated with uneven distributions for realized returns
@@ -158,42 +242,54 @@ class PositionPenalties:
         Args:
             positions: list[Position] - the list of positions
         """
-        if len(positions) < 1:
-            return 0.0
-
-        position_is_martingale = []
-        positional_returns = []
+        columns = PositionColumns.of(positions)
+        return PositionPenalties._martingale_percentiles(columns, columns.order_leverages)[0]
 
-        for position in positions:
-            step_count = 0
-            return_at_close = position.return_at_close
-
-            entry_order = position.orders[0]
-            entry_price = entry_order.price
-            max_leverage = abs(entry_order.leverage)
-
-            for order in position.orders[1:]:
-                price = order.price
-                leverage = abs(order.leverage)
-
-                losing = price < entry_price and entry_order.leverage > 0 or price > entry_price and entry_order.leverage < 0
-                if losing and leverage > max_leverage:
-                    step_count += 1
-                    max_leverage = max(max_leverage, leverage)
+    @staticmethod
+    def _martingale_percentiles(columns: PositionColumns, order_leverages: np.ndarray) -> list[float]:
+        """
+        Return weighted share of martingale positions for each miner in columns.
 
-            positional_returns.append(return_at_close ** ValiConfig.MARTINGALE_CONCENTRATION)
-            if step_count > ValiConfig.MARTINGALE_STEP_THRESHOLD:
-                position_is_martingale.append(True)
+        A position steps into a martingale each time a losing order (relative to the entry price and direction) raises
+        the absolute leverage above the largest seen so far.
+        """
+        n_positions = len(columns)
+        step_counts = np.zeros(n_positions, dtype=np.int64)
+        entry_leverages = np.zeros(n_positions, dtype=np.float64)
+        entry_prices = np.zeros(n_positions, dtype=np.float64)
+        max_leverages = np.zeros(n_positions, dtype=np.float64)
+        for k, position_indices, order_indices in columns.orders_by_index():
+            leverages = np.abs(order_leverages[order_indices])
+            prices = columns.order_prices[order_indices]
+            if k == 0:
+                entry_leverages[position_indices] = order_leverages[order_indices]
+                entry_prices[position_indices] = prices
+                max_leverages[position_indices] = leverages
+                continue
+
+            entry_leverage = entry_leverages[position_indices]
+            entry_price = entry_prices[position_indices]
+            max_leverage = max_leverages[position_indices]
+            losing = ((prices < entry_price) & (entry_leverage > 0)) | ((prices > entry_price) & (entry_leverage < 0))
+            step = losing & (leverages > max_leverage)
+            step_counts[position_indices] += step
+            max_leverages[position_indices] = np.where(step, leverages, max_leverage)
+
+        martingale_binaries = (step_counts > ValiConfig.MARTINGALE_STEP_THRESHOLD).astype(int)
+        # Python's float pow, since numpy's vectorized pow can differ from it in the last bit
+        martingale_weights = np.array([r ** ValiConfig.MARTINGALE_CONCENTRATION for r in columns.return_at_close.tolist()],
+                                      dtype=np.float64)
+        percentiles = []
+        for start, end in zip(columns.miner_offsets[:-1], columns.miner_offsets[1:]):
+            if start == end:
+                percentiles.append(0.0)
             else:
-                position_is_martingale.append(False)
-
-        martingale_binaries = np.array(position_is_martingale, dtype=int)
-        martingale_weights = np.array(positional_returns)
-        return np.average(martingale_binaries, weights=martingale_weights)
+                percentiles.append(np.average(martingale_binaries[start:end], weights=martingale_weights[start:end]))
+        return percentiles
 
     @staticmethod
     def martingale_metrics(
-            positions: list[Position]
+            positions: Union[list[Position], PositionColumns]
     ) -> dict[str, list[float]]:
         """
         Returns the penalty associated with uneven distributions for realized returns
@@ -211,57 +307,41 @@ class PositionPenalties:
                 "positional_returns": []
             }
 
-        losing_value_percents = []
-        losing_leverages_decimal_multiplier = []
-        positional_returns = []
-        order_holding_timings = []
-        times_readable = []
-        position_times = []
-        steps = []
-
-        for position in positions:
-            return_at_close = position.return_at_close
-            entry_order = position.orders[0]
-            entry_price = entry_order.price
-
-            entry_leverage = abs(entry_order.leverage) + ValiConfig.EPSILON
-            entry_time = position.orders[0].processed_ms
-            exit_time = position.orders[-1].processed_ms
-            entry_leverage = abs(entry_order.leverage)
-            direction_is_long = entry_order.leverage > 0
-
-            for step in range(1, len(position.orders)):
-                order = position.orders[step]
-                price = order.price
-                leverage = abs(order.leverage)
-                time_of_execution = order.processed_ms
-
-                losing = price < entry_price and direction_is_long or price > entry_price and not direction_is_long
-                if losing and leverage > 0:
-                    losing_percent = (1-(price / entry_price)) * 100
-                    losing_leverage_multiplier = leverage / entry_leverage
-                    losing_entry_timing = (time_of_execution - entry_time) / (exit_time - entry_time)
-                    times_readable.append(pd.to_datetime(time_of_execution, unit='ms', utc=True))
-                    position_times.append(pd.to_datetime(entry_time, unit='ms', utc=True))
-                    order_holding_timings.append(losing_entry_timing)
-                    losing_value_percents.append(losing_percent)
-                    losing_leverages_decimal_multiplier.append(losing_leverage_multiplier)
-                    positional_returns.append(return_at_close)
-                    steps.append(step)
+        columns = PositionColumns.of(positions)
+        n_orders = np.diff(columns.order_offsets)
+        position_of_order = np.repeat(np.arange(len(columns)), n_orders)
+        entry_order_indices = columns.order_offsets[:-1][position_of_order]
+        exit_order_indices = columns.order_offsets[1:][position_of_order] - 1
+        steps = np.arange(len(columns.order_leverages)) - entry_order_indices
+
+        prices = columns.order_prices
+        entry_prices = prices[entry_order_indices]
+        direction_is_long = columns.order_leverages[entry_order_indices] > 0
+        entry_leverages = np.abs(columns.order_leverages[entry_order_indices])
+        leverages = np.abs(columns.order_leverages)
+        entry_times = columns.order_times_ms[entry_order_indices]
+        exit_times = columns.order_times_ms[exit_order_indices]
+
+        losing = ((prices < entry_prices) & direction_is_long) | ((prices > entry_prices) & ~direction_is_long)
+        mask = (steps > 0) & losing & (leverages > 0)
+
+        losing_value_percents = (1 - (prices[mask] / entry_prices[mask])) * 100
+        losing_leverages_decimal_multiplier = leverages[mask] / entry_leverages[mask]
+        order_holding_timings = (columns.order_times_ms[mask] - entry_times[mask]) / (exit_times[mask] - entry_times[mask])
 
         return {
-            "losing_value_percents": losing_value_percents,
-            "entry_holding_timing": order_holding_timings,
-            "losing_leverages_decimal_multiplier": losing_leverages_decimal_multiplier,
-            "positional_returns": positional_returns,
-            "times_readable": times_readable,
-            "position_times": position_times,
-            "steps": steps
+            "losing_value_percents": losing_value_percents.tolist(),
+            "entry_holding_timing": order_holding_timings.tolist(),
+            "losing_leverages_decimal_multiplier": losing_leverages_decimal_multiplier.tolist(),
+            "positional_returns": columns.return_at_close[position_of_order[mask]].tolist(),
+            "times_readable": list(pd.to_datetime(columns.order_times_ms[mask], unit='ms', utc=True)),
+            "position_times": list(pd.to_datetime(entry_times[mask], unit='ms', utc=True)),
+            "steps": steps[mask].tolist()
         }
 
     @staticmethod
     def returns_ratio(
-            positions: list[Position]
+            positions: Union[list[Position], PositionColumns]
     ) -> float:
         """
         Returns the penalty associated with uneven distributions for realized returns
@@ -269,17 +349,16 @@ class PositionPenalties:
         Args:
             positions: list[Position] - the list of positions
         """
-        closed_positions = [position for position in positions if position.is_closed_position]
-        closed_position_returns = [math.log(
-                                        max(position.return_at_close, .00001))  # Prevent math domain error
-                                    for position in closed_positions]
-        closed_return = sum(closed_position_returns)
+        columns = PositionColumns.of(positions)
+        closed_position_returns = np.log(
+            np.maximum(columns.return_at_close[columns.is_closed_position], .00001))  # Prevent math domain error
+        closed_return = np.sum(closed_position_returns)
 
         # Return early if there will be an issue with the ratio denominator
         if closed_return == 0:
             return 1
 
-        numerator = max(closed_position_returns) if closed_return > 0 else min(closed_position_returns)
+        numerator = np.max(closed_position_returns) if closed_return > 0 else np.min(closed_position_returns)
         denominator = closed_return
 
         max_return_ratio = np.clip(numerator / denominator, 0, 1)
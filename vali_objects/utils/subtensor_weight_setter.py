@@ -1,16 +1,17 @@
 # developer: jbonilla
-import copy
 from typing import List
 
 import bittensor as bt
+import numpy as np
 
 from time_util.time_util import TimeUtil
 from vali_objects.vali_config import ValiConfig
 from shared_objects.cache_controller import CacheController
+from shared_objects.metagraph_snapshot import MetagraphSnapshot
 from vali_objects.utils.position_manager import PositionManager
 from vali_objects.position import Position
 from vali_objects.scoring.scoring import Scoring
-from vali_objects.vali_dataclasses.perf_ledger import PerfCheckpoint, PerfLedger
+from vali_objects.vali_dataclasses.perf_ledger import PerfCheckpoint, PerfLedger, PerfLedgerView
 
 
 class SubtensorWeightSetter(CacheController):
@@ -30,7 +31,7 @@ class SubtensorWeightSetter(CacheController):
             current_time = TimeUtil.now_in_millis()
 
         # Collect metagraph hotkeys to ensure we are only setting weights for miners in the metagraph
-        metagraph_hotkeys = self.metagraph.hotkeys
+        metagraph_snapshot = self.get_metagraph_snapshot()
 
         # augmented ledger should have the gain, loss, n_updates, and time_duration
         testing_hotkeys = list(self.position_manager.challengeperiod_manager.challengeperiod_testing.keys())
@@ -49,37 +50,18 @@ class SubtensorWeightSetter(CacheController):
             bt.logging.info("No returns to set weights with. Do nothing for now.")
         else:
             bt.logging.info("Calculating new subtensor weights...")
-            checkpoint_results = Scoring.compute_results_checkpoint(
+            checkpoint_miners, checkpoint_weights = Scoring.compute_results_checkpoint_arrays(
                 filtered_ledger,
                 filtered_positions,
                 evaluation_time_ms=current_time
             )
-            bt.logging.info(f"Sorted results for weight setting: [{sorted(checkpoint_results, key=lambda x: x[1], reverse=True)}]")
-
-            checkpoint_netuid_weights = []
-            for miner, score in checkpoint_results:
-                if miner in metagraph_hotkeys:
-                    checkpoint_netuid_weights.append((
-                        metagraph_hotkeys.index(miner),
-                        score
-                    ))
-                else:
-                    bt.logging.error(f"Miner {miner} not found in the metagraph.")
-
-            challengeperiod_weights = []
-            for miner in testing_hotkeys:
-                if miner in metagraph_hotkeys:
-                    challengeperiod_weights.append((
-                        metagraph_hotkeys.index(miner),
-                        ValiConfig.CHALLENGE_PERIOD_WEIGHT
-                    ))
-                else:
-                    bt.logging.error(f"Challengeperiod miner {miner} not found in the metagraph.")
-
-            transformed_list = checkpoint_netuid_weights + challengeperiod_weights
-            bt.logging.info(f"transformed list: {transformed_list}")
-            
-            self._set_subtensor_weights(wallet, subtensor, transformed_list, netuid)
+            bt.logging.info(f"Sorted results for weight setting: [{list(zip(checkpoint_miners, checkpoint_weights.tolist()))}]")
+
+            uids, weights = self.uids_and_weights(metagraph_snapshot, checkpoint_miners, checkpoint_weights,
+                                                  testing_hotkeys)
+            bt.logging.info(f"transformed list: {list(zip(uids.tolist(), weights.tolist()))}")
+
+            self._set_subtensor_weights(wallet, subtensor, uids, weights, netuid)
         self.set_last_update_time()
 
     @staticmethod
@@ -115,15 +97,16 @@ class SubtensorWeightSetter(CacheController):
     def filtered_ledger(
             self,
             hotkeys: List[str] = None
-    ) -> dict[str, PerfLedger]:
+    ) -> dict[str, PerfLedgerView]:
         """
-        Filter the ledger for a set of hotkeys.
+        Filter the ledger for a set of hotkeys. Returns read-only views shared with the perf ledger manager.
         """
         if hotkeys is None:
-            hotkeys = self.metagraph.hotkeys
+            hotkeys = self.get_metagraph_snapshot().hotkeys
+        hotkeys = set(hotkeys)
 
         # Note, eliminated miners will not appear in the dict below
-        ledger = self.perf_ledger_manager.get_perf_ledgers_from_memory()
+        ledger = self.perf_ledger_manager.get_perf_ledger_views()
         filtering_ledger = {}
         for hotkey, miner_ledger in ledger.items():
             if hotkey not in hotkeys:
@@ -132,11 +115,10 @@ class SubtensorWeightSetter(CacheController):
             if miner_ledger is None:
                 continue
 
-            ledger_copy = copy.deepcopy(miner_ledger)
-            if not self._filter_checkpoint_list(ledger_copy.cps):
+            if not self._filter_checkpoint_list(miner_ledger.cps):
                 continue
 
-            filtering_ledger[hotkey] = ledger_copy
+            filtering_ledger[hotkey] = miner_ledger
 
         return filtering_ledger
 
@@ -157,13 +139,14 @@ class SubtensorWeightSetter(CacheController):
         Filter the positions for a set of hotkeys.
         """
         if hotkeys is None:
-            hotkeys = self.metagraph.hotkeys
+            hotkeys = self.get_metagraph_snapshot().hotkeys
 
         positions = self.position_manager.get_positions_for_hotkeys(
             hotkeys,
             sort_positions=True
         )
 
+        hotkeys = set(hotkeys)
         filtering_positions = {}
         for hotkey, miner_positions in positions.items():
             if hotkey not in hotkeys:
@@ -189,15 +172,49 @@ class SubtensorWeightSetter(CacheController):
             filtered_positions.append(position)
         return filtered_positions
 
-    def _set_subtensor_weights(self, wallet, subtensor, filtered_results: list[tuple[str, float]], netuid):
-        filtered_netuids = [x[0] for x in filtered_results]
-        scaled_transformed_list = [x[1] for x in filtered_results]
+    @staticmethod
+    def uids_and_weights(
+            metagraph_snapshot: MetagraphSnapshot,
+            checkpoint_miners: List[str],
+            checkpoint_weights: np.ndarray,
+            testing_hotkeys: List[str]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The uids to set weights for and their weights. Scored miners get their checkpoint weights followed by the
+        challenge period miners at CHALLENGE_PERIOD_WEIGHT. Miners that are not in the metagraph are skipped.
+        """
+        checkpoint_uids = SubtensorWeightSetter.hotkeys_to_uids(metagraph_snapshot, checkpoint_miners)
+        checkpoint_found = checkpoint_uids >= 0
+        for i in np.flatnonzero(~checkpoint_found):
+            bt.logging.error(f"Miner {checkpoint_miners[i]} not found in the metagraph.")
+
+        challengeperiod_uids = SubtensorWeightSetter.hotkeys_to_uids(metagraph_snapshot, testing_hotkeys)
+        challengeperiod_found = challengeperiod_uids >= 0
+        for i in np.flatnonzero(~challengeperiod_found):
+            bt.logging.error(f"Challengeperiod miner {testing_hotkeys[i]} not found in the metagraph.")
+
+        uids = np.concatenate((checkpoint_uids[checkpoint_found], challengeperiod_uids[challengeperiod_found]))
+        weights = np.empty(len(uids))
+        n_checkpoint = np.count_nonzero(checkpoint_found)
+        weights[:n_checkpoint] = checkpoint_weights[checkpoint_found]
+        weights[n_checkpoint:] = ValiConfig.CHALLENGE_PERIOD_WEIGHT
+        return uids, weights
+
+    @staticmethod
+    def hotkeys_to_uids(metagraph_snapshot: MetagraphSnapshot, hotkeys: List[str]) -> np.ndarray:
+        """
+        Uids of hotkeys in the snapshot, -1 for hotkeys not in the metagraph.
+        """
+        hotkey_to_uid = metagraph_snapshot.hotkey_to_uid
+        return np.fromiter((hotkey_to_uid.get(hotkey, -1) for hotkey in hotkeys), dtype=np.int64, count=len(hotkeys))
 
+    def _set_subtensor_weights(self, wallet, subtensor, uids: np.ndarray, weights: np.ndarray, netuid):
+        # The same dtypes set_weights converts lists to, so the chain sees the same weights without the copies
         success, err_msg = subtensor.set_weights(
             netuid=netuid,
             wallet=wallet,
-            uids=filtered_netuids,
-            weights=scaled_transformed_list,
+            uids=uids.astype(np.int64, copy=False),
+            weights=weights.astype(np.float32),
             version_key=self.subnet_version,
         )
 
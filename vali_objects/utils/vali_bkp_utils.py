@@ -5,30 +5,21 @@ import json
 import os
 import pickle
 import uuid
-from multiprocessing.managers import DictProxy
 
 import bittensor as bt
-from pydantic import BaseModel
 
 from vali_objects.vali_config import ValiConfig
 from vali_objects.position import Position
 from vali_objects.vali_dataclasses.order import OrderStatus
-from vali_objects.enums.order_type_enum import OrderType
-from vali_objects.vali_config import TradePair
+from vali_objects.utils.fast_json import json_default
 
 
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, TradePair) or isinstance(obj, OrderType):
-            return obj.__json__()
-        elif isinstance(obj, BaseModel):
-            return obj.dict()
-        elif hasattr(obj, 'to_dict'):
-            return obj.to_dict()
-        elif isinstance(obj, DictProxy):
-            return dict(obj)
-
-        return json.JSONEncoder.default(self, obj)
+        try:
+            return json_default(obj)
+        except TypeError:
+            return json.JSONEncoder.default(self, obj)
 
 class ValiBkpUtils:
     @staticmethod
@@ -98,6 +89,11 @@ class ValiBkpUtils:
         suffix = "/tests" if running_unit_tests else ""
         return ValiConfig.BASE_DIR + f"{suffix}/validation/challengeperiod.json"
 
+    @staticmethod
+    def get_challengeperiod_scores_file_location(running_unit_tests=False) -> str:
+        suffix = "/tests" if running_unit_tests else ""
+        return ValiConfig.BASE_DIR + f"{suffix}/validation/challengeperiod_scores.jsonl"
+
     @staticmethod
     def get_last_order_timestamp_file_location(running_unit_tests=False) -> str:
         suffix = "/tests" if running_unit_tests else ""
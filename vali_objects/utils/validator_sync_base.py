@@ -1,5 +1,7 @@
+import bisect
 import time
 import traceback
+from contextlib import contextmanager
 from copy import deepcopy
 from enum import Enum
 from collections import defaultdict
@@ -57,7 +59,12 @@ class ValidatorSyncBase():
         self.miners_with_position_kept = set()
         self.perf_ledger_hks_to_invalidate.clear()
 
-    def sync_positions(self, shadow_mode, candidate_data=None, disk_positions=None) -> dict[str: list[Position]]:
+    def sync_positions(self, shadow_mode, candidate_data=None, disk_positions=None, position_locks=None) -> dict[str: list[Position]]:
+        """
+        Positions are resolved against a snapshot of the disk positions. If position_locks is provided, the
+        modifications for each (hotkey, trade pair) are applied while holding only that pair's lock. Pairs that
+        received an order after the snapshot was taken are resolved again against their current positions.
+        """
         t0 = time.time()
         self.init_data()
         perf_ledger_hks_to_invalidate = {}
@@ -87,23 +94,26 @@ class ValidatorSyncBase():
             disk_positions = self.position_manager.get_positions_for_all_miners(sort_positions=True)
 
         eliminations = candidate_data['eliminations']
-        if not self.is_mothership:
-            self.position_manager.elimination_manager.write_eliminations_to_disk(eliminations)
-
-        challenge_period_data = candidate_data.get('challengeperiod')
-        if challenge_period_data:  # Only in autosync as of now.
-            orig_testing_keys = set(self.position_manager.challengeperiod_manager.challengeperiod_testing.keys())
-            orig_success_keys = set(self.position_manager.challengeperiod_manager.challengeperiod_success.keys())
-            new_testing_keys = set(challenge_period_data.get('testing').keys())
-            new_success_keys = set(challenge_period_data.get('success').keys())
-            bt.logging.info(f"Challengeperiod testing sync keys added: {new_testing_keys-orig_testing_keys}\n"
-                            f"Challengeperiod testing sync keys removed: {orig_testing_keys - new_testing_keys}\n"
-                            f"Challengeperiod success sync keys added: {new_success_keys - orig_success_keys}\n"
-                            f"Challengeperiod success sync keys removed: {orig_success_keys - new_success_keys}")
-            if not shadow_mode:
-                self.position_manager.challengeperiod_manager.challengeperiod_testing = challenge_period_data.get('testing', {})
-                self.position_manager.challengeperiod_manager.challengeperiod_success = challenge_period_data.get('success', {})
-                self.position_manager.challengeperiod_manager._write_challengeperiod_from_memory_to_disk()
+        # Order intake reads eliminations and the challenge period, so these are written with signals blocked even
+        # when positions are applied per position lock.
+        with self.signals_blocked(position_locks):
+            if not self.is_mothership:
+                self.position_manager.elimination_manager.write_eliminations_to_disk(eliminations)
+
+            challenge_period_data = candidate_data.get('challengeperiod')
+            if challenge_period_data:  # Only in autosync as of now.
+                orig_testing_keys = set(self.position_manager.challengeperiod_manager.challengeperiod_testing.keys())
+                orig_success_keys = set(self.position_manager.challengeperiod_manager.challengeperiod_success.keys())
+                new_testing_keys = set(challenge_period_data.get('testing').keys())
+                new_success_keys = set(challenge_period_data.get('success').keys())
+                bt.logging.info(f"Challengeperiod testing sync keys added: {new_testing_keys-orig_testing_keys}\n"
+                                f"Challengeperiod testing sync keys removed: {orig_testing_keys - new_testing_keys}\n"
+                                f"Challengeperiod success sync keys added: {new_success_keys - orig_success_keys}\n"
+                                f"Challengeperiod success sync keys removed: {orig_success_keys - new_success_keys}")
+                if not shadow_mode:
+                    self.position_manager.challengeperiod_manager.challengeperiod_testing = challenge_period_data.get('testing', {})
+                    self.position_manager.challengeperiod_manager.challengeperiod_success = challenge_period_data.get('success', {})
+                    self.position_manager.challengeperiod_manager._write_challengeperiod_from_memory_to_disk()
 
         eliminated_hotkeys = set([e['hotkey'] for e in eliminations])
         # For a healthy validator, the existing positions will always be a superset of the candidate positions
@@ -125,13 +135,12 @@ class ValidatorSyncBase():
                 existing_positions = existing_positions_by_trade_pair.get(trade_pair, [])
 
                 try:
-                    position_to_sync_status, min_timestamp_of_change, stats = self.resolve_positions(candidate_positions, existing_positions, trade_pair, hotkey, hard_snap_cutoff_ms)
+                    min_timestamp_of_change = self.sync_trade_pair(candidate_positions, existing_positions, trade_pair,
+                                                                   hotkey, hard_snap_cutoff_ms, shadow_mode, position_locks)
                     if min_timestamp_of_change != float('inf'):
                         perf_ledger_hks_to_invalidate[hotkey] = (
                             min_timestamp_of_change) if hotkey not in perf_ledger_hks_to_invalidate else (
                             min(perf_ledger_hks_to_invalidate[hotkey], min_timestamp_of_change))
-                        if not shadow_mode:
-                            self.write_modifications(position_to_sync_status, stats)
                 except Exception as e:
                     full_traceback = traceback.format_exc()
                     # Slice the last 1000 characters of the traceback
@@ -163,6 +172,81 @@ class ValidatorSyncBase():
             bt.logging.info(f"  {k}: {v}")
         bt.logging.info(f"Position sync took {time.time() - t0} seconds")
 
+    def sync_trade_pair(self, candidate_positions, existing_positions, trade_pair, hotkey, hard_snap_cutoff_ms,
+                        shadow_mode, position_locks=None) -> float:
+        """
+        Resolve and apply the sync for a single (hotkey, trade pair). Returns the min timestamp of change.
+
+        Resolving mutates existing_positions, so they must be copies from partition_positions_by_trade_pair and never
+        the position manager's own objects. Writers can use those until the lock is taken, and a stale snapshot is
+        discarded.
+        """
+        snapshot_fingerprint = self.positions_fingerprint(existing_positions)
+        stats_snapshot = self.snapshot_sync_stats(hotkey)
+        position_to_sync_status, min_timestamp_of_change, stats = self.resolve_positions(candidate_positions, existing_positions, trade_pair, hotkey, hard_snap_cutoff_ms)
+        if shadow_mode:
+            return min_timestamp_of_change
+
+        if position_locks is None:
+            if min_timestamp_of_change != float('inf'):
+                self.write_modifications(position_to_sync_status, stats)
+            return min_timestamp_of_change
+
+        t0 = time.time()
+        with position_locks.get_lock(hotkey, trade_pair.trade_pair_id):
+            current_positions = self.partition_positions_by_trade_pair(
+                self.position_manager.get_positions_for_one_hotkey(hotkey, sort_positions=True)).get(trade_pair, [])
+            if self.positions_fingerprint(current_positions) != snapshot_fingerprint:
+                # The miner traded mid-sync. Resolve again against the current positions while holding the lock.
+                self.restore_sync_stats(hotkey, stats_snapshot)
+                self.global_stats['n_trade_pairs_resolved_again'] += 1
+                position_to_sync_status, min_timestamp_of_change, stats = self.resolve_positions(candidate_positions, current_positions, trade_pair, hotkey, hard_snap_cutoff_ms)
+            if min_timestamp_of_change != float('inf'):
+                self.write_modifications(position_to_sync_status, stats)
+        lock_held_ms = (time.time() - t0) * 1000
+        self.global_stats['max_position_lock_held_ms'] = max(self.global_stats['max_position_lock_held_ms'], lock_held_ms)
+        return min_timestamp_of_change
+
+    def positions_fingerprint(self, positions: list[Position]) -> list[tuple]:
+        """
+        Used to detect positions that changed after a snapshot was taken. Orders are only ever added, and price
+        corrections don't add orders but do move the return.
+        """
+        return sorted((p.position_uuid, len(p.orders), p.orders[-1].processed_ms if p.orders else 0, p.return_at_close)
+                      for p in positions)
+
+    @contextmanager
+    def signals_blocked(self, position_locks=None):
+        """
+        Hold signal_sync_lock with no orders in flight. Only needed when positions are applied per position lock,
+        otherwise the caller already holds it for the whole sync.
+        """
+        if position_locks is None or self.signal_sync_lock is None:
+            yield
+            return
+        with self.signal_sync_lock:
+            while self.n_orders_being_processed[0] > 0:
+                self.signal_sync_condition.wait()
+            yield
+
+    def snapshot_sync_stats(self, hk):
+        return dict(self.global_stats), [hk in miners for miners in self.miner_stat_sets()]
+
+    def restore_sync_stats(self, hk, snapshot):
+        """
+        Discard the stats recorded for hk since snapshot was taken.
+        """
+        global_stats, hk_in_sets = snapshot
+        self.global_stats = defaultdict(int, global_stats)
+        for miners, hk_in_set in zip(self.miner_stat_sets(), hk_in_sets):
+            if not hk_in_set:
+                miners.discard(hk)
+
+    def miner_stat_sets(self) -> list[set]:
+        return [self.miners_with_order_deletion, self.miners_with_order_insertion, self.miners_with_order_matched,
+                self.miners_with_order_kept, self.miners_with_position_deletion, self.miners_with_position_insertion,
+                self.miners_with_position_matched, self.miners_with_position_kept]
+
     def write_modifications(self, position_to_sync_status, stats):
         # Ensure the enums align with the global stats
         kept_and_matched = stats['kept'] + stats['matched']
@@ -320,6 +404,39 @@ class ValidatorSyncBase():
                  (o1["order_type"] == o2["order_type"]) and
                  abs(o1["processed_ms"] - o2["processed_ms"]) < timebound_ms))
 
+    def index_by_first_uuid(self, items: list, uuid_key) -> dict:
+        """
+        map each uuid to the first item in the list with that uuid
+        """
+        ret = {}
+        for item in items:
+            ret.setdefault(uuid_key(item), item)
+        return ret
+
+    def build_time_index(self, items: list, time_key) -> tuple[list, list]:
+        """
+        sort items by timestamp for windowed lookups. The original list index is kept so that ties can still be
+        broken by list order.
+        """
+        indexed_items = sorted(enumerate(items), key=lambda x: time_key(x[1]))
+        return [time_key(item) for _, item in indexed_items], indexed_items
+
+    def find_first_in_time_window(self, time_index: tuple[list, list], timestamp_ms: int, predicate):
+        """
+        return the item with the lowest original list index that is within SYNC_LOOK_AROUND_MS of timestamp_ms
+        and satisfies the predicate. Equivalent to a linear scan of the original list for the first match, since
+        every alignment check requires the timestamps to be strictly within SYNC_LOOK_AROUND_MS.
+        """
+        times, indexed_items = time_index
+        lo = bisect.bisect_right(times, timestamp_ms - self.SYNC_LOOK_AROUND_MS)
+        hi = bisect.bisect_left(times, timestamp_ms + self.SYNC_LOOK_AROUND_MS)
+        best_idx, best_item = None, None
+        for i in range(lo, hi):
+            idx, item = indexed_items[i]
+            if (best_idx is None or idx < best_idx) and predicate(item):
+                best_idx, best_item = idx, item
+        return best_item
+
     def sync_orders(self, ep, cp, hk, trade_pair, hard_snap_cutoff_ms):
         debug = 1
         existing_orders = ep.orders
@@ -337,34 +454,31 @@ class ValidatorSyncBase():
         inserted = list()
         stats = defaultdict(int)
         # First pass. Try to match 1:1 based on uuid
+        existing_orders_by_uuid = self.index_by_first_uuid(existing_orders, lambda o: o.order_uuid)
         for c in candidate_orders:
             if c.order_uuid in matched_candidates_by_uuid:
                 continue
-            for e in existing_orders:
-                if e.order_uuid in matched_existing_by_uuid:
-                    continue
-                if e.order_uuid == c.order_uuid:
-                    ret.append(e)
-                    matched_candidates_by_uuid |= {c.order_uuid}
-                    matched_existing_by_uuid |= {e.order_uuid}
-                    stats['matched'] += 1
-                    matched.append(e)
-                    break
+            e = existing_orders_by_uuid.get(c.order_uuid)
+            if e is not None:
+                ret.append(e)
+                matched_candidates_by_uuid |= {c.order_uuid}
+                matched_existing_by_uuid |= {e.order_uuid}
+                stats['matched'] += 1
+                matched.append(e)
 
         # Second pass. Try to match 1:1 based on timestamps, leverage, and order type
+        existing_orders_time_index = self.build_time_index(existing_orders, lambda o: o.processed_ms)
         for c in candidate_orders:
             if c.order_uuid in matched_candidates_by_uuid:  # already matched
                 continue
-            for e in existing_orders:
-                if e.order_uuid in matched_existing_by_uuid:
-                    continue
-                if self.orders_aligned(e, c):
-                    matched_candidates_by_uuid |= {c.order_uuid}
-                    matched_existing_by_uuid |= {e.order_uuid}
-                    ret.append(e)
-                    stats['matched'] += 1
-                    matched.append(e)
-                    break
+            e = self.find_first_in_time_window(existing_orders_time_index, c.processed_ms,
+                                               lambda x, c=c, m=matched_existing_by_uuid: x.order_uuid not in m and self.orders_aligned(x, c))
+            if e is not None:
+                matched_candidates_by_uuid |= {c.order_uuid}
+                matched_existing_by_uuid |= {e.order_uuid}
+                ret.append(e)
+                stats['matched'] += 1
+                matched.append(e)
 
         # Handle insertions (unmatched candidates)
         for o in candidate_orders:
@@ -456,59 +570,57 @@ class ValidatorSyncBase():
 
         # open_postition_acked = False
         # First pass. Try to match 1:1 based on position_uuid
+        existing_positions_by_uuid = self.index_by_first_uuid(existing_positions, lambda p: p.position_uuid)
         for c in candidate_positions:
             if c.position_uuid in matched_candidates_by_uuid:
                 continue
-            for e in existing_positions:
-                if e.position_uuid in matched_existing_by_uuid:
-                    continue
-                if e.position_uuid == c.position_uuid:
-                    # Block the match
-                    # if open_postition_acked and e.is_open_position:
-                    #     continue
-
-                    e.orders, min_timestamp_of_order_change = self.sync_orders(e, c, hk, trade_pair, hard_snap_cutoff_ms)
-                    if min_timestamp_of_order_change != float('inf'):
-                        e.rebuild_position_with_updated_orders()
-                        min_timestamp_of_change = min(min_timestamp_of_change, min_timestamp_of_order_change)
-                        position_to_sync_status[e] = PositionSyncResult.UPDATED
-                    else:
-                        position_to_sync_status[e] = PositionSyncResult.NOTHING
-                    # open_postition_acked |= e.is_open_position
-                    ret.append(e)
-
-                    matched_candidates_by_uuid |= {c.position_uuid}
-                    matched_existing_by_uuid |= {e.position_uuid}
-                    stats['matched'] += 1
-                    matched.append(e)
-                    break
+            e = existing_positions_by_uuid.get(c.position_uuid)
+            if e is not None:
+                # Block the match
+                # if open_postition_acked and e.is_open_position:
+                #     continue
 
-        # Second pass. Try to match 1:1 based on timestamps
+                e.orders, min_timestamp_of_order_change = self.sync_orders(e, c, hk, trade_pair, hard_snap_cutoff_ms)
+                if min_timestamp_of_order_change != float('inf'):
+                    e.rebuild_position_with_updated_orders()
+                    min_timestamp_of_change = min(min_timestamp_of_change, min_timestamp_of_order_change)
+                    position_to_sync_status[e] = PositionSyncResult.UPDATED
+                else:
+                    position_to_sync_status[e] = PositionSyncResult.NOTHING
+                # open_postition_acked |= e.is_open_position
+                ret.append(e)
+
+                matched_candidates_by_uuid |= {c.position_uuid}
+                matched_existing_by_uuid |= {e.position_uuid}
+                stats['matched'] += 1
+                matched.append(e)
+
+        # Second pass. Try to match 1:1 based on timestamps. Only unmatched existing positions are looked up and
+        # those have not been modified by the first pass, so their open_ms is still valid in the index.
+        existing_positions_time_index = self.build_time_index(existing_positions, lambda p: p.open_ms)
         for c in candidate_positions:
             if c.position_uuid in matched_candidates_by_uuid:
                 continue
-            for e in existing_positions:
-                if e.position_uuid in matched_existing_by_uuid:
-                    continue
-                if self.positions_aligned(e, c):
-                    # Block the match
-                    # if open_postition_acked and e.is_open_position:
-                    #     continue
-
-                    e.orders, min_timestamp_of_order_change = self.sync_orders(e, c, hk, trade_pair, hard_snap_cutoff_ms)
-                    if min_timestamp_of_order_change != float('inf'):
-                        e.rebuild_position_with_updated_orders()
-                        min_timestamp_of_change = min(min_timestamp_of_change, min_timestamp_of_order_change)
-                        position_to_sync_status[e] = PositionSyncResult.UPDATED
-                    else:
-                        position_to_sync_status[e] = PositionSyncResult.NOTHING
-                    # open_postition_acked |= e.is_open_position
-                    matched_candidates_by_uuid |= {c.position_uuid}
-                    matched_existing_by_uuid |= {e.position_uuid}
-                    ret.append(e)
-                    matched.append(e)
-                    stats['matched'] += 1
-                    break
+            e = self.find_first_in_time_window(existing_positions_time_index, c.open_ms,
+                                               lambda x, c=c, m=matched_existing_by_uuid: x.position_uuid not in m and self.positions_aligned(x, c))
+            if e is not None:
+                # Block the match
+                # if open_postition_acked and e.is_open_position:
+                #     continue
+
+                e.orders, min_timestamp_of_order_change = self.sync_orders(e, c, hk, trade_pair, hard_snap_cutoff_ms)
+                if min_timestamp_of_order_change != float('inf'):
+                    e.rebuild_position_with_updated_orders()
+                    min_timestamp_of_change = min(min_timestamp_of_change, min_timestamp_of_order_change)
+                    position_to_sync_status[e] = PositionSyncResult.UPDATED
+                else:
+                    position_to_sync_status[e] = PositionSyncResult.NOTHING
+                # open_postition_acked |= e.is_open_position
+                matched_candidates_by_uuid |= {c.position_uuid}
+                matched_existing_by_uuid |= {e.position_uuid}
+                ret.append(e)
+                matched.append(e)
+                stats['matched'] += 1
 
 
         # Handle insertions (unmatched candidates).
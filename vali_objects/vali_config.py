@@ -46,6 +46,7 @@ class ValiConfig:
     PERF_LEDGER_REFRESH_TIME_MS = 1000 * 60 * 5  # minutes
     CHALLENGE_PERIOD_REFRESH_TIME_MS = 1000 * 60 * 1  # minutes
     MDD_CHECK_REFRESH_TIME_MS = 60 * 1000  # 60 seconds
+    MDD_CHECK_N_SHARDS = 8  # Hotkey shards swept concurrently by the MDD checker
 
     # Positional Leverage limits
     CRYPTO_MIN_LEVERAGE = 0.01
@@ -191,6 +192,23 @@ class ValiConfig:
     # Cap leverage across miner's entire portfolio
     PORTFOLIO_LEVERAGE_CAP = 10
 
+    # Axon request scheduling. Each synapse method is served by its own worker pool. Requests beyond
+    # workers + queue depth are rejected immediately.
+    SIGNAL_MAX_WORKERS = 16
+    SIGNAL_MAX_QUEUE_DEPTH = 256
+    POSITION_INSPECTOR_MAX_WORKERS = 4
+    POSITION_INSPECTOR_MAX_QUEUE_DEPTH = 32
+    DASHBOARD_MAX_WORKERS = 2
+    DASHBOARD_MAX_QUEUE_DEPTH = 8
+    CHECKPOINT_MAX_WORKERS = 2
+    CHECKPOINT_MAX_QUEUE_DEPTH = 16
+    SYNAPSE_STATS_LOG_INTERVAL_MS = 1000 * 60 * 10  # 10 minutes
+
+    # Historical Polygon candles cached per process. Candles are only cached once they ended this long ago, since
+    # Polygon can still fill in late trades before then. The cap covers every trade pair and timespan together.
+    CANDLE_CACHE_SETTLE_MS = 1000 * 60 * 60  # 1 hour
+    CANDLE_CACHE_MAX_CANDLES = 500_000  # About 170 MB of polygon Aggs
+
 assert ValiConfig.CRYPTO_MIN_LEVERAGE >= ValiConfig.ORDER_MIN_LEVERAGE
 assert ValiConfig.CRYPTO_MAX_LEVERAGE <= ValiConfig.ORDER_MAX_LEVERAGE
 assert ValiConfig.FOREX_MIN_LEVERAGE >= ValiConfig.ORDER_MIN_LEVERAGE
@@ -4,8 +4,9 @@
 from time_util.time_util import TimeUtil
 from pydantic import field_validator
 
-from vali_objects.enums.order_type_enum import OrderType
+from vali_objects.enums.order_type_enum import OrderType, ORDER_TYPE_BY_VALUE
 from vali_objects.vali_dataclasses.price_source import PriceSource
+from vali_objects.utils import fast_json
 from vali_objects.vali_dataclasses.order_signal import Signal
 from enum import Enum, auto
 
@@ -45,6 +46,22 @@ class Order(Signal):
         # handle the conversion from dict to model instance
         return cls(**order_dict)
 
+    @classmethod
+    def from_trusted_dict(cls, order_dict: dict, trade_pair) -> 'Order':
+        """
+        Build an Order from JSON this codebase wrote itself (position files, checkpoints) without running pydantic
+        validation. The leverage sign and bounds were checked when the order was first created. Untrusted input
+        such as other validators' checkpoints must keep going through the regular constructor.
+        """
+        values = dict(order_dict)
+        values['trade_pair'] = trade_pair
+        values['order_type'] = ORDER_TYPE_BY_VALUE.get(values['order_type']) or OrderType(values['order_type'])
+        values['leverage'] = float(values['leverage'])
+        values['price'] = float(values['price'])
+        if 'price_sources' in values:
+            values['price_sources'] = [PriceSource.from_trusted_dict(ps) for ps in values['price_sources']]
+        return fast_json.construct_trusted(cls, values)
+
     def get_order_age(self, order):
         return TimeUtil.now_in_millis() - order.processed_ms
 
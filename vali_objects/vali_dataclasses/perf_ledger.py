@@ -5,6 +5,7 @@ import time
 import traceback
 from collections import defaultdict
 from copy import deepcopy
+from itertools import islice
 from typing import List
 import bittensor as bt
 from setproctitle import setproctitle
@@ -25,46 +26,91 @@ TARGET_CHECKPOINT_DURATION_MS = ValiConfig.TARGET_CHECKPOINT_DURATION_MS
 TARGET_LEDGER_WINDOW_MS = ValiConfig.TARGET_LEDGER_WINDOW_MS
 
 
+# Carry fee intervals end at 4, 12 and 20 UTC for crypto and at 21 UTC for forex, indices and equities
+CRYPTO_CARRY_FEE_BOUNDARY_OFFSET_MS = 4 * 60 * 60 * 1000
+FOREX_INDICES_CARRY_FEE_BOUNDARY_OFFSET_MS = 21 * 60 * 60 * 1000
+CARRY_FEE_LOOKAHEAD_MS = 30 * MS_IN_24_HOURS
+
+
 class FeeCache():
     def __init__(self):
         self.spread_fee: float = 1.0
-        self.spread_fee_last_order_processed_ms: int = 0
-
-        self.carry_fee: float = 1.0  # product of all individual interval fees.
-        self.carry_fee_next_increase_time_ms: int = 0  # Compute fees based off the prior interval
-
-    def get_spread_fee(self, position: Position) -> float:
-        if position.orders[-1].processed_ms == self.spread_fee_last_order_processed_ms:
-            return self.spread_fee
-
+        # The orders the fees below were computed from
+        self.n_orders: int = -1
+        self.last_order_processed_ms: int | None = None
+        self.close_ms: int | None = None
+
+        # Carry fee at each interval boundary, starting with the first one after fees start accruing. The fee at a
+        # boundary holds until the next one. Boundaries are evenly spaced so finding one is a division.
+        self.carry_fee_first_boundary_ms: int = 0
+        self.carry_fee_interval_ms: int = MS_IN_8_HOURS
+        self.carry_fees: List[float] = []
+        self.carry_fee_at_close: float | None = None
+
+    def refresh(self, position: Position):
+        orders = position.orders
+        if len(orders) == self.n_orders and (not orders or orders[-1].processed_ms == self.last_order_processed_ms) \
+                and position.close_ms == self.close_ms:
+            return
+        self.n_orders = len(orders)
+        self.last_order_processed_ms = orders[-1].processed_ms if orders else None
+        self.close_ms = position.close_ms
         self.spread_fee = position.get_spread_fee()
-        self.spread_fee_last_order_processed_ms = position.orders[-1].processed_ms
-        return self.spread_fee
 
-    def get_carry_fee(self, current_time_ms, position: Position) -> float:
-        # Calculate the number of times a new day occurred (UTC). If a position is opened at 23:59:58 and this function is
-        # called at 00:00:02, the carry fee will be calculated as if a day has passed. Another example: if a position is
-        # opened at 23:59:58 and this function is called at 23:59:59, the carry fee will be calculated as 0 days have passed
-        if position.is_closed_position:
-            current_time_ms = min(current_time_ms, position.close_ms)
-        # cache hit?
         if position.trade_pair.is_crypto:
-            start_time_cache_hit = self.carry_fee_next_increase_time_ms - MS_IN_8_HOURS
+            self.carry_fee_interval_ms = MS_IN_8_HOURS
+            offset_ms = CRYPTO_CARRY_FEE_BOUNDARY_OFFSET_MS
         elif position.trade_pair.is_forex or position.trade_pair.is_indices or position.trade_pair.is_equities:
-            start_time_cache_hit = self.carry_fee_next_increase_time_ms - MS_IN_24_HOURS
+            self.carry_fee_interval_ms = MS_IN_24_HOURS
+            offset_ms = FOREX_INDICES_CARRY_FEE_BOUNDARY_OFFSET_MS
         else:
             raise Exception(f"Unknown trade pair type: {position.trade_pair}")
-        if start_time_cache_hit <= current_time_ms < self.carry_fee_next_increase_time_ms:
-            return self.carry_fee
+        start_ms = position.start_carry_fee_accrual_ms
+        self.carry_fee_first_boundary_ms = start_ms - (start_ms - offset_ms) % self.carry_fee_interval_ms + \
+                                           self.carry_fee_interval_ms
+        self.carry_fees = []
+        self.carry_fee_at_close = None
 
-        # cache miss
-        carry_fee, next_update_time_ms = position.get_carry_fee(current_time_ms)
-        assert next_update_time_ms > current_time_ms, [TimeUtil.millis_to_verbose_formatted_date_str(x) for x in (self.carry_fee_next_increase_time_ms, next_update_time_ms, current_time_ms)] + [carry_fee, position] + [self.carry_fee_next_increase_time_ms, next_update_time_ms, current_time_ms]
+    def extend_carry_fees(self, current_time_ms: int, position: Position):
+        """
+        Computes the carry fees at every boundary up to current_time_ms plus some lookahead, or up to the close.
+        """
+        if position.is_closed_position:
+            end_ms = position.close_ms
+        else:
+            end_ms = max(current_time_ms + CARRY_FEE_LOOKAHEAD_MS,
+                         self.carry_fee_first_boundary_ms + 2 * len(self.carry_fees) * self.carry_fee_interval_ms)
+        n_boundaries = (end_ms - self.carry_fee_first_boundary_ms) // self.carry_fee_interval_ms + 1
+        # At a boundary, Position.get_carry_fee charges one full interval more than at the previous boundary over
+        # the same intervals, so each fee is the previous one times the next interval's fee.
+        carry_fees = []
+        fee_product = 1.0
+        for fee in islice(position.carry_fee_interval_fees(self.carry_fee_interval_ms), max(n_boundaries, 0)):
+            if fee is not None:
+                fee_product *= fee
+            carry_fees.append(fee_product)
+        self.carry_fees = carry_fees
+
+    def get_spread_fee(self, position: Position) -> float:
+        self.refresh(position)
+        return self.spread_fee
 
-        assert carry_fee >= 0, (carry_fee, next_update_time_ms, position)
-        self.carry_fee = carry_fee
-        self.carry_fee_next_increase_time_ms = next_update_time_ms
-        return self.carry_fee
+    def get_carry_fee(self, current_time_ms, position: Position) -> float:
+        # The carry fee at the last interval boundary (UTC) at or before current_time_ms. If a position is opened at
+        # 23:59:58 and this function is called at 00:00:02, the carry fee will be calculated as if a day has passed.
+        # Another example: if a position is opened at 23:59:58 and this function is called at 23:59:59, the carry
+        # fee will be calculated as 0 days have passed
+        self.refresh(position)
+        if position.is_closed_position and current_time_ms >= position.close_ms:
+            if self.carry_fee_at_close is None:
+                self.carry_fee_at_close = position.get_carry_fee(position.close_ms)[0]
+            return self.carry_fee_at_close
+        if current_time_ms < self.carry_fee_first_boundary_ms:
+            return 1.0
+        i = (current_time_ms - self.carry_fee_first_boundary_ms) // self.carry_fee_interval_ms
+        if i >= len(self.carry_fees):
+            self.extend_carry_fees(current_time_ms, position)
+        return self.carry_fees[i]
 
 
 class PerfCheckpoint:
@@ -310,6 +356,58 @@ class PerfLedger():
     def get_total_ledger_duration_ms(self):
         return sum(cp.accum_ms for cp in self.cps)
 
+class PerfLedgerView():
+    """
+    Read-only view of a PerfLedger held in the manager's memory. Readers share the ledger and its checkpoints
+    instead of deep copying them, so checkpoints must not be modified. Call copy() to get a PerfLedger that can be.
+    """
+    __slots__ = ('_ledger', '_cps', 'generation')
+
+    def __init__(self, ledger: PerfLedger, generation: int = 0):
+        object.__setattr__(self, '_ledger', ledger)
+        object.__setattr__(self, '_cps', tuple(ledger.cps))
+        object.__setattr__(self, 'generation', generation)  # Generation of the ledgers this view was taken from
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"PerfLedgerView is read-only. Use copy() before setting {name}")
+
+    def __reduce__(self):
+        return PerfLedgerView, (self._ledger, self.generation)
+
+    def copy(self) -> PerfLedger:
+        return deepcopy(self._ledger)
+
+    @property
+    def cps(self) -> tuple[PerfCheckpoint, ...]:
+        return self._cps
+
+    @property
+    def max_return(self):
+        return self._ledger.max_return
+
+    @property
+    def target_cp_duration_ms(self):
+        return self._ledger.target_cp_duration_ms
+
+    @property
+    def target_ledger_window_ms(self):
+        return self._ledger.target_ledger_window_ms
+
+    @property
+    def initialization_time_ms(self):
+        return self._ledger.initialization_time_ms
+
+    # Derived fields only read the attributes above
+    last_update_ms = PerfLedger.last_update_ms
+    prev_portfolio_ret = PerfLedger.prev_portfolio_ret
+    start_time_ms = PerfLedger.start_time_ms
+    to_dict = PerfLedger.to_dict
+    get_product_of_gains = PerfLedger.get_product_of_gains
+    get_product_of_loss = PerfLedger.get_product_of_loss
+    get_total_product = PerfLedger.get_total_product
+    get_total_ledger_duration_ms = PerfLedger.get_total_ledger_duration_ms
+
+
 class PerfLedgerManager(CacheController):
     def __init__(self, metagraph, ipc_manager=None, running_unit_tests=False, shutdown_dict=None,
                  position_manager=None, perf_ledger_hks_to_invalidate=None, live_price_fetcher=None):
@@ -322,9 +420,12 @@ class PerfLedgerManager(CacheController):
         if ipc_manager:
             self.pl_elimination_rows = ipc_manager.list()
             self.hotkey_to_perf_ledger = ipc_manager.dict()
+            self.perf_ledger_generation = ipc_manager.dict()  # {'generation': n}. Bumped whenever ledgers are written
         else:
             self.pl_elimination_rows = []
             self.hotkey_to_perf_ledger = {}
+            self.perf_ledger_generation = {}
+        self.perf_ledger_views_cache = None  # (generation, {hotkey: PerfLedgerView})
         self.running_unit_tests = running_unit_tests
         self.position_manager = position_manager
         self.pds = None  # Not pickable. Load it later once the process starts
@@ -377,6 +478,7 @@ class PerfLedgerManager(CacheController):
             ValiBkpUtils.write_file(file_path, {})
         for k in list(self.hotkey_to_perf_ledger.keys()):
             del self.hotkey_to_perf_ledger[k]
+        self.bump_perf_ledger_generation()
 
     def run_update_loop(self):
         setproctitle(f"vali_{self.__class__.__name__}")
@@ -961,8 +1063,25 @@ class PerfLedgerManager(CacheController):
     def get_perf_ledgers_from_memory(self, first_fetch=False):
         if first_fetch:
             self.hotkey_to_perf_ledger.update(self.get_perf_ledgers_from_disk())
+            self.bump_perf_ledger_generation()
         return deepcopy(self.hotkey_to_perf_ledger)
 
+    def bump_perf_ledger_generation(self):
+        self.perf_ledger_generation['generation'] = self.perf_ledger_generation.get('generation', 0) + 1
+
+    def get_perf_ledger_views(self) -> dict[str, PerfLedgerView]:
+        """
+        Read-only views of the ledgers in memory for callers that only read checkpoints. Nothing is deep copied and
+        the same views are handed out until the ledgers are written again.
+        """
+        # Read the generation before the ledgers so a concurrent write can only make the cache look older
+        generation = self.perf_ledger_generation.get('generation', 0)
+        if self.perf_ledger_views_cache is None or self.perf_ledger_views_cache[0] != generation:
+            views = {hotkey: PerfLedgerView(ledger, generation) if ledger is not None else None
+                     for hotkey, ledger in self.hotkey_to_perf_ledger.copy().items()}
+            self.perf_ledger_views_cache = (generation, views)
+        return dict(self.perf_ledger_views_cache[1])
+
     def update(self, testing_one_hotkey=None, regenerate_all_ledgers=False):
         assert self.position_manager.elimination_manager.metagraph, "Metagraph must be loaded before updating perf ledgers"
         assert self.metagraph, "Metagraph must be loaded before updating perf ledgers"
@@ -1097,6 +1216,7 @@ class PerfLedgerManager(CacheController):
 
         for k, v in perf_ledgers_copy.items():
             self.hotkey_to_perf_ledger[k] = v
+        self.bump_perf_ledger_generation()
 
     def print_perf_ledgers_on_disk(self):
         perf_ledgers = self.get_perf_ledgers_from_memory()
@@ -4,6 +4,10 @@ import bittensor as bt
 from typing import Optional
 from pydantic import BaseModel
 
+from vali_objects.utils import fast_json
+
+OPTIONAL_FLOAT_FIELDS = ('open', 'close', 'vwap', 'high', 'low', 'volume')
+
 
 class PriceSource(BaseModel):
     source: str = 'unknown'
@@ -18,6 +22,19 @@ class PriceSource(BaseModel):
     lag_ms: int = 0
     volume: Optional[float] = 0.0
 
+    @classmethod
+    def from_trusted_dict(cls, d: dict) -> 'PriceSource':
+        """
+        Build a PriceSource from JSON this codebase wrote itself without running pydantic validation. Ints are still
+        coerced to floats the way validation would.
+        """
+        values = dict(d)
+        for k in OPTIONAL_FLOAT_FIELDS:
+            v = values.get(k)
+            if v is not None and type(v) is not float:
+                values[k] = float(v)
+        return fast_json.construct_trusted(cls, values)
+
     def __eq__(self, other):
         if not isinstance(other, PriceSource):
             return NotImplemented
@@ -71,6 +88,13 @@ class PriceSource(BaseModel):
         order_time_ms = order.processed_ms
         existing_dict = {ps.source: ps for ps in order.price_sources}
         candidates_dict = {ps.source: ps for ps in candidate_price_sources}
+        # Sweeps mostly return the sources the order already has. A candidate equal to the existing source of its
+        # kind has the same time delta so it can't replace it. websocket isn't part of PriceSource equality but
+        # changes the time delta, so it is part of the key.
+        existing_keys = {(ps, ps.websocket) for ps in existing_dict.values()}
+        if all((ps, ps.websocket) in existing_keys for ps in candidates_dict.values()):
+            return False
+
         new_price_sources = []
         # We need to create new price sources. If there is overlap, take the one with the smallest time lag to order_time_ms
         any_changes = False
@@ -0,0 +1,135 @@
+# developer: Taoshidev
+# Copyright © 2024 Taoshi Inc
+from functools import cached_property
+from operator import attrgetter
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+
+from vali_objects.vali_dataclasses.price_source import PriceSource
+
+
+class PriceSourceBatch:
+    """
+    Price sources of many keys (trade pairs, orders) stored as columns so the best price and outlier bounds of every
+    key are computed with one set of numpy operations instead of a Python loop per key.
+
+    Gives the same answers as PriceSource.get_winning_event, PriceSource.parse_best_price,
+    PriceSource.non_null_events_sorted and LivePriceFetcher.filter_outliers, including their tie breaking.
+    """
+    def __init__(self, keys: List[Hashable], events_per_key: List[List[PriceSource | None]],
+                 now_ms_per_key: List[int] = None):
+        self.keys = keys
+        # None entries are skipped, the same as the list based helpers do
+        self.events = [e for events in events_per_key for e in events if e]
+        self.group = np.repeat(np.arange(len(keys)), [len(events) - events.count(None) for events in events_per_key])
+        self.now_ms = None
+        if now_ms_per_key is not None:
+            self.now_ms = np.asarray(now_ms_per_key, dtype=np.int64)[self.group]
+
+    # Columns are only built when used. filter_outliers only needs close and start_ms.
+    def column(self, name: str, dtype) -> np.ndarray:
+        # For float columns numpy turns None into nan
+        return np.array(list(map(attrgetter(name), self.events)), dtype=dtype)
+
+    @cached_property
+    def start_ms(self) -> np.ndarray:
+        return self.column('start_ms', np.int64)
+
+    @cached_property
+    def timespan_ms(self) -> np.ndarray:
+        return self.column('timespan_ms', np.int64)
+
+    @cached_property
+    def websocket(self) -> np.ndarray:
+        return self.column('websocket', bool)
+
+    @cached_property
+    def open(self) -> np.ndarray:
+        return self.column('open', np.float64)
+
+    @cached_property
+    def close(self) -> np.ndarray:
+        return self.column('close', np.float64)
+
+    @cached_property
+    def end_ms(self) -> np.ndarray:
+        return np.where(self.websocket, self.start_ms, self.start_ms + self.timespan_ms - 1)
+
+    def group_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        counts = np.bincount(self.group, minlength=len(self.keys))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return starts, counts
+
+    def time_delta_ms(self) -> np.ndarray:
+        to_start = np.abs(self.now_ms - self.start_ms)
+        return np.where(self.websocket, to_start, np.minimum(to_start, np.abs(self.now_ms - self.end_ms)))
+
+    def best_prices(self, max_time_delta_ms: int = None) -> Dict[Hashable, Tuple[float, List[PriceSource]]]:
+        """
+        For each key, returns the price parsed from the source closest to the key's time and its sources sorted by time
+        delta, with lag_ms set. Keys without sources or whose closest source is further than max_time_delta_ms away
+        are returned as (None, None) and their sources are left untouched. A nan price is returned as None.
+        """
+        ans = {key: (None, None) for key in self.keys}
+        if not self.events:
+            return ans
+        delta = self.time_delta_ms()
+        # Stable sort by (key, time delta). The first row of each key is the winner.
+        order = np.lexsort((delta, self.group))
+        starts, counts = self.group_bounds()
+        winner_rows = order[starts[counts > 0]]
+        to_start = np.abs(self.now_ms[winner_rows] - self.start_ms[winner_rows])
+        to_end = np.abs(self.now_ms[winner_rows] - self.end_ms[winner_rows])
+        use_open = self.websocket[winner_rows] | (to_start < to_end)
+        prices = np.where(use_open, self.open[winner_rows], self.close[winner_rows])
+        too_old = np.zeros(len(winner_rows), dtype=bool)
+        if max_time_delta_ms is not None:
+            too_old = delta[winner_rows] > max_time_delta_ms
+
+        order_list = order.tolist()
+        delta_list = delta.tolist()
+        for i, g in enumerate(np.flatnonzero(counts).tolist()):
+            if too_old[i]:
+                continue
+            rows = order_list[starts[g]: starts[g] + counts[g]]
+            sources = [self.events[r] for r in rows]
+            for r, source in zip(rows, sources):
+                # Same effect as source.lag_ms = ... without pydantic's __setattr__, which dominated the runtime
+                source.__dict__['lag_ms'] = delta_list[r]
+                source.__pydantic_fields_set__.add('lag_ms')
+            price = prices[i].item()
+            ans[self.keys[g]] = (None if price != price else price, sources)
+        return ans
+
+    def filter_outliers(self) -> Dict[Hashable, List[PriceSource]]:
+        """
+        For each key, drops the sources whose close is more than 5% away from the key's median close and sorts the
+        rest by start time, newest first.
+        """
+        ans = {key: [] for key in self.keys}
+        if not self.events:
+            return ans
+        starts, counts = self.group_bounds()
+        by_close = np.lexsort((self.close, self.group))
+        sorted_close = self.close[by_close]
+        nonempty = counts > 0
+        lo = starts[nonempty] + (counts[nonempty] - 1) // 2
+        hi = starts[nonempty] + counts[nonempty] // 2
+        medians = np.full(len(self.keys), np.nan)
+        medians[nonempty] = (sorted_close[lo] + sorted_close[hi]) / 2
+        # np.median is nan if any close is nan
+        has_nan = np.bincount(self.group, weights=np.isnan(self.close), minlength=len(self.keys)) > 0
+        medians[has_nan] = np.nan
+        median = medians[self.group]
+        keep = (median * 0.95 <= self.close) & (self.close <= median * 1.05)
+
+        # Stable sort by (key, newest start first)
+        order = np.lexsort((-self.start_ms, self.group))
+        kept = order[keep[order]]
+        kept_starts = np.searchsorted(self.group[kept], np.arange(len(self.keys) + 1)).tolist()
+        kept = kept.tolist()
+        events = self.events
+        for g, key in enumerate(self.keys):
+            ans[key] = [events[r] for r in kept[kept_starts[g]: kept_starts[g + 1]]]
+        return ans
@@ -1,12 +1,50 @@
+import heapq
 
 from sortedcontainers import SortedList
 from time_util.time_util import TimeUtil
 from vali_objects.vali_dataclasses.price_source import PriceSource
 
 
+MEDIAN_PRICE_FIELDS = ('open', 'close', 'high', 'low')
+
+
 def sorted_list_key(x):
     return x[0]
 
+class StreamingMedian:
+    """
+    Median of a growing set of prices. Adding a price is O(log n) and reading the median is O(1), instead of
+    re-sorting every price seen so far. The smaller half is kept in a max heap (negated) and the larger half in a min
+    heap, with the smaller half holding the extra price when the count is odd.
+    """
+    __slots__ = ('lower', 'upper')
+
+    def __init__(self, prices=()):
+        self.lower = []
+        self.upper = []
+        for price in prices:
+            self.add(price)
+
+    def __len__(self):
+        return len(self.lower) + len(self.upper)
+
+    def add(self, price):
+        if not self.lower or price <= -self.lower[0]:
+            heapq.heappush(self.lower, -price)
+            if len(self.lower) > len(self.upper) + 1:
+                heapq.heappush(self.upper, -heapq.heappop(self.lower))
+        else:
+            heapq.heappush(self.upper, price)
+            if len(self.upper) > len(self.lower):
+                heapq.heappush(self.lower, -heapq.heappop(self.upper))
+
+    def median(self):
+        # Same as RecentEventTracker.forex_median_price on the sorted prices
+        if len(self.lower) > len(self.upper):
+            return -self.lower[0]
+        return (self.upper[0] + -self.lower[0]) / 2.0
+
+
 class RecentEventTracker:
     OLDEST_ALLOWED_RECORD_MS = 300000  # 5 minutes
     def __init__(self):
@@ -19,7 +57,7 @@ class RecentEventTracker:
             #print(f'Duplicate timestamp {TimeUtil.millis_to_formatted_date_str(event_time_ms)} for tp {tp_debug_str} ignored')
             return
         self.events.add((event_time_ms, event))
-        self.timestamp_to_event[event_time_ms] = (event, [event.close] if is_forex_quote else None)
+        self.timestamp_to_event[event_time_ms] = (event, StreamingMedian([event.close]) if is_forex_quote else None)
         #print(f"Added event at {TimeUtil.millis_to_formatted_date_str(event_time_ms)}")
         self._cleanup_old_events()
         #print(event, tp_debug_str)
@@ -39,10 +77,11 @@ class RecentEventTracker:
     def update_prices_for_median(self, t_ms, new_price):
         existing_event, prices = self.get_event_by_timestamp(t_ms)
         if prices:
-            prices.append(new_price)
-            prices.sort()
-            median_price = self.forex_median_price(prices)
-            existing_event.open = existing_event.close = existing_event.high = existing_event.low = median_price
+            prices.add(new_price)
+            median_price = prices.median()
+            # Same as setting the four fields without pydantic's __setattr__, which cost more than the median
+            existing_event.__dict__.update(open=median_price, close=median_price, high=median_price, low=median_price)
+            existing_event.__pydantic_fields_set__.update(MEDIAN_PRICE_FIELDS)
 
     def _cleanup_old_events(self):
         # Don't lock here, as this method is called from within a lock